@@ -26,6 +26,9 @@ from importlib import import_module
 from django.conf import settings
 from django.contrib.admin.sites import AdminSite, AlreadyRegistered
 from django.contrib.admin.forms import AuthenticationForm
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models.fields import CharField
 from django.utils.translation import gettext_lazy as _
 
 
@@ -41,6 +44,10 @@ class freppleAuthenticationForm(AuthenticationForm):
 class freppleAdminSite(AdminSite):
     login_form = freppleAuthenticationForm
 
+    # Tables without a search index. The plan export rewrites these tables
+    # on every run, and maintaining the index would slow it down.
+    search_index_exclude = ("operationplan",)
+
     def register(self, model_or_iterable, admin_class=None, force=False, **options):
         try:
             super().register(model_or_iterable, admin_class, **options)
@@ -52,6 +59,49 @@ class freppleAdminSite(AdminSite):
                 self.unregister(model_or_iterable)
                 super().register(model_or_iterable, admin_class, **options)
 
+    def getSearchModels(self, app_label=None):
+        """
+        Returns the models that the search box looks into: all registered
+        models with a text primary key.
+        """
+        return [
+            m
+            for m in self._registry
+            if isinstance(m._meta.pk, CharField)
+            and (not app_label or m._meta.app_label == app_label)
+        ]
+
+    @staticmethod
+    def getSearchExpression(model):
+        """
+        Returns the SQL expression the search box matches a model on.
+        A trigram index on this expression is created after the migrations,
+        except for the tables in search_index_exclude.
+        """
+        pk = '"%s"' % model._meta.pk.column
+        try:
+            return "(%s || ' ' || coalesce(\"%s\", ''))" % (
+                pk,
+                model._meta.get_field("description").column,
+            )
+        except FieldDoesNotExist:
+            return "(%s)" % pk
+
+    def createSearchIndexes(self, app_label, database=DEFAULT_DB_ALIAS):
+        tables = {}
+        for m in self.getSearchModels(app_label):
+            if m._meta.managed:
+                tables[m._meta.db_table] = self.getSearchExpression(m)
+        with connections[database].cursor() as cursor:
+            for table, expression in tables.items():
+                if table in self.search_index_exclude:
+                    cursor.execute('drop index if exists "%s_search"' % table[:50])
+                else:
+                    cursor.execute(
+                        'create index if not exists "%s_search" on "%s" using gin (%s gin_trgm_ops)'
+                        % (table[:50], table, expression)
+                    )
+
 
 # Create two admin sites where all our apps will register their models
 data_site = freppleAdminSite(name="data")
@@ -41,6 +41,7 @@ class ArchivedBufferWidget(Widget):
     title = _("Inventory history")
     tooltip = _("Show the history of the on hand inventory")
     asynchronous = True
+    cache = True
     history = 12
 
     def args(self):
@@ -185,6 +186,7 @@ class ArchivedDemandWidget(Widget):
     title = _("Demand history")
     tooltip = _("Show the evolution of the open sales orders")
     asynchronous = True
+    cache = True
     history = 12
 
     def args(self):
@@ -350,6 +352,7 @@ class ArchivedPurchaseOrderWidget(Widget):
     title = _("Purchase order history")
     tooltip = _("Show the evolution of the open purchase orders")
     asynchronous = True
+    cache = True
     history = 12
 
     def args(self):
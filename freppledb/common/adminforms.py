@@ -51,6 +51,8 @@ from django.utils.text import format_lazy, get_text_list
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_protect
 
+from .auth import MultiDBBackend
+from .dashboard import Dashboard
 from .models import Comment, User, Scenario
 
 
@@ -167,6 +169,11 @@ class MultiDBModelAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         # Tell Django to save objects to the 'other' database.
         obj.save(using=request.database)
+        Dashboard.planChanged(request.database)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Dashboard.planChanged(request.database)
 
     def get_queryset(self, request):
         # Tell Django to get objects from the 'other' database.
@@ -818,4 +825,5 @@ class MultiDBUserCreationForm(UserCreationForm):
         user.save(using=DEFAULT_DB_ALIAS)
         for sc in self.cleaned_data["scenarios"]:
             User.objects.using(sc).filter(username=user.username).update(is_active=True)
+            MultiDBBackend.clearScenarioUsers(sc)
         return user
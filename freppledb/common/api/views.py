@@ -31,6 +31,7 @@ from rest_framework_bulk import ListBulkCreateUpdateDestroyAPIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions
 
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.models import User
 from freppledb.common.auth import getWebserviceAuthorization
 
@@ -111,6 +112,15 @@ class frePPleListCreateAPIView(ListBulkCreateUpdateDestroyAPIView):
         # filtered comes from self.filter_queryset(qs)
         return False
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Invalidate the cached widgets after a successful change
+        if (
+            request.method not in permissions.SAFE_METHODS
+            and response.status_code < 400
+        ):
+            Dashboard.planChanged(request.database)
+        return super().finalize_response(request, response, *args, **kwargs)
+
 
 class frePPleRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     """
@@ -126,3 +136,12 @@ class frePPleRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView)
             return super().get_queryset()
         else:
             return super().get_queryset().using(self.request.database)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Invalidate the cached widgets after a successful change
+        if (
+            request.method not in permissions.SAFE_METHODS
+            and response.status_code < 400
+        ):
+            Dashboard.planChanged(request.database)
+        return super().finalize_response(request, response, *args, **kwargs)
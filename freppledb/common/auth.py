@@ -29,10 +29,11 @@ from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import Permission
+from django.core.cache import cache
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
-from django.db import DEFAULT_DB_ALIAS
-from django.db.models import Q
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Q
 from django.http import HttpResponse
 
 from freppledb.common.models import User, Scenario
@@ -54,6 +55,60 @@ class MultiDBBackend(ModelBackend):
     to assure that the user object refers to the correct database.
     """
 
+    # User fields that can be different in each scenario
+    scenario_fields = (
+        "is_superuser",
+        "horizonlength",
+        "horizonbefore",
+        "horizontype",
+        "horizonbuckets",
+        "horizonstart",
+        "horizonend",
+        "horizonunit",
+    )
+
+    @staticmethod
+    def getScenarioUsers(scenario):
+        """
+        Returns a dictionary with the scenario specific fields of all active
+        users in a scenario database.
+        The result is cached. A cached entry is only used while the refresh
+        date and the users version of the scenario record are unchanged, which
+        keeps the cache of every web server process in sync.
+        """
+        key = "scenariousers_%s" % scenario.name
+        token = (scenario.lastrefresh, scenario.usersversion)
+        cached = cache.get(key, None)
+        if cached and cached[0] == token:
+            return cached[1]
+        users = {
+            i[0]: dict(zip(MultiDBBackend.scenario_fields, i[1:]))
+            for i in User.objects.using(scenario.name)
+            .filter(is_active=True)
+            .values_list("username", *MultiDBBackend.scenario_fields)
+        }
+        cache.set(key, (token, users), timeout=settings.CACHE_SCENARIO_USERS)
+        return users
+
+    @staticmethod
+    def clearScenarioUsers(database):
+        """
+        Invalidates the cached users of a scenario in all processes.
+        The users version is incremented after the current transaction is
+        committed, so no process can cache the old users with the new version.
+        """
+        cache.delete("scenariousers_%s" % database)
+
+        def bump():
+            try:
+                Scenario.objects.using(DEFAULT_DB_ALIAS).filter(name=database).update(
+                    usersversion=F("usersversion") + 1
+                )
+            except Exception as e:
+                logger.error("Error updating the users version: %s" % e)
+
+        transaction.on_commit(bump, using=database)
+
     @staticmethod
     def getScenarios(user):
         # Populate a dictionary with scenarios in which the user is active, and
@@ -66,30 +121,18 @@ class MultiDBBackend(ModelBackend):
                 db.description = db.name
             if db.name == DEFAULT_DB_ALIAS:
                 if user.is_active:
-                    db.is_superuser = user.is_superuser
-                    db.horizonlength = user.horizonlength
-                    db.horizonbefore = user.horizonbefore
-                    db.horizontype = user.horizontype
-                    db.horizonbuckets = user.horizonbuckets
-                    db.horizonstart = user.horizonstart
-                    db.horizonend = user.horizonend
-                    db.horizonunit = user.horizonunit
+                    for f in MultiDBBackend.scenario_fields:
+                        setattr(db, f, getattr(user, f))
                     user.scenarios.append(db)
             else:
                 try:
-                    user2 = User.objects.using(db.name).get(username=user.username)
-                    if user2.is_active:
-                        db.is_superuser = user2.is_superuser
-                        db.horizonlength = user2.horizonlength
-                        db.horizonbefore = user2.horizonbefore
-                        db.horizontype = user2.horizontype
-                        db.horizonbuckets = user2.horizonbuckets
-                        db.horizonstart = user2.horizonstart
-                        db.horizonend = user2.horizonend
-                        db.horizonunit = user2.horizonunit
+                    user2 = MultiDBBackend.getScenarioUsers(db).get(user.username, None)
+                    if user2:
+                        for f, v in user2.items():
+                            setattr(db, f, v)
                         user.scenarios.append(db)
                 except Exception:
-                    # Silently ignore errors. Eg user doesn't exist in scenario
+                    # Silently ignore errors. Eg scenario database isn't available
                     pass
 
     def authenticate(self, request, username=None, password=None):
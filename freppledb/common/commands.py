@@ -21,15 +21,18 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
 import io
 from importlib import import_module
+import json
 from operator import attrgetter
 import os
 import sys
 import site
 import logging
-from threading import Thread
+import struct
+from threading import Condition, Lock, Thread
 
 
 if __name__ == "__main__":
@@ -95,8 +98,10 @@ if __name__ == "__main__":
 
 from django.conf import settings
 from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
 from django.utils.encoding import force_str
 
+from freppledb.common.models import Parameter
 from freppledb.execute.models import Task
 
 logger = logging.getLogger(__name__)
@@ -159,6 +164,129 @@ class CopyFromGenerator(io.TextIOBase):
         return "".join(line)
 
 
+def _encodeNumeric(value):
+    if not isinstance(value, Decimal):
+        value = Decimal(repr(value) if isinstance(value, float) else value)
+    sign, digits, exp = value.as_tuple()
+    if not isinstance(exp, int):
+        raise ValueError("Can't export value %s" % value)
+    dscale = max(0, -exp)
+    number = int("".join(str(d) for d in digits) or "0")
+    if exp > 0:
+        number *= 10**exp
+        exp = 0
+    # Align the number to groups of 4 decimal digits
+    fractiongroups = (3 - exp) // 4
+    number *= 10 ** (fractiongroups * 4 + exp)
+    groups = []
+    while number:
+        number, rest = divmod(number, 10000)
+        groups.append(rest)
+    groups.reverse()
+    weight = len(groups) - fractiongroups - 1
+    while groups and not groups[-1]:
+        groups.pop()
+    return struct.pack(
+        "!hhHH%dH" % len(groups),
+        len(groups),
+        weight if groups else 0,
+        0x4000 if sign and groups else 0,
+        dscale,
+        *groups,
+    )
+
+
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _encodeTimestamp(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    delta = value - _PG_EPOCH
+    return struct.pack(
+        "!q", (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    )
+
+
+def _encodeInterval(value):
+    if isinstance(value, timedelta):
+        usec = (value.days * 86400 + value.seconds) * 1000000 + value.microseconds
+    else:
+        # Number of seconds
+        usec = round(float(value) * 1000000)
+    return struct.pack("!qii", usec, 0, 0)
+
+
+class CopyBinaryGenerator(io.RawIOBase):
+    """
+    File-like object to export data to PostgreSQL over a copy command
+    in binary format.
+
+    The iterator returns tuples with Python values, and the types argument
+    specifies the PostgreSQL type of each column. Sending the values in their
+    binary representation avoids formatting them as text in Python and
+    parsing them again in the database.
+
+    Usage:
+      cursor.copy_expert(
+         "copy mytable (col1, col2) from stdin with (format binary)",
+         CopyBinaryGenerator(itr, ("varchar", "numeric")),
+         size=settings.COPY_BUFFER_SIZE
+         )
+    """
+
+    encoders = {
+        "varchar": lambda v: str(v).encode("utf-8"),
+        "numeric": _encodeNumeric,
+        "integer": lambda v: struct.pack("!i", int(v)),
+        "boolean": lambda v: b"\x01" if v else b"\x00",
+        "timestamptz": _encodeTimestamp,
+        "date": lambda v: struct.pack("!i", (v - date(2000, 1, 1)).days),
+        "time": lambda v: struct.pack(
+            "!q",
+            ((v.hour * 60 + v.minute) * 60 + v.second) * 1000000 + v.microsecond,
+        ),
+        "interval": _encodeInterval,
+        "jsonb": lambda v: b"\x01" + v.encode("utf-8"),
+    }
+
+    def __init__(self, itr, types):
+        self._iter = itr
+        self._encoders = [self.encoders[t] for t in types]
+        self._fieldcount = struct.pack("!h", len(types))
+        # File header: signature, flags and header extension length
+        self._buff = bytearray(b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0))
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _encode(self, row):
+        out = [self._fieldcount]
+        for encoder, value in zip(self._encoders, row):
+            if value is None:
+                out.append(b"\xff\xff\xff\xff")
+            else:
+                data = encoder(value)
+                out.append(struct.pack("!i", len(data)))
+                out.append(data)
+        return b"".join(out)
+
+    def readinto(self, b):
+        n = len(b)
+        while len(self._buff) < n and not self._done:
+            try:
+                self._buff.extend(self._encode(next(self._iter)))
+            except StopIteration:
+                # File trailer
+                self._buff.extend(b"\xff\xff")
+                self._done = True
+        cnt = min(n, len(self._buff))
+        b[:cnt] = self._buff[:cnt]
+        del self._buff[:cnt]
+        return cnt
+
+
 class PlanTask:
     """
     Base class for steps in the plan generation process
@@ -170,6 +298,12 @@ class PlanTask:
     label = None
     export = False
 
+    # Tasks that need to finish before this one can start.
+    # When set (also when set to an empty tuple), the task can run in parallel
+    # with the neighbouring tasks that also declare their dependencies.
+    # A value None means the task needs all previous steps to be finished.
+    dependencies = None
+
     # Fields for internal use
     task = None
     thread = "main"
@@ -212,6 +346,9 @@ class PlanTaskSequence(PlanTask):
 
     export = True
 
+    # Maximum number of threads to run tasks with dependencies
+    threads = 1
+
     def __init__(self):
         self.steps = []
 
@@ -239,46 +376,29 @@ class PlanTaskSequence(PlanTask):
         # Execute all tasks in the list
         try:
             progress = 0
-            for step in self.steps:
-                if step.weight is None or step.weight <= 0:
-                    continue
+            steps = [s for s in self.steps if s.weight is not None and s.weight > 0]
+            idx = 0
+            while idx < len(steps):
+                # Collect the tasks we can run in parallel
+                batch = [steps[idx]]
+                idx += 1
+                if self.threads > 1 and batch[0].dependencies is not None:
+                    while idx < len(steps) and steps[idx].dependencies is not None:
+                        batch.append(steps[idx])
+                        idx += 1
 
                 # Update status and message
                 if self.task:
                     self.task.status = "%d%%" % int(progress * 100.0 / task_weight)
-                    self.task.message = step.description
+                    self.task.message = batch[0].description
                     self.task.save(using=database)
 
-                # Run the step
-                stepstart = datetime.now()
-                if step.thread == "main":
-                    logger.info(
-                        "Start step %s '%s'"
-                        % (
-                            step.sequence,
-                            step.description,
-                        )
-                    )
+                # Run the step(s)
+                if len(batch) > 1:
+                    self._runDependencies(batch)
                 else:
-                    logger.info(
-                        "Start step %s %s '%s'"
-                        % (
-                            step.thread,
-                            step.step,
-                            step.description,
-                        )
-                    )
-                step.timestamp = self.timestamp
-                step.run(**PlanTaskRegistry.getArguments())
-                logger.info(
-                    "Finished '%s' in %s %s"
-                    % (
-                        step.description,
-                        str(datetime.now() - stepstart).split(".")[0],
-                        "\n" if self.task else "",
-                    )
-                )
-                progress += step.weight
+                    self._runStep(batch[0])
+                progress += sum(s.weight for s in batch)
 
             # Final task status
             if self.task:
@@ -294,6 +414,104 @@ class PlanTaskSequence(PlanTask):
                 self.task.save(using=database)
             raise
 
+    def _runStep(self, step):
+        stepstart = datetime.now()
+        if step.thread == "main":
+            logger.info(
+                "Start step %s '%s'"
+                % (
+                    step.sequence,
+                    step.description,
+                )
+            )
+        else:
+            logger.info(
+                "Start step %s %s '%s'"
+                % (
+                    step.thread,
+                    step.step,
+                    step.description,
+                )
+            )
+        step.timestamp = self.timestamp
+        step.run(**PlanTaskRegistry.getArguments())
+        duration = datetime.now() - stepstart
+        logger.info(
+            "Finished '%s' in %s %s"
+            % (
+                step.description,
+                str(duration).split(".")[0],
+                "\n" if self.task else "",
+            )
+        )
+        PlanTaskRegistry.recordTiming(step, duration)
+
+    def _runDependencies(self, batch, dependencies=None):
+        """
+        Runs a list of tasks in a pool of threads. A task is started as
+        soon as all tasks it depends on are finished.
+
+        The dependencies argument is an optional dictionary that maps the
+        sequence of a task to the tasks it depends on. By default the
+        dependencies attribute of the tasks is used.
+
+        The database queries of the tasks run concurrently. The calls to the
+        frePPLe engine remain serialized, because the engine holds the Python
+        global interpreter lock while creating objects.
+        """
+        todo = list(batch)
+        sequences = {s.sequence for s in batch}
+        running = {}
+        finished = set()
+        errors = []
+        condition = Condition()
+
+        def worker(step):
+            try:
+                self._runStep(step)
+            except Exception as e:
+                logger.error("Exception caught in step %s: %s" % (step.sequence, e))
+                errors.append(e)
+            finally:
+                connections.close_all()
+                with condition:
+                    finished.add(step.sequence)
+                    condition.notify()
+
+        with condition:
+            while todo or running:
+                # Start all tasks that are ready to run
+                for step in list(todo):
+                    if errors or len(running) >= self.threads:
+                        break
+                    if all(
+                        d.sequence in finished or d.sequence not in sequences
+                        for d in (
+                            dependencies[step.sequence]
+                            if dependencies
+                            else step.dependencies
+                        )
+                    ):
+                        todo.remove(step)
+                        running[step.sequence] = Thread(
+                            target=worker, args=(step,), name=str(step.sequence)
+                        )
+                        running[step.sequence].start()
+                if errors:
+                    todo = []
+                elif todo and not running:
+                    raise Exception(
+                        "Circular dependencies between steps %s"
+                        % ", ".join(str(s.sequence) for s in todo)
+                    )
+                if running:
+                    # Wait for a task to finish
+                    condition.wait()
+                    for seq in [i for i in running if i in finished]:
+                        running.pop(seq).join()
+        if errors:
+            raise errors[0]
+
     def display(self, indentlevel=0, **kwargs):
         for i in self.steps:
             i.weight = i.getWeight(**kwargs)
@@ -351,6 +569,11 @@ class PlanTaskParallel(PlanTask):
 
     export = True
 
+    # When true, every task runs in a dedicated thread with its own database
+    # connection. Tasks in the same group still run in sequence, unless they
+    # explicitly declare the tasks they depend on.
+    threadPerTask = False
+
     class _PlanTaskThread(Thread):
         def __init__(self, seq, name, **kwargs):
             super().__init__()
@@ -383,6 +606,9 @@ class PlanTaskParallel(PlanTask):
         return longest
 
     def run(self, **kwargs):
+        if self.threadPerTask:
+            self._runPerTask()
+            return
         threads = []
         for threadname, g in self.groups.items():
             g.timestamp = self.timestamp
@@ -401,6 +627,28 @@ class PlanTaskParallel(PlanTask):
                 logger.error("Exception caught on thread %s" % t.name)
                 raise t.exception
 
+    def _runPerTask(self):
+        batch = []
+        dependencies = {}
+        for g in self.groups.values():
+            if g.weight is None or g.weight < 0:
+                continue
+            g.getWeight(**PlanTaskRegistry.getArguments())
+            previous = None
+            for s in g.steps:
+                if s.weight is None or s.weight <= 0:
+                    continue
+                if s.dependencies is not None:
+                    dependencies[s.sequence] = s.dependencies
+                else:
+                    dependencies[s.sequence] = (previous,) if previous else ()
+                batch.append(s)
+                previous = s
+        seq = PlanTaskSequence()
+        seq.timestamp = self.timestamp
+        seq.threads = len(batch)
+        seq._runDependencies(batch, dependencies)
+
     def display(self, indentlevel=0, **kwargs):
         for threadname, g in self.groups.items():
             g.weight = g.getWeight(**kwargs)
@@ -434,6 +682,11 @@ class PlanTaskRegistry:
     reg = PlanTaskSequence()
     arguments = {}
 
+    # Name of a file where the duration of every step is appended to, as a
+    # JSON record per line. It is used by the benchmark command.
+    timings = os.environ.get("FREPPLE_TIMINGS", None)
+    timingsLock = Lock()
+
     @classmethod
     def addArguments(cls, **kwargs):
         cls.arguments.update(kwargs)
@@ -489,6 +742,24 @@ class PlanTaskRegistry:
                 task.description = task.description[1]
         return task
 
+    @classmethod
+    def recordTiming(cls, step, duration):
+        if not cls.timings:
+            return
+        with cls.timingsLock:
+            with open(cls.timings, "a", encoding="utf-8") as f:
+                f.write(
+                    json.dumps(
+                        {
+                            "sequence": step.sequence,
+                            "description": str(step.description),
+                            "export": cls.arguments.get("export", False),
+                            "seconds": round(duration.total_seconds(), 3),
+                        }
+                    )
+                    + "\n"
+                )
+
     @classmethod
     def getTask(cls, sequence=None):
         return cls.reg._find(sequence)
@@ -551,6 +822,19 @@ class PlanTaskRegistry:
                 sys.exit(2)
         cls.arguments = {"database": database, "export": export, "cluster": cluster}
         cls.arguments.update(kwargs)
+        if export:
+            cls.reg.threads = 1
+        else:
+            try:
+                cls.reg.threads = max(
+                    int(Parameter.getValue("plan.loadThreads", database, 1)), 1
+                )
+            except ValueError:
+                cls.reg.threads = 1
+        PlanTaskParallel.threadPerTask = (
+            Parameter.getValue("plan.exportThreadPerTable", database, "false").lower()
+            == "true"
+        )
         cls.reg.timestamp = datetime.now().replace(microsecond=0)
         cls.reg.run(**cls.arguments)
         if export:
@@ -21,17 +21,22 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+from hashlib import sha1
 from importlib import import_module
 import logging
 
 from django.conf import settings
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
 from django.http import (
+    HttpResponse,
     HttpResponseNotAllowed,
     HttpResponseForbidden,
     HttpResponseServerError,
 )
+from django.utils.translation import get_language
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +61,8 @@ class Dashboard:
         client browser.
         It should return HTML content for synchronous widgets.
         It should return a Django response object for asynchronous widgets.
+        - Class attribute 'cache' specifies whether the result of an asynchronous
+        widget can be cached till the plan changes.
     """
 
     __registry__ = {}
@@ -97,11 +104,63 @@ class Dashboard:
                 return HttpResponseServerError("This widget is synchronous")
             if not w.has_permission(request.user):
                 return HttpResponseForbidden()
-            return w.render(request)
+            cache_key = w.getCacheKey(request)
+            if cache_key:
+                cache_val = cache.get(cache_key, None)
+                if cache_val:
+                    return HttpResponse(cache_val[0], content_type=cache_val[1])
+            response = w.render(request)
+            if cache_key and response.status_code == 200 and not response.streaming:
+                cache.set(
+                    cache_key,
+                    (response.content, response.get("Content-Type")),
+                    timeout=settings.CACHE_WIDGET,
+                )
+            return response
         except Exception as e:
             logger.error("Exception rendering widget %s: %s" % (w.name, e))
             return HttpResponseServerError("Server error")
 
+    @staticmethod
+    def getPlanVersion(database=DEFAULT_DB_ALIAS):
+        """
+        Returns a number that changes every time the plan or the data of
+        a scenario are updated, or None when it isn't available.
+        """
+        try:
+            with connections[database].cursor() as cursor:
+                cursor.execute("select last_value from common_planversion")
+                return cursor.fetchone()[0]
+        except Exception:
+            return None
+
+    @staticmethod
+    def planChanged(database=DEFAULT_DB_ALIAS):
+        """
+        Invalidates the cached widget results of a scenario.
+        The version is updated after the current transaction is committed, so
+        a widget can't cache results computed from the old data with the new
+        version.
+        The version is based on the clock, which keeps it unique when a
+        scenario is overwritten with a copy of another scenario.
+        """
+
+        def bump():
+            try:
+                with connections[database].cursor() as cursor:
+                    cursor.execute(
+                        """
+                        select setval('common_planversion', greatest(
+                          nextval('common_planversion'),
+                          (extract(epoch from clock_timestamp()) * 1000000)::bigint
+                          ))
+                        """
+                    )
+            except Exception as e:
+                logger.error("Error updating the plan version: %s" % e)
+
+        transaction.on_commit(bump, using=database)
+
     @classmethod
     def createWidgetPermissions(cls, app):
         # Registered all permissions defined by dashboard widgets
@@ -145,6 +204,10 @@ class Widget:
         It returns a HTTPResponse object for asynchronous widgets.
         - Class attribute 'url' optionally defines a url to a report with a more
         complete content than can be displayed in the dashboard widget.
+        - Class attribute 'cache' enables caching the result of an asynchronous
+        widget till the plan changes. Only use it for widgets that only depend
+        on the database content, the url arguments and the horizon preferences
+        of the user.
     """
 
     name = "Undefined"
@@ -158,6 +221,7 @@ class Widget:
     javascript = ""  # Javascript called for rendering the widget
     javascript_before_repeat = ""  # Javascript called before a refresh in repeat mode
     javascript_after_repeat = ""  # Javascript called after a refresh in repeat mode
+    cache = False  # Cache the result till the plan changes
 
     def __init__(self, **options):
         # Store all options as attributes on the instance
@@ -174,6 +238,44 @@ class Widget:
                 return False
         return True
 
+    @classmethod
+    def getCacheKey(cls, request):
+        """
+        Return the key to cache the result of the widget, or None when the
+        result can't be cached.
+        """
+        if not cls.cache or cls.repeat or not settings.CACHE_WIDGET:
+            return None
+        version = Dashboard.getPlanVersion(request.database)
+        if version is None:
+            return None
+        return "widget_%s" % (
+            sha1(
+                str(
+                    (
+                        request.database,
+                        cls.name,
+                        version,
+                        sorted(request.GET.lists()),
+                        request.prefix,
+                        get_language(),
+                        tuple(
+                            getattr(request.user, f, None)
+                            for f in (
+                                "horizonbuckets",
+                                "horizonstart",
+                                "horizonend",
+                                "horizontype",
+                                "horizonlength",
+                                "horizonbefore",
+                                "horizonunit",
+                            )
+                        ),
+                    )
+                ).encode("utf8")
+            ).hexdigest(),
+        )
+
     @classmethod
     def getAppLabel(cls):
         """
@@ -21,21 +21,25 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-from datetime import timedelta, datetime
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from logging import INFO, ERROR, WARNING, DEBUG
 from openpyxl.worksheet.cell_range import CellRange
 from openpyxl.worksheet.worksheet import Worksheet
+import json
 import unicodedata
 
 from django import forms
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.core.validators import EMPTY_VALUES
-from django.db import DEFAULT_DB_ALIAS
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.models import JSONField, UniqueConstraint
 from django.db.models.fields import (
     IntegerField,
     AutoField,
+    AutoFieldMixin,
     DurationField,
     BooleanField,
     DecimalField,
@@ -48,6 +52,7 @@ from django.db.models.fields import (
     NOT_PROVIDED,
 )
 from django.db.models.fields.related import RelatedField
+from django.db.models.signals import pre_save, post_save
 from django.forms.models import modelform_factory
 from django.utils import translation
 from django.utils.translation import get_language, gettext_lazy as _
@@ -55,7 +60,9 @@ from django.utils.encoding import force_str
 from django.utils.formats import get_format
 from django.utils.text import get_text_list
 
-from .models import Comment
+from .commands import CopyFromGenerator, clean_value
+from .dashboard import Dashboard
+from .models import AuditModel, Comment, Parameter
 from .localization import parseLocalizedDateTime
 
 
@@ -418,6 +425,7 @@ def _parseData(
     errors = 0
     warnings = 0
     has_pk_field = False
+    bulk = None
     processed_header = False
     rowWrapper = rowmapper()
 
@@ -558,6 +566,15 @@ def _parseData(
                 ):
                     natural_key = model.natural_key
 
+            # Use the bulk upload when it gives the same results
+            if (
+                (has_pk_field or natural_key)
+                and Parameter.getValue("upload.bulk", database, "true").lower()
+                == "true"
+                and BulkUpload.supports(model, headers)
+            ):
+                bulk = BulkUpload(model, headers, user, database, content_type_id)
+
         # Case 3: Process a data row
         else:
             try:
@@ -566,6 +583,13 @@ def _parseData(
                     if rownumber % 50 == 0:
                         yield (DEBUG, rownumber, None, None, None)
 
+                # Bulk upload: validate the row and write it later in a batch
+                if bulk:
+                    for error in bulk.add(rownumber, rowWrapper):
+                        errors += 1
+                        yield error
+                    continue
+
                 # Step 2: Fill the form with data, either updating an existing
                 # instance or creating a new one.
                 if has_pk_field:
@@ -663,6 +687,20 @@ def _parseData(
                 errors += 1
                 yield (ERROR, None, None, None, "Exception during upload: %s" % e)
 
+    if bulk:
+        try:
+            for error in bulk.flush():
+                errors += 1
+                yield error
+        except Exception as e:
+            errors += 1
+            yield (ERROR, None, None, None, "Exception during upload: %s" % e)
+        added += bulk.added
+        changed += bulk.changed
+
+    if added or changed:
+        Dashboard.planChanged(database)
+
     yield (
         INFO,
         None,
@@ -740,3 +778,454 @@ class BulkForeignKeyFormField(forms.fields.Field):
 
     def has_changed(self, initial, data):
         return initial != data
+
+
+class BulkUpload:
+    """
+    Bulk variant of the upload of data rows, used for models that don't have
+    any custom form, save or signal logic.
+
+    The rows are validated with the form field of each column, and with the
+    clean methods of the model when it defines them. Valid rows are then
+    written in batches:
+      - the existing records of a batch are read with a single query
+      - new and changed records are copied into a staging table
+      - an "insert ... on conflict" statement merges the staging table
+        into the model table, and new records of models with an automatic
+        primary key are inserted with a separate statement
+      - the audit comments of the batch are inserted with a single statement
+
+    Records are matched on the primary key. When the model has an automatic
+    primary key and the data doesn't contain it, records are matched on the
+    natural key instead, as the form based upload does.
+    The error messages per row are the same as the form based upload.
+    """
+
+    batchsize = 1000
+
+    def __init__(self, model, headers, user, database, content_type_id):
+        self.model = model
+        self.user = user
+        self.database = database
+        self.content_type_id = content_type_id
+        self.fields = [i for i in headers if i]
+        self.pk = model._meta.pk
+        self.autopk = isinstance(self.pk, AutoFieldMixin)
+        self.formfields = {
+            i.name: (
+                forms.IntegerField(required=False)
+                if i == self.pk and self.autopk
+                else (
+                    BulkForeignKeyFormField(field=i, using=database)
+                    if isinstance(i, RelatedField)
+                    else i.formfield(localize=True)
+                )
+            )
+            for i in self.fields
+        }
+        self.selfReferencing = [
+            i for i in self.fields if i.remote_field and i.remote_field.model == model
+        ]
+        self.natural_key = (
+            [model._meta.get_field(i) for i in model._meta.unique_together[0]]
+            if self.autopk
+            else []
+        )
+        # Models with their own validation logic
+        self.validate = (
+            model.clean is not models.Model.clean
+            or model.clean_fields is not models.Model.clean_fields
+        )
+        self.exclude = [i.name for i in model._meta.fields if i not in self.fields]
+        self.columns = model._meta.concrete_fields
+        self.table = model._meta.db_table
+        self.stagingtable = "tmp_upload_%s" % self.table
+        self.rows = {}
+        self.keys = set()
+        self.added = 0
+        self.changed = 0
+
+    @staticmethod
+    def supports(model, headers):
+        """
+        Returns true when the bulk upload gives the same result as the form
+        based upload.
+        """
+        pk = model._meta.pk
+        autopk = isinstance(pk, AutoFieldMixin)
+        fields = [i for i in headers if i]
+        if (
+            hasattr(model, "getModelForm")
+            or model.save not in (models.Model.save, AuditModel.save)
+            or model._meta.parents
+            or pre_save.has_listeners(model)
+            or post_save.has_listeners(model)
+            or pk.remote_field
+        ):
+            return False
+        if autopk:
+            # Records are matched on the natural key
+            if (
+                len(model._meta.unique_together) != 1
+                or not hasattr(model, "natural_key")
+                or not hasattr(model.objects, "get_by_natural_key")
+            ):
+                return False
+            natural_key = set(model._meta.unique_together[0])
+            for c in model._meta.constraints:
+                # Partial unique indexes on the natural key
+                if not isinstance(c, UniqueConstraint) or not natural_key.issuperset(
+                    c.fields
+                ):
+                    return False
+        elif model._meta.unique_together or model._meta.constraints or pk not in fields:
+            return False
+        for i in model._meta.concrete_fields:
+            if i.remote_field and i.remote_field.model == model and autopk:
+                return False
+            if i.unique and i != pk:
+                return False
+            if (
+                i not in fields
+                and i != pk
+                and not i.null
+                and not i.has_default()
+                and not i.empty_strings_allowed
+                and i.name != "lastmodified"
+            ):
+                return False
+        return True
+
+    @staticmethod
+    def _dbValue(field, value):
+        if isinstance(value, models.Model):
+            return value.pk
+        return value
+
+    @staticmethod
+    def _copyValue(field, value):
+        if value is None:
+            return "\\N"
+        elif isinstance(value, bool):
+            return "t" if value else "f"
+        elif isinstance(value, timedelta):
+            return "%s seconds" % value.total_seconds()
+        elif isinstance(value, (datetime, date, time)):
+            return value.isoformat()
+        elif isinstance(field, JSONField):
+            return clean_value(json.dumps(value, cls=field.encoder))
+        else:
+            return clean_value(str(value))
+
+    def add(self, rownumber, row):
+        """
+        Validates a data row and adds it to the current batch.
+        Returns the list of validation errors of the row, and of the batch
+        when it is written.
+        """
+        errors = []
+        for i in self.selfReferencing:
+            if row[i.name] in self.rows:
+                # The referenced record needs to be written first
+                errors.extend(self.flush())
+                break
+        values = {}
+        rowerrors = []
+        for i in self.fields:
+            try:
+                val = self.formfields[i.name].clean(row[i.name])
+                if not isinstance(i, RelatedField):
+                    i.run_validators(val)
+                values[i.name] = val
+            except ValidationError as e:
+                for error in e.messages:
+                    rowerrors.append((ERROR, rownumber, i.name, row[i.name], error))
+        if rowerrors:
+            return errors + rowerrors
+        if self.autopk:
+            obj = self.model(**{k: v for k, v in values.items() if k != self.pk.name})
+            natkey = tuple(self._dbValue(None, i) for i in obj.natural_key())
+            key = values.get(self.pk.name, None) or natkey
+        else:
+            natkey = None
+            key = values[self.pk.name]
+        if key in self.rows or natkey in self.keys:
+            # A record appears twice: it is compared with the first one
+            errors.extend(self.flush())
+        self.rows[key] = (
+            rownumber,
+            {i.name: row[i.name] for i in self.fields},
+            values,
+            natkey,
+        )
+        if natkey:
+            self.keys.add(natkey)
+        if len(self.rows) >= self.batchsize:
+            errors.extend(self.flush())
+        return errors
+
+    def _instance(self, old, values):
+        """
+        Returns a model instance with the existing data and uploaded data.
+        """
+        obj = self.model(**(old or {}))
+        for i in self.fields:
+            if i != self.pk or not self.autopk:
+                setattr(obj, i.name, values[i.name])
+        obj._state.adding = not old
+        obj._state.db = self.database
+        return obj
+
+    def _validate(self, rownumber, raw, obj, unique=False):
+        """
+        Runs the validation of the model, and returns the errors.
+        """
+        errors = []
+        try:
+            if unique:
+                obj.validate_unique(exclude=self.exclude)
+                raise ValidationError(
+                    obj.unique_error_message(
+                        self.model, tuple(i.name for i in self.natural_key)
+                    )
+                )
+            obj.full_clean(
+                exclude=self.exclude, validate_unique=False, validate_constraints=False
+            )
+        except ValidationError as e:
+            for field, messages in (
+                e.message_dict
+                if hasattr(e, "error_dict")
+                else {NON_FIELD_ERRORS: e.messages}
+            ).items():
+                for error in messages:
+                    if field == NON_FIELD_ERRORS or field not in raw:
+                        errors.append((ERROR, rownumber, None, None, error))
+                    else:
+                        errors.append((ERROR, rownumber, field, raw[field], error))
+        except Exception as e:
+            errors.append((ERROR, None, None, None, "Exception during upload: %s" % e))
+        return errors
+
+    def flush(self):
+        """
+        Writes the new and changed records of the current batch.
+        Returns the list of validation errors of the batch.
+        """
+        errors = []
+        if not self.rows:
+            return errors
+        rows = self.rows
+        self.rows = {}
+        self.keys = set()
+
+        # Read the existing records with a single query
+        attnames = [self.pk.attname]
+        for i in self.columns if self.validate else self.natural_key + self.fields:
+            if i.attname not in attnames:
+                attnames.append(i.attname)
+        if self.autopk:
+            filter = models.Q(
+                pk__in=[
+                    r[2][self.pk.name] for r in rows.values() if r[2].get(self.pk.name)
+                ]
+            )
+            first = self.natural_key[0].attname
+            firstvalues = set(r[3][0] for r in rows.values())
+            filter |= models.Q(**{"%s__in" % first: firstvalues - {None}})
+            if None in firstvalues:
+                filter |= models.Q(**{"%s__isnull" % first: True})
+        else:
+            filter = models.Q(pk__in=rows.keys())
+        existing = list(
+            self.model.objects.using(self.database).filter(filter).values(*attnames)
+        )
+        by_pk = {rec[self.pk.attname]: rec for rec in existing}
+        by_key = {
+            tuple(rec[i.attname] for i in self.natural_key): rec for rec in existing
+        }
+
+        # Compare with the uploaded data
+        now = datetime.now()
+        defaults = {
+            i.attname: (
+                now if i.name == "lastmodified" else self._dbValue(i, i.get_default())
+            )
+            for i in self.columns
+        }
+        records = []
+        accepted = []
+        for key, (rownumber, raw, values, natkey) in rows.items():
+            if not self.autopk:
+                old = by_pk.get(key, None)
+            elif self.pk in self.fields:
+                # Match on the primary key, and check the natural key is unique
+                old = by_pk.get(values[self.pk.name], None)
+                natkey = tuple(
+                    (natkey[idx] if i in self.fields or not old else old[i.attname])
+                    for idx, i in enumerate(self.natural_key)
+                )
+                other = by_key.get(natkey, None)
+                if other and other is not old:
+                    errors.extend(
+                        self._validate(
+                            rownumber, raw, self._instance(old, values), unique=True
+                        )
+                    )
+                    continue
+            else:
+                # Match on the natural key
+                old = by_key.get(natkey, None)
+            if old:
+                changed_data = [
+                    i.name
+                    for i in self.fields
+                    if i != self.pk
+                    and self._dbValue(i, values[i.name]) != old[i.attname]
+                ]
+                if not changed_data:
+                    continue
+            else:
+                changed_data = None
+            rec = defaults.copy()
+            if self.validate:
+                # The clean methods of the model can update the data
+                obj = self._instance(old, values)
+                rowerrors = self._validate(rownumber, raw, obj)
+                if rowerrors:
+                    errors.extend(rowerrors)
+                    continue
+                for i in self.fields:
+                    rec[i.attname] = getattr(obj, i.attname)
+            else:
+                for i in self.fields:
+                    rec[i.attname] = self._dbValue(i, values[i.name])
+            for idx, i in enumerate(self.natural_key):
+                rec[i.attname] = natkey[idx]
+            if self.autopk:
+                rec[self.pk.attname] = old[self.pk.attname] if old else None
+            records.append(rec)
+            accepted.append((rec, values, changed_data))
+        if not records:
+            return errors
+
+        # Copy the records in a staging table and merge it in the model table
+        columns = [i.column for i in self.columns]
+        updated = [i.column for i in self.fields if i != self.pk]
+        updated.extend(i.column for i in self.natural_key if i.column not in updated)
+        if "lastmodified" in columns:
+            updated.append("lastmodified")
+        quote = connections[self.database].ops.quote_name
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(
+                """
+                create temporary table if not exists %s as
+                select %s from %s with no data
+                """
+                % (
+                    self.stagingtable,
+                    ",".join(quote(c) for c in columns),
+                    self.table,
+                )
+            )
+            cursor.execute("truncate table %s" % self.stagingtable)
+            cursor.copy_from(
+                CopyFromGenerator(
+                    "%s\n"
+                    % "\v".join(
+                        self._copyValue(i, rec[i.attname]) for i in self.columns
+                    )
+                    for rec in records
+                ),
+                self.stagingtable,
+                columns=columns,
+                size=settings.COPY_BUFFER_SIZE,
+                sep="\v",
+            )
+            cursor.execute(
+                """
+                insert into %s (%s)
+                select %s from %s
+                where %s is not null
+                on conflict (%s) do %s
+                """
+                % (
+                    self.table,
+                    ",".join(quote(c) for c in columns),
+                    ",".join(quote(c) for c in columns),
+                    self.stagingtable,
+                    quote(self.pk.column),
+                    quote(self.pk.column),
+                    (
+                        "update set %s"
+                        % ", ".join(
+                            "%s = excluded.%s" % (quote(c), quote(c)) for c in updated
+                        )
+                        if updated
+                        else "nothing"
+                    ),
+                )
+            )
+            if self.autopk:
+                # New records get a primary key from the sequence
+                inserted = [c for c in columns if c != self.pk.column]
+                cursor.execute(
+                    """
+                    insert into %s (%s)
+                    select %s from %s
+                    where %s is null
+                    returning %s, %s
+                    """
+                    % (
+                        self.table,
+                        ",".join(quote(c) for c in inserted),
+                        ",".join(quote(c) for c in inserted),
+                        self.stagingtable,
+                        quote(self.pk.column),
+                        quote(self.pk.column),
+                        ",".join(quote(i.column) for i in self.natural_key),
+                    )
+                )
+                newkeys = {tuple(rec[1:]): rec[0] for rec in cursor.fetchall()}
+                for rec in records:
+                    if rec[self.pk.attname] is None:
+                        rec[self.pk.attname] = newkeys.get(
+                            tuple(rec[i.attname] for i in self.natural_key), None
+                        )
+
+        # Register the new records for references in the next batches
+        comments = []
+        for rec, values, changed_data in accepted:
+            obj = self.model(**rec)
+            for i in self.fields:
+                if i != self.pk:
+                    setattr(obj, i.name, values[i.name])
+            for i in self.selfReferencing:
+                cache = self.formfields[i.name].cache
+                if cache is not None and obj.pk not in cache:
+                    cache[obj.pk] = obj
+            if changed_data is None:
+                self.added += 1
+            else:
+                self.changed += 1
+            if self.user:
+                comments.append(
+                    Comment(
+                        user_id=self.user.id,
+                        content_type_id=self.content_type_id,
+                        object_pk=obj.pk,
+                        object_repr=force_str(obj)[:200],
+                        type="change" if changed_data is not None else "add",
+                        comment=(
+                            "Changed %s." % get_text_list(changed_data, "and")
+                            if changed_data is not None
+                            else "Added"
+                        ),
+                    )
+                )
+        if comments:
+            Comment.objects.using(self.database).bulk_create(
+                comments, batch_size=self.batchsize
+            )
+            Comment.launchNotifications(self.database)
+        return errors
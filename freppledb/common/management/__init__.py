@@ -64,6 +64,13 @@ def removePermissions(sender, using=DEFAULT_DB_ALIAS, **kwargs):
     Permission.objects.all().using(using).filter(codename="view_permission").delete()
 
 
+def createSearchIndexes(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    from freppledb.admin import data_site
+
+    data_site.createSearchIndexes(sender.label, using)
+
+
 signals.post_migrate.connect(removePermissions)
 signals.post_migrate.connect(createExtraPermissions)
+signals.post_migrate.connect(createSearchIndexes)
 request_finished.connect(resetRequest)
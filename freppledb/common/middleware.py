@@ -36,7 +36,6 @@ from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages import info
 from django.middleware.locale import LocaleMiddleware as DjangoLocaleMiddleware
 from django.db import DEFAULT_DB_ALIAS
-from django.db.models import Q
 from django.http import HttpResponseNotFound
 from django.http.response import (
     HttpResponse,
@@ -363,41 +362,7 @@ class AutoLoginAsAdminUser:
                 user = User.objects.get(username="admin")
                 user.backend = settings.AUTHENTICATION_BACKENDS[0]
                 login(request, user)
-                request.user.scenarios = []
-                for db in Scenario.objects.using(DEFAULT_DB_ALIAS).filter(
-                    Q(status="In use") | Q(name=DEFAULT_DB_ALIAS)
-                ):
-                    if not db.description:
-                        db.description = db.name
-                    if db.name == DEFAULT_DB_ALIAS:
-                        if request.user.is_active:
-                            db.is_superuser = request.user.is_superuser
-                            db.horizonlength = request.user.horizonlength
-                            db.horizonbefore = request.user.horizonbefore
-                            db.horizontype = request.user.horizontype
-                            db.horizonbuckets = request.user.horizonbuckets
-                            db.horizonstart = request.user.horizonstart
-                            db.horizonend = request.user.horizonend
-                            db.horizonunit = request.user.horizonunit
-                            request.user.scenarios.append(db)
-                    else:
-                        try:
-                            user2 = User.objects.using(db.name).get(
-                                username=request.user.username
-                            )
-                            if user2.is_active:
-                                db.is_superuser = user2.is_superuser
-                                db.horizonlength = user2.horizonlength
-                                db.horizonbefore = user2.horizonbefore
-                                db.horizontype = user2.horizontype
-                                db.horizonbuckets = user2.horizonbuckets
-                                db.horizonstart = user2.horizonstart
-                                db.horizonend = user2.horizonend
-                                db.horizonunit = user2.horizonunit
-                                request.user.scenarios.append(db)
-                        except Exception:
-                            # Silently ignore errors. Eg user doesn't exist in scenario
-                            pass
+                MultiDBBackend.getScenarios(request.user)
             except User.DoesNotExist:
                 pass
         return self.get_response(request)
@@ -31,6 +31,7 @@ import os
 from pathlib import Path
 from psycopg2.extras import execute_batch
 import sys
+from threading import get_ident, Lock
 import time
 
 from django.conf import settings
@@ -43,7 +44,7 @@ from django.core import mail
 from django.core.validators import FileExtensionValidator
 from django.db import models, DEFAULT_DB_ALIAS, connections, transaction
 from django.db.models import Q
-from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_delete, post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from django import forms
 from django.forms.models import modelform_factory
@@ -315,11 +316,114 @@ class Parameter(AuditModel):
     @staticmethod
     def getValue(key, database=DEFAULT_DB_ALIAS, default=None):
         try:
-            return Parameter.objects.using(database).only("value").get(pk=key).value
+            values = ParameterCache.getValues(database)
+            if values is None:
+                return Parameter.objects.using(database).only("value").get(pk=key).value
+            return values[key] if key in values else default
         except Exception:
             return default
 
 
+class ParameterCache:
+    """
+    A snapshot of the parameter table of a database, shared by all threads
+    of the process.
+
+    A trigger on the common_parameter table sends a notification on the
+    common_parameter channel. A connection listening on that channel is
+    polled before the snapshot is used, which doesn't need a round trip
+    to the database.
+    Changes made by this process are picked up from the model signals, or
+    from an explicit call to the invalidate method after raw SQL updates.
+    The notification arrives asynchronously, so these calls are also needed
+    to read the new value right after the change.
+    While those changes aren't committed, the snapshot isn't used by the
+    thread that made them.
+    """
+
+    _lock = Lock()
+    _databases = {}
+
+    def __init__(self, database):
+        self.database = database
+        self.values = None
+        # Threads with parameter changes that may not be committed yet
+        self.dirty = set()
+        self.listener = None
+        self.listener_name = None
+
+    @classmethod
+    def getValues(cls, database=DEFAULT_DB_ALIAS):
+        with cls._lock:
+            cache = cls._databases.get(database, None)
+            if not cache:
+                cache = cls._databases[database] = cls(database)
+            return cache.refresh()
+
+    @classmethod
+    def invalidate(cls, database=DEFAULT_DB_ALIAS):
+        with cls._lock:
+            cache = cls._databases.get(database, None)
+            if not cache:
+                cache = cls._databases[database] = cls(database)
+            cache.dirty.add(get_ident())
+            cache.values = None
+
+    def refresh(self):
+        conn = connections[self.database]
+        thread = get_ident()
+        if thread in self.dirty:
+            if conn.in_atomic_block:
+                return None
+            # Another thread can have read the snapshot before the commit
+            self.dirty.discard(thread)
+            self.values = None
+        if not self.listen(conn):
+            return None
+        if self.values is None:
+            with conn.cursor() as cursor:
+                cursor.execute("select name, value from common_parameter")
+                self.values = {i[0]: i[1] for i in cursor}
+        return self.values
+
+    def listen(self, conn):
+        # A forked process or a different database (eg when running the
+        # test suite) needs its own listener
+        name = (os.getpid(), conn.settings_dict["NAME"])
+        if self.listener_name != name or (self.listener and self.listener.closed):
+            self.values = None
+            self.listener = None
+            self.listener_name = name
+            try:
+                self.listener = conn.get_new_connection(conn.get_connection_params())
+                self.listener.autocommit = True
+                with self.listener.cursor() as cursor:
+                    cursor.execute("listen common_parameter")
+            except Exception as e:
+                logger.warning(
+                    "Parameters of %s aren't cached: %s" % (self.database, e)
+                )
+                self.listener = None
+        if not self.listener:
+            return False
+        try:
+            self.listener.poll()
+        except Exception:
+            # Reconnect on the next call
+            self.listener_name = None
+            self.values = None
+            return False
+        if self.listener.notifies:
+            del self.listener.notifies[:]
+            self.values = None
+        return True
+
+
+@receiver([post_save, post_delete], sender=Parameter)
+def parameter_changed(sender, instance, using, **kwargs):
+    ParameterCache.invalidate(using)
+
+
 class Scenario(models.Model):
     scenarioStatus = (("free", _("free")), ("in use", _("in use")), ("busy", _("busy")))
 
@@ -333,6 +437,8 @@ class Scenario(models.Model):
     )
     lastrefresh = models.DateTimeField(_("last refreshed"), null=True, editable=False)
     help_url = models.URLField("help", null=True, editable=False)
+    # Incremented when the users or their access rights change in the scenario
+    usersversion = models.BigIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -714,6 +820,13 @@ def delete_user(sender, instance, **kwargs):
     raise PermissionDenied
 
 
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, using, **kwargs):
+    from .auth import MultiDBBackend
+
+    MultiDBBackend.clearScenarioUsers(using)
+
+
 class Comment(models.Model):
     type_list = (
         ("add", _("Add")),
@@ -787,17 +900,27 @@ class Comment(models.Model):
             update_fields=update_fields,
         )
         if update_fields != ["processed"]:
-            req = getattr(_thread_locals, "request", None)
-            NotificationFactory.launchWorker(
-                database=using,
-                url=(
-                    "%s://%s" % ("https" if req.is_secure() else "http", req.get_host())
-                    if req
-                    else None
-                ),
-            )
+            self.launchNotifications(using)
         return tmp
 
+    @staticmethod
+    def launchNotifications(using=DEFAULT_DB_ALIAS):
+        """
+        Starts the worker that sends notifications to the followers of
+        the new comments.
+        """
+        from .middleware import _thread_locals
+
+        req = getattr(_thread_locals, "request", None)
+        NotificationFactory.launchWorker(
+            database=using,
+            url=(
+                "%s://%s" % ("https" if req.is_secure() else "http", req.get_host())
+                if req
+                else None
+            ),
+        )
+
     def attachmentlink(self):
         if self.attachment:
             return mark_safe(
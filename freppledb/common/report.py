@@ -59,8 +59,9 @@ from openpyxl.comments import Comment as CellComment
 from django.apps import apps
 from django.core.cache import cache
 from django.db import connection
-from django.db.models import Model, Lookup
+from django.db.models import F, Model, Lookup, Window
 from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.db.utils import DEFAULT_DB_ALIAS, load_backend, OperationalError
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_permission_codename
@@ -101,6 +102,7 @@ from freppledb.common.models import (
     HierarchyModel,
     NotificationFactory,
 )
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.dataload import parseExcelWorksheet, parseCSVdata
 from freppledb.common.localization import parseLocalizedDate, parseLocalizedDateTime
 
@@ -659,6 +661,15 @@ class GridReport(View):
     # display the duplication icon
     canDuplicate = True
 
+    # Retrieve a page by seeking from the last record of the previous page,
+    # rather than skipping all records of the previous pages.
+    # This is only used for reports without a "query" method.
+    keyset_pagination = False
+
+    # Set to a number of records to display an estimated record count for
+    # reports without filter, when the estimate is above this number.
+    approximate_count = False
+
     _attributes_added = False
 
     @classmethod
@@ -1544,6 +1555,10 @@ class GridReport(View):
         query = cls._apply_sort(request, request.query)
         if page:
             # Display a single page
+            if cls.keyset_pagination and not hasattr(cls, "query"):
+                rows = cls._keyset_page(request, query, fields, page)
+                if rows is not None:
+                    return rows
             cnt = (page - 1) * request.pagesize + 1
             if hasattr(cls, "query"):
                 return cls.query(request, query[cnt - 1 : cnt + request.pagesize])
@@ -1565,6 +1580,162 @@ class GridReport(View):
                     fields = [i.field_name for i in request.rows if i.field_name]
                     return query.values(*fields)
 
+    @classmethod
+    def _keyset_page(cls, request, query, fields, page):
+        """
+        Returns a page of the report with keyset pagination.
+
+        The sort fields of the last record of each page are cached. A page is
+        retrieved by filtering the records after the last record of the
+        closest previous page we know, which avoids that the database needs
+        to skip all records of the previous pages.
+        When the bounds of the previous page aren't known, eg when jumping
+        directly to a page deep in the report, they are computed first. A
+        window function numbers the records, and only the sort fields of the
+        last record of each skipped page are returned. This is cheaper than
+        an offset, which builds the complete records of all skipped pages.
+        The cached values are only valid for the same page size and plan
+        version: any change to the data makes the pages shift.
+        Returns None when the sort order doesn't allow keyset pagination.
+        """
+        ordering = list(query.query.order_by or query.model._meta.ordering or [])
+        if not all(isinstance(o, str) for o in ordering):
+            return None
+        pk = query.model._meta.pk.name
+        ordering = [pk if o.lstrip("-") == "pk" else o for o in ordering]
+        if pk not in [o.lstrip("-") for o in ordering]:
+            # The primary key makes the sort order unique
+            ordering.append(pk)
+        keys = [o.lstrip("-") for o in ordering]
+        query = query.order_by(*ordering)
+
+        version = Dashboard.getPlanVersion(request.database)
+        if version is None:
+            cache_key = None
+            bounds = {}
+        else:
+            tmp = query.query.get_compiler(request.database).as_sql(
+                with_col_aliases=False
+            )
+            cache_key = "keyset_%s" % (
+                sha1(
+                    str(
+                        (tmp[0], tmp[1], request.database, request.pagesize, version)
+                    ).encode("utf8")
+                ).hexdigest(),
+            )
+            bounds = cache.get(cache_key, None) or {}
+        start = max((p for p in bounds if p < page), default=0)
+        changed = False
+        if start < page - 1:
+            # Compute the bounds of the pages between the closest known page
+            # and the requested page
+            seeds = query
+            if start:
+                seeds = seeds.filter(
+                    cls._keyset_filter(query.model, ordering, bounds[start])
+                )
+            skip = (page - 1 - start) * request.pagesize
+            for rec in (
+                seeds.annotate(
+                    keyset_row=Window(
+                        RowNumber(),
+                        order_by=[
+                            F(o[1:]).desc() if o.startswith("-") else F(o).asc()
+                            for o in ordering
+                        ],
+                    )
+                )
+                .filter(
+                    keyset_row__lte=skip,
+                    keyset_row__in=list(
+                        range(request.pagesize, skip + 1, request.pagesize)
+                    ),
+                )
+                .values_list("keyset_row", *keys)
+            ):
+                if None not in rec[1:]:
+                    bounds[start + rec[0] // request.pagesize] = tuple(rec[1:])
+                    changed = True
+            start = max((p for p in bounds if p < page), default=0)
+        if start:
+            query = query.filter(
+                cls._keyset_filter(query.model, ordering, bounds[start])
+            )
+        cnt = (page - 1 - start) * request.pagesize + 1
+        rows = list(
+            query[cnt - 1 : cnt + request.pagesize].values(
+                *fields, *[k for k in keys if k not in fields]
+            )
+        )
+        if len(rows) >= request.pagesize:
+            last = tuple(rows[request.pagesize - 1][k] for k in keys)
+            if None not in last:
+                bounds[page] = last
+                changed = True
+        if changed and cache_key:
+            cache.set(cache_key, bounds, timeout=600)
+        return rows
+
+    @staticmethod
+    def _keyset_filter(model, ordering, values):
+        """
+        Builds a filter to select the records after a record in a sort order.
+        In PostgreSQL null values are sorted after all other values in an
+        ascending order, and before all other values in a descending order.
+        """
+        q = None
+        for field, value in reversed(list(zip(ordering, values))):
+            if field.startswith("-"):
+                cond = models.Q(**{"%s__lt" % field[1:]: value})
+            else:
+                cond = models.Q(**{"%s__gt" % field: value})
+                try:
+                    f = model._meta.get_field(field)
+                    nullable = f.null
+                except Exception:
+                    nullable = True
+                if nullable:
+                    cond |= models.Q(**{"%s__isnull" % field: True})
+            if q is not None:
+                cond |= models.Q(**{field.lstrip("-"): value}) & q
+            q = cond
+        return q
+
+    @classmethod
+    def _estimate_count(cls, request):
+        """
+        Returns the number of records in the report as estimated by the
+        PostgreSQL statistics, or None when the report is filtered or the
+        estimate is below the approximate_count threshold.
+        """
+        if request.GET.get("filters") or request.GET.get("_search") == "true":
+            return None
+        for i in request.GET:
+            for r in request.rows:
+                if r.name and (i == r.field_name or i.startswith(r.field_name + "__")):
+                    return None
+        with connections[request.database].cursor() as cursor:
+            if not request.query.query.where:
+                cursor.execute(
+                    "select reltuples::bigint from pg_class where oid = %s::regclass",
+                    (request.query.model._meta.db_table,),
+                )
+                estimate = cursor.fetchone()[0]
+            else:
+                tmp = request.query.query.get_compiler(request.database).as_sql(
+                    with_col_aliases=False
+                )
+                cursor.execute("explain (format json) " + tmp[0], tmp[1])
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                estimate = plan[0]["Plan"]["Plan Rows"]
+        # Tables that were never analyzed have a negative estimate
+        if estimate is None or estimate < max(cls.approximate_count, 1):
+            return None
+        return int(estimate)
+
     @classmethod
     def count_query(cls, request, *args, **kwargs):
         if not hasattr(request, "query"):
@@ -1577,6 +1748,12 @@ class GridReport(View):
                     request.database
                 )
 
+        if cls.approximate_count:
+            estimate = cls._estimate_count(request)
+            if estimate is not None:
+                request.approximate_count = True
+                return estimate
+
         tmp = request.query.query.get_compiler(request.database).as_sql(
             with_col_aliases=False
         )
@@ -1606,7 +1783,7 @@ class GridReport(View):
         page = request.GET.get("page", 1)
         if page is not None:
             page = int(page)
-            if page > total_pages:
+            if page > total_pages and not getattr(request, "approximate_count", False):
                 page = total_pages
             if page < 1:
                 page = 1
@@ -2014,6 +2191,7 @@ class GridReport(View):
             request.read().decode(request.encoding or settings.DEFAULT_CHARSET)
         )
         with transaction.atomic(using=request.database, savepoint=False):
+            Dashboard.planChanged(request.database)
             content_type_id = ContentType.objects.get_for_model(
                 cls.model, for_concrete_model=False
             ).pk
@@ -2439,6 +2617,7 @@ class GridReport(View):
         # Delete the data records
         cursor = connections[request.database].cursor()
         with transaction.atomic(using=request.database):
+            Dashboard.planChanged(request.database)
             sql_list = []
             containsOperationPlan = any(m.__name__ == "OperationPlan" for m in deps)
             for m in deps:
@@ -22,11 +22,16 @@
 #
 
 import os
+from threading import Thread
 
+from django.core.cache import cache
+from django.db import connection, DEFAULT_DB_ALIAS, transaction
 from django.http.response import StreamingHttpResponse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
-from freppledb.common.models import User
+from freppledb.common.auth import MultiDBBackend
+from freppledb.common.dashboard import Dashboard
+from freppledb.common.models import Parameter, ParameterCache, Scenario, User
 
 
 def checkResponse(testcase, response):
@@ -51,6 +56,50 @@ class DataLoadTest(TestCase):
         self.fail("Didn't find expected number of parameters")
 
 
+class ParameterCacheTest(TransactionTestCase):
+    def test_parameter_cache(self):
+        param = Parameter.objects.create(name="test.cache", value="1")
+        self.assertEqual(Parameter.getValue("test.cache"), "1")
+        values = ParameterCache.getValues()
+        self.assertIs(ParameterCache.getValues(), values)
+
+        # A change from this process
+        param.value = "2"
+        param.save()
+        self.assertEqual(Parameter.getValue("test.cache"), "2")
+
+        # A raw SQL change, followed by an explicit invalidation
+        conn = connection.get_new_connection(connection.get_connection_params())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "update common_parameter set value = '3' where name = 'test.cache'"
+            )
+        conn.close()
+        ParameterCache.invalidate()
+        self.assertEqual(Parameter.getValue("test.cache"), "3")
+
+        # An uncommitted change is only seen by its own transaction
+        values = []
+
+        def readValue():
+            values.append(Parameter.getValue("test.cache"))
+            connection.close()
+
+        with transaction.atomic():
+            param.value = "4"
+            param.save()
+            self.assertEqual(Parameter.getValue("test.cache"), "4")
+            thread = Thread(target=readValue)
+            thread.start()
+            thread.join()
+            self.assertEqual(values, ["3"])
+        self.assertEqual(Parameter.getValue("test.cache"), "4")
+
+        param.delete()
+        self.assertEqual(Parameter.getValue("test.cache", default="5"), "5")
+
+
 class UserPreferenceTest(TestCase):
     def test_get_set_preferences(self):
         user = User.objects.all().get(username="admin")
@@ -61,6 +110,36 @@ class UserPreferenceTest(TestCase):
         self.assertEqual(after, {"a": 1, "b": "c"})
 
 
+class ScenarioUsersTest(TestCase):
+    def test_scenario_users(self):
+        scenario = Scenario(name=DEFAULT_DB_ALIAS)
+        users = MultiDBBackend.getScenarioUsers(scenario)
+        self.assertTrue(users["admin"]["is_superuser"])
+        with self.assertNumQueries(0):
+            self.assertEqual(MultiDBBackend.getScenarioUsers(scenario), users)
+
+        # Saving a user clears the cache
+        user = User.objects.get(username="admin")
+        user.horizonlength = 12
+        user.save()
+        users = MultiDBBackend.getScenarioUsers(scenario)
+        self.assertEqual(users["admin"]["horizonlength"], 12)
+
+        # Other processes detect a change of the scenario access through the
+        # users version, even when their cache still holds the old entry
+        Scenario.syncWithSettings()
+        scenario = Scenario.objects.get(name=DEFAULT_DB_ALIAS)
+        MultiDBBackend.getScenarioUsers(scenario)
+        key = "scenariousers_%s" % DEFAULT_DB_ALIAS
+        stale = cache.get(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(username="admin").update(is_active=False)
+            MultiDBBackend.clearScenarioUsers(DEFAULT_DB_ALIAS)
+        cache.set(key, stale)
+        scenario = Scenario.objects.get(name=DEFAULT_DB_ALIAS)
+        self.assertNotIn("admin", MultiDBBackend.getScenarioUsers(scenario))
+
+
 class AppsTest(TestCase):
     def setUp(self):
         os.environ["FREPPLE_TEST"] = "YES"
@@ -74,3 +153,38 @@ class AppsTest(TestCase):
     def test_app_screen(self):
         response = self.client.get("/apps/")
         self.assertEqual(response.status_code, 200)
+
+
+class WidgetCacheTest(TestCase):
+    def setUp(self):
+        self.client.login(username="admin", password="admin")
+        cache.clear()
+
+    def cachedWidgets(self):
+        return len([k for k in cache._cache if "widget_" in k])
+
+    def test_widget_cache(self):
+        Parameter.objects.create(name="test.widgetcache", value="1")
+        version = Dashboard.getPlanVersion()
+        self.assertIsNotNone(version)
+        response = self.client.get("/widget/late_orders/?limit=5")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cachedWidgets(), 1)
+
+        # Same result from the cache
+        response2 = self.client.get("/widget/late_orders/?limit=5")
+        self.assertEqual(response2.content, response.content)
+        self.assertEqual(self.cachedWidgets(), 1)
+
+        # Editing data invalidates the cache
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/data/common/parameter/",
+                data='[{"id": "test.widgetcache", "value": "2"}]',
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(Dashboard.getPlanVersion(), version)
+        self.assertEqual(Parameter.getValue("test.widgetcache"), "2")
+        response = self.client.get("/widget/late_orders/?limit=5")
+        self.assertEqual(self.cachedWidgets(), 2)
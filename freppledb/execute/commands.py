@@ -273,6 +273,28 @@ class SupplyPlanning(PlanTask):
         frepple.printsize()
 
 
+@PlanTaskRegistry.register
+class RunSimulation(PlanTask):
+    description = "Simulate the plan execution"
+    sequence = 250
+
+    @classmethod
+    def getWeight(cls, **kwargs):
+        return 10 if "simulation" in os.environ else -1
+
+    @classmethod
+    def run(cls, database=DEFAULT_DB_ALIAS, **kwargs):
+        from freppledb.execute.management.commands.simulation import (
+            runEngineSimulation,
+        )
+
+        supplyplanning = PlanTaskRegistry.getTask(sequence=200)
+        runEngineSimulation(
+            database=database,
+            solver=getattr(supplyplanning, "solver", None),
+        )
+
+
 @PlanTaskRegistry.register
 class EraseModel(PlanTask):
     description = "Erase model"
@@ -0,0 +1,299 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from datetime import datetime
+import json
+import os
+import re
+import tempfile
+from time import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from django.conf import settings
+from django.core import management
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from freppledb import __version__
+from freppledb.execute.models import Task
+from freppledb.input.models import (
+    Demand,
+    Item,
+    Operation,
+    OperationMaterial,
+    OperationPlan,
+    Resource,
+)
+
+
+class Command(BaseCommand):
+    help = """
+      Generates a model with the createmodel command, plans it with the
+      runplan command and writes the performance figures in a JSON report.
+
+      The report contains the duration of every planning task, the throughput
+      of the loaders and exporters, and the peak memory usage. Reports of
+      different versions can be compared with the --compare option.
+
+      The database must be empty, or the --erase option must be used.
+    """
+
+    requires_system_checks = []
+
+    # Log messages with the throughput of the loaders and exporters
+    loaded = re.compile(r"Loaded (\d+) (.+?) in ([\d.]+) seconds")
+    exported = re.compile(r"Exported (\d+) records to (\S+) at (\d+) records/sec")
+
+    def get_version(self):
+        return __version__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cluster", type=int, help="Number of end items", default=100
+        )
+        parser.add_argument(
+            "--demand", type=int, help="Demands per end item", default=30
+        )
+        parser.add_argument(
+            "--level", type=int, help="Depth of bill-of-material", default=5
+        )
+        parser.add_argument(
+            "--resource", type=int, help="Number of resources", default=60
+        )
+        parser.add_argument(
+            "--resource_size", type=int, help="Size of each resource", default=5
+        )
+        parser.add_argument(
+            "--components", type=int, help="Total number of components", default=200
+        )
+        parser.add_argument(
+            "--components_per",
+            type=int,
+            help="Number of components per end item",
+            default=4,
+        )
+        parser.add_argument(
+            "--constraint",
+            default="capa,mfg_lt,po_lt",
+            help="Constraints considered by the planning algorithm",
+        )
+        parser.add_argument(
+            "--plantype", type=int, default=1, help="Plan type: 1=constrained plan"
+        )
+        parser.add_argument("--env", default="supply", help="Planning tasks to run")
+        parser.add_argument(
+            "--erase",
+            action="store_true",
+            default=False,
+            help="Erase all data in the database before creating the model",
+        )
+        parser.add_argument(
+            "--output", default="benchmark.json", help="Name of the JSON report"
+        )
+        parser.add_argument(
+            "--compare", help="JSON report of a previous run to compare with"
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Nominates a specific database to run the benchmark in",
+        )
+
+    def handle(self, **options):
+        database = options["database"]
+        if database not in settings.DATABASES:
+            raise CommandError("No database settings known for '%s'" % database)
+        model = {
+            i: options[i]
+            for i in (
+                "cluster",
+                "demand",
+                "level",
+                "resource",
+                "resource_size",
+                "components",
+                "components_per",
+            )
+        }
+        report = {
+            "version": __version__,
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "model": model,
+            "constraint": options["constraint"],
+            "plantype": options["plantype"],
+            "env": options["env"],
+        }
+
+        # Generate the model
+        if options["erase"]:
+            management.call_command("empty", all=True, database=database)
+        start = time()
+        management.call_command("createmodel", database=database, verbosity=0, **model)
+        report["createmodel"] = round(time() - start, 3)
+
+        # Plan the model, while the planning tasks record their duration
+        fd, timings = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        os.environ["FREPPLE_TIMINGS"] = timings
+        try:
+            start = time()
+            management.call_command(
+                "runplan",
+                database=database,
+                constraint=options["constraint"],
+                plantype=options["plantype"],
+                env="%s,nowebservice" % options["env"],
+            )
+            report["runplan"] = round(time() - start, 3)
+            with open(timings, "r", encoding="utf-8") as f:
+                report["steps"] = [json.loads(i) for i in f if i.strip()]
+        finally:
+            del os.environ["FREPPLE_TIMINGS"]
+            os.remove(timings)
+
+        # Throughput of loaders and exporters, as logged by the planning run
+        report["loaders"] = []
+        report["exporters"] = []
+        task = (
+            Task.objects.all()
+            .using(database)
+            .filter(name="runplan")
+            .order_by("-id")
+            .first()
+        )
+        if task and task.logfile:
+            with open(
+                os.path.join(settings.FREPPLE_LOGDIR, task.logfile),
+                "r",
+                encoding="utf-8",
+                errors="ignore",
+            ) as f:
+                for line in f:
+                    m = self.loaded.search(line)
+                    if m:
+                        rows = int(m.group(1))
+                        seconds = float(m.group(3))
+                        report["loaders"].append(
+                            {
+                                "name": m.group(2),
+                                "rows": rows,
+                                "seconds": seconds,
+                                "rows_per_sec": (
+                                    round(rows / seconds) if seconds else None
+                                ),
+                            }
+                        )
+                        continue
+                    m = self.exported.search(line)
+                    if m:
+                        rows = int(m.group(1))
+                        rate = int(m.group(3))
+                        report["exporters"].append(
+                            {
+                                "name": m.group(2),
+                                "rows": rows,
+                                "seconds": round(rows / rate, 3) if rate else 0,
+                                "rows_per_sec": rate,
+                            }
+                        )
+
+        # Size of the model and the plan
+        report["size"] = {
+            "items": Item.objects.using(database).count(),
+            "operations": Operation.objects.using(database).count(),
+            "operationmaterials": OperationMaterial.objects.using(database).count(),
+            "resources": Resource.objects.using(database).count(),
+            "demands": Demand.objects.using(database).count(),
+            "operationplans": OperationPlan.objects.using(database).count(),
+        }
+
+        # Peak memory of the planning engine and of this process, in MB
+        if resource:
+            report["peak_rss"] = {
+                "engine": round(
+                    resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0, 1
+                ),
+                "command": round(
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1
+                ),
+            }
+
+        with open(options["output"], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(
+            "Planned %s operationplans in %.1f seconds, report in %s"
+            % (report["size"]["operationplans"], report["runplan"], options["output"])
+        )
+
+        if options["compare"]:
+            with open(options["compare"], "r", encoding="utf-8") as f:
+                self.compare(json.load(f), report)
+
+    def compare(self, old, new):
+        """
+        Prints the durations of two reports next to each other.
+        """
+        if old.get("model") != new["model"]:
+            self.stdout.write("Warning: the reports are for different models")
+        self.stdout.write(
+            "%-50s %10s %10s %8s" % ("", old.get("version", ""), new["version"], "")
+        )
+
+        def line(name, before, after):
+            if before is None or after is None:
+                self.stdout.write("%-50s %10s %10s" % (name, before, after))
+            else:
+                self.stdout.write(
+                    "%-50s %10.2f %10.2f %+7.0f%%"
+                    % (
+                        name,
+                        before,
+                        after,
+                        (after - before) * 100 / before if before else 0,
+                    )
+                )
+
+        line("createmodel", old.get("createmodel"), new["createmodel"])
+        line("runplan", old.get("runplan"), new["runplan"])
+        before = {}
+        for s in old.get("steps", []):
+            key = (s["description"], s["export"])
+            before[key] = before.get(key, 0) + s["seconds"]
+        after = {}
+        for s in new["steps"]:
+            key = (s["description"], s["export"])
+            after[key] = after.get(key, 0) + s["seconds"]
+        for key in after:
+            line("  " + key[0][:48], before.get(key), after[key])
+        for key in ("engine", "command"):
+            line(
+                "peak RSS %s (MB)" % key,
+                old.get("peak_rss", {}).get(key),
+                new.get("peak_rss", {}).get(key),
+            )
@@ -58,6 +58,7 @@ class Command(BaseCommand):
     select column_name, data_type
     from information_schema.columns
     where table_name = %s and column_name <> 'lastmodified' and column_name <> 'id'
+    and is_generated = 'NEVER'
     """
         cursor.execute(sql, (table,))
         nb_of_rows = cursor.rowcount
@@ -29,6 +29,7 @@ from django.core import management
 from django.db import DEFAULT_DB_ALIAS, transaction
 from django.db.models import Min, Max
 
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.models import Parameter, BucketDetail
 from freppledb.input.models import Operation, Buffer, Resource, Location, Calendar
 from freppledb.input.models import CalendarBucket, Customer, Demand, Supplier
@@ -486,6 +487,8 @@ class Command(BaseCommand):
 
                     # TODO set some gross forecast values or historical demand values
 
+            Dashboard.planChanged(database)
+
             # Task update
             task.status = "Done"
             task.finished = datetime.now()
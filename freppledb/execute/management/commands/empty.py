@@ -35,6 +35,7 @@ from django.utils.translation import gettext_lazy as _
 from django.template.loader import render_to_string
 
 from freppledb.execute.models import Task
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.middleware import _thread_locals
 from freppledb.common.models import User
 from freppledb.common.report import EXCLUDE_FROM_BULK_OPERATIONS
@@ -167,7 +168,9 @@ class Command(BaseCommand):
                     if hasCustomer:
                         models.remove("input.customer")
                         if "freppledb.forecast" in settings.INSTALLED_APPS:
-                            cursor.execute("truncate forecastplan, forecast")
+                            cursor.execute(
+                                "truncate forecastplan, forecasttree, forecast"
+                            )
                         cursor.execute("delete from customer")
                         key = ContentType.objects.get_for_model(
                             inputmodels.Customer, for_concrete_model=False
@@ -252,12 +255,15 @@ class Command(BaseCommand):
                 tables.add("operationplanmaterial")
                 tables.add("operationplanresource")
                 tables.add("out_problem")
+                tables.add("out_inventoryplan")
+                tables.add("out_pegging")
             if "resource" in tables and "out_resourceplan" not in tables:
                 tables.add("out_resourceplan")
             if "freppledb.forecast" in settings.INSTALLED_APPS:
                 if "forecast" in tables:
                     tables.add("forecastplan")
                 if "forecastplan" in tables:
+                    tables.add("forecasttree")
                     cursor.execute("refresh materialized view forecastreport_view")
             if "demand" in tables and "out_constraint" not in tables:
                 tables.add("out_constraint")
@@ -316,6 +322,7 @@ class Command(BaseCommand):
                     cursor.execute("update common_user set horizonbuckets = null")
                 for stmt in connections[database].ops.sql_flush(no_style(), tables):
                     cursor.execute(stmt)
+                Dashboard.planChanged(database)
 
             # Task update
             task.status = "Done"
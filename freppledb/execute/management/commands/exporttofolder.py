@@ -62,6 +62,9 @@ class Command(BaseCommand):
 
     requires_system_checks = []
 
+    # Exports can run next to other exports, but not next to a plan
+    concurrency = "export"
+
     # The "statements" variable is only used during a transition period
     # to give customers the time to migrate their legacy custom configuration.
     statements = [
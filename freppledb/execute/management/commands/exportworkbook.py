@@ -21,27 +21,477 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-from django.core.management.base import BaseCommand
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import os
+from queue import Queue
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill
+from openpyxl.comments import Comment as CellComment
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_permission_codename
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models.fields import AutoField
+from django.db.models.fields.related import ForeignKey
+from django.test import RequestFactory
+from django.utils import translation
+from django.utils.encoding import force_str
 from django.utils.translation import gettext_lazy as _
 from django.template.loader import render_to_string
 
 from freppledb import __version__
+from freppledb.admin import data_site
+from freppledb.common.middleware import _thread_locals
+from freppledb.common.models import HierarchyModel, Parameter, User
+from freppledb.common.report import EXCLUDE_FROM_BULK_OPERATIONS, _getCellValue
+from freppledb.execute.models import Task
+
+logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
     help = """
-       This command exports data in a spreadsheet. It is only available only
-       from the user interface.
+      Exports data tables in a spreadsheet.
+
+      The spreadsheet is created in the export folder, from where it can be
+      downloaded. Each selected entity gets a separate sheet.
+      """
 
-       TODO implement a command line version of this command. Also unify that
-       command with the view function that is serving the spreadsheet from the
-       user interface.
-       """
+    requires_system_checks = []
+
+    # Exports can run next to other exports, but not next to a plan
+    concurrency = "export"
+
+    # Number of records fetched from the database at a time
+    chunk_size = 2000
+
+    # Number of entities fetched concurrently from the database
+    workers = 4
 
     def get_version(self):
         return __version__
 
-    requires_system_checks = []
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="User running the command")
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Nominates a specific database to export data from",
+        )
+        parser.add_argument(
+            "--task",
+            type=int,
+            help="Task identifier (generated automatically if not provided)",
+        )
+        parser.add_argument(
+            "--entities",
+            help="Comma separated list of models to export, eg input.item,input.location",
+        )
+        parser.add_argument(
+            "--anonymous",
+            default="false",
+            help="Set to true to mask the names of all entities in the export",
+        )
+        parser.add_argument(
+            "--filename",
+            help="Name of the spreadsheet file in the export folder. Default: workbook-<task id>.xlsx",
+        )
+
+    def handle(self, **options):
+        # Pick up the options
+        now = datetime.now()
+        self.database = options["database"]
+        if self.database not in settings.DATABASES:
+            raise CommandError("No database settings known for '%s'" % self.database)
+        if options["user"]:
+            try:
+                self.user = (
+                    User.objects.all()
+                    .using(self.database)
+                    .get(username=options["user"])
+                )
+            except Exception:
+                raise CommandError("User '%s' not found" % options["user"])
+        else:
+            self.user = None
+        if options["filename"]:
+            filename = os.path.basename(options["filename"])
+            if not filename.lower().endswith(".xlsx"):
+                raise CommandError("Spreadsheet file name must end with .xlsx")
+        else:
+            filename = None
+
+        task = None
+        old_thread_locals = getattr(_thread_locals, "database", None)
+        try:
+            setattr(_thread_locals, "database", self.database)
+            # Initialize the task
+            if options["task"]:
+                try:
+                    task = (
+                        Task.objects.all().using(self.database).get(pk=options["task"])
+                    )
+                except Exception:
+                    raise CommandError("Task identifier not found")
+                if (
+                    task.started
+                    or task.finished
+                    or task.status != "Waiting"
+                    or task.name not in ("frepple_exportworkbook", "exportworkbook")
+                ):
+                    raise CommandError("Invalid task identifier")
+                task.status = "0%"
+                task.started = now
+                if not self.user and task.user:
+                    self.user = task.user
+            else:
+                task = Task(
+                    name="exportworkbook",
+                    submitted=now,
+                    started=now,
+                    status="0%",
+                    user=self.user,
+                )
+                task.arguments = "--entities=%s" % (options["entities"] or "")
+            task.processid = os.getpid()
+            task.save(using=self.database)
+
+            # Concurrent exports each get their own file
+            if not filename:
+                filename = "workbook-%s.xlsx" % task.id
+
+            # Sheet names and headers are in the language of the user
+            if self.user and self.user.language != "auto":
+                translation.activate(self.user.language)
+            else:
+                translation.activate(settings.LANGUAGE_CODE)
+
+            # Make sure the export folder exists
+            exportFolder = os.path.join(
+                settings.DATABASES[self.database]["FILEUPLOADFOLDER"], "export"
+            )
+            os.makedirs(exportFolder, exist_ok=True)
+
+            # Write the workbook in a temporary file in the same folder, which
+            # is renamed when complete. Downloads never see a partial file.
+            fd, tmpname = tempfile.mkstemp(
+                prefix=".%s" % filename, suffix=".tmp", dir=exportFolder
+            )
+            os.close(fd)
+            try:
+                self.writeWorkbook(
+                    tmpname,
+                    [
+                        i.strip()
+                        for i in (options["entities"] or "").split(",")
+                        if i.strip()
+                    ],
+                    options["anonymous"].lower() == "true",
+                    task,
+                )
+                os.replace(tmpname, os.path.join(exportFolder, filename))
+            finally:
+                if os.path.exists(tmpname):
+                    os.remove(tmpname)
+
+            # Task update
+            task.status = "Done"
+            task.message = "Exported %s" % filename
+            task.finished = datetime.now()
+
+        except Exception as e:
+            if task:
+                task.status = "Failed"
+                task.message = "%s" % e
+                task.finished = datetime.now()
+            raise e
+
+        finally:
+            setattr(_thread_locals, "database", old_thread_locals)
+            if task:
+                task.processid = None
+                task.save(using=self.database)
+
+    def getSheet(self, wb, model, request):
+        """
+        Creates a sheet for a model, and returns it together with the
+        fields to export and the queryset to read them from.
+        """
+        ws = wb.create_sheet(title=force_str(model._meta.verbose_name))
+
+        # Build a list of fields and properties
+        fields = []
+        modelfields = []
+        header = []
+        source = False
+        lastmodified = False
+        owner = False
+        comment = None
+        try:
+            # The admin model of the class can define some fields to exclude from the export
+            exclude = data_site._registry[model].exclude
+        except Exception:
+            exclude = None
+        for i in model._meta.fields:
+            if isinstance(i, AutoField) and i.primary_key:
+                # Don't export automatically generated primary keys.
+                # We rely on the natural for restoring the data.
+                continue
+            elif i.name in ["lft", "rght", "lvl"]:
+                continue  # Skip some fields of HierarchyModel
+            elif i.name == "source":
+                source = i  # Put the source field at the end
+            elif i.name == "lastmodified":
+                lastmodified = i  # Put the last-modified field at the very end
+            elif not (exclude and i.name in exclude):
+                fields.append(i.column)
+                modelfields.append(i)
+                cell = WriteOnlyCell(ws, value=force_str(i.verbose_name).title())
+                if i.editable:
+                    cell.style = "headerstyle"
+                    if isinstance(i, ForeignKey):
+                        cell.comment = CellComment(
+                            force_str(
+                                _("Values in this field must exist in the %s table")
+                                % force_str(i.remote_field.model._meta.verbose_name)
+                            ),
+                            "Author",
+                        )
+                    elif i.choices:
+                        cell.comment = CellComment(
+                            force_str(
+                                _("Accepted values are: %s")
+                                % ", ".join([c[0] for c in i.choices])
+                            ),
+                            "Author",
+                        )
+                else:
+                    cell.style = "readlonlyheaderstyle"
+                    if not comment:
+                        comment = CellComment(
+                            force_str(_("Read only")),
+                            "Author",
+                            height=20,
+                            width=80,
+                        )
+                    cell.comment = comment
+                header.append(cell)
+                if i.name == "owner":
+                    owner = True
+        if hasattr(model, "propertyFields"):
+            if callable(model.propertyFields):
+                props = model.propertyFields(request)
+            else:
+                props = model.propertyFields
+            for i in props:
+                if i.export:
+                    fields.append(i.name)
+                    cell = WriteOnlyCell(ws, value=force_str(i.verbose_name).title())
+                    if i.editable:
+                        cell.style = "headerstyle"
+                        if isinstance(i, ForeignKey):
+                            cell.comment = CellComment(
+                                force_str(
+                                    _("Values in this field must exist in the %s table")
+                                    % force_str(i.remote_field.model._meta.verbose_name)
+                                ),
+                                "Author",
+                            )
+                    elif i.choices:
+                        cell.comment = CellComment(
+                            force_str(
+                                _("Accepted values are: %s")
+                                % ", ".join([c[0] for c in i.choices])
+                            ),
+                            "Author",
+                        )
+                    else:
+                        cell.style = "readlonlyheaderstyle"
+                        if not comment:
+                            comment = CellComment(
+                                force_str(_("Read only")),
+                                "Author",
+                                height=20,
+                                width=80,
+                            )
+                        cell.comment = comment
+                    header.append(cell)
+                    modelfields.append(i)
+        if source:
+            fields.append("source")
+            cell = WriteOnlyCell(ws, value=force_str(_("source")).title())
+            cell.style = "headerstyle"
+            header.append(cell)
+            modelfields.append(source)
+        if lastmodified:
+            fields.append("lastmodified")
+            cell = WriteOnlyCell(ws, value=force_str(_("last modified")).title())
+            cell.style = "readlonlyheaderstyle"
+            if not comment:
+                comment = CellComment(
+                    force_str(_("Read only")), "Author", height=20, width=80
+                )
+            cell.comment = comment
+            header.append(cell)
+            modelfields.append(lastmodified)
+
+        # Write a formatted header row
+        ws.append(header)
+
+        # Add an auto-filter to the table
+        ws.auto_filter.ref = "A1:%s1048576" % get_column_letter(len(header))
+
+        # Use the default manager
+        if issubclass(model, HierarchyModel):
+            model.rebuildHierarchy(database=self.database)
+            query = model.objects.all().using(self.database).order_by("lvl", "pk")
+        elif owner:
+            # First export records with empty owner field
+            query = model.objects.all().using(self.database).order_by("-owner", "pk")
+        else:
+            query = model.objects.all().using(self.database).order_by("pk")
+
+        # Special annotation of the export query
+        if hasattr(model, "export_objects"):
+            query = model.export_objects(query, request)
+
+        return ws, modelfields, query.values_list(*fields)
+
+    def fetchRows(self, query, rows):
+        """
+        Reads the records of a query through a server-side cursor and passes
+        them in chunks to the thread writing the sheet.
+        A None marks the end of the data, an exception the failure to read it.
+        """
+        try:
+            chunk = []
+            for rec in query.iterator(chunk_size=self.chunk_size):
+                chunk.append(rec)
+                if len(chunk) >= self.chunk_size:
+                    rows.put(chunk)
+                    chunk = []
+            if chunk:
+                rows.put(chunk)
+            rows.put(None)
+        except Exception as e:
+            rows.put(e)
+        finally:
+            # Each thread has its own database connection
+            connections[self.database].close()
+
+    def writeWorkbook(self, filename, entities, anonymous, task):
+        # Create a workbook
+        wb = Workbook(write_only=True)
+        wb.properties.creator = "frepple %s" % __version__
+
+        # Create a named style for the header row
+        headerstyle = NamedStyle(name="headerstyle")
+        headerstyle.fill = PatternFill(fill_type="solid", fgColor="70c4f4")
+        wb.add_named_style(headerstyle)
+        readlonlyheaderstyle = NamedStyle(name="readlonlyheaderstyle")
+        readlonlyheaderstyle.fill = PatternFill(fill_type="solid", fgColor="d0ebfb")
+        wb.add_named_style(readlonlyheaderstyle)
+
+        # retrieve value of parameter excel_duration_in_days
+        excel_duration_in_days = (
+            Parameter.getValue("excel_duration_in_days", self.database, "false").lower()
+            == "true"
+        )
+
+        # Some models need a request to build their export
+        request = RequestFactory().get("/dummy/")
+        request.user = self.user or User.objects.all().get(username="admin")
+        request.database = self.database
+        request.LANGUAGE_CODE = translation.get_language()
+
+        # Create the sheets of all selected entity types
+        sheets = []
+        for entity_name in entities:
+            try:
+                (app_label, model_label) = entity_name.split(".")
+                model = apps.get_model(app_label, model_label)
+                # Verify access rights
+                permname = get_permission_codename("change", model._meta)
+                if not request.user.has_perm("%s.%s" % (app_label, permname)):
+                    continue
+
+                # Never export some special administrative models
+                if model in EXCLUDE_FROM_BULK_OPERATIONS:
+                    continue
+
+                sheets.append((model, *self.getSheet(wb, model, request)))
+            except Exception as e:
+                # Ignore the error and move on to the next entity.
+                logger.warning("Can't export %s: %s" % (entity_name, e))
+
+        # Not a single entity to export
+        if not sheets:
+            raise Exception(_("Nothing to export"))
+
+        # The database queries of the entities run concurrently, while the
+        # sheets are written one after the other. The bounded queues limit
+        # the number of records held in memory.
+        exportConfig = {"anonymous": anonymous}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            queues = []
+            for model, ws, modelfields, query in sheets:
+                rows = Queue(maxsize=4)
+                pool.submit(self.fetchRows, query, rows)
+                queues.append(rows)
+
+            for cnt, (model, ws, modelfields, query) in enumerate(sheets):
+                task.message = "Exporting %s" % force_str(model._meta.verbose_name)
+                task.save(using=self.database, update_fields=["message"])
+                rows = queues[cnt]
+                failed = False
+                while True:
+                    chunk = rows.get()
+                    if chunk is None:
+                        break
+                    elif isinstance(chunk, Exception):
+                        logger.warning(
+                            "Can't export %s: %s"
+                            % (force_str(model._meta.verbose_name), chunk)
+                        )
+                        break
+                    elif failed:
+                        # Keep reading to let the query thread finish
+                        continue
+                    try:
+                        for rec in chunk:
+                            ws.append(
+                                [
+                                    _getCellValue(
+                                        f,
+                                        field=modelfields[fld],
+                                        exportConfig=exportConfig,
+                                        excel_duration_in_days=excel_duration_in_days,
+                                    )
+                                    for fld, f in enumerate(rec)
+                                ]
+                            )
+                    except Exception as e:
+                        # Ignore the error and move on to the next entity.
+                        logger.warning(
+                            "Can't export %s: %s"
+                            % (force_str(model._meta.verbose_name), e)
+                        )
+                        failed = True
+                task.status = "%d%%" % int((cnt + 1) * 100 / len(sheets))
+                task.save(using=self.database, update_fields=["status"])
+
+        wb.save(filename)
+
+    # accordion template
     title = _("Export a spreadsheet")
     index = 1000
     help_url = "command-reference.html#exportworkbook"
@@ -49,91 +499,3 @@ class Command(BaseCommand):
     @staticmethod
     def getHTML(request):
         return render_to_string("commands/exportworkbook.html", request=request)
-
-    # def add_arguments(self, parser):
-    #   parser.add_argument(
-    #     '--user', help='User running the command'
-    #     )
-    #   parser.add_argument(
-    #     '--database', default=DEFAULT_DB_ALIAS,
-    #     help='Nominates a specific database to load data from and export results into'
-    #     )
-    #   parser.add_argument(
-    #     '--task', type=int,
-    #     help='Task identifier (generated automatically if not provided)'
-    #     )
-    #   parser.add_argument(
-    #     'file', nargs='+',
-    #     help='spreadsheet file name'
-    #     )
-
-    # def handle(self, **options):
-    #   # Pick up the options
-    #   database = options['database']
-    #   if database not in settings.DATABASES:
-    #     raise CommandError("No database settings known for '%s'" % database )
-    #   if options['user']:
-    #     try:
-    #       user = User.objects.all().using(database).get(username=options['user'])
-    #     except Exception:
-    #       raise CommandError("User '%s' not found" % options['user'] )
-    #   else:
-    #     user = None
-    #
-    #   now = datetime.now()
-    #   task = None
-    #   try:
-    #     # Initialize the task
-    #     if options['task']:
-    #       try:
-    #         task = Task.objects.all().using(database).get(pk=options['task'])
-    #       except Exception:
-    #         raise CommandError("Task identifier not found")
-    #       if task.started or task.finished or task.status != "Waiting" or task.name != 'export spreadsheet':
-    #         raise CommandError("Invalid task identifier")
-    #       task.status = '0%'
-    #       task.started = now
-    #     else:
-    #       task = Task(name='export spreadsheet', submitted=now, started=now, status='0%', user=user)
-    #     task.arguments = ' '.join(options['file'])
-    #     task.save(using=database)
-    #
-    #     # Execute
-    #     # TODO: if frePPLe is available as a module, we don't really need to spawn another process.
-    #     os.environ['FREPPLE_HOME'] = settings.FREPPLE_HOME.replace('\\', '\\\\')
-    #     os.environ['FREPPLE_APP'] = settings.FREPPLE_APP
-    #     os.environ['FREPPLE_DATABASE'] = database
-    #     os.environ['PATH'] = settings.FREPPLE_HOME + os.pathsep + os.environ['PATH'] + os.pathsep + settings.FREPPLE_APP
-    #     os.environ['LD_LIBRARY_PATH'] = settings.FREPPLE_HOME
-    #     if 'DJANGO_SETTINGS_MODULE' not in os.environ:
-    #       os.environ['DJANGO_SETTINGS_MODULE'] = 'freppledb.settings'
-    #     if os.path.exists(os.path.join(os.environ['FREPPLE_HOME'], 'python36.zip')):
-    #       # For the py2exe executable
-    #       os.environ['PYTHONPATH'] = os.path.join(
-    #         os.environ['FREPPLE_HOME'],
-    #         'python%d%d.zip' % (sys.version_info[0], sys.version_info[1])
-    #         ) + os.pathsep + os.path.normpath(os.environ['FREPPLE_APP'])
-    #     else:
-    #       # Other executables
-    #       os.environ['PYTHONPATH'] = os.path.normpath(os.environ['FREPPLE_APP'])
-    #     cmdline = [ '"%s"' % i for i in options['file'] ]
-    #     cmdline.insert(0, 'frepple')
-    #     cmdline.append( '"%s"' % os.path.join(settings.FREPPLE_APP, 'freppledb', 'execute', 'loadxml.py') )
-    #     (out,ret) = subprocess.run(' '.join(cmdline))
-    #     if ret:
-    #       raise Exception('Exit code of the batch run is %d' % ret)
-    #
-    #     # Task update
-    #     task.status = 'Done'
-    #     task.finished = datetime.now()
-    #
-    #   except Exception as e:
-    #     if task:
-    #       task.status = 'Failed'
-    #       task.message = '%s' % e
-    #       task.finished = datetime.now()
-    #     raise e
-    #
-    #   finally:
-    #     if task:
-    #       task.save(using=database)
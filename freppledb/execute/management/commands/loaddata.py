@@ -32,7 +32,8 @@ from django.db import connections, transaction
 from django.template.loader import render_to_string
 from django.utils.translation import gettext_lazy as _
 
-from freppledb.common.models import User
+from freppledb.common.dashboard import Dashboard
+from freppledb.common.models import ParameterCache, User
 from freppledb.common.middleware import _thread_locals
 from freppledb.common.report import getCurrentDate
 from freppledb.execute.models import Task
@@ -132,6 +133,7 @@ class Command(loaddata.Command):
 
             # Excecute the standard django command
             super().handle(*fixture_labels, **options)
+            Dashboard.planChanged(database)
 
             # if the fixture doesn't contain the 'demo' word, let's not apply loaddata post-treatments
             if "FREPPLE_TEST" in os.environ:
@@ -157,6 +159,7 @@ class Command(loaddata.Command):
                     update common_parameter set value = 'today' where name = 'currentdate'
                     """
                 )
+                ParameterCache.invalidate(database)
 
                 # update demand due dates
                 cursor.execute(
@@ -220,6 +223,9 @@ class Command(loaddata.Command):
                         4 * (offset,),
                     )
 
+                # The dates of the demo data have moved
+                Dashboard.planChanged(database)
+
                 # Task update
                 task.status = "Done"
                 task.finished = datetime.now()
@@ -29,6 +29,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.db import DEFAULT_DB_ALIAS
 
+from freppledb.common.dashboard import Dashboard
 from freppledb.execute.models import Task
 from freppledb.common.models import User
 from freppledb import __version__
@@ -131,6 +132,7 @@ class Command(BaseCommand):
                     p.kill()
                     p.wait()
                     raise Exception("Database restoration failed")
+            Dashboard.planChanged(database)
 
             # Task update
             # We need to recreate a new task record, since the previous one is lost during the restoration.
@@ -27,7 +27,6 @@ import psutil
 import shlex
 import subprocess
 import time
-from time import sleep
 
 from django.core.management.base import BaseCommand, CommandError
 from django.db import DEFAULT_DB_ALIAS
@@ -42,6 +41,7 @@ from freppledb.common.middleware import _thread_locals
 from freppledb.common.models import User
 from freppledb.common.report import GridReport
 from freppledb.execute.models import Task
+from freppledb.execute.management.commands.runworker import TaskListener
 from freppledb import __version__
 
 
@@ -81,6 +81,9 @@ class Command(BaseCommand):
 
     requires_system_checks = []
 
+    # At most one plan runs at the same time, and no exports run next to it
+    concurrency = "plan"
+
     def get_version(self):
         return __version__
 
@@ -357,17 +360,30 @@ class Command(BaseCommand):
                     raise Exception("Failed with exit code %d" % ret)
 
             if options["background"]:
-                # Wait for the background task to be ready
-                while True:
-                    sleep(5)
+                # Wait for the background task to be ready.
+                # The database notifies us when its status changes. In between we
+                # only check whether the process is still alive.
+                finished = ["100%", "Canceled", "Failed", "Done"]
+                listener = TaskListener(database)
+                try:
                     t = Task.objects.using(database).get(pk=task.id)
-                    if t.status in ["100%", "Canceled", "Failed", "Done"]:
-                        break
-                    if not self.process_exists(t.processid):
-                        t.status = "Failed"
-                        t.processid = None
-                        t.save(update_fields=["processid", "status"], using=database)
-                        break
+                    while t.status not in finished:
+                        if task.id not in listener.wait(
+                            timeout=5
+                        ) and self.process_exists(t.processid):
+                            continue
+                        t = Task.objects.using(database).get(pk=task.id)
+                        if t.status not in finished and not self.process_exists(
+                            t.processid
+                        ):
+                            t.status = "Failed"
+                            t.processid = None
+                            t.save(
+                                update_fields=["processid", "status"], using=database
+                            )
+                            break
+                finally:
+                    listener.close()
             else:
                 # Reread the task from the database and update it
                 task = Task.objects.all().using(database).get(pk=task.id)
@@ -21,24 +21,22 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 from multiprocessing import Process
+from multiprocessing.connection import wait
 import operator
 import os
 import shlex
 from subprocess import Popen
 import sys
-from threading import Thread
-import time
 
 from django.conf import settings
-from django.core.management import get_commands
+from django.core.management import get_commands, load_command_class
 from django.core.management.base import BaseCommand, CommandError
 from django.db import DEFAULT_DB_ALIAS, connections
 
 from freppledb import __version__, runCommand
-from freppledb.common.models import Parameter
 from freppledb.common.middleware import _thread_locals
 from freppledb.execute.models import Task
 
@@ -46,33 +44,84 @@ from freppledb.execute.models import Task
 logger = logging.getLogger(__name__)
 
 
-class WorkerAlive(Thread):
+class TaskListener:
+    """
+    A dedicated database connection that listens to the notifications sent
+    when a task is submitted or changes its status.
+
+    A worker also uses this connection to hold an advisory lock as long as it
+    is alive. The database releases the lock automatically when the worker
+    dies, so no heartbeat needs to be written.
+    """
+
+    channel = "frepple_task"
+
+    # Key of the advisory lock held by the worker of a database
+    lock = 1718773104
+
     def __init__(self, database=DEFAULT_DB_ALIAS):
-        self.database = database
-        Thread.__init__(self)
-        self.daemon = True
+        wrapper = connections[database]
+        self.connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute("listen %s" % self.channel)
 
-    def run(self):
-        while True:
-            try:
-                p = (
-                    Parameter.objects.all()
-                    .using(self.database)
-                    .get_or_create(pk="Worker alive")[0]
-                )
-                p.value = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                p.save(update_fields=["value"])
-            except Exception:
-                pass
-            time.sleep(5)
+    def acquire(self):
+        """
+        Returns True when this connection obtained the worker lock, and False
+        when another worker is already active.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute("select pg_try_advisory_lock(%s)", (self.lock,))
+            return cursor.fetchone()[0]
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def notified(self):
+        """
+        Returns the identifiers of the tasks notified since the last call.
+        """
+        self.connection.poll()
+        ids = [int(n.payload) for n in self.connection.notifies]
+        del self.connection.notifies[:]
+        return ids
+
+    def wait(self, timeout=None):
+        """
+        Waits for notifications, and returns the identifiers of the notified tasks.
+        """
+        wait([self], timeout=timeout)
+        return self.notified()
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
 
 
 def checkActive(database=DEFAULT_DB_ALIAS):
     try:
-        p = Parameter.objects.all().using(database).get(pk="Worker alive")
-        return datetime.now() - datetime.strptime(
-            p.value, "%Y-%m-%d %H:%M:%S"
-        ) <= timedelta(0, 5)
+        with connections[database].cursor() as cursor:
+            cursor.execute(
+                """
+                select exists (
+                  select 1
+                  from pg_locks
+                  inner join pg_database
+                    on pg_database.oid = pg_locks.database
+                  where pg_locks.locktype = 'advisory'
+                    and pg_locks.granted
+                    and pg_database.datname = current_database()
+                    and pg_locks.classid = 0
+                    and pg_locks.objid = %s::oid
+                    and pg_locks.objsubid = 1
+                  )
+                """,
+                (TaskListener.lock,),
+            )
+            return cursor.fetchone()[0]
     except Exception:
         return False
 
@@ -119,7 +168,47 @@ def launchWorker(database=DEFAULT_DB_ALIAS):
             Popen(["frepplectl", "runworker", "--database=%s" % database])
 
 
-def runTask(task, database):
+# Number of tasks of a concurrency class that can run at the same time.
+# None means only the number of worker slots limits them.
+# Commands declare their class in a "concurrency" attribute. Commands without
+# it are exclusive: they run only when no other task is running.
+concurrency_limits = {"plan": 1, "export": None}
+
+# Pairs of concurrency classes that can't run at the same time. An export
+# running next to a plan generation would capture a half-written plan.
+concurrency_conflicts = {("plan", "export"), ("export", "plan")}
+
+
+def getConcurrency(name):
+    try:
+        return getattr(
+            load_command_class(get_commands()[name], name), "concurrency", None
+        )
+    except Exception:
+        return None
+
+
+def canStart(concurrency, running, slots):
+    """
+    Checks whether a task of a concurrency class can start next to the running
+    tasks. The argument running is the list of their concurrency classes.
+    """
+    if len(running) >= slots:
+        return False
+    if not concurrency:
+        return not running
+    if None in running:
+        return False
+    if any((concurrency, r) in concurrency_conflicts for r in running):
+        return False
+    limit = concurrency_limits.get(concurrency, 1)
+    return limit is None or running.count(concurrency) < limit
+
+
+def startTask(task, database, slot=None):
+    """
+    Launches a task in a child process, and returns the process.
+    """
     task.started = datetime.now()
     # Verify the command exists
     exists = False
@@ -134,64 +223,96 @@ def runTask(task, database):
         task.status = "Failed"
         task.processid = None
         task.save(using=database)
-    else:
-        # Close all database connections to assure the parent and child
-        # process don't share them.
-        connections.close_all()
-        # Spawn a new command process
-        args = []
-        kwargs = {"database": database, "task": task.id, "verbosity": 0}
-        background = "background" in task.arguments if task.arguments else False
-        if task.arguments:
-            for i in shlex.split(task.arguments or ""):
-                if "=" in i:
-                    key, val = i.split("=")
-                    kwargs[key.strip("--").replace("-", "_")] = val
-                else:
-                    args.append(i)
-        child = Process(
-            target=runCommand,
-            args=(task.name, *args),
-            kwargs=kwargs,
-            name="frepplectl %s" % task.name,
+        return None
+
+    # Close all database connections to assure the parent and child
+    # process don't share them.
+    connections.close_all()
+    # Spawn a new command process
+    args = []
+    kwargs = {"database": database, "task": task.id, "verbosity": 0}
+    if task.arguments:
+        for i in shlex.split(task.arguments or ""):
+            if "=" in i:
+                key, val = i.split("=")
+                kwargs[key.strip("--").replace("-", "_")] = val
+            else:
+                args.append(i)
+    child = Process(
+        target=runCommand,
+        args=(task.name, *args),
+        kwargs=kwargs,
+        name="frepplectl %s" % task.name,
+    )
+    child.start()
+
+    # Normally, the child will update the processid.
+    # Just to make sure, we do it also here.
+    task.processid = child.pid
+    task.slot = slot
+    task.save(update_fields=["processid", "slot"], using=database)
+    return child
+
+
+def finishTask(task, database):
+    background = "background" in task.arguments if task.arguments else False
+
+    # Read the task again from the database and update it
+    task = Task.objects.all().using(database).get(pk=task.id)
+    task.processid = None
+    if (
+        task.status not in ("Done", "Failed") or not task.finished or not task.started
+    ) and task.status != "Canceled":
+        now = datetime.now()
+        if not task.started:
+            task.started = now
+        if not background:
+            if not task.finished:
+                task.finished = now
+            if task.status not in ("Done", "Failed"):
+                task.status = "Done"
+        task.save(using=database)
+    if "FREPPLE_TEST" not in os.environ:
+        logger.info(
+            "Worker %s for database '%s' finished task %d at %s: success"
+            % (
+                os.getpid(),
+                settings.DATABASES[database]["NAME"],
+                task.id,
+                datetime.now(),
+            )
+        )
+
+
+def failTask(task, database, exception):
+    # Read the task again from the database and update.
+    task = Task.objects.all().using(database).get(pk=task.id)
+    task.status = "Failed"
+    task.processid = None
+    now = datetime.now()
+    if not task.started:
+        task.started = now
+    task.finished = now
+    task.message = str(exception)
+    task.save(using=database)
+    if "FREPPLE_TEST" not in os.environ:
+        logger.info(
+            "Worker %s for database '%s' finished task %d at %s: failed"
+            % (
+                os.getpid(),
+                settings.DATABASES[database]["NAME"],
+                task.id,
+                datetime.now(),
+            )
         )
-        child.start()
 
-        # Normally, the child will update the processid.
-        # Just to make sure, we do it also here.
-        task.processid = child.pid
-        task.save(update_fields=["processid"], using=database)
 
+def runTask(task, database, slot=None):
+    child = startTask(task, database, slot)
+    if child:
         # Wait for the child to finish
         child.join()
-
-        # Read the task again from the database and update it
-        task = Task.objects.all().using(database).get(pk=task.id)
-        task.processid = None
-        if (
-            task.status not in ("Done", "Failed")
-            or not task.finished
-            or not task.started
-        ) and task.status != "Canceled":
-            now = datetime.now()
-            if not task.started:
-                task.started = now
-            if not background:
-                if not task.finished:
-                    task.finished = now
-                if task.status not in ("Done", "Failed"):
-                    task.status = "Done"
-            task.save(using=database)
-        if "FREPPLE_TEST" not in os.environ:
-            logger.info(
-                "Worker %s for database '%s' finished task %d at %s: success"
-                % (
-                    os.getpid(),
-                    settings.DATABASES[database]["NAME"],
-                    task.id,
-                    datetime.now(),
-                )
-            )
+        finishTask(task, database)
 
 
 class Command(BaseCommand):
@@ -216,6 +337,12 @@ class Command(BaseCommand):
             default=False,
             help="Keep the worker alive after the queue is empty",
         )
+        parser.add_argument(
+            "--slots",
+            type=int,
+            default=getattr(settings, "WORKER_SLOTS", 1),
+            help="Maximum number of tasks to run at the same time",
+        )
 
     def handle(self, *args, **options):
         # Pick up the options
@@ -223,6 +350,7 @@ class Command(BaseCommand):
         if database not in settings.DATABASES:
             raise CommandError("No database settings known for '%s'" % database)
         continuous = options["continuous"]
+        slots = max(options["slots"], 1)
 
         # Use the test database if we are running the test suite
         if "FREPPLE_TEST" in os.environ:
@@ -230,8 +358,10 @@ class Command(BaseCommand):
                 connections[db].close()
                 settings.DATABASES[db]["NAME"] = settings.DATABASES[db]["TEST"]["NAME"]
 
-        # Check if a worker already exists
-        if checkActive(database):
+        # Check if a worker already exists, and otherwise mark this one as active
+        listener = TaskListener(database)
+        if not listener.acquire():
+            listener.close()
             if "FREPPLE_TEST" not in os.environ:
                 logger.info(
                     "Worker for database '%s' already active"
@@ -239,9 +369,6 @@ class Command(BaseCommand):
                 )
             return
 
-        # Spawn a worker-alive thread
-        WorkerAlive(database).start()
-
         # Process the queue
         if "FREPPLE_TEST" not in os.environ:
             logger.info(
@@ -251,67 +378,87 @@ class Command(BaseCommand):
         idle_loop_done = False
         old_thread_locals = getattr(_thread_locals, "database", None)
         setattr(_thread_locals, "database", database)
+        running = {}  # Maps a slot number to a task, its process and its concurrency
         while True:
+            # Wrap up the tasks that finished
+            for slot in [i for i, r in running.items() if not r[1].is_alive()]:
+                task, child, concurrency = running.pop(slot)
+                child.join()
+                try:
+                    finishTask(task, database)
+                except Exception as e:
+                    failTask(task, database, e)
+
+            # Start waiting tasks in the free slots.
+            # A waiting task that needs to run alone blocks all later tasks, so
+            # it gets its turn as soon as the running tasks are finished.
+            # Similarly, a waiting task blocks the later tasks it conflicts with.
             try:
-                task = (
+                waiting = list(
                     Task.objects.all()
                     .using(database)
                     .filter(status="Waiting")
-                    .order_by("id")[0]
+                    .exclude(id__in=[r[0].id for r in running.values()])
+                    .order_by("id")
                 )
-                idle_loop_done = False
             except Exception:
-                # No more tasks found
-                if continuous:
-                    time.sleep(5)
+                waiting = []
+            blocked = []
+            for task in waiting:
+                if len(running) >= slots:
+                    break
+                concurrency = getConcurrency(task.name)
+                if any((concurrency, b) in concurrency_conflicts for b in blocked):
                     continue
-                else:
-                    # Special case: we need to permit a single idle loop before shutting down
-                    # the worker. If we shut down immediately, a newly launched task could think
-                    # that a worker is already running - while it just shut down.
-                    if idle_loop_done:
-                        break
-                    else:
-                        idle_loop_done = True
-                        time.sleep(5)
+                if not canStart(concurrency, [r[2] for r in running.values()], slots):
+                    if concurrency:
+                        blocked.append(concurrency)
                         continue
-            try:
-                if "FREPPLE_TEST" not in os.environ:
-                    logger.info(
-                        "Worker %s for database '%s' starting task %d at %s"
-                        % (
-                            os.getpid(),
-                            settings.DATABASES[database]["NAME"],
-                            task.id,
-                            datetime.now(),
-                        )
-                    )
-                runTask(task, database)
-            except Exception as e:
-                # Read the task again from the database and update.
-                task = Task.objects.all().using(database).get(pk=task.id)
-                task.status = "Failed"
-                now = datetime.now()
-                if not task.started:
-                    task.started = now
-                task.finished = now
-                task.message = str(e)
-                task.save(using=database)
-                if "FREPPLE_TEST" not in os.environ:
-                    logger.info(
-                        "Worker %s for database '%s' finished task %d at %s: failed"
-                        % (
-                            os.getpid(),
-                            settings.DATABASES[database]["NAME"],
-                            task.id,
-                            datetime.now(),
+                    else:
+                        break
+                slot = min(set(range(1, slots + 1)) - running.keys())
+                try:
+                    if "FREPPLE_TEST" not in os.environ:
+                        logger.info(
+                            "Worker %s for database '%s' starting task %d in slot %d at %s"
+                            % (
+                                os.getpid(),
+                                settings.DATABASES[database]["NAME"],
+                                task.id,
+                                slot,
+                                datetime.now(),
+                            )
                         )
-                    )
-        # Remove the parameter again
-        try:
-            Parameter.objects.all().using(database).get(pk="Worker alive").delete()
-        except Exception:
-            pass
+                    child = startTask(task, database, slot)
+                    if child:
+                        running[slot] = (task, child, concurrency)
+                except Exception as e:
+                    failTask(task, database, e)
+
+            if running:
+                # Wait till a task finishes or a new task is submitted.
+                # The timeout is only a safety net for lost notifications.
+                idle_loop_done = False
+                wait(
+                    [r[1].sentinel for r in running.values()] + [listener],
+                    timeout=60,
+                )
+                listener.notified()
+            elif waiting:
+                idle_loop_done = False
+            elif continuous:
+                # No more tasks found
+                listener.wait(timeout=60)
+            elif idle_loop_done:
+                break
+            else:
+                # Special case: we need to permit a single idle loop before shutting down
+                # the worker. If we shut down immediately, a newly launched task could think
+                # that a worker is already running - while it just shut down.
+                idle_loop_done = True
+                listener.wait(timeout=5)
+        # Release the worker lock
+        listener.close()
         setattr(_thread_locals, "database", old_thread_locals)
 
         # Remove log files exceeding the configured disk space allocation
@@ -34,8 +34,9 @@ from django.template.loader import render_to_string
 
 from freppledb.execute.models import Task, ScheduledTask
 from freppledb.execute.views import FileManager
+from freppledb.common.auth import MultiDBBackend
 from freppledb.common.middleware import _thread_locals
-from freppledb.common.models import User, Scenario, Parameter
+from freppledb.common.models import User, Scenario
 from freppledb.common.report import create_connection
 from freppledb.input.models import Item
 from freppledb import __version__
@@ -497,15 +498,6 @@ class Command(BaseCommand):
                     update_fields=["status", "lastrefresh"], using=DEFAULT_DB_ALIAS
                 )
 
-            # Delete parameter that marks a running worker
-            if destination != DEFAULT_DB_ALIAS:
-                try:
-                    Parameter.objects.using(destination).filter(
-                        name="Worker alive"
-                    ).delete()
-                except BaseException:
-                    pass
-
             # Give access to the destination scenario to:
             #  a) the user doing the copy
             #  b) all active superusers from the source schema
@@ -521,6 +513,7 @@ class Command(BaseCommand):
                     User.objects.using(destination).filter(
                         username=user.username
                     ).update(is_active=True)
+                MultiDBBackend.clearScenarioUsers(destination)
 
             # Delete data files present in the scenario folders
             if destination != DEFAULT_DB_ALIAS and settings.DATABASES[destination][
@@ -250,7 +250,7 @@ class Command(BaseCommand):
                     % (steptask.id, idx, stepcount),
                     status="%d%%" % int((idx - 1) * 100.0 / stepcount),
                 )
-                runTask(steptask, database)
+                runTask(steptask, database, task.slot)
 
                 # Check the status
                 steptask = Task.objects.all().using(database).get(pk=steptask.id)
@@ -24,6 +24,8 @@
 from datetime import datetime, timedelta
 from freppledb.common.report import getCurrentDate
 import importlib
+import logging
+import os
 import random
 
 from django.conf import settings
@@ -35,7 +37,7 @@ from django.db.models import Sum, Max, Count, F
 from freppledb import __version__
 from freppledb.common.middleware import _thread_locals
 from freppledb.common.models import User, Parameter
-from freppledb.execute.models import Task
+from freppledb.execute.models import SimulationMetric, Task
 from freppledb.input.models import (
     PurchaseOrder,
     DistributionOrder,
@@ -46,6 +48,8 @@ from freppledb.input.models import (
 from freppledb.input.models import ManufacturingOrder, Location
 from freppledb.common.report import getCurrentDate
 
+logger = logging.getLogger(__name__)
+
 
 def load_class(full_class_string):
     """
@@ -63,6 +67,18 @@ def load_class(full_class_string):
         raise CommandError("Can't load class %s" % full_class_string)
 
 
+def getBuckets(curdate, horizon, step):
+    """
+    Returns the list of (start, end) dates of the buckets to simulate.
+    """
+    bckt_list = []
+    tmp = 0
+    while tmp <= horizon:
+        bckt_list.append(curdate + timedelta(days=tmp))
+        tmp += step
+    return list(zip(bckt_list[:-1], bckt_list[1:]))
+
+
 class Command(BaseCommand):
     help = """
   Runs a simulation to measure the plan performance.
@@ -90,6 +106,13 @@ class Command(BaseCommand):
   coded in a dedicated simulation class. A default implementation is
   provided, which can easily be extended in a subclass.
 
+  With the option "resident", the simulation runs inside the planning engine.
+  The model is then loaded only once: the events of each bucket are applied
+  on the objects in memory, the plan is regenerated in memory and only the
+  metrics of each bucket are saved in the database. The option "snapshot"
+  saves the complete plan in the database every N buckets. A custom
+  simulation class for this mode needs to extend the EngineSimulator class.
+
   Warning: The simulation run will update the data in the database.
   Make a backup if you can't afford loosing the current contents.
   """
@@ -136,6 +159,18 @@ class Command(BaseCommand):
             default=False,
             help="Allows to stop the simulation at the end of each step",
         )
+        parser.add_argument(
+            "--resident",
+            action="store_true",
+            default=False,
+            help="Keeps the model in the memory of the planning engine during the complete simulation",
+        )
+        parser.add_argument(
+            "--snapshot",
+            type=int,
+            default=0,
+            help="In resident mode, saves the plan in the database every N buckets. Default 0: only at the end of the simulation",
+        )
 
     def handle(self, **options):
         # Pick up the options
@@ -190,6 +225,10 @@ class Command(BaseCommand):
             if step < 0:
                 raise ValueError("Invalid step: %s" % options["step"])
             task.arguments += " --step=%d" % step
+            if options["resident"]:
+                task.arguments += " --resident"
+                if options["snapshot"]:
+                    task.arguments += " --snapshot=%d" % options["snapshot"]
             verbosity = int(options["verbosity"])
 
             # Log task
@@ -215,133 +254,78 @@ class Command(BaseCommand):
             curdate = getCurrentDate(database).date()
 
             # Compute how many simulation steps we need
-            bckt_list = []
-            tmp = 0
-            while tmp <= horizon:
-                bckt_list.append(curdate + timedelta(days=tmp))
-                tmp += step
-            bckt_list_len = len(bckt_list)
-
-            # Create the simulator class
-            if options.get("simulator", None):
-                cls = load_class(options["simulator"])
-                simulator = cls(database=database, verbosity=verbosity)
-            else:
-                simulator = Simulator(database=database, verbosity=verbosity)
-            simulator.buckets = 1
-
-            # Loop over all dates in the simulation horizon
-            idx = 0
-            strt = None
-            nd = None
-            for bckt in bckt_list:
-                if nd:
-                    strt = nd
-                    nd = bckt
-                else:
-                    nd = bckt
-                    continue
+            buckets = getBuckets(curdate, horizon, step)
 
-                # Start message
-                task.status = "%.0f%%" % (100.0 * idx / bckt_list_len)
-                task.message = "Simulating bucket from %s to %s " % (strt, nd)
+            if options["resident"]:
+                # The planning engine runs the complete simulation
+                task.message = "Simulating in the planning engine"
                 task.save(using=database)
-                idx += 1
-                simulator.buckets += 1
-
-                if verbosity > 0:
-                    print(
-                        "\nStart simulating bucket from %s to %s (%s out of %s)"
-                        % (strt, nd, idx, bckt_list_len)
+                env = [
+                    "fcst",
+                    "supply",
+                    "nowebservice",
+                    "simulation=%s" % task.id,
+                    "simulation_horizon=%d" % horizon,
+                    "simulation_step=%d" % step,
+                    "simulation_snapshot=%d" % options["snapshot"],
+                ]
+                if options.get("simulator", None):
+                    env.append("simulator=%s" % options["simulator"])
+                try:
+                    management.call_command(
+                        "runplan", database=database, env=",".join(env)
                     )
-
-                # Update currentdate parameter
-                param.value = strt.strftime("%Y-%m-%d %H:%M:%S")
-                param.save(using=database)
-
-                # Initialization of the bucket
-                if verbosity > 1:
-                    print("  Starting the bucket")
-                with transaction.atomic(using=database):
-                    simulator.start_bucket(strt, nd)
-
-                # Generate new demand records
-                if verbosity > 1:
-                    print("  Receive new orders from customers")
-                with transaction.atomic(using=database):
-                    simulator.generate_customer_demand(strt, nd)
-
-                # Generate the constrained plan
-                if verbosity > 1:
-                    print("  Generating plan...")
-                management.call_command(
-                    "runplan", database=database, env="fcst,supply,nowebservice"
+                finally:
+                    for i in env[3:]:
+                        os.environ.pop(i.split("=")[0], None)
+            else:
+                # Create the simulator class
+                if options.get("simulator", None):
+                    cls = load_class(options["simulator"])
+                    simulator = cls(database=database, verbosity=verbosity)
+                else:
+                    simulator = Simulator(database=database, verbosity=verbosity)
+                simulator.task = task
+                simulator.buckets = 1
+                param = (
+                    Parameter.objects.all()
+                    .using(database)
+                    .get_or_create(name="currentdate")[0]
                 )
 
-                if options["pause"]:
-                    print(
-                        "\nYou can analyze the plan in the bucket in the user interface now..."
-                    )
-                    input("\nPress Enter to continue the simulation...\n")
-
-                # Release new purchase orders
-                if verbosity > 1:
-                    print("  Create new purchase orders")
-                with transaction.atomic(using=database):
-                    simulator.create_purchase_orders(strt, nd)
-
-                # Release new manufacturing orders
-                if verbosity > 1:
-                    print("  Create new manufacturing orders")
-                with transaction.atomic(using=database):
-                    simulator.create_manufacturing_orders(strt, nd)
+                # Loop over all dates in the simulation horizon
+                for idx, (strt, nd) in enumerate(buckets):
+                    # Start message
+                    task.status = "%.0f%%" % (100.0 * idx / (len(buckets) + 1))
+                    task.message = "Simulating bucket from %s to %s " % (strt, nd)
+                    task.save(using=database)
+                    simulator.buckets += 1
 
-                # Release new distribution orders
-                if verbosity > 1:
-                    print("  Create new distribution orders")
-                with transaction.atomic(using=database):
-                    simulator.create_distribution_orders(strt, nd)
+                    if verbosity > 0:
+                        print(
+                            "\nStart simulating bucket from %s to %s (%s out of %s)"
+                            % (strt, nd, idx + 1, len(buckets) + 1)
+                        )
 
-                # Receive open purchase orders
-                if verbosity > 1:
-                    print("  Receive open purchase orders")
-                with transaction.atomic(using=database):
-                    simulator.receive_purchase_orders(strt, nd)
+                    # Update currentdate parameter
+                    param.value = strt.strftime("%Y-%m-%d %H:%M:%S")
+                    param.save(using=database)
 
-                # Receive open distribution orders
-                if verbosity > 1:
-                    print("  Receive open distribution orders")
-                with transaction.atomic(using=database):
-                    simulator.receive_distribution_orders(strt, nd)
+                    simulator.simulate_bucket(strt, nd, pause=options["pause"])
 
-                # Finish open manufacturing orders
+                # Report statistics from the simulation.
+                # The simulator class collected these results during its run.
                 if verbosity > 1:
-                    print("  Finish open manufacturing orders")
+                    print("Displaying final simulation metrics")
                 with transaction.atomic(using=database):
-                    simulator.finish_manufacturing_orders(strt, nd)
-
-                # Ship demand to customers
-                if verbosity > 1:
-                    print("  Ship orders to customers")
-                with transaction.atomic(using=database):
-                    simulator.ship_customer_demand(strt, nd)
-
-                # Finish of the bucket
-                if verbosity > 1:
-                    print("  Ending the bucket")
-                with transaction.atomic(using=database):
-                    simulator.end_bucket(strt, nd)
-
-            # Report statistics from the simulation.
-            # The simulator class collected these results during its run.
-            if verbosity > 1:
-                print("Displaying final simulation metrics")
-            with transaction.atomic(using=database):
-                simulator.show_metrics()
+                    simulator.show_metrics()
 
             # Task update
             task.status = "Done"
-            task.message = "Simulated from %s till %s" % (bckt_list[0], bckt_list[-1])
+            task.message = "Simulated from %s till %s" % (
+                curdate,
+                buckets[-1][1] if buckets else curdate,
+            )
             task.finished = datetime.now()
 
         except Exception as e:
@@ -362,6 +346,7 @@ class Simulator:
     def __init__(self, database=DEFAULT_DB_ALIAS, verbosity=0):
         self.database = database
         self.verbosity = verbosity
+        self.task = None
         self.demand_number = Demand.objects.all().using(self.database).count()
         self.mo_number = (
             ManufacturingOrder.objects.all()
@@ -394,6 +379,102 @@ class Simulator:
         self.demand_value = 0
         self.demand_count = 0
 
+    def simulate_bucket(self, strt, nd, pause=False):
+        """
+        Runs all simulation steps of a bucket.
+        """
+        # Initialization of the bucket
+        if self.verbosity > 1:
+            print("  Starting the bucket")
+        with transaction.atomic(using=self.database):
+            self.start_bucket(strt, nd)
+
+        # Generate new demand records
+        if self.verbosity > 1:
+            print("  Receive new orders from customers")
+        with transaction.atomic(using=self.database):
+            self.generate_customer_demand(strt, nd)
+
+        # Generate the constrained plan
+        if self.verbosity > 1:
+            print("  Generating plan...")
+        self.generate_plan(strt, nd)
+
+        if pause:
+            print(
+                "\nYou can analyze the plan in the bucket in the user interface now..."
+            )
+            input("\nPress Enter to continue the simulation...\n")
+
+        # Release new purchase orders
+        if self.verbosity > 1:
+            print("  Create new purchase orders")
+        with transaction.atomic(using=self.database):
+            self.create_purchase_orders(strt, nd)
+
+        # Release new manufacturing orders
+        if self.verbosity > 1:
+            print("  Create new manufacturing orders")
+        with transaction.atomic(using=self.database):
+            self.create_manufacturing_orders(strt, nd)
+
+        # Release new distribution orders
+        if self.verbosity > 1:
+            print("  Create new distribution orders")
+        with transaction.atomic(using=self.database):
+            self.create_distribution_orders(strt, nd)
+
+        # Receive open purchase orders
+        if self.verbosity > 1:
+            print("  Receive open purchase orders")
+        with transaction.atomic(using=self.database):
+            self.receive_purchase_orders(strt, nd)
+
+        # Receive open distribution orders
+        if self.verbosity > 1:
+            print("  Receive open distribution orders")
+        with transaction.atomic(using=self.database):
+            self.receive_distribution_orders(strt, nd)
+
+        # Finish open manufacturing orders
+        if self.verbosity > 1:
+            print("  Finish open manufacturing orders")
+        with transaction.atomic(using=self.database):
+            self.finish_manufacturing_orders(strt, nd)
+
+        # Ship demand to customers
+        if self.verbosity > 1:
+            print("  Ship orders to customers")
+        with transaction.atomic(using=self.database):
+            self.ship_customer_demand(strt, nd)
+
+        # Finish of the bucket
+        if self.verbosity > 1:
+            print("  Ending the bucket")
+        with transaction.atomic(using=self.database):
+            self.end_bucket(strt, nd)
+
+    def generate_plan(self, strt, nd):
+        """
+        Generates a constrained plan for the current state of the model.
+        """
+        management.call_command(
+            "runplan", database=self.database, env="fcst,supply,nowebservice"
+        )
+
+    def save_metrics(self, strt, nd, **metrics):
+        """
+        Stores the metrics of a bucket in the database.
+        """
+        SimulationMetric.objects.using(self.database).create(
+            task=self.task,
+            startdate=strt,
+            enddate=nd,
+            demand_shipped=self.demand_shipped,
+            demand_late=self.demand_late,
+            **metrics,
+        )
+
     def start_bucket(self, strt, nd):
         """
         A method called at the start of each simulation bucket.
@@ -451,6 +532,17 @@ class Simulator:
         if dmd["cnt"]:
             self.demand_count += dmd["cnt"]
 
+        self.save_metrics(
+            strt,
+            nd,
+            demand_count=dmd["cnt"] or 0,
+            demand_quantity=dmd["qty"] or 0,
+            demand_value=dmd["val"] or 0,
+            inventory_quantity=inv["qty"] or 0,
+            inventory_value=inv["val"] or 0,
+            wip_quantity=wip["qty"] or 0,
+        )
+
     def finish_manufacturing_orders(self, strt, nd):
         """
         Find all confirmed manufacturing orders scheduled to finish in this bucket.
@@ -691,27 +783,40 @@ class Simulator:
                 order_qty = int(random.uniform(0, fcstqty * 2))
                 if order_qty > 0:
                     self.demand_number += 1
-                    dmd = Demand.objects.using(self.database).create(
-                        name="Demand #%s" % self.demand_number,
-                        item=fcst.item,
-                        location=fcst.location,
-                        customer=fcst.customer,
-                        quantity=order_qty,
-                        status="open",
-                        due=strt + (nd - strt) / 2,
+                    self.open_demand(
+                        "Demand #%s" % self.demand_number,
+                        fcst.item,
+                        fcst.location,
+                        fcst.customer,
+                        order_qty,
+                        strt + (nd - strt) / 2,
                     )
                     if self.verbosity > 2:
                         print(
                             "      Opening demand %s - %d of %s@%s due on %s"
                             % (
-                                dmd.name,
-                                dmd.quantity,
-                                dmd.item.name,
-                                dmd.location.name,
-                                dmd.due,
+                                "Demand #%s" % self.demand_number,
+                                order_qty,
+                                fcst.item.name,
+                                fcst.location.name,
+                                strt + (nd - strt) / 2,
                             )
                         )
 
+    def open_demand(self, name, item, location, customer, quantity, due):
+        """
+        Creates a new open sales order.
+        """
+        Demand.objects.using(self.database).create(
+            name=name,
+            item=item,
+            location=location,
+            customer=customer,
+            quantity=quantity,
+            status="open",
+            due=due,
+        )
+
     def checkAvailable(self, qty, min_qty, oper, consume):
         """
         Verify whether an operationplan of a given quantity is material-feasible.
@@ -1045,3 +1150,269 @@ class Simulator:
             "   Average work in progress: %.2f units"
             % (self.wip_quantity / self.buckets)
         )
+
+
+class EngineSimulator(Simulator):
+    """
+    Simulator that runs inside the planning engine.
+
+    The events of each bucket are applied directly on the objects in memory:
+    confirming and closing operationplans, updating the inventory of the
+    buffers and opening, shipping and closing sales orders. The plan is then
+    regenerated in memory, without reloading the model from the database and
+    without exporting the plan in every bucket.
+    """
+
+    def __init__(self, database=DEFAULT_DB_ALIAS, verbosity=0, solver=None):
+        super().__init__(database=database, verbosity=verbosity)
+        self.solver = solver
+
+    @staticmethod
+    def _datetime(d):
+        return datetime(d.year, d.month, d.day)
+
+    @staticmethod
+    def _buffer(item, location):
+        import frepple
+
+        return frepple.buffer(
+            name="%s @ %s" % (item.name, location.name), item=item, location=location
+        )
+
+    @staticmethod
+    def _operationplans(ordertype, status):
+        import frepple
+
+        return [
+            j
+            for i in frepple.operations()
+            for j in i.operationplans
+            if j.ordertype == ordertype and j.status == status
+        ]
+
+    @staticmethod
+    def _execute(opplan, consume):
+        """
+        Updates the inventory with the material consumed or produced by
+        an operationplan.
+        """
+        for fp in list(opplan.flowplans):
+            if (fp.quantity < 0) == consume:
+                fp.buffer.onhand = fp.buffer.onhand + fp.quantity
+
+    def start_bucket(self, strt, nd):
+        import frepple
+
+        frepple.settings.current = self._datetime(strt)
+
+    def generate_plan(self, strt, nd):
+        if self.solver:
+            self.solver.solve()
+
+    def open_demand(self, name, item, location, customer, quantity, due):
+        import frepple
+
+        frepple.demand(
+            name=name,
+            item=frepple.item(name=item.name, action="C"),
+            location=frepple.location(name=location.name, action="C"),
+            customer=frepple.customer(name=customer.name, action="C"),
+            quantity=quantity,
+            due=self._datetime(due),
+            priority=10,
+            status="open",
+        )
+
+    def create_purchase_orders(self, strt, nd):
+        end = self._datetime(nd)
+        for po in self._operationplans("PO", "proposed"):
+            if po.start <= end:
+                po.status = "confirmed"
+
+    def create_manufacturing_orders(self, strt, nd):
+        end = self._datetime(nd)
+        for op in self._operationplans("MO", "proposed"):
+            if op.start <= end and not op.demand:
+                self._execute(op, True)
+                op.status = "confirmed"
+
+    def create_distribution_orders(self, strt, nd):
+        end = self._datetime(nd)
+        for do in self._operationplans("DO", "proposed"):
+            if do.start <= end:
+                self._execute(do, True)
+                do.status = "confirmed"
+
+    def receive_purchase_orders(self, strt, nd):
+        end = self._datetime(nd)
+        for po in self._operationplans("PO", "confirmed"):
+            if po.end <= end:
+                self._execute(po, False)
+                po.status = "closed"
+
+    def receive_distribution_orders(self, strt, nd):
+        end = self._datetime(nd)
+        for do in self._operationplans("DO", "confirmed"):
+            if do.end <= end:
+                self._execute(do, False)
+                do.status = "closed"
+
+    def finish_manufacturing_orders(self, strt, nd):
+        end = self._datetime(nd)
+        for op in self._operationplans("MO", "confirmed"):
+            if op.end <= end and not op.demand:
+                self._execute(op, False)
+                op.status = "closed"
+
+    def checkDemandExpired(self, dmd, nd):
+        maxlateness = dmd.maxlateness
+        if isinstance(maxlateness, timedelta):
+            maxlateness = maxlateness.total_seconds()
+        if (
+            maxlateness is not None
+            and (self._datetime(nd) - dmd.due).total_seconds() >= maxlateness
+        ):
+            # We're beyond the last possible delivery of the demand.
+            dmd.status = "closed"
+            dmd.category = "demand unsatisfied and expired"
+
+    def ship_customer_demand(self, strt, nd):
+        """
+        Ships the open sales orders from the inventory of the item at the
+        location of the order, following the same rules as the database
+        simulator.
+        """
+        import frepple
+
+        end = self._datetime(nd)
+        for dmd in sorted(
+            (
+                d
+                for d in frepple.demands()
+                if isinstance(d, frepple.demand_default)
+                and not d.hidden
+                and d.status == "open"
+                and d.due < end
+            ),
+            key=lambda d: (d.priority, d.due),
+        ):
+            buf = self._buffer(dmd.item, dmd.location)
+            minshipment = dmd.minshipment or 0
+            if buf.onhand < minshipment:
+                # Not sufficient to ship something
+                self.checkDemandExpired(dmd, nd)
+                continue
+            elif buf.onhand >= dmd.quantity:
+                # Shipping the complete remaining quantity
+                buf.onhand = buf.onhand - dmd.quantity
+            else:
+                if dmd.quantity > minshipment:
+                    ship_qty = min(buf.onhand, dmd.quantity - minshipment)
+                else:
+                    ship_qty = buf.onhand
+                if ship_qty <= minshipment:
+                    self.checkDemandExpired(dmd, nd)
+                else:
+                    # Partial shipment
+                    dmd.quantity = dmd.quantity - ship_qty
+                    buf.onhand = buf.onhand - ship_qty
+                    self.checkDemandExpired(dmd, nd)
+                continue
+
+            # We can satisfy this order
+            dmd.status = "closed"
+            self.demand_shipped += 1
+            if strt > dmd.due.date():
+                self.demand_late += 1
+                self.demand_lateness += strt - dmd.due.date()
+                dmd.category = "delivered late on %s" % strt
+            else:
+                dmd.category = "delivered on time on %s" % dmd.due
+
+    def end_bucket(self, strt, nd):
+        import frepple
+
+        inv_qty = 0
+        inv_val = 0
+        for buf in frepple.buffers():
+            if buf.onhand > 0:
+                inv_qty += buf.onhand
+                inv_val += buf.onhand * (buf.item.cost or 0)
+        wip_qty = sum(i.quantity for i in self._operationplans("MO", "confirmed"))
+        dmd_cnt = 0
+        dmd_qty = 0
+        dmd_val = 0
+        for dmd in frepple.demands():
+            if (
+                isinstance(dmd, frepple.demand_default)
+                and not dmd.hidden
+                and dmd.status == "open"
+            ):
+                dmd_cnt += 1
+                dmd_qty += dmd.quantity
+                dmd_val += dmd.quantity * (dmd.item.cost or 0)
+        self.inventory_quantity += inv_qty
+        self.inventory_value += inv_val
+        self.wip_quantity += wip_qty
+        self.demand_count += dmd_cnt
+        self.demand_quantity += dmd_qty
+        self.demand_value += dmd_val
+        self.save_metrics(
+            strt,
+            nd,
+            demand_count=dmd_cnt,
+            demand_quantity=dmd_qty,
+            demand_value=dmd_val,
+            inventory_quantity=inv_qty,
+            inventory_value=inv_val,
+            wip_quantity=wip_qty,
+        )
+
+    def snapshot(self):
+        """
+        Saves the current plan in the database.
+        """
+        from freppledb.common.commands import PlanTaskRegistry
+
+        arguments = PlanTaskRegistry.arguments
+        task = PlanTaskRegistry.reg.task
+        try:
+            PlanTaskRegistry.reg.task = None
+            PlanTaskRegistry.run(export=1, database=self.database)
+        finally:
+            PlanTaskRegistry.reg.task = task
+            PlanTaskRegistry.arguments = arguments
+
+
+def runEngineSimulation(database=DEFAULT_DB_ALIAS, solver=None):
+    """
+    Simulation loop of the resident mode, running in the planning engine.
+
+    The options are passed by the simulation command as environment
+    variables of the engine.
+    """
+    import frepple
+
+    horizon = int(os.environ.get("simulation_horizon", 60))
+    step = int(os.environ.get("simulation_step", 1))
+    snapshot = int(os.environ.get("simulation_snapshot", 0))
+    if os.environ.get("simulator", None):
+        cls = load_class(os.environ["simulator"])
+    else:
+        cls = EngineSimulator
+    simulator = cls(database=database, verbosity=1, solver=solver)
+    simulator.task = (
+        Task.objects.all().using(database).filter(pk=os.environ["simulation"]).first()
+        if os.environ["simulation"].isdigit()
+        else None
+    )
+    simulator.buckets = 1
+
+    buckets = getBuckets(frepple.settings.current.date(), horizon, step)
+    for idx, (strt, nd) in enumerate(buckets):
+        logger.info("Simulating bucket from %s to %s" % (strt, nd))
+        simulator.buckets += 1
+        simulator.simulate_bucket(strt, nd)
+        if snapshot and (idx + 1) % snapshot == 0 and idx + 1 < len(buckets):
+            simulator.snapshot()
+    simulator.show_metrics()
@@ -0,0 +1,109 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# All information contained herein is, and remains the property of frePPLe.
+# You are allowed to use and modify the source code, as long as the software is used
+# within your company.
+# You are not allowed to distribute the software, either in the form of source code
+# or in the form of compiled binaries.
+#
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("execute", "0010_dataexport"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimulationMetric",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        primary_key=True, serialize=False, verbose_name="identifier"
+                    ),
+                ),
+                ("startdate", models.DateField(verbose_name="start date")),
+                ("enddate", models.DateField(verbose_name="end date")),
+                (
+                    "demand_count",
+                    models.IntegerField(default=0, verbose_name="open demands"),
+                ),
+                (
+                    "demand_quantity",
+                    models.DecimalField(
+                        decimal_places=8,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="open demand quantity",
+                    ),
+                ),
+                (
+                    "demand_value",
+                    models.DecimalField(
+                        decimal_places=8,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="open demand value",
+                    ),
+                ),
+                (
+                    "demand_shipped",
+                    models.IntegerField(default=0, verbose_name="shipped demands"),
+                ),
+                (
+                    "demand_late",
+                    models.IntegerField(default=0, verbose_name="late demands"),
+                ),
+                (
+                    "inventory_quantity",
+                    models.DecimalField(
+                        decimal_places=8,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="inventory quantity",
+                    ),
+                ),
+                (
+                    "inventory_value",
+                    models.DecimalField(
+                        decimal_places=8,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="inventory value",
+                    ),
+                ),
+                (
+                    "wip_quantity",
+                    models.DecimalField(
+                        decimal_places=8,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="work in progress quantity",
+                    ),
+                ),
+                (
+                    "task",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="simulationmetrics",
+                        to="execute.task",
+                        verbose_name="task",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "simulation metric",
+                "verbose_name_plural": "simulation metrics",
+                "db_table": "execute_simulationmetric",
+                "ordering": ("task", "startdate"),
+                "default_permissions": [],
+            },
+        ),
+    ]
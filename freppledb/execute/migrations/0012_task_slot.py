@@ -0,0 +1,27 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# All information contained herein is, and remains the property of frePPLe.
+# You are allowed to use and modify the source code, as long as the software is used
+# within your company.
+# You are not allowed to distribute the software, either in the form of source code
+# or in the form of compiled binaries.
+#
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("execute", "0011_simulationmetric"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="slot",
+            field=models.IntegerField(
+                editable=False, null=True, verbose_name="worker slot"
+            ),
+        ),
+    ]
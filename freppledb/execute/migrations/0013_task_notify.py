@@ -0,0 +1,58 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# All information contained herein is, and remains the property of frePPLe.
+# You are allowed to use and modify the source code, as long as the software is used
+# within your company.
+# You are not allowed to distribute the software, either in the form of source code
+# or in the form of compiled binaries.
+#
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("execute", "0012_task_slot"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            create or replace function execute_log_notify() returns trigger as $$
+            begin
+              perform pg_notify('frepple_task', new.id::text);
+              return null;
+            end;
+            $$ language plpgsql
+            """,
+            "drop function if exists execute_log_notify()",
+        ),
+        migrations.RunSQL(
+            """
+            create trigger execute_log_insert
+            after insert on execute_log
+            for each row
+            when (new.status = 'Waiting')
+            execute procedure execute_log_notify()
+            """,
+            "drop trigger if exists execute_log_insert on execute_log",
+        ),
+        migrations.RunSQL(
+            """
+            create trigger execute_log_update
+            after update of status on execute_log
+            for each row
+            when (
+              new.status is distinct from old.status
+              and new.status in ('Waiting', '100%', 'Done', 'Failed', 'Canceled')
+              )
+            execute procedure execute_log_notify()
+            """,
+            "drop trigger if exists execute_log_update on execute_log",
+        ),
+        migrations.RunSQL(
+            "delete from common_parameter where name = 'Worker alive'",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -71,6 +71,7 @@ class Task(models.Model):
         on_delete=models.CASCADE,
     )
     processid = models.IntegerField("processid", editable=False, null=True)
+    slot = models.IntegerField(_("worker slot"), editable=False, null=True)
 
     def __str__(self):
         return "%s - %s - %s" % (self.id, self.name, self.status)
@@ -271,3 +272,50 @@ class DataExport(models.Model):
         if os.sep in self.name:
             raise Exception("Export names can't contain %s" % os.sep)
         super().save(*args, **kwargs)
+
+
+class SimulationMetric(models.Model):
+    """
+    Performance metrics measured at the end of each bucket of a simulation run.
+    """
+
+    # Database fields
+    id = models.AutoField(_("identifier"), primary_key=True)
+    task = models.ForeignKey(
+        Task,
+        verbose_name=_("task"),
+        null=True,
+        blank=True,
+        related_name="simulationmetrics",
+        on_delete=models.CASCADE,
+    )
+    startdate = models.DateField(_("start date"))
+    enddate = models.DateField(_("end date"))
+    demand_count = models.IntegerField("open demands", default=0)
+    demand_quantity = models.DecimalField(
+        "open demand quantity", max_digits=20, decimal_places=8, default=0
+    )
+    demand_value = models.DecimalField(
+        "open demand value", max_digits=20, decimal_places=8, default=0
+    )
+    demand_shipped = models.IntegerField("shipped demands", default=0)
+    demand_late = models.IntegerField("late demands", default=0)
+    inventory_quantity = models.DecimalField(
+        "inventory quantity", max_digits=20, decimal_places=8, default=0
+    )
+    inventory_value = models.DecimalField(
+        "inventory value", max_digits=20, decimal_places=8, default=0
+    )
+    wip_quantity = models.DecimalField(
+        "work in progress quantity", max_digits=20, decimal_places=8, default=0
+    )
+
+    def __str__(self):
+        return "%s - %s" % (self.task_id, self.startdate)
+
+    class Meta:
+        db_table = "execute_simulationmetric"
+        verbose_name = "simulation metric"
+        verbose_name_plural = "simulation metrics"
+        ordering = ("task", "startdate")
+        default_permissions = []
@@ -22,6 +22,7 @@
 #
 
 import base64
+from datetime import datetime
 import json
 import os
 from time import sleep
@@ -31,12 +32,19 @@ from django.conf import settings
 from django.core import management
 from django.db import DEFAULT_DB_ALIAS, transaction
 from django.db.models import Sum, Count, Q
-from django.test import TransactionTestCase
-
-from freppledb.execute.models import Task
+from django.test import SimpleTestCase, TransactionTestCase
+
+from freppledb.execute.management.commands.runworker import (
+    canStart,
+    checkActive,
+    getConcurrency,
+    TaskListener,
+)
+from freppledb.execute.models import SimulationMetric, Task
 import freppledb.output as output
 import freppledb.input as input
 import freppledb.common as common
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.models import Parameter, User, Notification
 
 
@@ -61,7 +69,9 @@ class execute_with_commands(TransactionTestCase):
     def test_run_cmd(self):
         # Empty the database tables
         self.assertNotEqual(input.models.Calendar.objects.count(), 0)
+        version = Dashboard.getPlanVersion()
         management.call_command("empty", all=True)
+        self.assertNotEqual(Dashboard.getPlanVersion(), version)
         self.assertEqual(input.models.Calendar.objects.count(), 0)
         self.assertEqual(input.models.Demand.objects.count(), 0)
         self.assertEqual(output.models.Problem.objects.count(), 0)
@@ -208,6 +218,53 @@ class execute_multidb(TransactionTestCase):
         )
 
 
+class worker_slots(SimpleTestCase):
+    def test_concurrency(self):
+        self.assertEqual(getConcurrency("runplan"), "plan")
+        self.assertEqual(getConcurrency("exportworkbook"), "export")
+        self.assertIsNone(getConcurrency("importfromfolder"))
+        self.assertIsNone(getConcurrency("nonexisting"))
+
+        # A task without concurrency class runs alone
+        self.assertTrue(canStart(None, [], 4))
+        self.assertFalse(canStart(None, ["export"], 4))
+        self.assertFalse(canStart("export", [None], 4))
+
+        # At most one plan, and no exports next to it
+        self.assertFalse(canStart("plan", ["plan"], 4))
+        self.assertFalse(canStart("plan", ["export", "export"], 4))
+        self.assertFalse(canStart("export", ["plan"], 4))
+        self.assertTrue(canStart("export", ["export", "export"], 4))
+        self.assertFalse(canStart("export", ["export", "export"], 2))
+
+
+class worker_notify(TransactionTestCase):
+    def test_listener(self):
+        listener = TaskListener()
+        try:
+            # Submitting a task notifies the listener
+            task = Task.objects.create(
+                name="runplan", submitted=datetime.now(), status="Waiting"
+            )
+            self.assertIn(task.id, listener.wait(timeout=5))
+
+            # Progress updates don't notify, a finished task does
+            task.status = "10%"
+            task.save(update_fields=["status"])
+            self.assertEqual(listener.wait(timeout=1), [])
+            task.status = "Done"
+            task.save(update_fields=["status"])
+            self.assertEqual(listener.wait(timeout=5), [task.id])
+
+            # The worker lock marks an active worker
+            self.assertFalse(checkActive())
+            self.assertTrue(listener.acquire())
+            self.assertTrue(checkActive())
+        finally:
+            listener.close()
+        self.assertFalse(checkActive())
+
+
 class FixtureTest(TransactionTestCase):
     def test_fixture_demo(self):
         self.assertEqual(input.models.Item.objects.count(), 0)
@@ -274,6 +331,19 @@ class execute_simulation(TransactionTestCase):
         )
         # TODO add comparison with initial_planned_late
 
+    def test_resident(self):
+        # The planning engine simulates all buckets with a single model load
+        management.call_command(
+            "simulation", step=7, horizon=28, resident=True, verbosity=0
+        )
+        task = Task.objects.filter(name="simulation").order_by("-id").first()
+        self.assertEqual(task.status, "Done")
+        self.assertEqual(
+            SimulationMetric.objects.filter(task=task).count(),
+            4,
+            "Expected metrics for every simulated bucket",
+        )
+
 
 class remote_commands(TransactionTestCase):
     fixtures = ["demo"]
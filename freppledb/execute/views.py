@@ -26,11 +26,7 @@ import gzip
 from importlib import import_module
 from io import BytesIO
 import json
-from openpyxl import load_workbook, Workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.cell import WriteOnlyCell
-from openpyxl.styles import NamedStyle, PatternFill
-from openpyxl.comments import Comment as CellComment
+from openpyxl import load_workbook
 import operator
 import os
 import psutil
@@ -39,13 +35,10 @@ import shlex
 from time import sleep
 from zipfile import ZipFile, ZIP_DEFLATED
 
-from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_permission_codename
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
-from django.db.models.fields import AutoField
-from django.db.models.fields.related import ForeignKey
 from django.views.decorators.cache import never_cache
 from django.shortcuts import render
 from django.utils.html import escape
@@ -68,11 +61,9 @@ from django.utils.encoding import force_str
 from django.utils.text import capfirst
 from django.core.management import get_commands, call_command
 
-from freppledb import __version__
-from freppledb.admin import data_site
 from freppledb.common.auth import basicauthentication
 from freppledb.common.dataload import parseExcelWorksheet
-from freppledb.common.models import Scenario, HierarchyModel, Parameter
+from freppledb.common.models import Scenario, Parameter
 from freppledb.common.report import (
     GridFieldDuration,
     GridFieldBool,
@@ -81,12 +72,11 @@ from freppledb.common.report import (
     GridFieldText,
     GridFieldInteger,
     EXCLUDE_FROM_BULK_OPERATIONS,
-    _getCellValue,
     matchesModelName,
 )
 from freppledb.common.views import sendStaticFile
 from .models import Task, ScheduledTask, DataExport
-from .management.commands.runworker import launchWorker
+from .management.commands.runworker import checkActive, launchWorker
 from .management.commands.runplan import parseConstraints, constraintString
 from .management.commands.scheduletasks import scheduler
 
@@ -139,6 +129,12 @@ class TaskReport(GridReport):
             align="center",
             extra="formatter:status",
         ),
+        GridFieldInteger(
+            "slot",
+            title=_("worker slot"),
+            editable=False,
+            align="center",
+        ),
         GridFieldText(
             "logfile",
             title=_("log file"),
@@ -213,11 +209,8 @@ class TaskReport(GridReport):
         )
 
         # Cancel waiting tasks if no runworker is active
-        worker_alive = Parameter.getValue("Worker alive", request.database, None)
         try:
-            if not worker_alive or datetime.now() - datetime.strptime(
-                worker_alive, "%Y-%m-%d %H:%M:%S"
-            ) > timedelta(0, 30):
+            if not checkActive(request.database):
                 Task.objects.using(request.database).filter(
                     status__iexact="waiting",
                     submitted__lte=datetime.now() - timedelta(0, 30),
@@ -233,6 +226,7 @@ class TaskReport(GridReport):
                 "started": rec.started,
                 "finished": rec.finished,
                 "status": rec.status,
+                "slot": rec.slot,
                 "logfile": rec.logfile if rec.logfile in logfileslist else None,
                 "message": rec.message,
                 "arguments": rec.arguments,
@@ -371,9 +365,7 @@ def APITask(request, action):
 @csrf_protect
 def LaunchTask(request, action):
     try:
-        if action == "exportworkbook":
-            return exportWorkbook(request)
-        elif action == "importworkbook":
+        if action == "importworkbook":
             return StreamingHttpResponse(
                 content_type="text/plain; charset=%s" % settings.DEFAULT_CHARSET,
                 streaming_content=importWorkbook(request),
@@ -618,6 +610,17 @@ def wrapTask(request, action):
         if arguments:
             task.arguments = " ".join(arguments)
         task.save(using=request.database)
+    elif action == "exportworkbook":
+        entities = args.getlist("entities")
+        if not entities:
+            raise Exception(_("Nothing to export"))
+        task = Task(
+            name="exportworkbook", submitted=now, status="Waiting", user=request.user
+        )
+        task.arguments = "--entities=%s" % ",".join(entities)
+        if args.get("anonymous", False):
+            task.arguments += " --anonymous=true"
+        task.save(using=request.database)
     elif action == "measure_copy":
         if not request.user.has_perm("auth.run_db"):
             raise Exception("Missing execution privileges")
@@ -867,6 +870,26 @@ class FileManager:
         else:
             raise Http404("Invalid folder code")
 
+    @staticmethod
+    def getWorkbookOwners(request):
+        """
+        Returns a dictionary with the user that exported each spreadsheet of
+        the export folder. Only these users and superusers can download them.
+        """
+        owners = {}
+        for message, user_id in (
+            Task.objects.using(request.database)
+            .filter(
+                name__in=("exportworkbook", "frepple_exportworkbook"),
+                status="Done",
+                message__startswith="Exported ",
+            )
+            .order_by("id")
+            .values_list("message", "user_id")
+        ):
+            owners[message[9:]] = user_id
+        return owners
+
     @staticmethod
     def cleanFolder(foldercode, database=DEFAULT_DB_ALIAS):
         if foldercode == 0:
@@ -1038,6 +1061,12 @@ class FileManager:
                 if not os.path.isfile(cleanpath):
                     logger.warning("Failed file download: %s" % filename)
                     return HttpResponseNotFound(force_str(_("Error")))
+                if foldercode == "1" and not request.user.is_superuser:
+                    owner = FileManager.getWorkbookOwners(request).get(
+                        clean_filename, None
+                    )
+                    if owner and owner != request.user.id:
+                        return HttpResponseForbidden(force_str(_("Permission denied")))
                 return sendStaticFile(
                     request,
                     folder,
@@ -1052,11 +1081,19 @@ class FileManager:
                 return HttpResponseNotFound(force_str(_("Error")))
         else:
             # Download all files
+            if foldercode == "1" and not request.user.is_superuser:
+                owners = FileManager.getWorkbookOwners(request)
+            else:
+                owners = {}
             b = BytesIO()
             with ZipFile(file=b, mode="w", compression=ZIP_DEFLATED) as zf:
                 if os.path.isdir(folder):
                     for filename in os.listdir(folder):
                         fullfilename = os.path.join(folder, filename)
+                        owner = owners.get(filename, None)
+                        if owner and owner != request.user.id:
+                            # Spreadsheet exported by another user
+                            continue
                         if filename.endswith(extensions) and os.access(
                             fullfilename, os.R_OK
                         ):
@@ -1141,226 +1178,6 @@ def scheduletasks(request):
         return HttpResponseServerError("Error updating scheduled task")
 
 
-def exportWorkbook(request):
-    # Create a workbook
-    wb = Workbook(write_only=True)
-    wb.properties.creator = "frepple %s" % __version__
-
-    # Create a named style for the header row
-    headerstyle = NamedStyle(name="headerstyle")
-    headerstyle.fill = PatternFill(fill_type="solid", fgColor="70c4f4")
-    wb.add_named_style(headerstyle)
-    readlonlyheaderstyle = NamedStyle(name="readlonlyheaderstyle")
-    readlonlyheaderstyle.fill = PatternFill(fill_type="solid", fgColor="d0ebfb")
-    wb.add_named_style(readlonlyheaderstyle)
-
-    # retrieve value of parameter excel_duration_in_days
-    excel_duration_in_days = (
-        Parameter.getValue("excel_duration_in_days", request.database, "false").lower()
-        == "true"
-    )
-
-    # Loop over all selected entity types
-    exportConfig = {"anonymous": request.POST.get("anonymous", False)}
-    ok = False
-    for entity_name in request.POST.getlist("entities"):
-        try:
-            # Initialize
-            (app_label, model_label) = entity_name.split(".")
-            model = apps.get_model(app_label, model_label)
-            # Verify access rights
-            permname = get_permission_codename("change", model._meta)
-            if not request.user.has_perm("%s.%s" % (app_label, permname)):
-                continue
-
-            # Never export some special administrative models
-            if model in EXCLUDE_FROM_BULK_OPERATIONS:
-                continue
-
-            # Create sheet
-            ok = True
-            ws = wb.create_sheet(title=force_str(model._meta.verbose_name))
-
-            # Build a list of fields and properties
-            fields = []
-            modelfields = []
-            header = []
-            source = False
-            lastmodified = False
-            owner = False
-            comment = None
-            try:
-                # The admin model of the class can define some fields to exclude from the export
-                exclude = data_site._registry[model].exclude
-            except Exception:
-                exclude = None
-            for i in model._meta.fields:
-                if isinstance(i, AutoField) and i.primary_key:
-                    # Don't export automatically generated primary keys.
-                    # We rely on the natural for restoring the data.
-                    continue
-                elif i.name in ["lft", "rght", "lvl"]:
-                    continue  # Skip some fields of HierarchyModel
-                elif i.name == "source":
-                    source = i  # Put the source field at the end
-                elif i.name == "lastmodified":
-                    lastmodified = i  # Put the last-modified field at the very end
-                elif not (exclude and i.name in exclude):
-                    fields.append(i.column)
-                    modelfields.append(i)
-                    cell = WriteOnlyCell(ws, value=force_str(i.verbose_name).title())
-                    if i.editable:
-                        cell.style = "headerstyle"
-                        if isinstance(i, ForeignKey):
-                            cell.comment = CellComment(
-                                force_str(
-                                    _("Values in this field must exist in the %s table")
-                                    % force_str(i.remote_field.model._meta.verbose_name)
-                                ),
-                                "Author",
-                            )
-                        elif i.choices:
-                            cell.comment = CellComment(
-                                force_str(
-                                    _("Accepted values are: %s")
-                                    % ", ".join([c[0] for c in i.choices])
-                                ),
-                                "Author",
-                            )
-                    else:
-                        cell.style = "readlonlyheaderstyle"
-                        if not comment:
-                            comment = CellComment(
-                                force_str(_("Read only")),
-                                "Author",
-                                height=20,
-                                width=80,
-                            )
-                        cell.comment = comment
-                    header.append(cell)
-                    if i.name == "owner":
-                        owner = True
-            if hasattr(model, "propertyFields"):
-                if callable(model.propertyFields):
-                    props = model.propertyFields(request)
-                else:
-                    props = model.propertyFields
-                for i in props:
-                    if i.export:
-                        fields.append(i.name)
-                        cell = WriteOnlyCell(
-                            ws, value=force_str(i.verbose_name).title()
-                        )
-                        if i.editable:
-                            cell.style = "headerstyle"
-                            if isinstance(i, ForeignKey):
-                                cell.comment = CellComment(
-                                    force_str(
-                                        _(
-                                            "Values in this field must exist in the %s table"
-                                        )
-                                        % force_str(
-                                            i.remote_field.model._meta.verbose_name
-                                        )
-                                    ),
-                                    "Author",
-                                )
-                        elif i.choices:
-                            cell.comment = CellComment(
-                                force_str(
-                                    _("Accepted values are: %s")
-                                    % ", ".join([c[0] for c in i.choices])
-                                ),
-                                "Author",
-                            )
-                        else:
-                            cell.style = "readlonlyheaderstyle"
-                            if not comment:
-                                comment = CellComment(
-                                    force_str(_("Read only")),
-                                    "Author",
-                                    height=20,
-                                    width=80,
-                                )
-                            cell.comment = comment
-                        header.append(cell)
-                        modelfields.append(i)
-            if source:
-                fields.append("source")
-                cell = WriteOnlyCell(ws, value=force_str(_("source")).title())
-                cell.style = "headerstyle"
-                header.append(cell)
-                modelfields.append(source)
-            if lastmodified:
-                fields.append("lastmodified")
-                cell = WriteOnlyCell(ws, value=force_str(_("last modified")).title())
-                cell.style = "readlonlyheaderstyle"
-                if not comment:
-                    comment = CellComment(
-                        force_str(_("Read only")), "Author", height=20, width=80
-                    )
-                cell.comment = comment
-                header.append(cell)
-                modelfields.append(lastmodified)
-
-            # Write a formatted header row
-            ws.append(header)
-
-            # Add an auto-filter to the table
-            ws.auto_filter.ref = "A1:%s1048576" % get_column_letter(len(header))
-
-            # Use the default manager
-            if issubclass(model, HierarchyModel):
-                model.rebuildHierarchy(database=request.database)
-                query = (
-                    model.objects.all().using(request.database).order_by("lvl", "pk")
-                )
-            elif owner:
-                # First export records with empty owner field
-                query = (
-                    model.objects.all().using(request.database).order_by("-owner", "pk")
-                )
-            else:
-                query = model.objects.all().using(request.database).order_by("pk")
-
-            # Special annotation of the export query
-            if hasattr(model, "export_objects"):
-                query = model.export_objects(query, request)
-
-            # Loop over all records
-            for rec in query.values_list(*fields):
-                cells = []
-                fld = 0
-                for f in rec:
-                    cells.append(
-                        _getCellValue(
-                            f,
-                            field=modelfields[fld],
-                            exportConfig=exportConfig,
-                            excel_duration_in_days=excel_duration_in_days,
-                        )
-                    )
-                    fld += 1
-                ws.append(cells)
-        except Exception:
-            pass  # Silently ignore the error and move on to the next entity.
-
-    # Not a single entity to export
-    if not ok:
-        raise Exception(_("Nothing to export"))
-
-    # Write the excel from memory to a string and then to a HTTP response
-    output = BytesIO()
-    wb.save(output)
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        content=output.getvalue(),
-    )
-    response["Content-Disposition"] = 'attachment; filename="frepple.xlsx"'
-    response["Cache-Control"] = "no-cache, no-store"
-    return response
-
-
 def importWorkbook(request):
     """
     This method reads a spreadsheet in Office Open XML format (typically with
@@ -39,7 +39,16 @@ from freppledb.boot import getAttributes
 from freppledb.common.commands import PlanTaskRegistry, PlanTask, clean_value
 from freppledb.common.models import Parameter, BucketDetail
 from freppledb.common.report import getCurrentDate
-from freppledb.input.commands.load import LoadTask
+from freppledb.input.commands.load import (
+    LoadTask,
+    loadBuffers,
+    loadCalendarBuckets,
+    loadCustomers,
+    loadDemand,
+    loadItems,
+    loadLocations,
+    loadOperations,
+)
 from freppledb.input.models import Item, Customer, Location
 
 
@@ -887,6 +896,15 @@ class LoadMeasures(PlanTask):
 class LoadForecast(LoadTask):
     description = "Load forecast"
     sequence = 107.5
+    dependencies = (
+        loadItems,
+        loadLocations,
+        loadCustomers,
+        loadBuffers,
+        loadOperations,
+        loadCalendarBuckets,
+        loadDemand,
+    )
 
     calendar = None
 
@@ -1440,3 +1458,128 @@ class ExportForecast(PlanTask):
         # refresh materialized view
         with connections[database].cursor() as cursor:
             cursor.execute("REFRESH MATERIALIZED VIEW forecastreport_view")
+
+
+@PlanTaskRegistry.register
+class ExportForecastTree(PlanTask):
+    description = "Export forecast editor aggregates"
+    sequence = (401, "export3", 2)
+    label = ("fcst", _("Generate forecast"))
+    export = True
+
+    # Number of buckets shown in the forecast editor trees
+    buckets = 3
+
+    @classmethod
+    def getWeight(cls, database=DEFAULT_DB_ALIAS, **kwargs):
+        return ExportForecast.getWeight(database=database, **kwargs)
+
+    @classmethod
+    def run(cls, database=DEFAULT_DB_ALIAS, **kwargs):
+        import frepple
+
+        cls.refresh(database=database, current=frepple.settings.current)
+
+    @classmethod
+    def refresh(
+        cls,
+        database=DEFAULT_DB_ALIAS,
+        items=None,
+        locations=None,
+        customers=None,
+        current=None,
+    ):
+        """
+        Recomputes the table with the totals per node and bucket that the
+        forecast editor trees read.
+        The table is rebuilt from scratch when no items, locations or customers
+        are passed. Otherwise only the nodes above and below them are updated.
+        """
+        from .models import ForecastPlan
+
+        if not current:
+            current = getCurrentDate(database, lastplan=True)
+        filters = []
+        args = []
+        for dimension, names in (
+            ("item", items),
+            ("location", locations),
+            ("customer", customers),
+        ):
+            if names is None:
+                continue
+            filters.append(
+                """
+                %s_id in (
+                  select parent.name
+                  from %s parent
+                  inner join %s child
+                    on child.lft between parent.lft and parent.rght
+                    or parent.lft between child.lft and child.rght
+                  where child.name = any(%%s)
+                  )
+                """
+                % (dimension, dimension, dimension)
+            )
+            args.append(list(names))
+        where = " and ".join(filters) if filters else "true"
+
+        with transaction.atomic(using=database):
+            with connections[database].cursor() as cursor:
+                if filters:
+                    cursor.execute("delete from forecasttree where %s" % where, args)
+                else:
+                    cursor.execute("truncate table forecasttree")
+                cursor.execute(
+                    """
+                    with buckets as (
+                      select bucket_id, name, startdate, enddate
+                      from (
+                        select bucket_id, name, startdate, enddate,
+                        row_number() over (partition by bucket_id order by startdate) as rownumber
+                        from common_bucketdetail
+                        where enddate > %%s
+                        and bucket_id in (
+                          select name
+                          from common_bucket
+                          where level <= (
+                            select level
+                            from common_bucket
+                            where name = (select value from common_parameter where name='forecast.calendar')
+                            )
+                          )
+                        ) d
+                      where rownumber <= %%s
+                      )
+                    insert into forecasttree
+                      (item_id, location_id, customer_id, bucket, bucketname, startdate, %s)
+                    select
+                      nodes.item_id, nodes.location_id, nodes.customer_id,
+                      buckets.bucket_id, buckets.name, buckets.startdate, %s
+                    from (
+                      select item_id, location_id, customer_id
+                      from forecasthierarchy
+                      where %s
+                      ) nodes
+                    cross join buckets
+                    left outer join forecastplan
+                      on forecastplan.item_id = nodes.item_id
+                      and forecastplan.location_id = nodes.location_id
+                      and forecastplan.customer_id = nodes.customer_id
+                      and forecastplan.startdate >= buckets.startdate
+                      and forecastplan.startdate < buckets.enddate
+                    group by nodes.item_id, nodes.location_id, nodes.customer_id,
+                      buckets.bucket_id, buckets.name, buckets.startdate
+                    """
+                    % (
+                        ", ".join(ForecastPlan.numeric_measures),
+                        ", ".join(
+                            "coalesce(sum(forecastplan.%s),0)" % m
+                            for m in ForecastPlan.numeric_measures
+                        ),
+                        where,
+                    ),
+                    [current, cls.buckets] + args,
+                )
+                if not filters:
+                    cursor.execute("analyze forecasttree")
@@ -31,6 +31,7 @@ from django.utils.translation import gettext_lazy as _
 from django.template import Template, RequestContext
 
 from freppledb.execute.models import Task
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.models import User
 from freppledb import VERSION
 
@@ -76,7 +77,8 @@ class Command(BaseCommand):
         parser.add_argument("destination", help="destination measure")
 
     def handle(self, **options):
-        from freppledb.forecast.models import Measure
+        from freppledb.forecast.commands import ExportForecastTree
+        from freppledb.forecast.models import ForecastPlan, Measure
 
         # Make sure the debug flag is not set!
         # When it is set, the django database wrapper collects a list of all sql
@@ -219,6 +221,14 @@ class Command(BaseCommand):
                 ("and startdate <= '%s'" % (enddate,)) if enddate else "",
             )
             cursor.execute(sql, (destination, source, source))
+
+            # The forecast editor totals of standard measures need a rebuild
+            if destination in ForecastPlan.numeric_measures:
+                cursor.execute("select exists (select 1 from forecasttree)")
+                if cursor.fetchone()[0]:
+                    ExportForecastTree.refresh(database=database)
+            Dashboard.planChanged(database)
+
             # Logging message
             task.processid = None
             task.status = "Done"
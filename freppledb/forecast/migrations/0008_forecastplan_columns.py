@@ -0,0 +1,56 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from django.db import migrations
+
+# Standard measures that get a numeric column in the forecastplan table.
+# Keep in sync with ForecastPlan.numeric_measures.
+measures = (
+    "orderstotal",
+    "ordersopen",
+    "ordersadjustment",
+    "ordersplanned",
+    "forecastbaseline",
+    "forecastoverride",
+    "forecasttotal",
+    "forecastnet",
+    "forecastconsumed",
+    "forecastplanned",
+)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("forecast", "0007_exports")]
+
+    operations = [
+        migrations.RunSQL(
+            "alter table forecastplan %s"
+            % ", ".join(
+                "add column %s numeric generated always as ((value->>'%s')::numeric) stored"
+                % (m, m)
+                for m in measures
+            ),
+            "alter table forecastplan %s"
+            % ", ".join("drop column %s" % m for m in measures),
+        ),
+    ]
@@ -0,0 +1,63 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from django.db import migrations
+
+# Keep in sync with ForecastPlan.numeric_measures.
+measures = (
+    "orderstotal",
+    "ordersopen",
+    "ordersadjustment",
+    "ordersplanned",
+    "forecastbaseline",
+    "forecastoverride",
+    "forecasttotal",
+    "forecastnet",
+    "forecastconsumed",
+    "forecastplanned",
+)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("forecast", "0008_forecastplan_columns")]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            create table forecasttree (
+              item_id character varying(300) not null,
+              location_id character varying(300) not null,
+              customer_id character varying(300) not null,
+              bucket character varying(300) not null,
+              bucketname character varying(300) not null,
+              startdate timestamp with time zone not null,
+              %s,
+              primary key (item_id, location_id, customer_id, bucket, startdate)
+            );
+            create index forecasttree_item on forecasttree (bucket, location_id, customer_id);
+            create index forecasttree_location on forecasttree (bucket, item_id, customer_id);
+            """
+            % ",\n".join("%s numeric not null default 0" % m for m in measures),
+            "drop table if exists forecasttree",
+        ),
+    ]
@@ -28,10 +28,11 @@ from logging import INFO, ERROR, WARNING, DEBUG
 from openpyxl.worksheet.cell_range import CellRange
 from openpyxl.worksheet.worksheet import Worksheet
 import os
+from queue import Empty, Queue
 import random
 import requests
 from requests import ConnectionError
-from threading import local
+from threading import local, Thread
 
 from django.conf import settings
 from django.core import management
@@ -268,6 +269,81 @@ class Forecast(AuditModel):
                 my_session.close()
 
 
+class ForecastUploader:
+    """
+    Posts forecast updates to the web service from a separate thread, so the
+    parsing of a data file doesn't wait for the web service.
+
+    The records are posted in batches of about maxbytes. A bounded queue keeps
+    at most maxbatches batches waiting, and the batches are posted in the order
+    they are created.
+    """
+
+    def __init__(self, server, token, maxbytes=1000000, maxbatches=4):
+        self.url = "http://%s/forecast/detail/" % server
+        self.token = token
+        self.maxbytes = maxbytes
+        self.batch = []
+        self.size = 0
+        self.batches = Queue(maxsize=maxbatches)
+        self.errors = Queue()
+        self.lost = False
+        self.thread = Thread(target=self.post, daemon=True)
+        self.thread.start()
+
+    def add(self, record):
+        data = json.dumps(record).encode("utf-8")
+        self.batch.append(data)
+        self.size += len(data) + 1
+        if self.size >= self.maxbytes:
+            self.send()
+
+    def send(self):
+        if self.batch:
+            # Blocks when the web service can't keep up
+            self.batches.put(b"[%s]" % b",".join(self.batch))
+            self.batch = []
+            self.size = 0
+
+    def post(self):
+        with requests.Session() as session:
+            while True:
+                payload = self.batches.get()
+                if payload is None:
+                    break
+                elif self.lost:
+                    continue
+                try:
+                    response = session.post(
+                        self.url,
+                        data=payload,
+                        headers={
+                            "Authorization": "Bearer %s" % self.token,
+                            "Content-Type": "application/json",
+                            "content-length": str(len(payload)),
+                        },
+                    )
+                    for e in response.json().get("errors", []) or []:
+                        self.errors.put(e)
+                except ConnectionError:
+                    self.lost = True
+                except Exception as e:
+                    self.errors.put(str(e))
+
+    def getErrors(self):
+        while True:
+            try:
+                yield self.errors.get_nowait()
+            except Empty:
+                return
+
+    def close(self):
+        if self.thread.is_alive():
+            self.send()
+            self.batches.put(None)
+            self.thread.join()
+
+
 class PropertyField:
     """
     A class to define a computed field on a Django model.
@@ -307,11 +383,39 @@ class ForecastPlan(models.Model):
     # Model managers
     objects = models.Manager()  # The default model manager
 
+    # Standard measures that are also stored in a numeric column of the table.
+    # The database generates these columns from the value field, so writers
+    # only need to update the value field. Readers should use the columns,
+    # because casting the text out of the value field is a lot slower.
+    numeric_measures = (
+        "orderstotal",
+        "ordersopen",
+        "ordersadjustment",
+        "ordersplanned",
+        "forecastbaseline",
+        "forecastoverride",
+        "forecasttotal",
+        "forecastnet",
+        "forecastconsumed",
+        "forecastplanned",
+    )
+
+    @classmethod
+    def measureSQL(cls, name, table="forecastplan"):
+        """
+        Returns the SQL expression to read the numeric value of a measure.
+        """
+        prefix = "%s." % table if table else ""
+        if name in cls.numeric_measures:
+            return "%s%s" % (prefix, name)
+        else:
+            return "(%svalue->>'%s')::numeric" % (prefix, name.replace("'", "''"))
+
     @classmethod
     def export_objects(cls, query, request):
         return query.extra(
             select={
-                m.name: "(value->>'%s')::numeric" % m.name
+                m.name: cls.measureSQL(m.name, table=None)
                 for m in chain(
                     Measure.standard_measures(), Measure.objects.using(request.database)
                 )
@@ -452,17 +556,17 @@ class ForecastPlan(models.Model):
                 connections._connections = tmp
             except management.base.CommandError:
                 yield (ERROR, None, None, None, "Web service didn't start")
-                raise StopIteration
+                return
         else:
             yield (ERROR, None, None, None, "Web service not activated")
-            raise StopIteration
+            return
 
         # Detect excel autofilter data tables
         if isinstance(data, Worksheet) and data.auto_filter.ref:
             bounds = CellRange(data.auto_filter.ref).bounds
         else:
             bounds = None
-        svcdata = []
+        uploader = None
 
         # keep a list of all forecast combinations visited
         # This is used to add missing forecast records.
@@ -474,304 +578,213 @@ class ForecastPlan(models.Model):
         )
         forecast_combinations = set()
 
-        for row in data:
-            rownumber += 1
-            if bounds:
-                # Only process data in the excel auto-filter range
-                if rownumber < bounds[1]:
-                    continue
-                elif rownumber > bounds[3]:
-                    break
+        completed = False
+        try:
+            for row in data:
+                rownumber += 1
+                if bounds:
+                    # Only process data in the excel auto-filter range
+                    if rownumber < bounds[1]:
+                        continue
+                    elif rownumber > bounds[3]:
+                        break
+                    else:
+                        rowWrapper.setData(row)
                 else:
                     rowWrapper.setData(row)
-            else:
-                rowWrapper.setData(row)
-
-            # Case 1: Process the header row
-            if not processed_header:
-                processed_header = True
-                colnum = 1
-                for col in rowWrapper.values():
-                    if isinstance(col, datetime):
-                        col = col.strftime("%Y-%m-%dT%H:%M:%S")
-                    else:
-                        col = str(col).strip().strip("#").lower() if col else ""
 
-                    ok = False
-                    if pivotbuckets is not None:
-                        headers.append(
-                            PropertyField(name=col, editable=True, type="string")
-                        )
-                        pivotbuckets.append(col)
-                        continue
-                    for i in chain(
-                        ForecastPlan._meta.fields,
-                        Measure.standard_measures(),
-                        Measure.objects.all().using(database),
-                        [
-                            # Dummy fields used during import
-                            PropertyField(
-                                name="forecast",
-                                verbose_name=_("forecast"),
-                                editable=True,
-                                type="string",
-                                export=False,
-                            ),
-                            PropertyField(
-                                name="bucket",
-                                verbose_name=_("bucket"),
-                                editable=True,
-                                type="string",
-                                export=False,
-                            ),
-                            PropertyField(
-                                name="datafield",
-                                verbose_name=_("data field"),
-                                editable=True,
-                                type="string",
-                                export=False,
-                            ),
-                            PropertyField(
-                                name="multiplier",
-                                verbose_name=_("multiplier"),
-                                editable=True,
-                                type="number",
-                                export=False,
-                            ),
-                        ],
-                    ):
-                        # Try with translated field names
-                        if (
-                            col == i.name.lower()
-                            or col == i.verbose_name.lower()
-                            or col
-                            == (
-                                "%s - %s" % (ForecastPlan.__name__, i.verbose_name)
-                            ).lower()
+                # Case 1: Process the header row
+                if not processed_header:
+                    processed_header = True
+                    colnum = 1
+                    for col in rowWrapper.values():
+                        if isinstance(col, datetime):
+                            col = col.strftime("%Y-%m-%dT%H:%M:%S")
+                        else:
+                            col = str(col).strip().strip("#").lower() if col else ""
+
+                        ok = False
+                        if pivotbuckets is not None:
+                            headers.append(
+                                PropertyField(name=col, editable=True, type="string")
+                            )
+                            pivotbuckets.append(col)
+                            continue
+                        for i in chain(
+                            ForecastPlan._meta.fields,
+                            Measure.standard_measures(),
+                            Measure.objects.all().using(database),
+                            [
+                                # Dummy fields used during import
+                                PropertyField(
+                                    name="forecast",
+                                    verbose_name=_("forecast"),
+                                    editable=True,
+                                    type="string",
+                                    export=False,
+                                ),
+                                PropertyField(
+                                    name="bucket",
+                                    verbose_name=_("bucket"),
+                                    editable=True,
+                                    type="string",
+                                    export=False,
+                                ),
+                                PropertyField(
+                                    name="datafield",
+                                    verbose_name=_("data field"),
+                                    editable=True,
+                                    type="string",
+                                    export=False,
+                                ),
+                                PropertyField(
+                                    name="multiplier",
+                                    verbose_name=_("multiplier"),
+                                    editable=True,
+                                    type="number",
+                                    export=False,
+                                ),
+                            ],
                         ):
-                            if i.name == "datafield":
-                                pivotbuckets = []
-                                headers.append(i)
-                            elif i.editable is True:
-                                headers.append(i)
-                                if isinstance(i, Measure):
-                                    measures.append(i)
-                            else:
-                                headers.append(None)
-                            ok = True
-                            break
-                        if translation.get_language() != "en":
-                            # Try with English field names
-                            with translation.override("en"):
-                                if (
-                                    col == i.name.lower()
-                                    or col == i.verbose_name.lower()
-                                    or col
-                                    == (
-                                        "%s - %s"
-                                        % (ForecastPlan.__name__, i.verbose_name)
-                                    ).lower()
-                                ):
-                                    if i.name == "datafield":
-                                        pivotbuckets = []
-                                        headers.append(i)
-                                    elif i.editable is True:
-                                        headers.append(i)
-                                        if isinstance(i, Measure):
-                                            measures.append(i)
-                                    else:
-                                        headers.append(None)
-                                    ok = True
-                                    break
-                    if not ok:
-                        headers.append(None)
-                        warnings += 1
+                            # Try with translated field names
+                            if (
+                                col == i.name.lower()
+                                or col == i.verbose_name.lower()
+                                or col
+                                == (
+                                    "%s - %s" % (ForecastPlan.__name__, i.verbose_name)
+                                ).lower()
+                            ):
+                                if i.name == "datafield":
+                                    pivotbuckets = []
+                                    headers.append(i)
+                                elif i.editable is True:
+                                    headers.append(i)
+                                    if isinstance(i, Measure):
+                                        measures.append(i)
+                                else:
+                                    headers.append(None)
+                                ok = True
+                                break
+                            if translation.get_language() != "en":
+                                # Try with English field names
+                                with translation.override("en"):
+                                    if (
+                                        col == i.name.lower()
+                                        or col == i.verbose_name.lower()
+                                        or col
+                                        == (
+                                            "%s - %s"
+                                            % (ForecastPlan.__name__, i.verbose_name)
+                                        ).lower()
+                                    ):
+                                        if i.name == "datafield":
+                                            pivotbuckets = []
+                                            headers.append(i)
+                                        elif i.editable is True:
+                                            headers.append(i)
+                                            if isinstance(i, Measure):
+                                                measures.append(i)
+                                        else:
+                                            headers.append(None)
+                                        ok = True
+                                        break
+                        if not ok:
+                            headers.append(None)
+                            warnings += 1
+                            yield (
+                                WARNING,
+                                None,
+                                None,
+                                None,
+                                force_str(
+                                    _(
+                                        "Skipping unknown field %(column)s"
+                                        % {"column": '"%s"' % col}
+                                    )
+                                ),
+                            )
+                        colnum += 1
+                    rowWrapper = rowmapper(headers)
+
+                    # Check required fields
+                    fields = [i.name for i in headers if i]
+                    hasforecastfield = "forecast" in fields
+                    missing = []
+                    if not hasforecastfield:
+                        for k in ["item", "customer", "location"]:
+                            if k not in fields:
+                                missing.append(k)
+                    if (
+                        "startdate" not in fields
+                        and "enddate" not in fields
+                        and "bucket" not in fields
+                        and pivotbuckets is None
+                    ):
+                        missing.append("startdate")
+                    if missing:
+                        errors += 1
                         yield (
-                            WARNING,
+                            ERROR,
                             None,
                             None,
                             None,
-                            force_str(
-                                _(
-                                    "Skipping unknown field %(column)s"
-                                    % {"column": '"%s"' % col}
-                                )
+                            _(
+                                "Some keys were missing: %(keys)s"
+                                % {"keys": ", ".join(missing)}
                             ),
                         )
-                    colnum += 1
-                rowWrapper = rowmapper(headers)
-
-                # Check required fields
-                fields = [i.name for i in headers if i]
-                hasforecastfield = "forecast" in fields
-                missing = []
-                if not hasforecastfield:
-                    for k in ["item", "customer", "location"]:
-                        if k not in fields:
-                            missing.append(k)
-                if (
-                    "startdate" not in fields
-                    and "enddate" not in fields
-                    and "bucket" not in fields
-                    and pivotbuckets is None
-                ):
-                    missing.append("startdate")
-                if missing:
-                    errors += 1
-                    yield (
-                        ERROR,
-                        None,
-                        None,
-                        None,
-                        _(
-                            "Some keys were missing: %(keys)s"
-                            % {"keys": ", ".join(missing)}
-                        ),
+                    if pivotbuckets:
+                        measures = [
+                            m
+                            for m in chain(
+                                Measure.standard_measures(),
+                                Measure.objects.all().using(database),
+                            )
+                            if m.editable
+                        ]
+                    elif not measures:
+                        # Check the presence of editable fields
+                        warnings += 1
+                        yield (WARNING, None, None, None, _("No editable fields found"))
+                        return
+
+                    # Initialize http connection
+                    session = requests.Session()
+                    token = getWebserviceAuthorization(
+                        user=user.username if user else "admin",
+                        sid=user.id if user else 1,
+                        exp=3600,
                     )
-                if pivotbuckets:
-                    measures = [
-                        m
-                        for m in chain(
-                            Measure.standard_measures(),
-                            Measure.objects.all().using(database),
+                    if "FREPPLE_TEST" in os.environ:
+                        server = settings.DATABASES[database]["TEST"].get(
+                            "FREPPLE_PORT", None
                         )
-                        if m.editable
-                    ]
-                elif not measures:
-                    # Check the presence of editable fields
-                    warnings += 1
-                    yield (WARNING, None, None, None, _("No editable fields found"))
-                    raise StopIteration
-
-                # Initialize http connection
-                session = requests.Session()
-                token = getWebserviceAuthorization(
-                    user=user.username if user else "admin",
-                    sid=user.id if user else 1,
-                    exp=3600,
-                )
-                if "FREPPLE_TEST" in os.environ:
-                    server = settings.DATABASES[database]["TEST"].get(
-                        "FREPPLE_PORT", None
-                    )
-                else:
-                    server = settings.DATABASES[database].get("FREPPLE_PORT", None)
-                if server:
-                    server = server.replace("0.0.0.0:", "localhost:")
+                    else:
+                        server = settings.DATABASES[database].get("FREPPLE_PORT", None)
+                    if server:
+                        server = server.replace("0.0.0.0:", "localhost:")
 
-                def sendToService(d):
-                    response = session.post(
-                        "http://%s/forecast/detail/" % server,
-                        headers={
-                            "Authorization": "Bearer %s" % token,
-                            "Content-Type": "application/json",
-                        },
-                        json=d,
+                    Forecast.flush(
+                        session, mode="manual", database=database, token=token
                     )
-                    return response.json().get("errors", []) or []
+                    uploader = ForecastUploader(server, token)
 
-                Forecast.flush(session, mode="manual", database=database, token=token)
-
-            # Case 2: Skip empty rows
-            elif rowWrapper.empty():
-                continue
-
-            # Case 3: Process a data row
-            else:
-                # Send a ping-alive message to make the upload interruptable
-                if ping:
-                    if rownumber % 50 == 0:
-                        yield (DEBUG, rownumber, None, None, None)
-
-                multiplier = rowWrapper.get("multiplier") or 1
-                if populateForecastTable:
-                    forecast_combinations.add(
-                        (
-                            rowWrapper.get("item", None),
-                            rowWrapper.get("location", None),
-                            rowWrapper.get("customer", None),
-                        )
-                    )
+                # Case 2: Skip empty rows
+                elif rowWrapper.empty():
+                    continue
 
-                # Call the update method
-                if pivotbuckets:
-                    # Upload in pivot layout
-                    fieldname = rowWrapper.get("datafield", "").lower()
-                    field = None
-                    for m in measures:
-                        if (
-                            fieldname == m.verbose_name.lower()
-                            or fieldname == m.name.lower()
-                        ):
-                            field = m
-                            break
-                    if not field:
-                        # Irrelevant data field
-                        continue
-                    for col in pivotbuckets:
-                        try:
-                            val = rowWrapper.get(col, None)
-                            if val is not None and val != "":
-                                svcdata.append(
-                                    {
-                                        "bucket": col,
-                                        "forecast": rowWrapper.get("forecast", None),
-                                        "item": rowWrapper.get("item", None),
-                                        "location": rowWrapper.get("location", None),
-                                        "customer": rowWrapper.get("customer", None),
-                                        field.name: val * multiplier,
-                                    }
-                                )
-                                if len(svcdata) >= 1000:
-                                    for e in sendToService(svcdata):
-                                        yield (ERROR, None, None, None, e)
-                                    svcdata = []
-                                changed += 1
-                        except ConnectionError:
-                            yield (
-                                ERROR,
-                                None,
-                                None,
-                                None,
-                                "The connection with the web service was lost",
-                            )
-                            raise StopIteration
-                        except Exception as e:
-                            errors += 1
-                            yield (ERROR, rownumber, field, val, str(e))
+                # Case 3: Process a data row
                 else:
-                    # Upload in list layout
-                    try:
-                        r = {
-                            m.name: (
-                                rowWrapper.get(m.name) * multiplier
-                                if rowWrapper.get(m.name) is not None
-                                and rowWrapper.get(m.name) != ""
-                                else None
-                            )
-                            for m in measures
-                        }
-                        for f in (
-                            "forecast",
-                            "item",
-                            "customer",
-                            "location",
-                            "startdate",
-                            "enddate",
-                            "bucket",
-                        ):
-                            t = rowWrapper.get(f, None)
-                            if isinstance(t, datetime):
-                                t = t.strftime("%Y-%m-%dT%H:%M:%S")
-                            if t:
-                                r[f] = t
-                        svcdata.append(r)
-                        if len(svcdata) >= 1000:
-                            for e in sendToService(svcdata):
-                                yield (ERROR, None, None, None, e)
-                            svcdata = []
-                        changed += 1
-                    except ConnectionError:
+                    # Send a ping-alive message to make the upload interruptable
+                    if ping:
+                        if rownumber % 50 == 0:
+                            yield (DEBUG, rownumber, None, None, None)
+
+                    # Report the replies of the web service
+                    for e in uploader.getErrors():
+                        yield (ERROR, None, None, None, e)
+                    if uploader.lost:
                         yield (
                             ERROR,
                             None,
@@ -779,14 +792,111 @@ class ForecastPlan(models.Model):
                             None,
                             "The connection with the web service was lost",
                         )
-                        raise StopIteration
-                    except Exception as e:
-                        errors += 1
-                        yield (ERROR, rownumber, None, None, str(e))
+                        return
 
-        if svcdata:
-            for e in sendToService(svcdata):
+                    multiplier = rowWrapper.get("multiplier") or 1
+                    if populateForecastTable:
+                        forecast_combinations.add(
+                            (
+                                rowWrapper.get("item", None),
+                                rowWrapper.get("location", None),
+                                rowWrapper.get("customer", None),
+                            )
+                        )
+
+                    # Call the update method
+                    if pivotbuckets:
+                        # Upload in pivot layout
+                        fieldname = rowWrapper.get("datafield", "").lower()
+                        field = None
+                        for m in measures:
+                            if (
+                                fieldname == m.verbose_name.lower()
+                                or fieldname == m.name.lower()
+                            ):
+                                field = m
+                                break
+                        if not field:
+                            # Irrelevant data field
+                            continue
+                        for col in pivotbuckets:
+                            try:
+                                val = rowWrapper.get(col, None)
+                                if val is not None and val != "":
+                                    uploader.add(
+                                        {
+                                            "bucket": col,
+                                            "forecast": rowWrapper.get(
+                                                "forecast", None
+                                            ),
+                                            "item": rowWrapper.get("item", None),
+                                            "location": rowWrapper.get(
+                                                "location", None
+                                            ),
+                                            "customer": rowWrapper.get(
+                                                "customer", None
+                                            ),
+                                            field.name: val * multiplier,
+                                        }
+                                    )
+                                    changed += 1
+                            except Exception as e:
+                                errors += 1
+                                yield (ERROR, rownumber, field, val, str(e))
+                    else:
+                        # Upload in list layout
+                        try:
+                            r = {
+                                m.name: (
+                                    rowWrapper.get(m.name) * multiplier
+                                    if rowWrapper.get(m.name) is not None
+                                    and rowWrapper.get(m.name) != ""
+                                    else None
+                                )
+                                for m in measures
+                            }
+                            for f in (
+                                "forecast",
+                                "item",
+                                "customer",
+                                "location",
+                                "startdate",
+                                "enddate",
+                                "bucket",
+                            ):
+                                t = rowWrapper.get(f, None)
+                                if isinstance(t, datetime):
+                                    t = t.strftime("%Y-%m-%dT%H:%M:%S")
+                                if t:
+                                    r[f] = t
+                            uploader.add(r)
+                            changed += 1
+                        except Exception as e:
+                            errors += 1
+                            yield (ERROR, rownumber, None, None, str(e))
+            completed = True
+        finally:
+            if uploader:
+                uploader.close()
+            if session and not completed:
+                # Don't leave the web service in manual flush mode
+                try:
+                    Forecast.flush(session, mode="auto", database=database, token=token)
+                except Exception:
+                    pass
+                session.close()
+
+        if uploader:
+            for e in uploader.getErrors():
                 yield (ERROR, None, None, None, e)
+            if uploader.lost:
+                yield (
+                    ERROR,
+                    None,
+                    None,
+                    None,
+                    "The connection with the web service was lost",
+                )
 
         # Add any missing forecast record
         if populateForecastTable:
@@ -860,6 +970,14 @@ class ForecastPlan(models.Model):
                     select * from cte on conflict (item_id, location_id, customer_id) do nothing;
                     """
                 )
+                # add the new combinations in the forecast editor totals
+                if cursor.rowcount > 0:
+                    from .commands import ExportForecastTree
+
+                    cursor.execute("select distinct item_id from forecast_combinations")
+                    ExportForecastTree.refresh(
+                        database=database, items=[i[0] for i in cursor.fetchall()]
+                    )
 
         if session:
             Forecast.flush(session, mode="auto", database=database, token=token)
@@ -29,6 +29,7 @@ from channels.db import database_sync_to_async
 from channels.generic.http import AsyncHttpConsumer
 
 from freppledb.webservice.utils import lock
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.localization import parseLocalizedDateTime
 from freppledb.common.models import Comment
 from freppledb.forecast.models import Forecast
@@ -36,6 +37,11 @@ from freppledb.input.models import Item, Location, Customer, Buffer
 from freppledb.webservice.utils import fcst_solver
 
 
+@database_sync_to_async
+def planChanged(database):
+    Dashboard.planChanged(database)
+
+
 class ForecastService(AsyncHttpConsumer):
     """
     Processes forecast update messages in these formats:
@@ -56,10 +62,10 @@ class ForecastService(AsyncHttpConsumer):
         """
 
     @database_sync_to_async
-    def updateForecastMethod(self, f):
+    def updateForecastMethod(self, item, location, customer, method):
         Forecast.objects.all().using(self.scope["database"]).filter(
-            item=f.item.name, location=f.location.name, customer=f.customer.name
-        ).update(method=f.methods)
+            item=item, location=location, customer=customer
+        ).update(method=method)
 
     @database_sync_to_async
     def replan(self, item, location):
@@ -77,13 +83,60 @@ class ForecastService(AsyncHttpConsumer):
 
         # Minimal export - full cluster replan is taking too long.
         ExportForecastMetrics().run(database=self.scope["database"], cluster=[cluster])
+        return cluster
+
+    @database_sync_to_async
+    def refreshTree(self, nodes, cluster=None):
+        from freppledb.forecast.commands import ExportForecastTree
+
+        # The forecast buckets need to be written before we can aggregate them
+        frepple.cache.flush()
+        if cluster is None:
+            ExportForecastTree.refresh(
+                database=self.scope["database"],
+                items={n[0] for n in nodes},
+                locations={n[1] for n in nodes},
+                customers={n[2] for n in nodes},
+            )
+        else:
+            # Replanning a cluster changes the netting of all its items
+            ExportForecastTree.refresh(
+                database=self.scope["database"],
+                items={n[0] for n in nodes}
+                | {i.name for i in frepple.items() if i.cluster == cluster},
+            )
+
+    @staticmethod
+    def getObject(cache, kind, name):
+        """
+        Returns the item, location or customer with this name, or the root of
+        its hierarchy when no name is given.
+        """
+        obj = cache.get((kind, name), None)
+        if obj is None:
+            if name:
+                obj = getattr(frepple, kind)(name=name, action="C")
+            else:
+                for obj in getattr(frepple, "%ss" % kind)():
+                    break
+                while obj and obj.owner:
+                    obj = obj.owner
+            cache[(kind, name)] = obj
+        return obj
+
+    @staticmethod
+    def getDate(cache, value):
+        dt = cache.get(("date", value), None)
+        if dt is None:
+            dt = cache[("date", value)] = parseLocalizedDateTime(value)
+        return dt
 
     @database_sync_to_async
     def updateComment(self, commenttype, comment, item, location, customer):
         if commenttype == "item" and item:
             Comment(
                 content_object=Item.objects.using(self.scope["database"]).get(
-                    name=item.name
+                    name=item
                 ),
                 user=self.scope["user"],
                 comment=comment,
@@ -91,7 +144,7 @@ class ForecastService(AsyncHttpConsumer):
         elif commenttype == "location" and location:
             Comment(
                 content_object=Location.objects.using(self.scope["database"]).get(
-                    name=location.name
+                    name=location
                 ),
                 user=self.scope["user"],
                 comment=comment,
@@ -99,7 +152,7 @@ class ForecastService(AsyncHttpConsumer):
         elif commenttype == "customer" and customer:
             Comment(
                 content_object=Customer.objects.using(self.scope["database"]).get(
-                    name=customer.name
+                    name=customer
                 ),
                 user=self.scope["user"],
                 comment=comment,
@@ -109,7 +162,7 @@ class ForecastService(AsyncHttpConsumer):
             Comment(
                 content_object=Buffer.objects.all()
                 .using(self.scope["database"])
-                .filter(item__name=item.name, location__name=location.name)
+                .filter(item__name=item, location__name=location)
                 .first(),
                 user=self.scope["user"],
                 comment=comment,
@@ -118,88 +171,66 @@ class ForecastService(AsyncHttpConsumer):
             raise Exception("Invalid comment type")
 
     async def handle(self, body):
-        async with lock:
-            errors = []
-            try:
-                if self.scope["method"] != "POST":
-                    self.scope["response_headers"].append(
-                        (b"Content-Type", b"text/html")
-                    )
-                    await self.send_response(
-                        401,
-                        (self.msgtemplate % "Only POST requests allowed").encode(),
-                        headers=self.scope["response_headers"],
-                    )
-                    return
+        errors = []
+        try:
+            if self.scope["method"] != "POST":
+                self.scope["response_headers"].append((b"Content-Type", b"text/html"))
+                await self.send_response(
+                    401,
+                    (self.msgtemplate % "Only POST requests allowed").encode(),
+                    headers=self.scope["response_headers"],
+                )
+                return
 
-                # Check permissions
-                if not self.scope["user"].has_perm("forecast.change_forecast"):
-                    self.scope["response_headers"].append(
-                        (b"Content-Type", b"text/html")
-                    )
-                    await self.send_response(
-                        403,
-                        (self.msgtemplate % "Permission denied").encode(),
-                        headers=self.scope["response_headers"],
-                    )
-                    return
+            # Check permissions
+            if not self.scope["user"].has_perm("forecast.change_forecast"):
+                self.scope["response_headers"].append((b"Content-Type", b"text/html"))
+                await self.send_response(
+                    403,
+                    (self.msgtemplate % "Permission denied").encode(),
+                    headers=self.scope["response_headers"],
+                )
+                return
 
-                data = json.loads(body.decode("utf-8"))
+            data = json.loads(body.decode("utf-8"))
 
+            methods = []
+            nodes = set()
+            cluster = None
+            async with lock:
                 try:
                     replan = False
                     frepple.cache.write_immediately = False
                     if isinstance(data, list):
                         # Message format #1
+                        # A batch often has many records for the same objects and
+                        # dates. We look each of them up only once.
+                        cache = {}
                         for bckt in data:
                             # Validate
-                            item = None
-                            location = None
-                            customer = None
-                            if bckt.get("item", None):
-                                try:
-                                    item = frepple.item(name=bckt["item"], action="C")
-                                except Exception:
-                                    errors.append("Item not found: %s" % bckt["item"])
-                            else:
-                                # Use root item
-                                for i in frepple.items():
-                                    item = i
-                                    break
-                                while item and item.owner:
-                                    item = item.owner
-                            if bckt.get("location", None):
-                                try:
-                                    location = frepple.location(
-                                        name=bckt["location"], action="C"
-                                    )
-                                except Exception:
-                                    errors.append(
-                                        "Location not found: %s" % bckt["location"]
-                                    )
-                            else:
-                                # Use root location
-                                for i in frepple.locations():
-                                    location = i
-                                    break
-                                while location and location.owner:
-                                    location = location.owner
-                            if bckt.get("customer", None):
-                                try:
-                                    customer = frepple.customer(
-                                        name=bckt["customer"], action="C"
-                                    )
-                                except Exception:
-                                    errors.append(
-                                        "Customer not found: %s" % bckt["customer"]
-                                    )
-                            else:
-                                # Use root customer
-                                for i in frepple.customers():
-                                    customer = i
-                                    break
-                                while customer and customer.owner:
-                                    customer = customer.owner
+                            try:
+                                item = self.getObject(cache, "item", bckt.get("item"))
+                            except Exception:
+                                item = None
+                                errors.append("Item not found: %s" % bckt["item"])
+                            try:
+                                location = self.getObject(
+                                    cache, "location", bckt.get("location")
+                                )
+                            except Exception:
+                                location = None
+                                errors.append(
+                                    "Location not found: %s" % bckt["location"]
+                                )
+                            try:
+                                customer = self.getObject(
+                                    cache, "customer", bckt.get("customer")
+                                )
+                            except Exception:
+                                customer = None
+                                errors.append(
+                                    "Customer not found: %s" % bckt["customer"]
+                                )
                             if customer and item and location:
                                 try:
                                     args = {
@@ -212,14 +243,12 @@ class ForecastService(AsyncHttpConsumer):
                                         args["bucket"] = bucket.lower()
                                     startdate = bckt.get("startdate", None)
                                     if startdate:
-                                        args["startdate"] = parseLocalizedDateTime(
-                                            startdate
+                                        args["startdate"] = self.getDate(
+                                            cache, startdate
                                         )
                                     enddate = bckt.get("enddate", None)
                                     if enddate:
-                                        args["enddate"] = parseLocalizedDateTime(
-                                            enddate
-                                        )
+                                        args["enddate"] = self.getDate(cache, enddate)
                                     for key, val in bckt.items():
                                         if (
                                             key
@@ -238,6 +267,7 @@ class ForecastService(AsyncHttpConsumer):
                                         ):
                                             args[key] = float(val)
                                     frepple.setForecast(**args)
+                                    nodes.add((item.name, location.name, customer.name))
                                     replan = True
                                 except Exception as e:
                                     errors.append("Error processing %s" % e)
@@ -310,7 +340,14 @@ class ForecastService(AsyncHttpConsumer):
                                         ):
                                             f.owner.methods = method
                                             replan = True
-                                            await self.updateForecastMethod(f.owner)
+                                            methods.append(
+                                                (
+                                                    f.owner.item.name,
+                                                    f.owner.location.name,
+                                                    f.owner.customer.name,
+                                                    f.owner.methods,
+                                                )
+                                            )
                                         elif (
                                             isinstance(f, frepple.demand_forecast)
                                             and f.location
@@ -320,7 +357,14 @@ class ForecastService(AsyncHttpConsumer):
                                         ):
                                             f.methods = method
                                             replan = True
-                                            await self.updateForecastMethod(f)
+                                            methods.append(
+                                                (
+                                                    f.item.name,
+                                                    f.location.name,
+                                                    f.customer.name,
+                                                    f.methods,
+                                                )
+                                            )
                                 else:
                                     if not item:
                                         errors.append(
@@ -381,55 +425,75 @@ class ForecastService(AsyncHttpConsumer):
                                             if key != "forecastoverride":
                                                 replan = True
                                     frepple.setForecast(**args)
+                                    nodes.add((item.name, location.name, customer.name))
                                 except Exception as e:
                                     errors.append("Error processing %s" % e)
 
                         if replan:
                             try:
-                                await self.replan(item, location)
+                                cluster = await self.replan(item, location)
+                                nodes.add((item.name, location.name, customer.name))
                             except Exception:
                                 errors.append(b"Exception during replanning")
 
                 finally:
                     frepple.cache.write_immediately = True
 
-                # Save a new comment
-                if (
-                    "commenttype" in data
-                    and "comment" in data
-                    and self.scope["user"].has_perm("common.add_comment")
-                ):
+                # Update the totals displayed in the forecast editor trees
+                if nodes:
                     try:
-                        await self.updateComment(
-                            data["commenttype"],
-                            data["comment"],
-                            item,
-                            location,
-                            customer,
-                        )
+                        await self.refreshTree(nodes, cluster)
                     except Exception:
-                        errors.append(b"Exception entering comment")
+                        errors.append("Exception updating the forecast editor totals")
 
-                # Reply
-                self.scope["response_headers"].append(
-                    (b"Content-Type", b"application/json")
-                )
-                if errors:
-                    answer = {"errors": errors}
-                else:
-                    answer = {"OK": 1}
-                await self.send_response(
-                    500 if errors else 200,
-                    json.dumps(answer).encode(),
-                    headers=self.scope["response_headers"],
-                )
-            except Exception as e:
-                errors.append(str(e).encode())
-                await self.send_response(
-                    500,
-                    json.dumps({"errors": errors}).encode(),
-                    headers=self.scope["response_headers"],
-                )
+            # Save the new forecast methods
+            for m in methods:
+                try:
+                    await self.updateForecastMethod(*m)
+                except Exception:
+                    errors.append("Exception updating forecast method")
+
+            # Invalidate the cached reports and widgets
+            if nodes or methods:
+                await planChanged(self.scope["database"])
+
+            # Save a new comment
+            if (
+                "commenttype" in data
+                and "comment" in data
+                and self.scope["user"].has_perm("common.add_comment")
+            ):
+                try:
+                    await self.updateComment(
+                        data["commenttype"],
+                        data["comment"],
+                        item.name if item else None,
+                        location.name if location else None,
+                        customer.name if customer else None,
+                    )
+                except Exception:
+                    errors.append(b"Exception entering comment")
+
+            # Reply
+            self.scope["response_headers"].append(
+                (b"Content-Type", b"application/json")
+            )
+            if errors:
+                answer = {"errors": errors}
+            else:
+                answer = {"OK": 1}
+            await self.send_response(
+                500 if errors else 200,
+                json.dumps(answer).encode(),
+                headers=self.scope["response_headers"],
+            )
+        except Exception as e:
+            errors.append(str(e).encode())
+            await self.send_response(
+                500,
+                json.dumps({"errors": errors}).encode(),
+                headers=self.scope["response_headers"],
+            )
 
 
 class FlushService(AsyncHttpConsumer):
@@ -450,6 +514,7 @@ class FlushService(AsyncHttpConsumer):
                 async with lock:
                     frepple.cache.flush()
                     frepple.cache.write_immediately = True
+                await planChanged(self.scope["database"])
             else:
                 await self.send_response(
                     404,
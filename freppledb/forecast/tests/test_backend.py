@@ -23,22 +23,27 @@
 
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
 import os
+import tempfile
 from rest_framework.test import APIClient, APITransactionTestCase, APIRequestFactory
+from threading import Thread
 import unittest
 
 from django.conf import settings
 from django.core import management
 from django.db import transaction
-from django.test import TransactionTestCase
+from django.test import SimpleTestCase, TransactionTestCase
 from django.db import DEFAULT_DB_ALIAS, connections
 
-from freppledb.common.models import Parameter, User
+from freppledb.common.models import Parameter, ParameterCache, User
 from freppledb.common.tests import checkResponse
 from freppledb.input.models import Item, Location, Customer
 
 if "freppledb.forecast" in settings.INSTALLED_APPS:
-    from freppledb.forecast.models import Forecast, ForecastPlan
+    from freppledb.forecast.commands import ExportForecastTree
+    from freppledb.forecast.models import Forecast, ForecastPlan, ForecastUploader
 
 
 @unittest.skipUnless(
@@ -402,6 +407,79 @@ class ForecastEdit(TransactionTestCase):
         )
 
 
+@unittest.skipUnless(
+    "freppledb.forecast" in settings.INSTALLED_APPS, "App not activated"
+)
+class ForecastPlanColumns(TransactionTestCase):
+    fixtures = ["demo"]
+
+    def test_numeric_columns(self):
+        item = Item.objects.all().first()
+        location = Location.objects.all().first()
+        customer = Customer.objects.all().first()
+        ForecastPlan.objects.create(
+            item=item,
+            location=location,
+            customer=customer,
+            startdate=datetime(2030, 1, 1),
+            enddate=datetime(2030, 2, 1),
+            value={"forecasttotal": 12.5, "forecastnet": 3, "mymeasure": 7},
+        )
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                "select %s, %s, %s, %s from forecastplan where startdate = %%s"
+                % tuple(
+                    ForecastPlan.measureSQL(m)
+                    for m in (
+                        "forecasttotal",
+                        "forecastnet",
+                        "mymeasure",
+                        "orderstotal",
+                    )
+                ),
+                (datetime(2030, 1, 1),),
+            )
+            self.assertEqual(
+                cursor.fetchone(), (Decimal("12.5"), Decimal(3), Decimal(7), None)
+            )
+
+        # The columns follow updates of the value field
+        ForecastPlan.objects.filter(startdate=datetime(2030, 1, 1)).update(
+            value={"forecasttotal": 1}
+        )
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                "select forecasttotal, forecastnet from forecastplan where startdate = %s",
+                (datetime(2030, 1, 1),),
+            )
+            self.assertEqual(cursor.fetchone(), (Decimal(1), None))
+
+    def test_createfixture(self):
+        # The generated columns are left out of a fixture
+        ForecastPlan.objects.create(
+            item=Item.objects.all().first(),
+            location=Location.objects.all().first(),
+            customer=Customer.objects.all().first(),
+            startdate=datetime(2030, 1, 1),
+            enddate=datetime(2030, 2, 1),
+            value={"forecasttotal": 12.5},
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fixture = os.path.join(tmpdir, "fixture.json")
+            management.call_command("createfixture", fixture)
+            with open(fixture) as f:
+                self.assertNotIn('"orderstotal"', f.read())
+            management.call_command("empty", all=True)
+            self.assertEqual(ForecastPlan.objects.count(), 0)
+            management.call_command("loaddata", fixture, verbosity=0)
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                "select forecasttotal from forecastplan where startdate = %s",
+                (datetime(2030, 1, 1),),
+            )
+            self.assertEqual(cursor.fetchone(), (Decimal("12.5"),))
+
+
 @unittest.skipUnless(
     "freppledb.forecast" in settings.INSTALLED_APPS, "App not activated"
 )
@@ -566,6 +644,30 @@ class ReportTest(TransactionTestCase):
         )
         checkResponse(self, response)
 
+        # The trees show the same totals from the forecasttree table as from the
+        # forecastplan table, also after an incremental refresh
+        response = self.client.get("/forecast/itemtree/", {"measure": "forecasttotal"})
+        checkResponse(self, response)
+        fromtree = json.loads(response.content)
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute("select count(*) from forecasttree")
+            count = cursor.fetchone()[0]
+            self.assertGreater(count, 0)
+            ExportForecastTree.refresh(
+                items=[fcst.item.name],
+                locations=[fcst.location.name],
+                customers=[fcst.customer.name],
+            )
+            cursor.execute("select count(*) from forecasttree")
+            self.assertEqual(cursor.fetchone()[0], count)
+            response = self.client.get(
+                "/forecast/itemtree/", {"measure": "forecasttotal"}
+            )
+            self.assertEqual(json.loads(response.content), fromtree)
+            cursor.execute("truncate forecasttree")
+        response = self.client.get("/forecast/itemtree/", {"measure": "forecasttotal"})
+        self.assertEqual(json.loads(response.content), fromtree)
+
 
 @unittest.skipUnless(
     "freppledb.forecast" in settings.INSTALLED_APPS, "App not activated"
@@ -585,6 +687,7 @@ class ForecastSimulation(TransactionTestCase):
             "update common_parameter set value=%s where name = 'currentdate'",
             (self.now.strftime("%Y-%m-%d %H:%M:%S"),),
         )
+        ParameterCache.invalidate(DEFAULT_DB_ALIAS)
         cursor.execute("update demand set due = due + %s * interval '1 day'", (offset,))
 
     def tearDown(self):
@@ -630,3 +733,49 @@ class ForecastSimulation(TransactionTestCase):
         self.assertAlmostEqual(
             first=errorSum, second=Decimal(472.16), delta=Decimal(5.0)
         )
+
+
+@unittest.skipUnless(
+    "freppledb.forecast" in settings.INSTALLED_APPS, "App not activated"
+)
+class ForecastUploaderTest(SimpleTestCase):
+    def test_batches(self):
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append(
+                    json.loads(self.rfile.read(int(self.headers["content-length"])))
+                )
+                reply = json.dumps(
+                    {"errors": ["error in batch 2"]}
+                    if len(received) == 2
+                    else {"OK": 1}
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, *args):
+                pass
+
+        with ThreadingHTTPServer(("localhost", 0), Handler) as server:
+            Thread(target=server.serve_forever, daemon=True).start()
+            uploader = ForecastUploader(
+                "localhost:%s" % server.server_port, "token", maxbytes=1000
+            )
+            for i in range(100):
+                uploader.add({"item": "item %s" % i, "forecastoverride": i})
+            uploader.close()
+            server.shutdown()
+
+        # The records are posted in batches of limited size, in their original order
+        self.assertGreater(len(received), 2)
+        self.assertEqual(
+            [r["forecastoverride"] for batch in received for r in batch],
+            list(range(100)),
+        )
+        self.assertEqual(list(uploader.getErrors()), ["error in batch 2"])
+        self.assertFalse(uploader.lost)
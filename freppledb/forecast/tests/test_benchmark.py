@@ -0,0 +1,167 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+import os
+from time import time
+import unittest
+
+from django.conf import settings
+from django.db import connection
+from django.test import TransactionTestCase
+
+from freppledb.common.models import User
+from freppledb.common.report import getCurrentDate
+from freppledb.input.models import Customer, Item, Location
+
+if "freppledb.forecast" in settings.INSTALLED_APPS:
+    from freppledb.forecast.commands import ExportForecastTree
+    from freppledb.forecast.models import ForecastPlan
+
+
+@unittest.skipUnless(
+    "freppledb.forecast" in settings.INSTALLED_APPS, "App not activated"
+)
+@unittest.skipUnless("FREPPLE_BENCHMARK" in os.environ, "Benchmarks not requested")
+class ForecastTreeBenchmark(TransactionTestCase):
+    """
+    Measures the forecast editor tree queries on a large forecastplan table,
+    with and without the totals of the forecasttree table, and compares reading
+    a measure from its numeric column with casting it from the value field.
+
+    Run with:
+      FREPPLE_BENCHMARK=5000000 ./frepplectl.py test freppledb.forecast.tests.test_benchmark
+    """
+
+    fixtures = ["demo"]
+
+    def setUp(self):
+        os.environ["FREPPLE_TEST"] = "YES"
+        try:
+            self.size = int(os.environ["FREPPLE_BENCHMARK"])
+        except ValueError:
+            self.size = 5000000
+        if not User.objects.filter(username="admin").count():
+            User.objects.create_superuser("admin", "your@company.com", "admin")
+        self.client.login(username="admin", password="admin")
+        for m in (Item, Location, Customer):
+            m.rebuildHierarchy()
+        self.current = getCurrentDate(lastplan=True)
+        with connection.cursor() as cursor:
+            cursor.execute("truncate forecasttree")
+            # Every item at the top location and customer, with the records
+            # spread over the next buckets
+            cursor.execute(
+                """
+                insert into forecasthierarchy (item_id, location_id, customer_id)
+                select item.name, location.name, customer.name
+                from item
+                cross join location
+                cross join customer
+                where location.lvl = 0 and customer.lvl = 0
+                and not exists (
+                  select 1 from forecasthierarchy
+                  where item_id = item.name
+                  and location_id = location.name
+                  and customer_id = customer.name
+                  )
+                """
+            )
+            cursor.execute(
+                """
+                insert into forecastplan
+                  (item_id, location_id, customer_id, startdate, enddate, value)
+                select
+                  item.name, location.name, customer.name,
+                  %s + i * interval '1 second',
+                  %s + (i + 1) * interval '1 second',
+                  jsonb_build_object(
+                    'forecastbaseline', i %% 100,
+                    'forecasttotal', i %% 100,
+                    'forecastnet', i %% 50,
+                    'orderstotal', i %% 10
+                    )
+                from generate_series(1, %s) i
+                cross join lateral (
+                  select name from item order by name
+                  offset i %% (select count(*) from item) limit 1
+                  ) item
+                cross join (select name from location where lvl = 0) location
+                cross join (select name from customer where lvl = 0) customer
+                """,
+                (self.current, self.current, self.size),
+            )
+            cursor.execute("analyze forecastplan")
+        super().setUp()
+
+    def tearDown(self):
+        del os.environ["FREPPLE_TEST"]
+        super().tearDown()
+
+    def test_tree_queries(self):
+        timings = {}
+        for tree in ("itemtree", "locationtree", "customertree"):
+            start = time()
+            response = self.client.get(
+                "/forecast/%s/?measure=forecasttotal" % tree, follow=True
+            )
+            timings[tree] = time() - start
+            self.assertEqual(response.status_code, 200)
+        start = time()
+        ExportForecastTree.refresh()
+        timings["forecasttree refresh"] = time() - start
+        for tree in ("itemtree", "locationtree", "customertree"):
+            start = time()
+            response = self.client.get(
+                "/forecast/%s/?measure=forecasttotal" % tree, follow=True
+            )
+            timings["%s from forecasttree" % tree] = time() - start
+            self.assertEqual(response.status_code, 200)
+        start = time()
+        ExportForecastTree.refresh(items=[Item.objects.order_by("name")[0].name])
+        timings["forecasttree refresh of an item"] = time() - start
+        with connection.cursor() as cursor:
+            for name, expression in (
+                ("value field", "(value->>'forecasttotal')::numeric"),
+                ("numeric column", ForecastPlan.measureSQL("forecasttotal")),
+            ):
+                start = time()
+                cursor.execute(
+                    """
+                    select item_id, sum(%s)
+                    from forecastplan
+                    where startdate >= %%s
+                    group by item_id
+                    """
+                    % expression,
+                    (self.current,),
+                )
+                cursor.fetchall()
+                timings[name] = time() - start
+        print(
+            "\nForecast editor on %d forecastplan records: %s"
+            % (
+                self.size,
+                ", ".join("%s %.2fs" % (k, v) for k, v in timings.items()),
+            )
+        )
@@ -820,10 +820,10 @@ class OverviewReport(GridPivot):
             """
             select
                 fcst.name,
-                coalesce(sum((forecastplan.value->>'ordersopen')::numeric), 0)
-                - coalesce(sum((forecastplan.value->>'ordersplanned')::numeric), 0) as backlog_order,
-                coalesce(sum((forecastplan.value->>'forecastnet')::numeric), 0)
-                - coalesce(sum((forecastplan.value->>'forecastplanned')::numeric), 0) as backlog_forecast,
+                coalesce(sum(forecastplan.ordersopen), 0)
+                - coalesce(sum(forecastplan.ordersplanned), 0) as backlog_order,
+                coalesce(sum(forecastplan.forecastnet), 0)
+                - coalesce(sum(forecastplan.forecastplanned), 0) as backlog_forecast,
                 coalesce(sum((forecastplan.value->>'ordersopenvalue')::numeric), 0)
                 - coalesce(sum((forecastplan.value->>'ordersplannedvalue')::numeric), 0) as backlog_order_value,
                 coalesce(sum((forecastplan.value->>'forecastnetvalue')::numeric), 0)
@@ -948,11 +948,10 @@ class OverviewReport(GridPivot):
             ",\n".join(
                 [
                     (
-                        "coalesce(sum((forecastplan.value->>'%s')::numeric),0) as %s"
-                        % (m.name, m.name)
+                        "coalesce(sum(%s),0) as %s"
+                        % (ForecastPlan.measureSQL(m.name), m.name)
                         if m.defaultvalue != -1
-                        else "sum((forecastplan.value->>'%s')::numeric) as %s"
-                        % (m.name, m.name)
+                        else "sum(%s) as %s" % (ForecastPlan.measureSQL(m.name), m.name)
                     )
                     for m in request.measures
                     if not m.computed
@@ -1197,6 +1196,79 @@ class ForecastEditor:
             return measurename
         return "forecastnet"
 
+    @staticmethod
+    def getTreeBuckets(request, measurename, current):
+        """
+        Returns the bucket and the start dates of the buckets displayed in the trees
+        when the forecasttree table has the totals for them, and None otherwise.
+        """
+        if measurename not in ForecastPlan.numeric_measures:
+            return None
+        with connections[request.database].cursor() as cursor:
+            cursor.execute(
+                """
+                select bucket_id, array_agg(startdate order by startdate)
+                from (
+                  select bucket_id, startdate
+                  from common_bucketdetail
+                  where bucket_id = (
+                    select name
+                    from common_bucket
+                    where level = (
+                      select min(level)
+                      from common_bucket
+                      where name in (%s, (select value from common_parameter where name='forecast.calendar'))
+                      )
+                    )
+                  and enddate > %s
+                  order by startdate
+                  limit 3
+                  ) d
+                group by bucket_id
+                """,
+                (request.user.horizonbuckets, current),
+            )
+            rec = cursor.fetchone()
+            if not rec:
+                return None
+            cursor.execute(
+                """
+                select exists (
+                  select 1 from forecasttree where bucket = %s and startdate = %s
+                  )
+                """,
+                (rec[0], rec[1][0]),
+            )
+            return rec if cursor.fetchone()[0] else None
+
+    @staticmethod
+    def getTreeQuery(dimension):
+        """
+        Returns the query to read the nodes of a tree from the forecasttree table.
+        The table holds the totals per node and bucket, and is maintained by the
+        plan generation and the forecast service.
+        """
+        return """
+          select name, bucketname, val, flag, lvl, description
+          from (
+            select {dim}.name, forecasttree.bucketname, forecasttree.startdate,
+            coalesce(sum(%s),0) val, {dim}.rght-{dim}.lft>1 flag, {dim}.lvl,
+            {dim}.description
+            from forecasttree
+            inner join item on item.name = forecasttree.item_id
+            inner join location on location.name = forecasttree.location_id
+            inner join customer on customer.name = forecasttree.customer_id
+            where forecasttree.bucket = %%s
+            and forecasttree.startdate = any(%%s)
+            and %s and %s and %s
+            group by {dim}.name, forecasttree.bucketname, forecasttree.startdate,
+              {dim}.lvl, {dim}.rght-{dim}.lft>1, {dim}.description
+            ) recs
+          order by lvl, startdate, sum(val) over (partition by name) desc, name
+          """.format(
+            dim=dimension
+        )
+
     @staticmethod
     @staff_member_required
     def itemtree(request):
@@ -1239,12 +1311,12 @@ class ForecastEditor:
             customerfilter = "customer.lvl = %s"
             customer = 0
 
-        # TODO this query only returns 300 items. If there are more than 300, they are not visible from the forecast editor
-        # Now that this is rendered in directive this is potentially not necessary any longer.
+        # TODO When the forecasttree table can't be used, this query only returns 300 items.
+        # If there are more than 300, they are not visible from the forecast editor.
         query = """
             with all_recs as (
               select d.startdate, item.name as item_id, item.description, d.name,
-              coalesce(sum((value->>%%s)::numeric),0) val, item.rght-item.lft>1 flag, item.lvl
+              coalesce(sum(%s),0) val, item.rght-item.lft>1 flag, item.lvl
                 from (
                   select name, startdate, enddate
                   from common_bucketdetail
@@ -1295,16 +1367,30 @@ class ForecastEditor:
         # Pick up the current date
         current = getCurrentDate(request.database, lastplan=True)
 
+        # Read the totals from the forecasttree table when it has them
+        treebuckets = ForecastEditor.getTreeBuckets(request, measurename, current)
+        if treebuckets:
+            query = ForecastEditor.getTreeQuery("item")
+            measure = ForecastPlan.measureSQL(measurename, table="forecasttree")
+            params = treebuckets
+        else:
+            measure = ForecastPlan.measureSQL(measurename)
+            params = (request.user.horizonbuckets, current)
+
         # Execute the query
         cursor = connections[request.database].cursor()
         result = []
         result_idx = {}
         cursor.execute(
-            query % (itemfilter, locationfilter, customerfilter),
+            query
+            % (
+                measure,
+                itemfilter,
+                locationfilter,
+                customerfilter,
+            ),
             (
-                measurename,
-                request.user.horizonbuckets,
-                current,
+                *params,
                 item,
                 item,
                 location,
@@ -1377,7 +1463,7 @@ class ForecastEditor:
         query = """
           with all_recs as (
           select d.startdate, location.name lname, d.name bname,
-          coalesce(sum((value->>%%s)::numeric),0) val, location.rght-location.lft>1 flag, location.lvl, location.description
+          coalesce(sum(%s),0) val, location.rght-location.lft>1 flag, location.lvl, location.description
             from (
               select name, startdate, enddate
               from common_bucketdetail
@@ -1428,16 +1514,30 @@ class ForecastEditor:
         # Pick up the current date
         current = getCurrentDate(request.database, lastplan=True)
 
+        # Read the totals from the forecasttree table when it has them
+        treebuckets = ForecastEditor.getTreeBuckets(request, measurename, current)
+        if treebuckets:
+            query = ForecastEditor.getTreeQuery("location")
+            measure = ForecastPlan.measureSQL(measurename, table="forecasttree")
+            params = treebuckets
+        else:
+            measure = ForecastPlan.measureSQL(measurename)
+            params = (request.user.horizonbuckets, current)
+
         # Execute the query
         cursor = connections[request.database].cursor()
         result = []
         result_idx = {}
         cursor.execute(
-            query % (itemfilter, locationfilter, customerfilter),
+            query
+            % (
+                measure,
+                itemfilter,
+                locationfilter,
+                customerfilter,
+            ),
             (
-                measurename,
-                request.user.horizonbuckets,
-                current,
+                *params,
                 item,
                 location,
                 customer,
@@ -1509,7 +1609,7 @@ class ForecastEditor:
         query = """
           with all_recs as (
           select d.startdate, customer.name cname, d.name bname,
-          coalesce(sum((value->>%%s)::numeric),0) val, customer.rght-customer.lft>1 flag, customer.lvl,
+          coalesce(sum(%s),0) val, customer.rght-customer.lft>1 flag, customer.lvl,
           customer.description
             from (
               select name, startdate, enddate
@@ -1562,16 +1662,30 @@ class ForecastEditor:
         # Pick up the current date
         current = getCurrentDate(request.database, lastplan=True)
 
+        # Read the totals from the forecasttree table when it has them
+        treebuckets = ForecastEditor.getTreeBuckets(request, measurename, current)
+        if treebuckets:
+            query = ForecastEditor.getTreeQuery("customer")
+            measure = ForecastPlan.measureSQL(measurename, table="forecasttree")
+            params = treebuckets
+        else:
+            measure = ForecastPlan.measureSQL(measurename)
+            params = (request.user.horizonbuckets, current)
+
         # Execute the query
         cursor = connections[request.database].cursor()
         result = []
         result_idx = {}
         cursor.execute(
-            query % (itemfilter, locationfilter, customerfilter),
+            query
+            % (
+                measure,
+                itemfilter,
+                locationfilter,
+                customerfilter,
+            ),
             (
-                measurename,
-                request.user.horizonbuckets,
-                current,
+                *params,
                 item,
                 location,
                 customer,
@@ -1716,11 +1830,10 @@ class ForecastEditor:
             ",\n".join(
                 [
                     (
-                        "coalesce(sum((forecastplan.value->>'%s')::numeric),0) as %s"
-                        % (m.name, m.name)
+                        "coalesce(sum(%s),0) as %s"
+                        % (ForecastPlan.measureSQL(m.name), m.name)
                         if not m.defaultvalue
-                        else "sum((forecastplan.value->>'%s')::numeric) as %s"
-                        % (m.name, m.name)
+                        else "sum(%s) as %s" % (ForecastPlan.measureSQL(m.name), m.name)
                     )
                     for m in request.measures
                     if not m.computed
@@ -45,6 +45,7 @@ class ForecastWidget(Widget):
     tooltip = _("Show the value of all sales order and forecast")
     permissions = (("view_forecast_report", "Can view forecast report"),)
     asynchronous = True
+    cache = True
     history = 12
     future = 12
 
@@ -272,12 +273,12 @@ class ForecastWidget(Widget):
                 coalesce((value->>'ordersadjustmentvalue')::numeric,0)
                 ))) as orderstotalvalue,
               round(sum(greatest((value->>'ordersopenvalue')::numeric,0))) as ordersopenvalue,
-              round(sum(greatest((value->>'forecasttotal')::numeric,0))) as fcst,
+              round(sum(greatest(forecastplan.forecasttotal,0))) as fcst,
               round(sum(greatest(0,
-                (value->>'orderstotal')::numeric +
-                coalesce((value->>'ordersadjustment')::numeric,0)
+                forecastplan.orderstotal +
+                coalesce(forecastplan.ordersadjustment,0)
                 ))) as orderstotal,
-              round(sum(greatest((value->>'ordersopen')::numeric,0))) as ordersopen
+              round(sum(greatest(forecastplan.ordersopen,0))) as ordersopen
             from common_bucketdetail
             left outer join forecastplan
               on item_id = (select name from item where item.lvl = 0 limit 1)
@@ -326,6 +327,7 @@ class ForecastAccuracyWidget(Widget):
     tooltip = _("Show the evolution of the SMAPE forecast error")
     permissions = (("view_forecast_report", "Can view forecast report"),)
     asynchronous = True
+    cache = True
     history = 12
 
     def args(self):
@@ -439,8 +441,8 @@ class ForecastAccuracyWidget(Widget):
               (
               select
                 startdate,
-                greatest((value->>'forecasttotal')::numeric,0) fcst,
-                greatest((value->>'orderstotal')::numeric + coalesce((value->>'ordersadjustment')::numeric,0),0) orders
+                greatest(forecastplan.forecasttotal,0) fcst,
+                greatest(forecastplan.orderstotal + coalesce(forecastplan.ordersadjustment,0),0) orders
               from forecastplan
               inner join forecast
                 on forecastplan.item_id = forecast.item_id
@@ -479,6 +481,7 @@ class OutliersWidget(Widget):
     tooltip = _("Displays outliers detected in the demand history")
     permissions = (("view_problem_report", "Can view problem report"),)
     asynchronous = True
+    cache = True
     url = "/problem/?name=outlier"
     exporturl = True
     limit = 20
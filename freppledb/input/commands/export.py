@@ -21,15 +21,20 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-from datetime import datetime
+from datetime import date, datetime, time
 import logging
-from psycopg2.extras import execute_batch
 
 from django.db import DEFAULT_DB_ALIAS, connections
 from django.conf import settings
 
 from freppledb.boot import getAttributes
-from freppledb.common.commands import PlanTaskRegistry, PlanTask
+from freppledb.common.commands import (
+    CopyFromGenerator,
+    PlanTaskRegistry,
+    PlanTask,
+    clean_value,
+)
+from freppledb.common.models import ParameterCache
 from freppledb.input.models import (
     Buffer,
     Calendar,
@@ -61,19 +66,128 @@ default_end = datetime(2030, 12, 31)
 map_search = {0: "PRIORITY", 1: "MINCOST", 2: "MINPENALTY", 3: "MINCOSTPENALTY"}
 
 
-def SQL4attributes(attrs, with_on_conflict=True):
-    """Snippet is used many times in this file"""
-    res0 = []
-    res1 = []
-    res2 = []
-    for a in attrs:
-        res0.append(",%s" % a[0])
-        res1.append(",%s * '1 second'::interval" if a[2] == "duration" else ",%s")
-        res2.append(",\n%s=excluded.%s" % (a[0], a[0]))
-    if with_on_conflict:
-        return ("".join(res0), "".join(res1), "".join(res2))
+def copyValue(value, duration=False):
+    """Formats a value for a COPY command in text format"""
+    if value is None:
+        return "\\N"
+    elif duration:
+        return "%.6f seconds" % value
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, (datetime, date, time)):
+        return value.isoformat()
     else:
-        return ("".join(res0), "".join(res1))
+        return clean_value(str(value))
+
+
+def mergeStatic(
+    cursor,
+    model,
+    columns,
+    keys,
+    rows,
+    attrs=(),
+    durations=(),
+    nullkeys=(),
+    onchange=None,
+    source=None,
+):
+    """
+    Merges the exported rows in the table of a model.
+
+    The rows are copied in a temporary staging table, and merged in the table
+    with a single statement. Existing records of which none of the fields
+    changes are skipped, and keep their lastmodified timestamp.
+    When exporting the data of a source, the primary keys of the skipped
+    records are passed to the cleanStatic task, which would otherwise consider
+    them as obsolete.
+
+    The columns argument is a comma separated list of the fields in each row,
+    followed by the attributes. Durations are passed as a number of seconds.
+    The keys identify a record, and nullkeys are the keys that can be null.
+    The onchange argument is an extra SQL assignment on updated records.
+
+    Returns a tuple with the number of inserted, updated and skipped records.
+    """
+    table = model._meta.db_table
+    staging = "tmp_export_%s" % table
+    columns = columns.split(",") + [a[0] for a in attrs]
+    durations = set(durations).union(a[0] for a in attrs if a[2] == "duration")
+    isduration = [c in durations for c in columns]
+    updated = [c for c in columns if c not in keys]
+    compared = [c for c in updated if c != "lastmodified"]
+    match = " and ".join(
+        't."%s" %s s."%s"' % (k, "is not distinct from" if k in nullkeys else "=", k)
+        for k in keys
+    )
+    cursor.execute(
+        "create temporary table if not exists %s as select %s from %s with no data"
+        % (staging, ",".join('"%s"' % c for c in columns), table)
+    )
+    cursor.execute("truncate table %s" % staging)
+    cursor.copy_expert(
+        "copy %s (%s) from stdin with delimiter E'\\013'"
+        % (staging, ",".join('"%s"' % c for c in columns)),
+        CopyFromGenerator(
+            "%s\n" % "\v".join(copyValue(v, d) for v, d in zip(r, isduration))
+            for r in rows
+        ),
+        size=settings.COPY_BUFFER_SIZE,
+    )
+    cursor.execute(
+        """
+        with upd as (
+          update %s t set %s%s
+          from %s s
+          where %s
+          and (%s) is distinct from (%s)
+          returning 1
+          ),
+        ins as (
+          insert into %s (%s)
+          select %s from %s s
+          where not exists (select 1 from %s t where %s)
+          returning 1
+          )
+        select
+          (select count(*) from ins),
+          (select count(*) from upd),
+          (select count(*) from %s)
+        """
+        % (
+            table,
+            ",".join('"%s"=s."%s"' % (c, c) for c in updated),
+            ",%s" % onchange if onchange else "",
+            staging,
+            match,
+            ",".join('t."%s"' % c for c in compared) or "null",
+            ",".join('s."%s"' % c for c in compared) or "null",
+            table,
+            ",".join('"%s"' % c for c in columns),
+            ",".join('s."%s"' % c for c in columns),
+            staging,
+            table,
+            match,
+            staging,
+        )
+    )
+    inserted, changed, total = cursor.fetchone()
+    skipped = total - inserted - changed
+    if source:
+        cursor.execute(
+            """
+            select t."%s" from %s t
+            inner join %s s on %s
+            where t.lastmodified is distinct from s.lastmodified
+            """
+            % (model._meta.pk.column, table, staging, match)
+        )
+        cleanStatic.unchanged.setdefault(table, set()).update(i[0] for i in cursor)
+    logger.info(
+        "Exported %s: %d inserted, %d updated, %d unchanged"
+        % (table, inserted, changed, skipped)
+    )
+    return inserted, changed, skipped
 
 
 @PlanTaskRegistry.register
@@ -81,6 +195,33 @@ class cleanStatic(PlanTask):
     description = "Clean static data"
     sequence = 308
 
+    # Models of which the records are exported with the mergeStatic function
+    models = (
+        Buffer,
+        Calendar,
+        CalendarBucket,
+        Customer,
+        Demand,
+        Item,
+        ItemSupplier,
+        ItemDistribution,
+        Location,
+        Operation,
+        OperationDependency,
+        OperationMaterial,
+        OperationResource,
+        Resource,
+        ResourceSkill,
+        SetupMatrix,
+        SetupRule,
+        Skill,
+        Supplier,
+    )
+
+    # Primary keys of the records that were exported without any change.
+    # They keep the lastmodified timestamp of a previous export.
+    unchanged = {}
+
     @classmethod
     def getWeight(cls, database=DEFAULT_DB_ALIAS, **kwargs):
         if kwargs.get("exportstatic", False) and kwargs.get("source", None):
@@ -100,8 +241,9 @@ class cleanStatic(PlanTask):
             and split_part(old%s.subcategory,',',2) = split_part(new%s.subcategory,',',2)
             and new%s.lastmodified > old%s.lastmodified
             and old%s.source = %%s and new%s.source = %%s
+            and old%s.name not in (select name from tmp_unchanged_%s)
             """
-            % ((model_name,) * 14),
+            % ((model_name,) * 16),
             (source, source),
         )
 
@@ -127,6 +269,33 @@ class cleanStatic(PlanTask):
                             **{related.field.name: oldname}
                         ).delete()
 
+    @classmethod
+    def loadUnchanged(cls, cursor):
+        """
+        Copies the keys of the unchanged records in temporary tables.
+        Records with a lastmodified timestamp different from the current
+        export are only obsolete when they aren't in these tables.
+        """
+        for model in cls.models:
+            table = model._meta.db_table
+            cursor.execute(
+                """
+                create temporary table if not exists tmp_unchanged_%s as
+                select %s from %s with no data
+                """
+                % (table, model._meta.pk.column, table)
+            )
+            cursor.execute("truncate table tmp_unchanged_%s" % table)
+            keys = cls.unchanged.pop(table, None)
+            if keys:
+                cursor.copy_from(
+                    CopyFromGenerator("%s\n" % clean_value(str(k)) for k in keys),
+                    "tmp_unchanged_%s" % table,
+                    size=settings.COPY_BUFFER_SIZE,
+                    sep="\v",
+                )
+            cursor.execute("analyze tmp_unchanged_%s" % table)
+
     @classmethod
     def getSQLNoReferences(cls, table, field):
         sql = " and ".join(
@@ -146,6 +315,7 @@ class cleanStatic(PlanTask):
             # detect if we have an item/location/customer name change
             cls.fk_relations = {}
             if source:
+                cls.loadUnchanged(cursor)
                 cls.updateNames(Item, database, source)
                 cls.updateNames(Location, database, source)
                 cls.updateNames(Customer, database, source)
@@ -178,7 +348,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operation_dependency
-                where source = %%s and lastmodified <> %%s and %s
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_operation_dependency) and %s
                 """
                 % cls.getSQLNoReferences("operation_dependency", "id"),
                 (source, cls.timestamp),
@@ -188,6 +359,7 @@ class cleanStatic(PlanTask):
                 with cte as (
                     select name from operation
                     where operation.source = %%s and operation.lastmodified <> %%s
+                    and operation.name not in (select name from tmp_unchanged_operation)
                     )
                 delete from operation_dependency
                 where ( operation_id in (select name from cte)
@@ -201,7 +373,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationmaterial
-                where source = %%s and lastmodified <> %%s and %s
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_operationmaterial) and %s
                 """
                 % cls.getSQLNoReferences("operationmaterial", "id"),
                 (source, cls.timestamp),
@@ -212,6 +385,7 @@ class cleanStatic(PlanTask):
                 where operation_id in (
                     select name from operation
                     where operation.source = %%s and operation.lastmodified <> %%s
+                    and operation.name not in (select name from tmp_unchanged_operation)
                     )
                 and %s
                 """
@@ -219,35 +393,61 @@ class cleanStatic(PlanTask):
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from buffer where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from buffer
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_buffer)
+                and %s
+                """
                 % cls.getSQLNoReferences("operationmaterial", "id"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from operationplan where demand_id in (select name from demand where source = %s and lastmodified <> %s)",
+                """
+                delete from operationplan where demand_id in (
+                  select name from demand where source = %s and lastmodified <> %s
+                  and name not in (select name from tmp_unchanged_demand)
+                  )
+                """,
                 (source, cls.timestamp),
             )
 
             cursor.execute(
                 """
                 update operationplan set demand_id = null where demand_id in
-                (select name from demand where source = %s and lastmodified <> %s)
+                (select name from demand where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_demand))
                 """,
                 (source, cls.timestamp),
             )
 
             cursor.execute(
-                "delete from demand where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from demand
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_demand)
+                and %s
+                """
                 % cls.getSQLNoReferences("demand", "name"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from itemsupplier where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from itemsupplier
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_itemsupplier)
+                and %s
+                """
                 % cls.getSQLNoReferences("itemsupplier", "id"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from itemdistribution where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from itemdistribution
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_itemdistribution)
+                and %s
+                """
                 % cls.getSQLNoReferences("itemdistribution", "id"),
                 (source, cls.timestamp),
             )
@@ -258,9 +458,11 @@ class cleanStatic(PlanTask):
                   or operation_id in (
                     select name from operation
                     where operation.source = %s and operation.lastmodified <> %s
+                    and operation.name not in (select name from tmp_unchanged_operation)
                     )
                   or supplier_id in (
                     select name from supplier where source = %s and lastmodified <> %s
+                    and name not in (select name from tmp_unchanged_supplier)
                    ))
                 """,
                 (source, cls.timestamp, source, cls.timestamp, source, cls.timestamp),
@@ -277,9 +479,11 @@ class cleanStatic(PlanTask):
                     or operation_id in (
                         select name from operation
                         where operation.source = %s and operation.lastmodified <> %s
+                        and operation.name not in (select name from tmp_unchanged_operation)
                         )
                     or supplier_id in (
                         select name from supplier where source = %s and lastmodified <> %s
+                        and name not in (select name from tmp_unchanged_supplier)
                     )
                     or type = 'STCK'
                 )
@@ -294,9 +498,11 @@ class cleanStatic(PlanTask):
                   or operation_id in (
                     select name from operation
                     where operation.source = %s and operation.lastmodified <> %s
+                    and operation.name not in (select name from tmp_unchanged_operation)
                     )
                   or supplier_id in (
                     select name from supplier where source = %s and lastmodified <> %s
+                    and name not in (select name from tmp_unchanged_supplier)
                    )
                   or type = 'STCK'
                 """,
@@ -305,10 +511,12 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationresource
-                where ((source = %%s and lastmodified <> %%s)
+                where ((source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_operationresource))
                   or operation_id in (
                      select name from operation
                      where operation.source = %%s and operation.lastmodified <> %%s
+                     and operation.name not in (select name from tmp_unchanged_operation)
                      )
                   ) and %s
                 """
@@ -316,7 +524,12 @@ class cleanStatic(PlanTask):
                 (source, cls.timestamp, source, cls.timestamp),
             )
             cursor.execute(
-                "delete from operation where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from operation
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_operation)
+                and %s
+                """
                 % cls.getSQLNoReferences("operation", "name"),
                 (source, cls.timestamp),
             )
@@ -324,7 +537,8 @@ class cleanStatic(PlanTask):
                 cursor.execute(
                     """
                     delete from forecast where item_id in
-                    (select name from item where source = %%s and lastmodified <> %%s)
+                    (select name from item where source = %%s and lastmodified <> %%s
+                     and name not in (select name from tmp_unchanged_item))
                     and %s
                     """
                     % cls.getSQLNoReferences("forecast", "name"),
@@ -333,7 +547,8 @@ class cleanStatic(PlanTask):
                 cursor.execute(
                     """
                     delete from forecast where location_id in
-                    (select name from location where source = %%s and lastmodified <> %%s)
+                    (select name from location where source = %%s and lastmodified <> %%s
+                     and name not in (select name from tmp_unchanged_location))
                     and %s
                     """
                     % cls.getSQLNoReferences("forecast", "name"),
@@ -342,38 +557,64 @@ class cleanStatic(PlanTask):
                 cursor.execute(
                     """
                     delete from forecast where customer_id in
-                    (select name from customer where source = %%s and lastmodified <> %%s)
+                    (select name from customer where source = %%s and lastmodified <> %%s
+                     and name not in (select name from tmp_unchanged_customer))
                     and %s
                     """
                     % cls.getSQLNoReferences("forecast", "name"),
                     (source, cls.timestamp),
                 )
+                deleted = {}
+                for dimension in ("item", "location", "customer"):
+                    cursor.execute(
+                        """
+                        select name from %s where source = %%s and lastmodified <> %%s
+                        and name not in (select name from tmp_unchanged_%s)
+                        """
+                        % (dimension, dimension),
+                        (source, cls.timestamp),
+                    )
+                    deleted[dimension] = [i[0] for i in cursor.fetchall()]
                 cursor.execute(
                     """
                     delete from forecastplan where item_id in
-                    (select name from item where source = %s and lastmodified <> %s)
+                    (select name from item where source = %s and lastmodified <> %s
+                     and name not in (select name from tmp_unchanged_item))
                     """,
                     (source, cls.timestamp),
                 )
                 cursor.execute(
                     """
                     delete from forecastplan where location_id in
-                    (select name from location where source = %s and lastmodified <> %s)
+                    (select name from location where source = %s and lastmodified <> %s
+                     and name not in (select name from tmp_unchanged_location))
                     """,
                     (source, cls.timestamp),
                 )
                 cursor.execute(
                     """
                     delete from forecastplan where customer_id in
-                    (select name from customer where source = %s and lastmodified <> %s)
+                    (select name from customer where source = %s and lastmodified <> %s
+                     and name not in (select name from tmp_unchanged_customer))
                     """,
                     (source, cls.timestamp),
                 )
+                # Update the forecast editor totals of the parents
+                cursor.execute("select exists (select 1 from forecasttree)")
+                if cursor.fetchone()[0]:
+                    from freppledb.forecast.commands import ExportForecastTree
+
+                    for dimension, names in deleted.items():
+                        if names:
+                            ExportForecastTree.refresh(
+                                database=database, **{"%ss" % dimension: names}
+                            )
             if "freppledb.inventoryplanning" in settings.INSTALLED_APPS:
                 cursor.execute(
                     """
                     delete from inventoryplanning where item_id in
-                    (select name from item where source = %%s and lastmodified <> %%s)
+                    (select name from item where source = %%s and lastmodified <> %%s
+                     and name not in (select name from tmp_unchanged_item))
                     and %s
                     """
                     % cls.getSQLNoReferences("inventoryplanning", "id"),
@@ -382,14 +623,16 @@ class cleanStatic(PlanTask):
                 cursor.execute(
                     """
                     delete from out_inventoryplanning where item_id in
-                    (select name from item where source = %s and lastmodified <> %s)
+                    (select name from item where source = %s and lastmodified <> %s
+                     and name not in (select name from tmp_unchanged_item))
                     """,
                     (source, cls.timestamp),
                 )
                 cursor.execute(
                     """
                     delete from inventoryplanning where location_id in
-                    (select name from location where source = %%s and lastmodified <> %%s)
+                    (select name from location where source = %%s and lastmodified <> %%s
+                     and name not in (select name from tmp_unchanged_location))
                     and %s
                     """
                     % cls.getSQLNoReferences("inventoryplanning", "id"),
@@ -398,7 +641,8 @@ class cleanStatic(PlanTask):
                 cursor.execute(
                     """
                     delete from out_inventoryplanning where location_id in
-                    (select name from location where source = %s and lastmodified <> %s)
+                    (select name from location where source = %s and lastmodified <> %s
+                     and name not in (select name from tmp_unchanged_location))
                     """,
                     (source, cls.timestamp),
                 )
@@ -407,7 +651,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationplanmaterial where item_id in
-                (select name from item where source = %s and lastmodified <> %s)
+                (select name from item where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_item))
                 """,
                 (source, cls.timestamp),
             )
@@ -415,7 +660,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationplan where item_id in
-                (select name from item where source = %s and lastmodified <> %s)
+                (select name from item where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_item))
                 """,
                 (source, cls.timestamp),
             )
@@ -423,7 +669,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from itemsupplier where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("itemsupplier", "id"),
@@ -433,7 +680,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from itemdistribution where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("itemdistribution", "id"),
@@ -443,7 +691,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from buffer where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("buffer", "id"),
@@ -454,7 +703,8 @@ class cleanStatic(PlanTask):
                 """
                 update operationplan set demand_id = null where demand_id in
                 (select name from demand where item_id in
-                (select name from item where source = %s and lastmodified <> %s))
+                (select name from item where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_item)))
                 """,
                 (source, cls.timestamp),
             )
@@ -462,7 +712,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from demand where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("demand", "name"),
@@ -472,7 +723,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationplanmaterial where item_id in
-                (select name from item where source = %s and lastmodified <> %s)
+                (select name from item where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_item))
                 """,
                 (source, cls.timestamp),
             )
@@ -480,7 +732,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationplan where item_id in
-                (select name from item where source = %s and lastmodified <> %s)
+                (select name from item where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_item))
                 """,
                 (source, cls.timestamp),
             )
@@ -488,7 +741,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from itemsupplier where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("itemsupplier", "id"),
@@ -498,7 +752,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from itemdistribution where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("itemdistribution", "id"),
@@ -508,7 +763,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from buffer where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("buffer", "id"),
@@ -518,7 +774,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from demand where item_id in
-                (select name from item where source = %%s and lastmodified <> %%s)
+                (select name from item where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_item))
                 and %s
                 """
                 % cls.getSQLNoReferences("demand", "name"),
@@ -526,17 +783,32 @@ class cleanStatic(PlanTask):
             )
 
             cursor.execute(
-                "delete from item where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from item
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_item)
+                and %s
+                """
                 % cls.getSQLNoReferences("item", "name"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from resourceskill where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from resourceskill
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_resourceskill)
+                and %s
+                """
                 % cls.getSQLNoReferences("resourceskill", "id"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from operation where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from operation
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_operation)
+                and %s
+                """
                 % cls.getSQLNoReferences("operation", "name"),
                 (source, cls.timestamp),
             )
@@ -544,13 +816,19 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationplanresource where resource_id in
-                (select name from resource where source = %s and lastmodified <> %s)
+                (select name from resource where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_resource))
                 """,
                 (source, cls.timestamp),
             )
 
             cursor.execute(
-                "delete from resource where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from resource
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_resource)
+                and %s
+                """
                 % cls.getSQLNoReferences("resource", "name"),
                 (source, cls.timestamp),
             )
@@ -559,18 +837,22 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationplanmaterial where location_id in
-                (select name from location where source = %s and lastmodified <> %s)
+                (select name from location where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_location))
                 """,
                 (source, cls.timestamp),
             )
             cursor.execute(
                 """
                 delete from operationplan where location_id in
-                (select name from location where source = %s and lastmodified <> %s)
+                (select name from location where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_location))
                 or origin_id in
-                (select name from location where source = %s and lastmodified <> %s)
+                (select name from location where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_location))
                 or destination_id in
-                (select name from location where source = %s and lastmodified <> %s)
+                (select name from location where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_location))
                 """,
                 (source, cls.timestamp) * 3,
             )
@@ -578,7 +860,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from itemsupplier where location_id in
-                (select name from location where source = %%s and lastmodified <> %%s)
+                (select name from location where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_location))
                 and %s
                 """
                 % cls.getSQLNoReferences("itemsupplier", "id"),
@@ -588,8 +871,10 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from itemdistribution where (
-                  location_id in (select name from location where source = %%s and lastmodified <> %%s)
-                  or origin_id in (select name from location where source = %%s and lastmodified <> %%s)
+                  location_id in (select name from location where source = %%s and lastmodified <> %%s
+                    and name not in (select name from tmp_unchanged_location))
+                  or origin_id in (select name from location where source = %%s and lastmodified <> %%s
+                    and name not in (select name from tmp_unchanged_location))
                 ) and %s
                 """
                 % cls.getSQLNoReferences("itemdistribution", "id"),
@@ -599,7 +884,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from buffer where location_id in
-                (select name from location where source = %%s and lastmodified <> %%s)
+                (select name from location where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_location))
                 and %s
                 """
                 % cls.getSQLNoReferences("buffer", "id"),
@@ -610,7 +896,8 @@ class cleanStatic(PlanTask):
                 """
                 update operationplan set demand_id = null where demand_id in
                 (select name from demand where location_id in
-                (select name from location where source = %s and lastmodified <> %s))
+                (select name from location where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_location)))
                 """,
                 (source, cls.timestamp),
             )
@@ -618,7 +905,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from demand where location_id in
-                (select name from location where source = %%s and lastmodified <> %%s)
+                (select name from location where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_location))
                 and %s
                 """
                 % cls.getSQLNoReferences("demand", "name"),
@@ -627,7 +915,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from resource where location_id in
-                (select name from location where source = %%s and lastmodified <> %%s)
+                (select name from location where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_location))
                 and %s
                 """
                 % cls.getSQLNoReferences("resource", "name"),
@@ -637,7 +926,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operation where location_id in
-                (select name from location where source = %%s and lastmodified <> %%s)
+                (select name from location where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_location))
                 and %s
                 """
                 % cls.getSQLNoReferences("operation", "name"),
@@ -645,34 +935,64 @@ class cleanStatic(PlanTask):
             )
 
             cursor.execute(
-                "delete from location where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from location
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_location)
+                and %s
+                """
                 % cls.getSQLNoReferences("location", "name"),
                 (source, cls.timestamp),
             )
 
             # calendar deletion
             cursor.execute(
-                "delete from calendarbucket where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from calendarbucket
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_calendarbucket)
+                and %s
+                """
                 % cls.getSQLNoReferences("calendarbucket", "id"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from calendar where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from calendar
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_calendar)
+                and %s
+                """
                 % cls.getSQLNoReferences("calendar", "name"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from skill where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from skill
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_skill)
+                and %s
+                """
                 % cls.getSQLNoReferences("skill", "name"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from setuprule where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from setuprule
+                where source = %%s and lastmodified <> %%s
+                and id not in (select id from tmp_unchanged_setuprule)
+                and %s
+                """
                 % cls.getSQLNoReferences("setuprule", "id"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from setupmatrix where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from setupmatrix
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_setupmatrix)
+                and %s
+                """
                 % cls.getSQLNoReferences("setupmatrix", "name"),
                 (source, cls.timestamp),
             )
@@ -681,7 +1001,8 @@ class cleanStatic(PlanTask):
                 """
                 update operationplan set demand_id = null where demand_id in
                 (select name from demand where customer_id in
-                (select name from customer where source = %s and lastmodified <> %s))
+                (select name from customer where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_customer)))
                 """,
                 (source, cls.timestamp),
             )
@@ -690,14 +1011,20 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from demand where customer_id in
-                (select name from customer where source = %%s and lastmodified <> %%s)
+                (select name from customer where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_customer))
                 and %s
                 """
                 % cls.getSQLNoReferences("demand", "name"),
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from customer where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from customer
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_customer)
+                and %s
+                """
                 % cls.getSQLNoReferences("customer", "name"),
                 (source, cls.timestamp),
             )
@@ -706,7 +1033,8 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from itemsupplier where supplier_id in
-                (select name from supplier where source = %%s and lastmodified <> %%s)
+                (select name from supplier where source = %%s and lastmodified <> %%s
+                 and name not in (select name from tmp_unchanged_supplier))
                 and %s
                 """
                 % cls.getSQLNoReferences("itemsupplier", "id"),
@@ -715,12 +1043,18 @@ class cleanStatic(PlanTask):
             cursor.execute(
                 """
                 delete from operationplan where supplier_id in
-                (select name from supplier where source = %s and lastmodified <> %s)
+                (select name from supplier where source = %s and lastmodified <> %s
+                 and name not in (select name from tmp_unchanged_supplier))
                 """,
                 (source, cls.timestamp),
             )
             cursor.execute(
-                "delete from supplier where source = %%s and lastmodified <> %%s and %s"
+                """
+                delete from supplier
+                where source = %%s and lastmodified <> %%s
+                and name not in (select name from tmp_unchanged_supplier)
+                and %s
+                """
                 % cls.getSQLNoReferences("supplier", "name"),
                 (source, cls.timestamp),
             )
@@ -750,6 +1084,7 @@ class exportParameters(PlanTask):
                 "update common_parameter set value=%s, lastmodified=%s where name='currentdate'",
                 (frepple.settings.current.strftime("%Y-%m-%d %H:%M:%S"), cls.timestamp),
             )
+        ParameterCache.invalidate(database)
 
 
 @PlanTaskRegistry.register
@@ -782,20 +1117,14 @@ class exportCalendars(PlanTask):
                 yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """insert into calendar
-                (name,defaultvalue,source,lastmodified%s)
-                values(%%s,%%s,%%s,%%s%s)
-                on conflict (name)
-                do update set
-                  defaultvalue=excluded.defaultvalue,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Calendar,
+                "name,defaultvalue,source,lastmodified",
+                ("name",),
                 getData(),
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -827,41 +1156,22 @@ class exportLocations(PlanTask):
                     i.subcategory,
                     i.source,
                     cls.timestamp,
+                    i.owner.name if i.owner else None,
                 ]
                 for a in attrs:
                     r.append(getattr(i, a[0], None))
                 yield r
 
-        def getOwners():
-            for i in frepple.locations():
-                if i.owner and (not source or source == i.source):
-                    yield (i.owner.name, i.name)
-
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """insert into location
-                (name,description,available_id,category,subcategory,source,lastmodified,owner_id%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s,null%s)
-                on conflict (name)
-                do update set
-                  description=excluded.description,
-                  available_id=excluded.available_id,
-                  category=excluded.category,
-                  subcategory=excluded.subcategory,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified,
-                  owner_id=excluded.owner_id,
-                  lft=null
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Location,
+                "name,description,available_id,category,subcategory,source,lastmodified,owner_id",
+                ("name",),
                 getData(),
-            )
-            execute_batch(
-                cursor,
-                "update location set owner_id=%s, lft=null where name=%s",
-                getOwners(),
+                attrs=attrs,
+                onchange="lft=null",
+                source=source,
             )
 
 
@@ -899,45 +1209,22 @@ class exportItems(PlanTask):
                     i.volume,
                     i.weight,
                     cls.timestamp,
+                    i.owner.name if i.owner else None,
                 ]
                 for a in attrs:
                     r.append(getattr(i, a[0], None))
                 yield r
 
-        def getOwners():
-            for i in frepple.items():
-                if i.owner and (not source or source == i.source):
-                    yield (i.owner.name, i.name)
-
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """insert into item
-                (name,description,cost,category,subcategory,type,source,uom,volume,weight,lastmodified,owner_id%s)
-                values (%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,null%s)
-                on conflict (name)
-                do update set
-                  description=excluded.description,
-                  cost=excluded.cost,
-                  category=excluded.category,
-                  subcategory=excluded.subcategory,
-                  type=excluded.type,
-                  source=excluded.source,
-                  uom=excluded.uom,
-                  volume=excluded.volume,
-                  weight=excluded.weight,
-                  lastmodified=excluded.lastmodified,
-                  owner_id=excluded.owner_id,
-                  lft=null
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Item,
+                "name,description,cost,category,subcategory,type,source,uom,volume,weight,lastmodified,owner_id",
+                ("name",),
                 getData(),
-            )
-            execute_batch(
-                cursor,
-                "update item set owner_id=%s, lft=null where name=%s",
-                getOwners(),
+                attrs=attrs,
+                onchange="lft=null",
+                source=source,
             )
 
 
@@ -999,70 +1286,22 @@ class exportOperations(PlanTask):
                     i.effective_start if i.effective_start != default_start else None,
                     i.effective_end if i.effective_end != default_end else None,
                     cls.timestamp,
+                    i.owner.name if i.owner and not i.owner.hidden else None,
                 ]
                 for a in attrs:
                     r.append(getattr(i, a[0], None))
                 yield r
 
-        def getOwners():
-            for i in frepple.operations():
-                if (
-                    i.owner
-                    and not i.hidden
-                    and not i.owner.hidden
-                    and (not source or source == i.source)
-                    and not isinstance(
-                        i,
-                        (
-                            frepple.operation_itemsupplier,
-                            frepple.operation_itemdistribution,
-                        ),
-                    )
-                ):
-                    yield (i.owner.name, i.name)
-
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into operation
-                (name,fence,posttime,sizeminimum,sizemultiple,sizemaximum,type,
-                duration,duration_per,location_id,cost,search,description,category,
-                subcategory,source,item_id,priority,effective_start,effective_end,
-                lastmodified,owner_id%s)
-                values(%%s,%%s * interval '1 second',%%s * interval '1 second',%%s,%%s,
-                %%s,%%s,%%s * interval '1 second',%%s * interval '1 second',%%s,%%s,%%s,
-                %%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,null%s)
-                on conflict (name)
-                do update set
-                  fence=excluded.fence,
-                  posttime=excluded.posttime,
-                  sizeminimum=excluded.sizeminimum,
-                  sizemultiple=excluded.sizemultiple,
-                  sizemaximum=excluded.sizemaximum,
-                  type=excluded.type,
-                  duration=excluded.duration,
-                  duration_per=excluded.duration_per,
-                  location_id=excluded.location_id,
-                  cost=excluded.cost,
-                  search=excluded.search,
-                  description=excluded.description,
-                  category=excluded.category,
-                  subcategory=excluded.subcategory,
-                  source=excluded.source,
-                  item_id=excluded.item_id,
-                  priority=excluded.priority,
-                  effective_start=excluded.effective_start,
-                  effective_end=excluded.effective_end,
-                  lastmodified=excluded.lastmodified,
-                  owner_id=excluded.owner_id
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Operation,
+                "name,fence,posttime,sizeminimum,sizemultiple,sizemaximum,type,duration,duration_per,location_id,cost,search,description,category,subcategory,source,item_id,priority,effective_start,effective_end,lastmodified,owner_id",
+                ("name",),
                 getData(),
-            )
-            execute_batch(
-                cursor, "update operation set owner_id=%s where name=%s", getOwners()
+                attrs=attrs,
+                durations=("fence", "posttime", "duration", "duration_per"),
+                source=source,
             )
 
 
@@ -1092,19 +1331,14 @@ class exportSetupMatrices(PlanTask):
                 yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """insert into setupmatrix
-                (name,source,lastmodified%s)
-                values(%%s,%%s,%%s%s)
-                on conflict (name)
-                do update set
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                SetupMatrix,
+                "name,source,lastmodified",
+                ("name",),
                 getData(),
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -1147,56 +1381,23 @@ class exportResources(PlanTask):
                     i.constrained,
                     i.source,
                     cls.timestamp,
+                    i.owner.name if i.owner else None,
                 ]
                 for a in attrs:
                     r.append(getattr(i, a[0], None))
                 yield r
 
-        def getOwners():
-            for i in frepple.resources():
-                if not i.hidden and i.owner and (not source or source == i.source):
-                    yield (i.owner.name, i.name)
-
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """insert into resource
-                (name,description,maximum,maximum_calendar_id,location_id,type,cost,
-                 maxearly,setup,setupmatrix_id,category,subcategory,efficiency,
-                 efficiency_calendar_id,available_id,constrained,source,lastmodified,owner_id%s)
-                values(
-                  %%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s * interval '1 second',%%s,%%s,%%s,%%s,
-                  %%s,%%s,%%s,%%s,%%s,%%s,null%s)
-                on conflict (name)
-                do update set
-                  description=excluded.description,
-                  maximum=excluded.maximum,
-                  maximum_calendar_id=excluded.maximum_calendar_id,
-                  location_id=excluded.location_id,
-                  type=excluded.type,
-                  cost=excluded.cost,
-                  maxearly=excluded.maxearly,
-                  setup=excluded.setup,
-                  setupmatrix_id=excluded.setupmatrix_id,
-                  category=excluded.category,
-                  subcategory=excluded.subcategory,
-                  efficiency=excluded.efficiency,
-                  efficiency_calendar_id=excluded.efficiency_calendar_id,
-                  available_id=excluded.available_id,
-                  constrained=excluded.constrained,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified,
-                  owner_id=excluded.owner_id,
-                  lft=null
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Resource,
+                "name,description,maximum,maximum_calendar_id,location_id,type,cost,maxearly,setup,setupmatrix_id,category,subcategory,efficiency,efficiency_calendar_id,available_id,constrained,source,lastmodified,owner_id",
+                ("name",),
                 getData(),
-            )
-            execute_batch(
-                cursor,
-                "update resource set owner_id=%s, lft=null where name=%s",
-                getOwners(),
+                attrs=attrs,
+                durations=("maxearly",),
+                onchange="lft=null",
+                source=source,
             )
 
 
@@ -1237,24 +1438,15 @@ class exportSetupRules(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """insert into setuprule
-                (setupmatrix_id,priority,fromsetup,tosetup,duration,cost,resource_id,source,lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s * interval '1 second',%%s,%%s,%%s,%%s%s)
-                on conflict (setupmatrix_id, priority)
-                do update set
-                  fromsetup=excluded.fromsetup,
-                  tosetup=excluded.tosetup,
-                  duration=excluded.duration,
-                  cost=excluded.cost,
-                  resource_id=excluded.resource_id,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                SetupRule,
+                "setupmatrix_id,priority,fromsetup,tosetup,duration,cost,resource_id,source,lastmodified",
+                ("setupmatrix_id", "priority"),
                 getData(),
+                attrs=attrs,
+                durations=("duration",),
+                source=source,
             )
 
 
@@ -1284,19 +1476,14 @@ class exportSkills(PlanTask):
                 yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """insert into skill
-                (name,source,lastmodified%s)
-                values(%%s,%%s,%%s%s)
-                on conflict (name)
-                do update set
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Skill,
+                "name,source,lastmodified",
+                ("name",),
                 getData(),
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -1337,23 +1524,14 @@ class exportResourceSkills(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into resourceskill
-                (effective_start,effective_end,priority,source,lastmodified,resource_id,skill_id%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (resource_id, skill_id)
-                do update set
-                  effective_start=excluded.effective_start,
-                  effective_end=excluded.effective_end,
-                  priority=excluded.priority,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                ResourceSkill,
+                "effective_start,effective_end,priority,source,lastmodified,resource_id,skill_id",
+                ("resource_id", "skill_id"),
                 getData(),
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -1401,28 +1579,14 @@ class exportOperationResources(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into operationresource
-                (operation_id,resource_id,effective_start,effective_end,
-                quantity,setup,name,priority,search,source,skill_id,lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (operation_id, resource_id, effective_start)
-                do update set
-                  effective_end=excluded.effective_end,
-                  quantity=excluded.quantity,
-                  setup=excluded.setup,
-                  name=excluded.name,
-                  priority=excluded.priority,
-                  search=excluded.search,
-                  skill_id=excluded.skill_id,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                OperationResource,
+                "operation_id,resource_id,effective_start,effective_end,quantity,setup,name,priority,search,source,skill_id,lastmodified",
+                ("operation_id", "resource_id", "effective_start"),
                 getData(),
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -1453,41 +1617,22 @@ class exportCustomers(PlanTask):
                     i.subcategory,
                     i.source,
                     cls.timestamp,
+                    i.owner.name if i.owner else None,
                 ]
                 for a in attrs:
                     r.append(getattr(i, a[0], None))
                 yield r
 
-        def getOwners():
-            for i in frepple.customers():
-                if i.owner and (not source or source == i.source):
-                    yield (i.owner.name, i.name)
-
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into customer
-                (name,description,category,subcategory,source,lastmodified,owner_id%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,null%s)
-                on conflict (name)
-                do update set
-                  description=excluded.description,
-                  category=excluded.category,
-                  subcategory=excluded.subcategory,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified,
-                  owner_id=excluded.owner_id,
-                  lft=null
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Customer,
+                "name,description,category,subcategory,source,lastmodified,owner_id",
+                ("name",),
                 getData(),
-            )
-            execute_batch(
-                cursor,
-                "update customer set owner_id=%s, lft=null where name=%s",
-                getOwners(),
+                attrs=attrs,
+                onchange="lft=null",
+                source=source,
             )
 
 
@@ -1549,37 +1694,15 @@ class exportDemands(PlanTask):
                 yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into demand
-                (name,batch,due,quantity,priority,item_id,location_id,operation_id,customer_id,
-                 minshipment,maxlateness,category,subcategory,source,description,lastmodified,
-                 status,owner,policy%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s * interval '1 second',%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (name)
-                do update set
-                  batch=excluded.batch,
-                  due=excluded.due,
-                  quantity=excluded.quantity,
-                  priority=excluded.priority,
-                  item_id=excluded.item_id,
-                  location_id=excluded.location_id,
-                  operation_id=excluded.operation_id,
-                  customer_id=excluded.customer_id,
-                  minshipment=excluded.minshipment,
-                  maxlateness=excluded.maxlateness,
-                  category=excluded.category,
-                  description=excluded.description,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified,
-                  status=excluded.status,
-                  owner=excluded.owner,
-                  policy=excluded.policy
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Demand,
+                "name,batch,due,quantity,priority,item_id,location_id,operation_id,customer_id,minshipment,maxlateness,category,subcategory,source,description,lastmodified,status,owner,policy",
+                ("name",),
                 getData(),
+                attrs=attrs,
+                durations=("maxlateness",),
+                source=source,
             )
 
 
@@ -1641,32 +1764,14 @@ class exportCalendarBuckets(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into calendarbucket
-                (calendar_id,startdate,enddate,priority,value,
-                sunday,monday,tuesday,wednesday,thursday,friday,saturday,
-                starttime,endtime,source,lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (calendar_id,startdate,enddate,priority)
-                do update set
-                  value=excluded.value,
-                  sunday=excluded.sunday,
-                  monday=excluded.monday,
-                  tuesday=excluded.tuesday,
-                  wednesday=excluded.wednesday,
-                  thursday=excluded.thursday,
-                  friday=excluded.friday,
-                  saturday=excluded.saturday,
-                  starttime=excluded.starttime,
-                  endtime=excluded.endtime,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                CalendarBucket,
+                "calendar_id,startdate,enddate,priority,value,sunday,monday,tuesday,wednesday,thursday,friday,saturday,starttime,endtime,source,lastmodified",
+                ("calendar_id", "startdate", "enddate", "priority"),
                 getData(cursor),
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -1711,32 +1816,14 @@ class exportBuffers(PlanTask):
                 yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into buffer
-                (item_id,location_id,batch,description,onhand,
-                minimum,minimum_calendar_id,
-                maximum,maximum_calendar_id,
-                type,category,subcategory,source,lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (location_id, item_id, batch)
-                do update set
-                  description=excluded.description,
-                  onhand=excluded.onhand,
-                  minimum=excluded.minimum,
-                  minimum_calendar_id=excluded.minimum_calendar_id,
-                  maximum=excluded.maximum,
-                  maximum_calendar_id=excluded.maximum_calendar_id,
-                  type=excluded.type,
-                  category=excluded.category,
-                  subcategory=excluded.subcategory,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Buffer,
+                "item_id,location_id,batch,description,onhand,minimum,minimum_calendar_id,maximum,maximum_calendar_id,type,category,subcategory,source,lastmodified",
+                ("location_id", "item_id", "batch"),
                 getData(),
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -1787,29 +1874,15 @@ class exportOperationMaterials(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into operationmaterial
-                (operation_id,item_id,effective_start,quantity,type,effective_end,
-                name,priority,search,source,transferbatch,"offset",lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s * interval '1 second',%%s%s)
-                on conflict (operation_id, item_id, effective_start)
-                do update set
-                  quantity=excluded.quantity,
-                  type=excluded.type,
-                  effective_end=excluded.effective_end,
-                  name=excluded.name,
-                  priority=excluded.priority,
-                  search=excluded.search,
-                  source=excluded.source,
-                  transferbatch=excluded.transferbatch,
-                  "offset"=excluded."offset",
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                OperationMaterial,
+                "operation_id,item_id,effective_start,quantity,type,effective_end,name,priority,search,source,transferbatch,offset,lastmodified",
+                ("operation_id", "item_id", "effective_start"),
                 getData(),
+                attrs=attrs,
+                durations=("offset",),
+                source=source,
             )
 
 
@@ -1853,22 +1926,15 @@ class exportOperationDependencies(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into operation_dependency
-                (operation_id,blockedby_id,quantity,safety_leadtime,hard_safety_leadtime,lastmodified%s)
-                values(%%s,%%s,%%s,%%s * interval '1 second',%%s * interval '1 second',%%s%s)
-                on conflict (operation_id, blockedby_id)
-                do update set
-                  quantity=excluded.quantity,
-                  safety_leadtime=excluded.safety_leadtime,
-                  hard_safety_leadtime=excluded.hard_safety_leadtime,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                OperationDependency,
+                "operation_id,blockedby_id,quantity,safety_leadtime,hard_safety_leadtime,lastmodified",
+                ("operation_id", "blockedby_id"),
                 getData(),
+                attrs=attrs,
+                durations=("safety_leadtime", "hard_safety_leadtime"),
+                source=source,
             )
 
 
@@ -1904,39 +1970,21 @@ class exportSuppliers(PlanTask):
                     available.name if available else None,
                     i.source,
                     cls.timestamp,
+                    i.owner.name if i.owner else None,
                 ]
                 for a in attrs:
                     r.append(getattr(i, a[0], None))
                 yield r
 
-        def getOwners():
-            for i in frepple.suppliers():
-                if i.owner and (not source or source == i.source):
-                    yield (i.owner.name, i.name)
-
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into supplier
-                (name,description,category,subcategory,available_id,source,lastmodified,owner_id%s)
-                values(%%s,%%s,%%s,%%s,%%s,%%s,%%s,null%s)
-                on conflict (name)
-                do update set
-                  description=excluded.description,
-                  category=excluded.category,
-                  subcategory=excluded.subcategory,
-                  available_id=excluded.available_id,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified,
-                  owner_id=excluded.owner_id
-                  %s
-                """
-                % SQL4attributes(attrs),
+                Supplier,
+                "name,description,category,subcategory,available_id,source,lastmodified,owner_id",
+                ("name",),
                 getData(),
-            )
-            execute_batch(
-                cursor, "update supplier set owner_id=%s where name=%s", getOwners()
+                attrs=attrs,
+                source=source,
             )
 
 
@@ -1956,13 +2004,11 @@ class exportItemSuppliers(PlanTask):
         source = kwargs.get("source", None)
         attrs = list(getAttributes(ItemSupplier))
 
-        def getData(null_location):
+        def getData():
             for s in frepple.suppliers():
                 for i in s.itemsuppliers:
                     if i.hidden or (source and source != i.source):
                         continue
-                    if null_location != (i.location is None):
-                        continue
                     r = [
                         i.item.name,
                         i.location.name if i.location else None,
@@ -1989,72 +2035,22 @@ class exportItemSuppliers(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
-                cursor,
-                """
-                insert into itemsupplier
-                (item_id,location_id,supplier_id,effective_start,leadtime,sizeminimum,
-                 sizemultiple,sizemaximum,batchwindow,hard_safety_leadtime,extra_safety_leadtime,
-                 fence,cost,priority,effective_end,
-                 resource_id,resource_qty,source,lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s * interval '1 second',%%s,%%s,%%s,
-                %%s * interval '1 second',%%s * interval '1 second',%%s * interval '1 second',
-                %%s * interval '1 second',%%s,%%s,%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (item_id, location_id, supplier_id, effective_start)
-                do update set
-                  leadtime=excluded.leadtime,
-                  sizeminimum=excluded.sizeminimum,
-                  sizemultiple=excluded.sizemultiple,
-                  sizemaximum=excluded.sizemaximum,
-                  batchwindow=excluded.batchwindow,
-                  hard_safety_leadtime=excluded.hard_safety_leadtime,
-                  extra_safety_leadtime=excluded.extra_safety_leadtime,
-                  fence=excluded.fence,
-                  cost=excluded.cost,
-                  priority=excluded.priority,
-                  effective_end=excluded.effective_end,
-                  resource_id=excluded.resource_id,
-                  resource_qty=excluded.resource_qty,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
-                getData(null_location=False),
-            )
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into itemsupplier
-                (item_id,location_id,supplier_id,effective_start,leadtime,sizeminimum,
-                 sizemultiple,sizemaximum,batchwindow,hard_safety_leadtime,extra_safety_leadtime,
-                 fence,cost,priority,effective_end,
-                 resource_id,resource_qty,source,lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s * interval '1 second',%%s,%%s,%%s,
-                %%s * interval '1 second',%%s * interval '1 second',%%s * interval '1 second',
-                %%s * interval '1 second',%%s,%%s,%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (item_id, supplier_id, effective_start)
-                   where location_id is null
-                do update set
-                  leadtime=excluded.leadtime,
-                  sizeminimum=excluded.sizeminimum,
-                  sizemultiple=excluded.sizemultiple,
-                  sizemaximum=excluded.sizemaximum,
-                  batchwindow=excluded.batchwindow,
-                  hard_safety_leadtime=excluded.hard_safety_leadtime,
-                  extra_safety_leadtime=excluded.extra_safety_leadtime,
-                  fence=excluded.fence,
-                  cost=excluded.cost,
-                  priority=excluded.priority,
-                  effective_end=excluded.effective_end,
-                  resource_id=excluded.resource_id,
-                  resource_qty=excluded.resource_qty,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
-                getData(null_location=True),
+                ItemSupplier,
+                "item_id,location_id,supplier_id,effective_start,leadtime,sizeminimum,sizemultiple,sizemaximum,batchwindow,hard_safety_leadtime,extra_safety_leadtime,fence,cost,priority,effective_end,resource_id,resource_qty,source,lastmodified",
+                ("item_id", "location_id", "supplier_id", "effective_start"),
+                getData(),
+                attrs=attrs,
+                durations=(
+                    "leadtime",
+                    "batchwindow",
+                    "hard_safety_leadtime",
+                    "extra_safety_leadtime",
+                    "fence",
+                ),
+                nullkeys=("location_id",),
+                source=source,
             )
 
 
@@ -2101,26 +2097,13 @@ class exportItemDistributions(PlanTask):
                     yield r
 
         with connections[database].cursor() as cursor:
-            execute_batch(
+            mergeStatic(
                 cursor,
-                """
-                insert into itemdistribution
-                (item_id,location_id,origin_id,effective_start,leadtime,sizeminimum,
-                 sizemultiple,batchwindow,cost,priority,effective_end,source,lastmodified%s)
-                values(%%s,%%s,%%s,%%s,%%s * interval '1 second',%%s,%%s,%%s * interval '1 second',%%s,%%s,%%s,%%s,%%s%s)
-                on conflict (item_id, location_id, origin_id, effective_start)
-                do update set
-                  leadtime=excluded.leadtime,
-                  sizeminimum=excluded.sizeminimum,
-                  sizemultiple=excluded.sizemultiple,
-                  batchwindow=excluded.batchwindow,
-                  cost=excluded.cost,
-                  priority=excluded.priority,
-                  effective_end=excluded.effective_end,
-                  source=excluded.source,
-                  lastmodified=excluded.lastmodified
-                  %s
-                """
-                % SQL4attributes(attrs),
+                ItemDistribution,
+                "item_id,location_id,origin_id,effective_start,leadtime,sizeminimum,sizemultiple,batchwindow,cost,priority,effective_end,source,lastmodified",
+                ("item_id", "location_id", "origin_id", "effective_start"),
                 getData(),
+                attrs=attrs,
+                durations=("leadtime", "batchwindow"),
+                source=source,
             )
@@ -77,6 +77,71 @@ class LoadTask(PlanTask):
     filter = None
 
 
+def bulkLoadArguments(columns, row):
+    """
+    Returns the keyword arguments to create an object from a row of a
+    bulk load query.
+    """
+    args = {}
+    for col, val in zip(columns, row):
+        if val is None:
+            continue
+        if isinstance(col, tuple):
+            args[col[0]] = col[1](name=val)
+        else:
+            args[col] = val
+    return args
+
+
+def bulkLoad(cursor, pytype, columns, batchsize=10000, rowloader=None):
+    """
+    Loads all records from a cursor into the engine.
+
+    The rows are fetched in batches and passed to the frepple.bulk_load
+    function, which creates all objects of the batch in a single call.
+    The columns argument has an entry for each field in the query result:
+    a attribute name, or a tuple (attribute name, callable) for fields
+    referencing another entity. The callable is called with the field value
+    as name argument, and its result is cached for the batch.
+    The query can return more fields than there are columns. The extra
+    fields are ignored by the bulk load.
+
+    The optional rowloader argument is a function that is called with every
+    row first. Rows for which it returns True are loaded by the function
+    itself, and are left out of the bulk load.
+
+    The row-by-row loop is used when the engine doesn't provide the
+    bulk_load function, or when the environment variable "nobulkload" is set.
+    It is slower, but useful to compare performance.
+
+    Returns the number of records loaded.
+    """
+    import frepple
+
+    cnt = 0
+    bulk = getattr(frepple, "bulk_load", None)
+    if "nobulkload" in os.environ:
+        bulk = None
+    while True:
+        rows = cursor.fetchmany(batchsize)
+        if not rows:
+            break
+        if rowloader:
+            size = len(rows)
+            rows = [row for row in rows if not rowloader(row)]
+            cnt += size - len(rows)
+        if bulk:
+            cnt += bulk(pytype, columns, rows)
+            continue
+        for row in rows:
+            try:
+                pytype(**bulkLoadArguments(columns, row))
+                cnt += 1
+            except Exception as e:
+                logger.error("**** %s ****" % e)
+    return cnt
+
+
 @PlanTaskRegistry.register
 class checkBuckets(CheckTask):
     # check for no buckets available
@@ -1098,59 +1163,57 @@ class loadItems(LoadTask):
             filter_where = ""
 
         with transaction.atomic(using=database):
-            with connections[database].chunked_cursor() as cursor:
-                cnt = 0
-                starttime = time()
-                attrs = [f[0] for f in getAttributes(Item)]
-                if attrs:
-                    attrsql = ", %s" % ", ".join(attrs)
-                else:
-                    attrsql = ""
-                cursor.execute(
+            cnt = 0
+            starttime = time()
+            attrs = [f[0] for f in getAttributes(Item)]
+            if attrs:
+                attrsql = ", %s" % ", ".join(attrs)
+            else:
+                attrsql = ""
+            # One bulk load for each item type. The owner is returned in a
+            # different field depending on the type of the owner.
+            for pytype, type_filter in (
+                (frepple.item_mto, "type = 'make to order'"),
+                (frepple.item_mts, "type is distinct from 'make to order'"),
+            ):
+                with connections[database].chunked_cursor() as cursor:
+                    cursor.execute(
+                        """
+                    select
+                      name, description, category, subcategory, source,
+                      nullif(cost, 0),
+                      case when owner_type = 'make to order'
+                        then nullif(owner_id, '')
+                      end,
+                      case when owner_type is distinct from 'make to order'
+                        then nullif(owner_id, '')
+                      end %s
+                    from (
+                      select
+                        item.*,
+                        (select type from item p_item where item.owner_id = p_item.name) as owner_type
+                      from item %s
+                      ) item
+                    where %s
                     """
-                select
-                  name, description, owner_id,
-                  cost, category, subcategory, source, type,
-                  (select type from item p_item where item.owner_id = p_item.name) %s
-                from item %s
-                """
-                    % (attrsql, filter_where)
-                )
-                for i in cursor:
-                    cnt += 1
-                    try:
-                        if i[7] == "make to order":
-                            x = frepple.item_mto(
-                                name=i[0],
-                                description=i[1],
-                                category=i[4],
-                                subcategory=i[5],
-                                source=i[6],
-                            )
-                        else:
-                            x = frepple.item_mts(
-                                name=i[0],
-                                description=i[1],
-                                category=i[4],
-                                subcategory=i[5],
-                                source=i[6],
-                            )
-                        if i[2]:
-                            if i[8] == "make to order":
-                                x.owner = frepple.item_mto(name=i[2])
-                            else:
-                                x.owner = frepple.item_mts(name=i[2])
-                        if i[3]:
-                            x.cost = i[3]
-                        idx = 9
-                        for a in attrs:
-                            setattr(x, a, i[idx])
-                            idx += 1
-                    except Exception as e:
-                        logger.error("**** %s ****" % e)
-                logger.info(
-                    "Loaded %d items in %.2f seconds" % (cnt, time() - starttime)
-                )
+                        % (attrsql, filter_where, type_filter)
+                    )
+                    cnt += bulkLoad(
+                        cursor,
+                        pytype,
+                        [
+                            "name",
+                            "description",
+                            "category",
+                            "subcategory",
+                            "source",
+                            "cost",
+                            ("owner", frepple.item_mto),
+                            ("owner", frepple.item_mts),
+                        ]
+                        + attrs,
+                    )
+            logger.info("Loaded %d items in %.2f seconds" % (cnt, time() - starttime))
 
 
 @PlanTaskRegistry.register
@@ -1345,90 +1408,87 @@ class loadBuffers(LoadTask):
             filter_where = ""
 
         with transaction.atomic(using=database):
-            with connections[database].chunked_cursor() as cursor:
-                cnt = 0
-                starttime = time()
-                cursor.execute(
-                    """
-                select
-                  case
-                  when batch is not null
-                    and batch is distinct from ''
-                    and exists (select 1 from item where item.name = buffer.item_id and item.type = 'make to order')
-                    then item_id || ' @ ' || batch || ' @ '||location_id
-                  else
-                    item_id ||' @ '||location_id
-                  end as name,
-                  min (description),
-                  min(location_id), min(item_id),
-                  sum(onhand),
-                  min(minimum),
-                  min(minimum_calendar_id),
-                  min(type),
-                  min(min_interval),
-                  min(category),
-                  min(subcategory),
-                  min(source),
-                  min(batch),
-                  min(maximum),
-                  min(maximum_calendar_id)
-                from buffer
-                %s
-                group by case
-                  when batch is not null
-                    and batch is distinct from ''
-                    and exists (select 1 from item where item.name = buffer.item_id and item.type = 'make to order')
-                    then item_id || ' @ ' || batch || ' @ '||location_id
-                  else
-                    item_id ||' @ '||location_id
-                  end
+            cnt = 0
+            starttime = time()
+            # The column order matches the order of the attributes in the
+            # bulk load columns below. The buffer type is the last field.
+            query = """
+                select * from (
+                  select
+                    case
+                    when batch is not null
+                      and batch is distinct from ''
+                      and exists (select 1 from item where item.name = buffer.item_id and item.type = 'make to order')
+                      then item_id || ' @ ' || batch || ' @ '||location_id
+                    else
+                      item_id ||' @ '||location_id
+                    end as name,
+                    min(description),
+                    min(location_id),
+                    min(item_id),
+                    nullif(min(batch), ''),
+                    greatest(coalesce(sum(onhand), 0), 0),
+                    min(category),
+                    min(subcategory),
+                    min(source),
+                    case when min(type) is distinct from 'infinite' then min(min_interval) end,
+                    case when min(subcategory) = 'tool' then true end,
+                    nullif(min(minimum), 0),
+                    min(minimum_calendar_id),
+                    nullif(min(maximum), 0),
+                    min(maximum_calendar_id),
+                    min(type) as type
+                  from buffer
+                  %s
+                  group by case
+                    when batch is not null
+                      and batch is distinct from ''
+                      and exists (select 1 from item where item.name = buffer.item_id and item.type = 'make to order')
+                      then item_id || ' @ ' || batch || ' @ '||location_id
+                    else
+                      item_id ||' @ '||location_id
+                    end
+                  ) buffers
+                where %s
                 """
-                    % filter_where
+            with connections[database].cursor() as cursor:
+                cursor.execute(
+                    query
+                    % (
+                        filter_where,
+                        "type is not null and type not in ('default', 'infinite') limit 1",
+                    )
                 )
                 for i in cursor:
-                    cnt += 1
-                    if i[7] == "infinite":
-                        b = frepple.buffer_infinite(
-                            name=i[0],
-                            description=i[1],
-                            location=frepple.location(name=i[2]),
-                            item=frepple.item(name=i[3]),
-                            batch=i[12] if i[12] else None,
-                            onhand=max(i[4] or 0, 0),
-                            category=i[9],
-                            subcategory=i[10],
-                            source=i[11],
-                        )
-                    elif not i[7] or i[7] == "default":
-                        b = frepple.buffer(
-                            name=i[0],
-                            description=i[1],
-                            location=frepple.location(name=i[2]),
-                            item=frepple.item(name=i[3]),
-                            batch=i[12] if i[12] else None,
-                            onhand=max(i[4] or 0, 0),
-                            category=i[9],
-                            subcategory=i[10],
-                            source=i[11],
-                        )
-                        if i[8]:
-                            b.mininterval = i[8]
-                    else:
-                        raise ValueError("Buffer type '%s' not recognized" % i[7])
-                    if i[10] == "tool":
-                        b.tool = True
-                    if i[5]:
-                        b.minimum = i[5]
-                    if i[6]:
-                        b.minimum_calendar = frepple.calendar(name=i[6])
-                    if i[13]:
-                        b.maximum = i[13]
-                    if i[14]:
-                        b.maximum_calendar = frepple.calendar(name=i[14])
-
-                logger.info(
-                    "Loaded %d buffers in %.2f seconds" % (cnt, time() - starttime)
-                )
+                    raise ValueError("Buffer type '%s' not recognized" % i[-1])
+            for pytype, type_filter in (
+                (frepple.buffer_infinite, "type = 'infinite'"),
+                (frepple.buffer, "type is null or type = 'default'"),
+            ):
+                with connections[database].chunked_cursor() as cursor:
+                    cursor.execute(query % (filter_where, type_filter))
+                    cnt += bulkLoad(
+                        cursor,
+                        pytype,
+                        [
+                            "name",
+                            "description",
+                            ("location", frepple.location),
+                            ("item", frepple.item),
+                            "batch",
+                            "onhand",
+                            "category",
+                            "subcategory",
+                            "source",
+                            "mininterval",
+                            "tool",
+                            "minimum",
+                            ("minimum_calendar", frepple.calendar),
+                            "maximum",
+                            ("maximum_calendar", frepple.calendar),
+                        ],
+                    )
+            logger.info("Loaded %d buffers in %.2f seconds" % (cnt, time() - starttime))
 
 
 @PlanTaskRegistry.register
@@ -1765,49 +1825,42 @@ class loadOperationMaterials(LoadTask):
 
         with transaction.atomic(using=database):
             with connections[database].chunked_cursor() as cursor:
-                cnt = 0
                 starttime = time()
                 # Note: The sorting of the flows is not really necessary, but helps to make
                 # the planning progress consistent across runs and database engines.
                 cursor.execute(
                     """
                 SELECT
-                  operation_id, item_id, quantity, type, effective_start, effective_end,
-                  name, priority, search, source, transferbatch, quantity_fixed, "offset"
+                  operation_id, item_id, quantity, quantity_fixed, 'flow_' || type, source,
+                  case when effective_start > '1971-01-03' then effective_start end,
+                  case when effective_end < '2030-12-29' then effective_end end,
+                  nullif(name, ''), priority, nullif(search, ''),
+                  case when type = 'transfer_batch' then nullif(transferbatch, 0) end,
+                  case when type is distinct from 'transfer_batch' then nullif("offset", interval '0') end
                 FROM operationmaterial %s
                 ORDER BY operation_id, priority, item_id
                 """
                     % filter_where
                 )
-                for i in cursor:
-                    cnt += 1
-                    try:
-                        curflow = frepple.flow(
-                            operation=frepple.operation(name=i[0]),
-                            item=frepple.item(name=i[1]),
-                            quantity=i[2],
-                            quantity_fixed=i[11],
-                            type="flow_%s" % i[3],
-                            source=i[9],
-                        )
-                        if i[4] and i[4] > datetime(1971, 1, 3):
-                            curflow.effective_start = i[4]
-                        if i[5] and i[5] < datetime(2030, 12, 29):
-                            curflow.effective_end = i[5]
-                        if i[6] and i[6] != "":
-                            curflow.name = i[6]
-                        if i[7] is not None:
-                            curflow.priority = i[7]
-                        if i[8]:
-                            curflow.search = i[8]
-                        if i[3] == "transfer_batch":
-                            if i[10]:
-                                curflow.transferbatch = i[10]
-                        else:
-                            if i[12]:
-                                curflow.offset = i[12]
-                    except Exception as e:
-                        logger.error("**** %s ****" % e)
+                cnt = bulkLoad(
+                    cursor,
+                    frepple.flow,
+                    [
+                        ("operation", frepple.operation),
+                        ("item", frepple.item),
+                        "quantity",
+                        "quantity_fixed",
+                        "type",
+                        "source",
+                        "effective_start",
+                        "effective_end",
+                        "name",
+                        "priority",
+                        "search",
+                        "transferbatch",
+                        "offset",
+                    ],
+                )
                 logger.info(
                     "Loaded %d operation materials in %.2f seconds"
                     % (cnt, time() - starttime)
@@ -1957,55 +2010,63 @@ class loadDemand(LoadTask):
 
         with transaction.atomic(using=database):
             with connections[database].chunked_cursor() as cursor:
-                cnt = 0
                 starttime = time()
+                # The column order matches the order of the attributes in the
+                # bulk load columns below
                 cursor.execute(
                     """
                     SELECT
-                    name, due, quantity, priority, item_id,
-                    operation_id, customer_id, owner, minshipment, maxlateness,
-                    category, subcategory, source, location_id, status,
-                    batch, description, policy %s
+                    name, due, quantity, priority, status, item_id,
+                    category, subcategory, source, batch, description,
+                    nullif(operation_id, ''), nullif(customer_id, ''), nullif(owner, ''),
+                    minshipment, maxlateness, nullif(location_id, '') %s
                     FROM demand
                     WHERE (status IS NULL OR status in ('open', 'quote', 'inquiry') or (status = 'closed' and due >= %%s)) %s
                     """
                     % (attrsql, filter_and),
                     (fcst_start_date,),
                 )
+                cnt = bulkLoad(
+                    cursor,
+                    frepple.demand,
+                    [
+                        "name",
+                        "due",
+                        "quantity",
+                        "priority",
+                        "status",
+                        ("item", frepple.item),
+                        "category",
+                        "subcategory",
+                        "source",
+                        "batch",
+                        "description",
+                        ("operation", frepple.operation),
+                        ("customer", frepple.customer),
+                        ("owner", frepple.demand_group),
+                        "minshipment",
+                        "maxlateness",
+                        ("location", frepple.location),
+                    ]
+                    + attrs,
+                )
+
+            # Policy of the demand groups
+            with connections[database].cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT owner, min(policy)
+                    FROM demand
+                    WHERE owner is not null and owner <> '' and policy is not null
+                    and (status IS NULL OR status in ('open', 'quote', 'inquiry') or (status = 'closed' and due >= %%s)) %s
+                    GROUP BY owner
+                    """
+                    % filter_and,
+                    (fcst_start_date,),
+                )
                 for i in cursor:
-                    cnt += 1
                     try:
-                        x = frepple.demand(
-                            name=i[0],
-                            due=i[1],
-                            quantity=i[2],
-                            priority=i[3],
-                            status=i[14],
-                            item=frepple.item(name=i[4]),
-                            category=i[10],
-                            subcategory=i[11],
-                            source=i[12],
-                            batch=i[15],
-                            description=i[16],
-                        )
-                        if i[5]:
-                            x.operation = frepple.operation(name=i[5])
-                        if i[6]:
-                            x.customer = frepple.customer(name=i[6])
-                        if i[7]:
-                            x.owner = frepple.demand_group(name=i[7])
-                            if i[17]:
-                                x.owner.policy = i[17]
-                        if i[8] is not None:
-                            x.minshipment = i[8]
-                        if i[9] is not None:
-                            x.maxlateness = i[9]
-                        if i[13]:
-                            x.location = frepple.location(name=i[13])
-                        idx = 18
-                        for a in attrs:
-                            setattr(x, a, i[idx])
-                            idx += 1
+                        frepple.demand_group(name=i[0]).policy = i[1]
                     except Exception as e:
                         logger.error("**** %s ****" % e)
                 logger.info(
@@ -2071,354 +2132,242 @@ class loadOperationPlans(LoadTask):
                     confirmed_filter = " and operationplan.status <> 'closed'"
                     parent_filter = " where status <> 'closed' "
                     create_flag = False
-                cnt_mo = 0
-                cnt_po = 0
-                cnt_do = 0
-                cnt_dlvr = 0
-
-                attrs = [
-                    "operationplan.%s" % f[0] for f in getAttributes(OperationPlan)
-                ]
-                if attrs:
-                    attrsql = ", %s" % ", ".join(attrs)
-                else:
-                    attrsql = ""
-
+                cnt = 0
                 starttime = time()
+
+                # Fields that are only set for some order types or statuses
+                consume_material_sql = []
+                if not consume_material:
+                    consume_material_sql.append(
+                        "operationplan.status = 'confirmed' and operationplan.type = 'MO'"
+                    )
+                if not consume_material_completed:
+                    consume_material_sql.append(
+                        "operationplan.status = 'completed' and operationplan.type <> 'PO'"
+                    )
+                if consume_material_sql:
+                    consume_material_sql = "case when %s then false end" % " or ".join(
+                        "(%s)" % c for c in consume_material_sql
+                    )
+                else:
+                    consume_material_sql = "null::boolean"
+                if consume_capacity:
+                    consume_capacity_sql = "null::boolean"
+                else:
+                    consume_capacity_sql = (
+                        "case when operationplan.status = 'confirmed' then false end"
+                    )
+                attrs = [f[0] for f in getAttributes(OperationPlan)]
                 if with_fcst:
-                    cursor.execute(
-                        """
-                        SELECT
-                        operationplan.operation_id, operationplan.reference, operationplan.quantity,
-                        case when operationplan.plan ? 'setupend'
-                           then (operationplan.plan->>'setupend')::timestamp
-                           else operationplan.startdate
-                           end, operationplan.enddate, operationplan.status, operationplan.source,
-                        operationplan.type, operationplan.origin_id, operationplan.destination_id, operationplan.supplier_id,
-                        operationplan.item_id, operationplan.location_id, operationplan.batch, operationplan.quantity_completed,
-                        array(
-                            select resource_id
-                            from operationplanresource
-                            where operationplan_id = operationplan.reference
-                            order by resource_id
-                        ),
-                        case when operationplan.plan ? 'setupoverride'
-                          then (operationplan.plan->>'setupoverride')::integer
-                        end,
-                        coalesce(dmd.name, null),
-                        coalesce(forecast.name, null), operationplan.due
-                        %s
-                        FROM operationplan
-                        LEFT OUTER JOIN (select name from demand
-                        where demand.status is null or demand.status in ('open', 'quote')
-                        ) dmd
-                        on dmd.name = operationplan.demand_id
+                    fcst_select = ", forecast.name, operationplan.due"
+                    fcst_join = """
                         LEFT OUTER JOIN (select name from forecast) forecast
                         on forecast.name = operationplan.forecast
-                        WHERE operationplan.owner_id IS NULL
-                        and operationplan.quantity >= 0 and operationplan.status <> 'closed'
-                        %s%s and operationplan.type in ('PO', 'MO', 'DO', 'DLVR')
-                        and (operationplan.startdate is null or operationplan.startdate < '2030-12-31')
-                        and (operationplan.enddate is null or operationplan.enddate < '2030-12-31')
-                        ORDER BY operationplan.reference ASC
                         """
-                        % (attrsql, filter_and, confirmed_filter)
-                    )
                 else:
-                    cursor.execute(
-                        """
-                        SELECT
-                        operationplan.operation_id, operationplan.reference, operationplan.quantity,
-                        case when operationplan.plan ? 'setupend'
-                           then (operationplan.plan->>'setupend')::timestamp
-                           else operationplan.startdate
-                           end, operationplan.enddate, operationplan.status, operationplan.source,
-                        operationplan.type, operationplan.origin_id, operationplan.destination_id, operationplan.supplier_id,
-                        operationplan.item_id, operationplan.location_id, operationplan.batch, operationplan.quantity_completed,
-                        array(
-                            select resource_id
-                            from operationplanresource
-                            where operationplan_id = operationplan.reference
-                            order by resource_id
-                        ),
-                        case when operationplan.plan ? 'setupoverride'
-                          then (operationplan.plan->>'setupoverride')::integer
-                        end,
-                        coalesce(dmd.name, null)
-                        %s
-                        FROM operationplan
-                        LEFT OUTER JOIN (select name from demand
-                        where demand.status is null or demand.status in ('open', 'quote')
-                        ) dmd
-                        on dmd.name = operationplan.demand_id
-                        WHERE operationplan.owner_id IS NULL
-                        and operationplan.quantity >= 0 and operationplan.status <> 'closed'
-                        %s%s and operationplan.type in ('PO', 'MO', 'DO', 'DLVR')
-                        and (operationplan.startdate is null or operationplan.startdate < '2030-12-31')
-                        and (operationplan.enddate is null or operationplan.enddate < '2030-12-31')
-                        ORDER BY operationplan.reference ASC
-                        """
-                        % (attrsql, filter_and, confirmed_filter)
+                    fcst_select = ""
+                    fcst_join = ""
+
+                def forecastLoader(columns):
+                    """
+                    Returns a function to load the operationplans of a forecast
+                    bucket. They can't be bulk loaded, because the bucket is
+                    found from the forecast name and the due date.
+                    These fields are returned after the bulk load columns.
+                    """
+                    if not with_fcst:
+                        return None
+                    dmd = [c[0] if isinstance(c, tuple) else c for c in columns].index(
+                        "demand"
                     )
-                for i in cursor:
-                    try:
-                        if i[17]:
-                            dmd = frepple.demand(name=i[17])
-                        elif with_fcst and i[18] and i[19]:
-                            dmd = frepple.demand_forecastbucket(
-                                forecast=frepple.demand_forecast(name=i[18]),
-                                start=i[19],
+                    fcst = len(columns)
+
+                    def loader(row):
+                        if row[dmd] or not row[fcst] or not row[fcst + 1]:
+                            return False
+                        try:
+                            args = bulkLoadArguments(columns, row)
+                            args["demand"] = frepple.demand_forecastbucket(
+                                forecast=frepple.demand_forecast(name=row[fcst]),
+                                start=row[fcst + 1],
                             )
-                        else:
-                            dmd = None
-                        if i[7] == "MO":
-                            cnt_mo += 1
-                            opplan = frepple.operationplan(
-                                operation=frepple.operation(name=i[0]),
-                                reference=i[1],
-                                quantity=i[2],
-                                source=i[6],
-                                start=i[3],
-                                end=i[4],
-                                statusNoPropagation=i[5],
-                                create=create_flag,
-                                batch=i[13],
-                                quantity_completed=i[14],
-                                resources=i[15],
-                            )
-                            if opplan:
-                                if i[5] == "confirmed":
-                                    if not consume_material:
-                                        opplan.consume_material = False
-                                    if not consume_capacity:
-                                        opplan.consume_capacity = False
-                                elif i[5] == "completed":
-                                    if not consume_material_completed:
-                                        opplan.consume_material = False
-                                if i[16] is not None:
-                                    opplan.setupoverride = i[16]
-                        elif i[7] == "PO":
-                            cnt_po += 1
-                            opplan = frepple.operationplan(
-                                location=frepple.location(name=i[12]),
-                                ordertype=i[7],
-                                reference=i[1],
-                                item=frepple.item(name=i[11]) if i[11] else None,
-                                supplier=(
-                                    frepple.supplier(name=i[10]) if i[10] else None
-                                ),
-                                quantity=i[2],
-                                start=i[3],
-                                end=i[4],
-                                statusNoPropagation=i[5],
-                                source=i[6],
-                                create=create_flag,
-                                batch=i[13],
-                            )
-                            if opplan and i[5] == "confirmed":
-                                if not consume_capacity:
-                                    opplan.consume_capacity = False
-                        elif i[7] == "DO":
-                            cnt_do += 1
-                            opplan = frepple.operationplan(
-                                location=frepple.location(name=i[9]) if i[9] else None,
-                                reference=i[1],
-                                ordertype=i[7],
-                                item=frepple.item(name=i[11]) if i[11] else None,
-                                origin=frepple.location(name=i[8]) if i[8] else None,
-                                quantity=i[2],
-                                start=i[3],
-                                end=i[4],
-                                statusNoPropagation=i[5],
-                                source=i[6],
-                                create=create_flag,
-                                batch=i[13],
-                            )
-                            if opplan:
-                                if i[5] == "confirmed":
-                                    if not consume_capacity:
-                                        opplan.consume_capacity = False
-                                elif i[5] == "completed":
-                                    if not consume_material_completed:
-                                        opplan.consume_material = False
-                        elif i[7] == "DLVR":
-                            cnt_dlvr += 1
-                            opplan = frepple.operationplan(
-                                location=(
-                                    frepple.location(name=i[12]) if i[12] else None
-                                ),
-                                reference=i[1],
-                                ordertype=i[7],
-                                item=frepple.item(name=i[11]) if i[11] else None,
-                                origin=frepple.location(name=i[8]) if i[8] else None,
-                                demand=dmd,
-                                quantity=i[2],
-                                start=i[3],
-                                end=i[4],
-                                statusNoPropagation=i[5],
-                                source=i[6],
-                                create=create_flag,
-                                batch=i[13],
-                            )
-                            if opplan:
-                                if i[5] == "confirmed":
-                                    if not consume_capacity:
-                                        opplan.consume_capacity = False
-                                elif i[5] == "completed":
-                                    if not consume_material_completed:
-                                        opplan.consume_material = False
-                            opplan = None
-                        else:
-                            logger.warning(
-                                "Warning: unhandled operationplan type '%s'" % i[7]
-                            )
-                            continue
+                            frepple.operationplan(**args)
+                        except Exception as e:
+                            logger.error("**** %s ****" % e)
+                        return True
 
-                        if opplan:
-                            idx = 20 if with_fcst else 18
-                            for a in getAttributes(OperationPlan):
-                                setattr(opplan, a[0], i[idx])
-                                idx += 1
+                    return loader
 
-                        if dmd and opplan:
-                            opplan.demand = dmd
-                    except Exception as e:
-                        logger.error("**** %s ****" % e)
+                # The column order matches the order of the attributes in the
+                # bulk load columns below
+                cursor.execute(
+                    """
+                    SELECT
+                    case when operationplan.type = 'MO' then operationplan.operation_id end,
+                    operationplan.reference, operationplan.quantity,
+                    case when operationplan.plan ? 'setupend'
+                       then (operationplan.plan->>'setupend')::timestamp
+                       else operationplan.startdate
+                       end, operationplan.enddate, operationplan.status, operationplan.source,
+                    case when operationplan.type <> 'MO' then operationplan.type end,
+                    case operationplan.type
+                      when 'DO' then operationplan.destination_id
+                      when 'MO' then null
+                      else operationplan.location_id
+                      end,
+                    case when operationplan.type <> 'MO' then operationplan.item_id end,
+                    case when operationplan.type = 'PO' then operationplan.supplier_id end,
+                    case when operationplan.type in ('DO', 'DLVR') then operationplan.origin_id end,
+                    %s, operationplan.batch,
+                    case when operationplan.type = 'MO' then operationplan.quantity_completed end,
+                    case when operationplan.type = 'MO' then array(
+                        select resource_id
+                        from operationplanresource
+                        where operationplan_id = operationplan.reference
+                        order by resource_id
+                    ) end,
+                    case when operationplan.type = 'MO' and operationplan.plan ? 'setupoverride'
+                      then (operationplan.plan->>'setupoverride')::integer
+                    end,
+                    %s, %s,
+                    dmd.name
+                    %s
+                    %s
+                    FROM operationplan
+                    LEFT OUTER JOIN (select name from demand
+                    where demand.status is null or demand.status in ('open', 'quote')
+                    ) dmd
+                    on dmd.name = operationplan.demand_id
+                    %s
+                    WHERE operationplan.owner_id IS NULL
+                    and operationplan.quantity >= 0 and operationplan.status <> 'closed'
+                    %s%s and operationplan.type in ('PO', 'MO', 'DO', 'DLVR')
+                    and (operationplan.startdate is null or operationplan.startdate < '2030-12-31')
+                    and (operationplan.enddate is null or operationplan.enddate < '2030-12-31')
+                    ORDER BY operationplan.reference ASC
+                    """
+                    % (
+                        "true" if create_flag else "false",
+                        consume_material_sql,
+                        consume_capacity_sql,
+                        "".join(
+                            ", case when operationplan.type <> 'DLVR' then operationplan.%s end"
+                            % a
+                            for a in attrs
+                        ),
+                        fcst_select,
+                        fcst_join,
+                        filter_and,
+                        confirmed_filter,
+                    )
+                )
+                columns = [
+                    ("operation", frepple.operation),
+                    "reference",
+                    "quantity",
+                    "start",
+                    "end",
+                    "statusNoPropagation",
+                    "source",
+                    "ordertype",
+                    ("location", frepple.location),
+                    ("item", frepple.item),
+                    ("supplier", frepple.supplier),
+                    ("origin", frepple.location),
+                    "create",
+                    "batch",
+                    "quantity_completed",
+                    "resources",
+                    "setupoverride",
+                    "consume_material",
+                    "consume_capacity",
+                    ("demand", frepple.demand),
+                ] + attrs
+                cnt += bulkLoad(
+                    cursor,
+                    frepple.operationplan,
+                    columns,
+                    rowloader=forecastLoader(columns),
+                )
         with transaction.atomic(using=database):
             with connections[database].chunked_cursor() as cursor:
-                if with_fcst:
-                    cursor.execute(
-                        """
-                        SELECT
-                        operationplan.operation_id, operationplan.reference, operationplan.quantity,
-                        case when operationplan.plan ? 'setupend'
-                           then (operationplan.plan->>'setupend')::timestamp
-                           else operationplan.startdate
-                           end, operationplan.enddate, operationplan.status,
-                        operationplan.owner_id, operationplan.source, operationplan.batch,
-                        array(
-                            select resource_id
-                            from operationplanresource
-                            where operationplan_id = operationplan.reference
-                            order by resource_id
-                        ),
-                        coalesce(dmd.name, null), coalesce(forecast.name, null), operationplan.due %s
-                        FROM operationplan
-                        INNER JOIN (select reference
-                        from operationplan %s
-                        ) opplan_parent
-                        on operationplan.owner_id = opplan_parent.reference
-                        LEFT OUTER JOIN (select name from demand
-                        where demand.status is null or demand.status in ('open', 'quote')
-                        ) dmd
-                        on dmd.name = operationplan.demand_id
-                        LEFT OUTER JOIN (select name from forecast) forecast
-                        on forecast.name = operationplan.forecast
-                        WHERE operationplan.quantity >= 0
-                        and (
-                          operationplan.status <> 'closed'
-                          or exists (
-                            select 1 from operationplan as parent_opplan
-                            where parent_opplan.reference = operationplan.owner_id
-                            and parent_opplan.status <> 'closed'
-                            )
+                cursor.execute(
+                    """
+                    SELECT
+                    operationplan.operation_id, operationplan.reference, operationplan.quantity,
+                    case when operationplan.plan ? 'setupend'
+                       then (operationplan.plan->>'setupend')::timestamp
+                       else operationplan.startdate
+                       end, operationplan.enddate, operationplan.status,
+                    operationplan.source, operationplan.batch,
+                    array(
+                        select resource_id
+                        from operationplanresource
+                        where operationplan_id = operationplan.reference
+                        order by resource_id
+                    ),
+                    %s, %s,
+                    operationplan.owner_id, dmd.name
+                    %s
+                    %s
+                    FROM operationplan
+                    INNER JOIN (select reference
+                    from operationplan %s
+                    ) opplan_parent
+                    on operationplan.owner_id = opplan_parent.reference
+                    LEFT OUTER JOIN (select name from demand
+                    where demand.status is null or demand.status in ('open', 'quote')
+                    ) dmd
+                    on dmd.name = operationplan.demand_id
+                    %s
+                    WHERE operationplan.quantity >= 0
+                    and (
+                      operationplan.status <> 'closed'
+                      or exists (
+                        select 1 from operationplan as parent_opplan
+                        where parent_opplan.reference = operationplan.owner_id
+                        and parent_opplan.status <> 'closed'
                         )
-                        %s and operationplan.type = 'MO'
-                        and (operationplan.startdate is null or operationplan.startdate < '2030-12-31')
-                        and (operationplan.enddate is null or operationplan.enddate < '2030-12-31')
-                        ORDER BY operationplan.reference ASC
-                        """
-                        % (attrsql, parent_filter, filter_and)
                     )
-                else:
-                    cursor.execute(
-                        """
-                        SELECT
-                        operationplan.operation_id, operationplan.reference, operationplan.quantity,
-                        case when operationplan.plan ? 'setupend'
-                           then (operationplan.plan->>'setupend')::timestamp
-                           else operationplan.startdate
-                           end, operationplan.enddate, operationplan.status,
-                        operationplan.owner_id, operationplan.source, operationplan.batch,
-                        array(
-                            select resource_id
-                            from operationplanresource
-                            where operationplan_id = operationplan.reference
-                            order by resource_id
-                        ),
-                        coalesce(dmd.name, null) %s
-                        FROM operationplan
-                        INNER JOIN (select reference
-                        from operationplan %s
-                        ) opplan_parent
-                        on operationplan.owner_id = opplan_parent.reference
-                        LEFT OUTER JOIN (select name from demand
-                        where demand.status is null or demand.status in ('open', 'quote')
-                        ) dmd
-                        on dmd.name = operationplan.demand_id
-                        WHERE operationplan.quantity >= 0
-                        and (
-                          operationplan.status <> 'closed'
-                          or exists (
-                            select 1 from operationplan as parent_opplan
-                            where parent_opplan.reference = operationplan.owner_id
-                            and parent_opplan.status <> 'closed'
-                            )
-                        )
-                        %s and operationplan.type = 'MO'
-                        and (operationplan.startdate is null or operationplan.startdate < '2030-12-31')
-                        and (operationplan.enddate is null or operationplan.enddate < '2030-12-31')
-                        ORDER BY operationplan.reference ASC
-                        """
-                        % (attrsql, parent_filter, filter_and)
+                    %s and operationplan.type = 'MO'
+                    and (operationplan.startdate is null or operationplan.startdate < '2030-12-31')
+                    and (operationplan.enddate is null or operationplan.enddate < '2030-12-31')
+                    ORDER BY operationplan.reference ASC
+                    """
+                    % (
+                        consume_material_sql,
+                        consume_capacity_sql,
+                        "".join(", operationplan.%s" % a for a in attrs),
+                        fcst_select,
+                        parent_filter,
+                        fcst_join,
+                        filter_and,
                     )
-                for i in cursor:
-                    try:
-                        cnt_mo += 1
-                        opplan = frepple.operationplan(
-                            operation=frepple.operation(name=i[0]),
-                            reference=i[1],
-                            quantity=i[2],
-                            source=i[7],
-                            start=i[3],
-                            end=i[4],
-                            statusNoPropagation=i[5],
-                            batch=i[8],
-                            resources=i[9],
-                        )
-                        if opplan:
-                            if i[5] == "confirmed":
-                                if not consume_material:
-                                    opplan.consume_material = False
-                                if not consume_capacity:
-                                    opplan.consume_capacity = False
-                            elif i[5] == "completed":
-                                if not consume_material_completed:
-                                    opplan.consume_material = False
-                            if i[6]:
-                                try:
-                                    opplan.owner = frepple.operationplan(reference=i[6])
-                                except Exception:
-                                    logger.error(
-                                        "Reference %s: Can't set owner field to %s"
-                                        % (i[1], i[6])
-                                    )
-                            if i[10]:
-                                opplan.demand = frepple.demand(name=i[10])
-                            elif with_fcst and i[11] and i[12]:
-                                opplan.demand = frepple.forecastbucket(
-                                    forecast=frepple.demand_forecast(name=i[11]),
-                                    start=i[12],
-                                )
-                            idx = 13 if with_fcst else 11
-                            for a in getAttributes(OperationPlan):
-                                setattr(opplan, a[0], i[idx])
-                                idx += 1
-                    except Exception as e:
-                        logger.error("**** %s ****" % e)
+                )
+                columns = [
+                    ("operation", frepple.operation),
+                    "reference",
+                    "quantity",
+                    "start",
+                    "end",
+                    "statusNoPropagation",
+                    "source",
+                    "batch",
+                    "resources",
+                    "consume_material",
+                    "consume_capacity",
+                    ("owner", lambda name: frepple.operationplan(reference=name)),
+                    ("demand", frepple.demand),
+                ] + attrs
+                cnt += bulkLoad(
+                    cursor,
+                    frepple.operationplan,
+                    columns,
+                    rowloader=forecastLoader(columns),
+                )
                 logger.info(
-                    "Loaded %d manufacturing orders, %d purchase orders, %d distribution orders and %s deliveries in %.2f seconds"
-                    % (cnt_mo, cnt_po, cnt_do, cnt_dlvr, time() - starttime)
+                    "Loaded %d operationplans in %.2f seconds"
+                    % (cnt, time() - starttime)
                 )
 
         with connections[database].cursor() as cursor:
@@ -2547,3 +2496,51 @@ class PlanSize(CheckTask):
         import frepple
 
         frepple.printsize()
+
+
+# Dependencies between the data loading tasks.
+# When the parameter plan.loadThreads is larger than 1, the tasks that don't
+# depend on each other read their data from the database concurrently.
+loadLocations.dependencies = (loadCalendars,)
+loadCalendars.dependencies = ()
+loadCalendarBuckets.dependencies = (loadCalendars,)
+loadCustomers.dependencies = ()
+loadResources.dependencies = (loadLocations, loadCalendars, loadCalendarBuckets)
+loadSuppliers.dependencies = (loadLocations, loadCalendars)
+loadOperations.dependencies = (loadLocations, loadCalendars, loadItems)
+loadSuboperations.dependencies = (loadOperations,)
+loadOperationDependencies.dependencies = (loadOperations,)
+loadItems.dependencies = ()
+loadItemSuppliers.dependencies = (
+    loadItems,
+    loadSuppliers,
+    loadLocations,
+    loadResources,
+)
+loadItemDistributions.dependencies = (loadItems, loadLocations, loadResources)
+loadBuffers.dependencies = (loadItems, loadLocations, loadCalendars)
+loadSetupMatrices.dependencies = (loadResources,)
+loadResourceSkills.dependencies = (loadResources,)
+# Flows and deliveries create default buffers for missing ones, so the
+# configured buffers need to be loaded first
+loadOperationMaterials.dependencies = (
+    loadOperations,
+    loadSuboperations,
+    loadItems,
+    loadBuffers,
+)
+LinkCalendarsToBuffers.dependencies = (
+    loadBuffers,
+    loadCalendarBuckets,
+    loadItems,
+    loadLocations,
+)
+loadOperationResources.dependencies = (loadOperations, loadResources)
+loadDemand.dependencies = (
+    loadItems,
+    loadBuffers,
+    loadOperations,
+    loadCustomers,
+    loadLocations,
+    loadCalendarBuckets,
+)
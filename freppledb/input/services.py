@@ -25,41 +25,16 @@ import frepple
 
 from collections import OrderedDict
 import json
+import logging
 
-from channels.db import database_sync_to_async
 from channels.generic.http import AsyncHttpConsumer
 
 from freppledb.boot import getAttributes
-from freppledb.common.commands import PlanTaskRegistry
 from freppledb.common.localization import parseLocalizedDateTime, parseLocalizedDate
 from freppledb.input.models import OperationPlan
-from freppledb.webservice.utils import lock
+from freppledb.webservice.utils import lock, PlanSaver
 
-
-@database_sync_to_async
-def savePlan(
-    deleted_opplans,
-    related_opplans,
-    related_resources,
-    related_buffers,
-    related_demands,
-    database,
-    cluster,
-):
-    try:
-        PlanTaskRegistry.run(
-            export=1,
-            cluster=cluster,
-            database=database,
-            deleted_opplans=deleted_opplans,
-            opplans=related_opplans,
-            resources=related_resources,
-            buffers=related_buffers,
-            demands=related_demands,
-        )
-    except Exception as e:
-        print("Error saving plan:", e)
-        raise e
+logger = logging.getLogger(__name__)
 
 
 def collectRelated(
@@ -364,27 +339,33 @@ class OperationplanService(AsyncHttpConsumer):
                     except Exception as e:
                         errors.append(str(e))
 
-                # Save all changes
-                if (
-                    deleted_opplans
-                    or related_opplans
-                    or related_resources
-                    or related_buffers
-                    or related_demands
-                ):
-                    try:
-                        await savePlan(
-                            deleted_opplans,
-                            related_opplans,
-                            related_resources,
-                            related_buffers,
-                            related_demands,
-                            self.scope["database"],
-                            -2,
-                        )
-                    except Exception as e:
-                        print("exception " % e)
-                        errors.append("Error saving plan")
+                # Only keep the keys of the changed objects. The plan in memory
+                # can change again before the changes are saved.
+                related_opplans = [o.reference for o in related_opplans]
+                related_resources = [r.name for r in related_resources]
+                related_buffers = [b.name for b in related_buffers]
+                related_demands = [d.name for d in related_demands]
+
+            # Save all changes, after releasing the lock
+            if (
+                deleted_opplans
+                or related_opplans
+                or related_resources
+                or related_buffers
+                or related_demands
+            ):
+                try:
+                    await PlanSaver.save(
+                        database=self.scope["database"],
+                        deleted_opplans=deleted_opplans,
+                        opplans=related_opplans,
+                        resources=related_resources,
+                        buffers=related_buffers,
+                        demands=related_demands,
+                    )
+                except Exception:
+                    logger.exception("Error saving plan")
+                    errors.append("Error saving plan")
 
             self.scope["response_headers"].append((b"Content-Type", b"text/html"))
             if errors:
@@ -399,8 +380,8 @@ class OperationplanService(AsyncHttpConsumer):
                     b'{"OK": 1}',
                     headers=self.scope["response_headers"],
                 )
-        except Exception as e:
-            print("exception " % e)
+        except Exception:
+            logger.exception("Error updating operationplans")
             await self.send_response(
                 500,
                 b"Error updating operationplans",
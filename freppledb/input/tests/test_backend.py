@@ -21,8 +21,9 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-from datetime import date
+from datetime import date, datetime, timedelta
 from itertools import chain
+import json
 import os
 import random
 from rest_framework.test import APIClient, APITestCase, APIRequestFactory
@@ -34,11 +35,14 @@ from django.conf import settings
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core import management
+from django.core.cache import cache
+from django.db import connection, DEFAULT_DB_ALIAS
 from django.http.response import StreamingHttpResponse
 from django.test import TestCase, TransactionTestCase
 from django.utils import translation
 from django.utils.formats import date_format
 
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.dataload import parseCSVdata
 from freppledb.common.models import (
     User,
@@ -51,6 +55,8 @@ from freppledb.common.models import (
     NotificationFactory,
 )
 from freppledb.common.tests import checkResponse
+from freppledb.execute.models import Task
+from freppledb.input.commands.export import cleanStatic, mergeStatic
 from freppledb.input.models import (
     Buffer,
     Calendar,
@@ -76,6 +82,7 @@ from freppledb.input.models import (
     SubOperation,
     Supplier,
 )
+from freppledb.input.views import SupplyPathGraph
 
 
 class DataLoadTest(TestCase):
@@ -127,6 +134,116 @@ class DataLoadTest(TestCase):
         response = self.client.get("/data/input/calendardetail/Working%20Days/")
         checkResponse(self, response)
 
+    def test_keyset_pagination(self):
+        def getPage(page):
+            response = self.client.get(
+                "/data/input/purchaseorder/?format=json&rows=1&page=%s" % page
+            )
+            data = json.loads(b"".join(response.streaming_content))
+            self.assertEqual(data["records"], 4)
+            return data["rows"][0]["reference"]
+
+        # Pages retrieved in sequence seek from the last record of the
+        # previous page. Jumping to the last page first computes the bounds
+        # of the skipped pages, which are then reused in reverse order.
+        cache.clear()
+        forward = [getPage(p) for p in range(1, 5)]
+        cache.clear()
+        backward = [getPage(p) for p in range(4, 0, -1)]
+        self.assertEqual(len(set(forward)), 4)
+        self.assertEqual(forward, list(reversed(backward)))
+
+        # Cached pages aren't reused for another page size
+        response = self.client.get(
+            "/data/input/purchaseorder/?format=json&rows=2&page=2"
+        )
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([r["reference"] for r in data["rows"]], forward[2:])
+
+        # Cached pages aren't reused after the data changed
+        PurchaseOrder.objects.filter(reference=forward[0]).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            Dashboard.planChanged()
+        response = self.client.get(
+            "/data/input/purchaseorder/?format=json&rows=1&page=2"
+        )
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["rows"][0]["reference"], forward[2])
+
+    def test_supply_path(self):
+        response = self.client.get("/supplypath/item/product/?format=json")
+        self.assertContains(response, "Pack product @ factory 1")
+        response = self.client.get("/whereused/item/product/?format=json")
+        checkResponse(self, response)
+
+        # The graph is reused until the plan version or the data change
+        graph = SupplyPathGraph.get()
+        self.assertIs(SupplyPathGraph.get(), graph)
+        op = Operation.objects.get(name="Pack product @ factory 1")
+        op.priority = 0
+        op.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Dashboard.planChanged()
+        self.assertIsNot(SupplyPathGraph.get(), graph)
+        response = self.client.get("/supplypath/item/product/?format=json")
+        self.assertNotContains(response, "Pack product @ factory 1")
+
+        # Changes that don't bump the plan version are detected as well
+        graph = SupplyPathGraph.get()
+        op.priority = 1
+        op.save()
+        self.assertIsNot(SupplyPathGraph.get(), graph)
+
+    def test_search(self):
+        response = self.client.get("/search/?term=prod")
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content)
+        self.assertIn("/detail/input/item/", [i.get("url", None) for i in result])
+        self.assertIn("product", [i["value"] for i in result])
+        with connection.cursor() as cursor:
+            cursor.execute("select 1 from pg_indexes where indexname = 'item_search'")
+            self.assertIsNotNone(cursor.fetchone())
+            # The plan export rewrites the operationplan table
+            cursor.execute(
+                "select 1 from pg_indexes where indexname = 'operationplan_search'"
+            )
+            self.assertIsNone(cursor.fetchone())
+
+    def test_static_export(self):
+        now = datetime.now().replace(microsecond=0)
+        rows = [
+            [
+                c.name,
+                c.description,
+                c.category,
+                c.subcategory,
+                c.source,
+                now,
+                c.owner_id,
+            ]
+            for c in Customer.objects.all().order_by("name")
+        ]
+        rows[0][1] = "changed description"
+        rows.append(["new customer", None, None, None, None, now, None])
+        with connection.cursor() as cursor:
+            result = mergeStatic(
+                cursor,
+                Customer,
+                "name,description,category,subcategory,source,lastmodified,owner_id",
+                ("name",),
+                iter(rows),
+                source="test",
+            )
+        # Only the changed and the new record are written
+        self.assertEqual(result, (1, 1, len(rows) - 2))
+        self.assertEqual(Customer.objects.filter(lastmodified=now).count(), 2)
+        self.assertEqual(
+            Customer.objects.get(name=rows[0][0]).description, "changed description"
+        )
+        self.assertEqual(
+            cleanStatic.unchanged.pop("customer"), {r[0] for r in rows[1:-1]}
+        )
+
     def test_csv_upload(self):
         self.assertEqual(
             [(i.name, i.category or "") for i in Location.objects.all()],
@@ -157,6 +274,106 @@ class DataLoadTest(TestCase):
             ],  # Test result is different in Enterprise Edition
         )
 
+    def test_bulk_upload(self):
+        d = Demand.objects.order_by("name").first()
+
+        def upload(bulk, suffix):
+            Parameter.objects.update_or_create(
+                name="upload.bulk", defaults={"value": bulk}
+            )
+            return [
+                msg
+                for msg in parseCSVdata(
+                    Demand,
+                    [
+                        ["name", "item", "location", "customer", "quantity", "due"],
+                        [
+                            d.name,
+                            d.item_id,
+                            d.location_id,
+                            d.customer_id,
+                            5,
+                            "2030-01-01",
+                        ],
+                        [
+                            "new %s" % suffix,
+                            d.item_id,
+                            d.location_id,
+                            d.customer_id,
+                            1,
+                            "2030-01-01",
+                        ],
+                        ["bad item", "unknown", d.location_id, d.customer_id, 1, ""],
+                        ["bad qty", d.item_id, d.location_id, d.customer_id, "x", ""],
+                    ],
+                    user=User.objects.get(username="admin"),
+                )
+            ]
+
+        # The bulk upload returns the same messages as the row by row upload
+        comments = Comment.objects.count()
+        bulk = upload("true", 1)
+        self.assertEqual(Demand.objects.get(name=d.name).quantity, 5)
+        self.assertEqual(Demand.objects.get(name="new 1").item_id, d.item_id)
+        self.assertEqual(Comment.objects.count(), comments + 2)
+        self.assertEqual(upload("true", 1)[-1][4], upload("false", 1)[-1][4])
+        Demand.objects.filter(name=d.name).update(quantity=d.quantity)
+        self.assertEqual(
+            [str(m[4]) for m in bulk], [str(m[4]) for m in upload("false", 2)]
+        )
+        self.assertFalse(Demand.objects.filter(name__startswith="bad").exists())
+
+    def test_bulk_upload_itemsupplier(self):
+        def upload(bulk, data):
+            Parameter.objects.update_or_create(
+                name="upload.bulk", defaults={"value": bulk}
+            )
+            return [
+                str(msg[4])
+                for msg in parseCSVdata(
+                    ItemSupplier, data, user=User.objects.get(username="admin")
+                )
+            ]
+
+        def reset():
+            ItemSupplier.objects.filter(item="box").update(
+                leadtime=timedelta(days=1), priority=1
+            )
+            ItemSupplier.objects.filter(
+                item="ink", supplier="Cardboard manfacturer"
+            ).delete()
+
+        # Without identifier the records are matched on the natural key
+        data = [
+            ["item", "location", "supplier", "leadtime", "priority"],
+            ["box", "", "Cardboard manfacturer", "2 00:00:00", 2],
+            ["ink", "", "Cardboard manfacturer", "1 00:00:00", 1],
+            ["thread", "", "unknown", "1 00:00:00", 1],
+        ]
+        count = ItemSupplier.objects.count()
+        bulk = upload("true", data)
+        box = ItemSupplier.objects.get(item="box")
+        self.assertEqual((box.leadtime, box.priority), (timedelta(days=2), 2))
+        new = ItemSupplier.objects.get(item="ink", supplier="Cardboard manfacturer")
+        self.assertEqual(new.effective_start, datetime(1971, 1, 1))
+        self.assertEqual(ItemSupplier.objects.count(), count + 1)
+        self.assertEqual(upload("true", data)[-1], upload("false", data)[-1])
+        reset()
+        self.assertEqual(bulk, upload("false", data))
+        reset()
+
+        # With identifier a new record can't reuse an existing natural key
+        data = [
+            ["id", "item", "location", "supplier", "priority"],
+            [box.id, "box", "", "Cardboard manfacturer", 3],
+            ["", "ink", "", "Raw material supplier", 1],
+        ]
+        bulk = upload("true", data)
+        self.assertEqual(ItemSupplier.objects.get(id=box.id).priority, 3)
+        self.assertEqual(ItemSupplier.objects.count(), count)
+        ItemSupplier.objects.filter(id=box.id).update(priority=1)
+        self.assertEqual(bulk, upload("false", data))
+
     def test_forms(self):
         item = Item.objects.all()[0].name
         loc1 = Location.objects.all()[0].name
@@ -287,10 +504,12 @@ class ExcelTest(TransactionTestCase):
         self.assertTrue(countDemand > 0)
 
         # Export workbook
-        response = self.client.post(
-            "/execute/launch/exportworkbook/",
-            {
-                "entities": [
+        management.call_command(
+            "exportworkbook",
+            user="admin",
+            filename="workbook.xlsx",
+            entities=",".join(
+                [
                     "input.demand",
                     "input.item",
                     "input.customer",
@@ -317,10 +536,34 @@ class ExcelTest(TransactionTestCase):
                     "common.bucket",
                     "common.bucketdetail",
                 ]
-            },
+            ),
+        )
+        self.assertEqual(
+            Task.objects.filter(name="exportworkbook").first().status, "Done"
+        )
+
+        # Only the user that exported the spreadsheet can download it
+        response = self.client.get("/execute/downloadfromfolder/1/workbook.xlsx/")
+        self.assertEqual(response.status_code, 200)
+        User.objects.create_user(
+            username="test user",
+            email="tester@yourcompany.com",
+            password="big_secret12345",
+            is_staff=True,
+        )
+        self.client.login(username="test user", password="big_secret12345")
+        response = self.client.get("/execute/downloadfromfolder/1/workbook.xlsx/")
+        self.assertEqual(response.status_code, 403)
+        self.client.login(username="admin", password="admin")
+
+        os.replace(
+            os.path.join(
+                settings.DATABASES[DEFAULT_DB_ALIAS]["FILEUPLOADFOLDER"],
+                "export",
+                "workbook.xlsx",
+            ),
+            "workbook.xlsx",
         )
-        with open("workbook.xlsx", "wb") as f:
-            f.write(response.content)
 
         # Erase the database
         management.call_command("empty", all=True)
@@ -0,0 +1,153 @@
+#
+# Copyright (C) 2026 by frePPLe bv
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import json
+import os
+import tempfile
+from unittest import skipUnless
+
+from django.core import management
+from django.db import connection
+from django.test import TransactionTestCase
+
+from freppledb.common.models import Parameter
+from freppledb.input.commands.load import loadDemand, loadOperationPlans
+from freppledb.input.models import Demand, ManufacturingOrder
+
+
+@skipUnless("FREPPLE_BENCHMARK" in os.environ, "Benchmarks not requested")
+class LoadBenchmark(TransactionTestCase):
+    """
+    Compares the throughput of the bulk load of demands and operationplans
+    in the engine with the row-by-row loop.
+
+    Run with:
+      FREPPLE_BENCHMARK=100000 ./frepplectl.py test freppledb.input.tests.test_benchmark
+    """
+
+    fixtures = ["demo"]
+
+    def setUp(self):
+        os.environ["FREPPLE_TEST"] = "YES"
+        param = Parameter.objects.all().get_or_create(pk="plan.webservice")[0]
+        param.value = "false"
+        param.save()
+        try:
+            self.size = int(os.environ["FREPPLE_BENCHMARK"])
+        except ValueError:
+            self.size = 100000
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                insert into demand
+                  (name, item_id, location_id, customer_id, due, quantity,
+                   priority, status, lastmodified)
+                select
+                  'bench ' || i, item.name, location.name, customer.name,
+                  now() + i * interval '1 minute', 1, 10, 'open', now()
+                from generate_series(1, %s) i
+                cross join lateral (
+                  select name from item where lft = rght - 1 order by name
+                  offset i %% 10 limit 1
+                  ) item
+                cross join (select min(name) as name from location) location
+                cross join (select min(name) as name from customer) customer
+                """,
+                (self.size,),
+            )
+            cursor.execute(
+                """
+                insert into operationplan
+                  (reference, type, status, operation_id, quantity,
+                   startdate, enddate, lastmodified)
+                select
+                  'bench ' || i, 'MO', 'confirmed', operation.name, 1,
+                  now() + i * interval '1 minute',
+                  now() + (i + 60) * interval '1 minute', now()
+                from generate_series(1, %s) i
+                cross join lateral (
+                  select name from operation
+                  where type in ('fixed_time', 'time_per') and owner_id is null
+                  order by name
+                  offset i %% (
+                    select count(*) from operation
+                    where type in ('fixed_time', 'time_per') and owner_id is null
+                    )
+                  limit 1
+                  ) operation
+                """,
+                (self.size,),
+            )
+        super().setUp()
+
+    def tearDown(self):
+        del os.environ["FREPPLE_TEST"]
+        super().tearDown()
+
+    def _run(self, env):
+        """
+        Runs a plan and returns the duration of the demand and operationplan
+        loading steps, in a dictionary keyed by the step sequence.
+        The environment doesn't have the supply and fcst flags, so the plan
+        only loads the data, without solver and export steps.
+        The other steps and the startup of the engine aren't timed: each step
+        appends its duration to the file passed in FREPPLE_TIMINGS.
+        """
+        fd, timings = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        os.environ["FREPPLE_TIMINGS"] = timings
+        try:
+            management.call_command("runplan", plantype=1, env=env)
+            with open(timings, "r", encoding="utf-8") as f:
+                steps = [json.loads(i) for i in f if i.strip()]
+        finally:
+            del os.environ["FREPPLE_TIMINGS"]
+            os.environ.pop("nobulkload", None)
+            os.remove(timings)
+        return {
+            task.sequence: sum(
+                s["seconds"] for s in steps if s["sequence"] == task.sequence
+            )
+            for task in (loadDemand, loadOperationPlans)
+        }
+
+    def test_load(self):
+        demands = Demand.objects.count()
+        orders = ManufacturingOrder.objects.count()
+        loop = self._run("nowebservice,nobulkload")
+        bulk = self._run("nowebservice")
+        for task, cnt, label in (
+            (loadDemand, demands, "demands"),
+            (loadOperationPlans, orders, "manufacturing orders"),
+        ):
+            print(
+                "\nLoading %d %s: %.0f rows/sec with the row loop, %.0f rows/sec in bulk"
+                % (
+                    cnt,
+                    label,
+                    cnt / loop[task.sequence],
+                    cnt / bulk[task.sequence],
+                )
+            )
+        self.assertEqual(Demand.objects.count(), demands)
+        self.assertEqual(ManufacturingOrder.objects.count(), orders)
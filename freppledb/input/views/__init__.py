@@ -24,6 +24,7 @@
 from .utils import (
     search,
     PathReport,
+    SupplyPathGraph,
     DownstreamDemandPath,
     DownstreamBufferPath,
     DownstreamItemPath,
@@ -21,16 +21,18 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
 from datetime import datetime
 import json
+from threading import Lock
 
 from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import FieldDoesNotExist
-from django.db import connections
-from django.db.models import Q, F
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import BooleanField, Q, F
 from django.db.models.expressions import RawSQL
-from django.db.models.fields import CharField
 from django.http import HttpResponse, Http404
 from django.http.response import StreamingHttpResponse, HttpResponseServerError
 from django.utils.decorators import method_decorator
@@ -42,6 +44,7 @@ from django.views.generic import View
 from django.views.decorators.csrf import csrf_exempt
 
 from freppledb.common.auth import getWebserviceAuthorization
+from freppledb.common.dashboard import Dashboard
 from freppledb.common.report import (
     GridReport,
     GridFieldText,
@@ -73,112 +76,127 @@ logger = logging.getLogger(__name__)
 @staff_member_required
 def search(request):
     term = request.GET.get("term").strip()
+    pattern = "%%%s%%" % (
+        term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    )
     result = []
 
-    # Loop over all models in the data_site
+    # Collect all models in the data_site
     # We are interested in models satisfying these criteria:
     #  - primary key is of type text
-    #  - user has change permissions
-    with_forecast = "freppledb.forecast" in settings.INSTALLED_APPS
-    if with_forecast:
-        from freppledb.forecast.models import Forecast
-
-        query = (
-            Forecast.objects.using(request.database)
-            .filter(
-                Q(item__name__icontains=term) | Q(item__description__icontains=term)
+    #  - user has view permissions
+    searches = []
+    if "freppledb.forecast" in settings.INSTALLED_APPS:
+        searches.append(
+            (
+                Item,
+                Item.objects.using(request.database).filter(
+                    RawSQL(
+                        "exists (select 1 from forecast where forecast.item_id = item.name)",
+                        (),
+                        output_field=BooleanField(),
+                    )
+                ),
+                force_str(_("Forecast editor")),
+                {"url": "/forecast/editor/"},
             )
-            .order_by("item__name")
-            .distinct("item__name")
-            .values_list("item__name", "item__description")
         )
-        count = len(query)
-        if count > 0:
-            result.append(
-                {
-                    "value": None,
-                    "label": (
-                        ngettext(
-                            "%(name)s - %(count)d match",
-                            "%(name)s - %(count)d matches",
-                            count,
-                        )
-                        % {"name": force_str(_("Forecast editor")), "count": count}
-                    ).capitalize(),
-                }
-            )
-            result.extend(
-                [
-                    {
-                        "url": "/forecast/editor/",
-                        "value": i[0],
-                        "display": "%s%s" % (i[0], " %s" % (i[1],) if i[1] else ""),
-                    }
-                    for i in query[:10]
-                ]
-            )
-    for cls, admn in data_site._registry.items():
+    for cls in data_site.getSearchModels():
         if request.user.has_perm(
             "%s.view_%s" % (cls._meta.app_label, cls._meta.object_name.lower())
-        ) and isinstance(cls._meta.pk, CharField):
-            descriptionExists = True
-            try:
-                cls._meta.get_field("description")
-                query = (
-                    cls.objects.using(request.database)
-                    .filter(Q(pk__icontains=term) | Q(description__icontains=term))
-                    .order_by("pk")
-                    .values_list("pk", "description")
-                )
-            except FieldDoesNotExist:
-                descriptionExists = False
-                query = (
-                    cls.objects.using(request.database)
-                    .filter(pk__icontains=term)
-                    .order_by("pk")
-                    .values_list("pk")
-                )
-            count = len(query)
-            if count > 0:
-                result.append(
+        ):
+            searches.append(
+                (
+                    cls,
+                    cls.objects.using(request.database),
+                    force_str(cls._meta.verbose_name),
                     {
-                        "value": None,
-                        "label": (
-                            ngettext(
-                                "%(name)s - %(count)d match",
-                                "%(name)s - %(count)d matches",
-                                count,
-                            )
-                            % {
-                                "name": force_str(cls._meta.verbose_name),
-                                "count": count,
-                            }
-                        ).capitalize(),
-                    }
+                        "url": (
+                            "/data/%s/%s/?noautofilter&parentreference="
+                            if issubclass(cls, OperationPlan)
+                            else "/detail/%s/%s/"
+                        )
+                        % (cls._meta.app_label, cls._meta.object_name.lower()),
+                        "removeTrailingSlash": (
+                            True if issubclass(cls, OperationPlan) else False
+                        ),
+                    },
                 )
-                result.extend(
-                    [
-                        {
-                            "url": (
-                                "/data/%s/%s/?noautofilter&parentreference="
-                                if issubclass(cls, OperationPlan)
-                                else "/detail/%s/%s/"
-                            )
-                            % (cls._meta.app_label, cls._meta.object_name.lower()),
-                            "removeTrailingSlash": (
-                                True if issubclass(cls, OperationPlan) else False
-                            ),
-                            "value": i[0],
-                            "display": "%s%s"
-                            % (
-                                i[0],
-                                " %s" % (i[1],) if descriptionExists and i[1] else "",
-                            ),
-                        }
-                        for i in query[:10]
-                    ]
+            )
+    if not searches:
+        return HttpResponse(
+            content_type="application/json; charset=%s" % settings.DEFAULT_CHARSET,
+            content=b"[]",
+        )
+
+    # Build a single query returning the 10 best matches of each model and
+    # the total number of matches. The matching uses the trigram indexes on
+    # the search expression of each table.
+    sql = []
+    params = []
+    for idx, (cls, query, label, extra) in enumerate(searches):
+        expression = data_site.getSearchExpression(cls)
+        try:
+            description = '"%s"' % cls._meta.get_field("description").column
+        except FieldDoesNotExist:
+            description = "null::text"
+        query = (
+            query.annotate(
+                search_description=RawSQL(description, ()),
+                search_rank=RawSQL("similarity(%s, %%s)" % expression, (term,)),
+                search_count=RawSQL("count(*) over ()", ()),
+            )
+            .filter(
+                RawSQL(
+                    "%s ilike %%s" % expression,
+                    (pattern,),
+                    output_field=BooleanField(),
                 )
+            )
+            .order_by("-search_rank", "pk")
+            .values_list("pk", "search_description", "search_rank", "search_count")[:10]
+        )
+        q, p = query.query.sql_with_params()
+        sql.append(
+            'select %s, t."%s", t.search_description, t.search_rank, t.search_count from (%s) t'
+            % (idx, cls._meta.pk.column, q)
+        )
+        params.extend(p)
+    matches = {}
+    with connections[request.database].cursor() as cursor:
+        cursor.execute(" union all ".join(sql), params)
+        for rec in cursor.fetchall():
+            matches.setdefault(rec[0], []).append(rec[1:])
+
     # Construct reply
+    for idx, (cls, query, label, extra) in enumerate(searches):
+        if idx not in matches:
+            continue
+        recs = sorted(matches[idx], key=lambda i: (-i[2], i[0]))
+        count = recs[0][3]
+        result.append(
+            {
+                "value": None,
+                "label": (
+                    ngettext(
+                        "%(name)s - %(count)d match",
+                        "%(name)s - %(count)d matches",
+                        count,
+                    )
+                    % {"name": label, "count": count}
+                ).capitalize(),
+            }
+        )
+        result.extend(
+            [
+                {
+                    **extra,
+                    "value": i[0],
+                    "display": "%s%s" % (i[0], " %s" % (i[1],) if i[1] else ""),
+                }
+                for i in recs
+            ]
+        )
     return HttpResponse(
         content_type="application/json; charset=%s" % settings.DEFAULT_CHARSET,
         content=json.dumps(result).encode(settings.DEFAULT_CHARSET),
@@ -191,6 +209,10 @@ class OperationPlanMixin(GridReport):
     hasTimeBuckets = True
     hasTimeOnly = True
 
+    # These tables can be very large
+    keyset_pagination = True
+    approximate_count = 100000
+
     @classmethod
     def operationplanExtraBasequery(cls, query, request):
         # special keyword superop used for search field of operationplan
@@ -286,6 +308,475 @@ class OperationPlanMixin(GridReport):
         return getWebServiceContext(request)
 
 
+class SupplyPathGraph:
+    """
+    An in-memory copy of the supply chain model of a scenario.
+
+    The supply path and where-used reports walk this graph rather than
+    running a set of queries for every operation, buffer and resource they
+    visit. A graph is built once per database. It is rebuilt when the plan
+    version of the database, or the last modification date or the number of
+    records of one of the source tables changes.
+    """
+
+    # Tables the graph is built from
+    tables = (
+        "item",
+        "location",
+        "operation",
+        "operationmaterial",
+        "operationresource",
+        "operation_dependency",
+        "itemsupplier",
+        "itemdistribution",
+    )
+
+    Operation = namedtuple(
+        "Operation",
+        "name type location priority duration duration_per item owner "
+        "sizeminimum sizemultiple sizemaximum",
+    )
+
+    Replenishment = namedtuple(
+        "Replenishment",
+        "item origin location supplier priority resource resource_qty "
+        "leadtime sizeminimum sizemultiple sizemaximum",
+    )
+
+    _graphs = {}
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, database=DEFAULT_DB_ALIAS):
+        with connections[database].cursor() as cursor:
+            cursor.execute(
+                "select %s"
+                % ", ".join(
+                    "(select max(lastmodified) from %s), (select count(*) from %s)"
+                    % (t, t)
+                    for t in cls.tables
+                )
+            )
+            signature = (Dashboard.getPlanVersion(database), cursor.fetchone())
+        with cls._lock:
+            graph = cls._graphs.get(database, None)
+            if not graph or graph.signature != signature:
+                graph = cls(database, signature)
+                cls._graphs[database] = graph
+            return graph
+
+    def __init__(self, database, signature):
+        self.signature = signature
+        self.items = {}
+        self.operations = {}
+        self.suboperations = {}
+        self.materials = {}
+        self.resources = {}
+        self.blockedby = {}
+        self.blocking = {}
+        self.suppliers = {}
+        self.distributions = {}
+        self.routing_positions = {}
+
+        def number(v):
+            return float(v) if v is not None else None
+
+        with connections[database].cursor() as cursor:
+            cursor.execute(
+                "select name, owner_id, description, uom, lft, rght from item"
+            )
+            for i in cursor:
+                self.items[i[0]] = i[1:]
+            self.itemtree = sorted(
+                (i[3], n) for n, i in self.items.items() if i[3] is not None
+            )
+
+            cursor.execute(
+                "select name from location where lft = rght - 1 order by name"
+            )
+            self.leaflocations = [i[0] for i in cursor]
+
+            cursor.execute(
+                """
+                select
+                  name, coalesce(type, 'fixed_time'), location_id, priority,
+                  duration, duration_per, item_id, owner_id,
+                  sizeminimum, sizemultiple, sizemaximum
+                from operation
+                order by name
+                """
+            )
+            for i in cursor:
+                op = self.Operation(*i[:8], number(i[8]), number(i[9]), number(i[10]))
+                self.operations[op.name] = op
+                if op.owner:
+                    self.suboperations.setdefault(op.owner, []).append(op.name)
+
+            cursor.execute(
+                """
+                select operation_id, item_id, quantity,
+                  coalesce(quantity, quantity_fixed, 0)
+                from operationmaterial
+                order by id
+                """
+            )
+            for oper, item, qty, effective_qty in cursor:
+                self.materials.setdefault(oper, []).append(
+                    (item, number(qty), float(effective_qty))
+                )
+
+            cursor.execute(
+                """
+                select operation_id, resource_id, quantity
+                from operationresource
+                order by id
+                """
+            )
+            for oper, res, qty in cursor:
+                self.resources.setdefault(oper, {})[res] = number(qty)
+
+            cursor.execute(
+                """
+                select operation_id, blockedby_id, quantity
+                from operation_dependency
+                where operation_id is not null and blockedby_id is not null
+                order by id
+                """
+            )
+            for oper, blockedby, qty in cursor:
+                self.blockedby.setdefault(oper, {})[blockedby] = number(qty)
+                self.blocking.setdefault(blockedby, {})[oper] = number(qty)
+
+            cursor.execute(
+                """
+                select
+                  item_id, null, location_id, supplier_id, priority,
+                  resource_id, resource_qty, leadtime,
+                  sizeminimum, sizemultiple, sizemaximum
+                from itemsupplier
+                order by id
+                """
+            )
+            for i in cursor:
+                self.suppliers.setdefault(i[0], []).append(
+                    self.Replenishment(
+                        *i[:6], number(i[6]), i[7], *[number(j) for j in i[8:]]
+                    )
+                )
+
+            cursor.execute(
+                """
+                select
+                  item_id, origin_id, location_id, null, priority,
+                  resource_id, resource_qty, leadtime,
+                  sizeminimum, sizemultiple, sizemaximum
+                from itemdistribution
+                order by id
+                """
+            )
+            for i in cursor:
+                self.distributions.setdefault(i[0], []).append(
+                    self.Replenishment(
+                        *i[:6], number(i[6]), i[7], *[number(j) for j in i[8:]]
+                    )
+                )
+
+            # Position of the steps in routings with operation dependencies.
+            # For the routing itself, x,y refer to the number of rows and columns.
+            cursor.execute(
+                """
+            with q as (
+                with recursive cte as
+                (
+                select 1 as y, operation.owner_id, operation.name, null::text as blockedby_id
+                from operation
+                where operation.owner_id is not null
+                and not exists (select 1 from operation_dependency
+                                inner join operation bb on bb.name = operation_dependency.blockedby_id
+                                and bb.owner_id = operation.owner_id
+                                where operation_dependency.operation_id = operation.name)
+                and exists (select 1 from operation_dependency
+                           inner join operation op1 on op1.name = operation_dependency.operation_id
+                           inner join operation op2 on op2.name = operation_dependency.blockedby_id
+                           where op1.owner_id = operation.owner_id
+                           and op2.owner_id = operation.owner_id)
+                union all
+                select cte.y+1, operation.owner_id, operation.name, operation_dependency.blockedby_id
+                from operation_dependency
+                inner join cte on cte.name = operation_dependency.blockedby_id
+                inner join operation on operation.name = operation_dependency.operation_id and operation.owner_id = cte.owner_id
+                )
+                select distinct cte.owner_id, y, name from cte
+                )
+            select owner_id, name, row_number() over(partition by owner_id, y order by name) as x, y from q
+            order by 1,2,3
+            """
+            )
+            for rec in cursor:
+                self.routing_positions[rec[1]] = (rec[2], rec[3])
+                if rec[0] not in self.routing_positions:
+                    self.routing_positions[rec[0]] = (rec[2], rec[3])
+                else:
+                    self.routing_positions[rec[0]] = (
+                        max(rec[2], self.routing_positions[rec[0]][0]),
+                        max(rec[3], self.routing_positions[rec[0]][1]),
+                    )
+
+        # Index the operations that can be the starting point of a path
+        self.producers = {}
+        self.consumers = {}
+        self.resourceusers = {}
+        for op in self.operations.values():
+            if not self.isPlannable(op):
+                continue
+            for item, qty, effective_qty in self.materials.get(op.name, []):
+                if qty is not None and qty > 0:
+                    self.producers.setdefault(item, set()).add(op.name)
+                elif qty is not None and qty < 0:
+                    self.consumers.setdefault(item, set()).add(op.name)
+            parent = self.operations.get(op.owner, None)
+            grandparent = self.operations.get(parent.owner, None) if parent else None
+            for o in (op, parent, grandparent):
+                if o and o.item:
+                    self.producers.setdefault(o.item, set()).add(op.name)
+            for res in self.resources.get(op.name, {}):
+                self.resourceusers.setdefault(res, set()).add(op.name)
+
+    def isPlannable(self, op):
+        if op.type not in ("time_per", "fixed_time") or op.priority == 0:
+            return False
+        parent = self.operations.get(op.owner, None)
+        return not parent or parent.priority != 0
+
+    def getSuboperationCount(self, name):
+        return len(self.suboperations.get(name, []))
+
+    def getItem(self, op):
+        if op.item:
+            return op.item
+        for item, qty, effective_qty in self.materials.get(op.name, []):
+            if qty is not None and qty > 0:
+                return item
+
+    def getAncestorItems(self, item):
+        while item and item in self.items:
+            yield item
+            item = self.items[item][0]
+
+    def getDescendantItems(self, item):
+        if item not in self.items or self.items[item][3] is None:
+            return []
+        lft = self.items[item][3]
+        rght = self.items[item][4]
+        return [
+            i[1]
+            for i in self.itemtree[
+                bisect_left(self.itemtree, (lft,)) : bisect_right(
+                    self.itemtree, (rght, chr(0x10FFFF))
+                )
+            ]
+        ]
+
+    def getOperationsForItem(self, item, downstream, location=None):
+        ops = (self.consumers if downstream else self.producers).get(item, [])
+        if location:
+            return [o for o in ops if self.operations[o].location == location]
+        return list(ops)
+
+    def getOperationsForResource(self, resource):
+        return list(self.resourceusers.get(resource, []))
+
+    def getOperationsForName(self, name):
+        ops = [name]
+        for child in self.suboperations.get(name, []):
+            ops.append(child)
+            ops.extend(self.suboperations.get(child, []))
+        return [
+            o
+            for o in ops
+            if o in self.operations and self.isPlannable(self.operations[o])
+        ]
+
+    def getOperationRows(self, operations):
+        """
+        Returns a record for each operation in the list. For suboperations
+        a record is returned for all steps or alternates of the parent.
+        """
+        rows = {}
+        for name in operations:
+            op = self.operations[name]
+            parent = self.operations.get(op.owner, None)
+            grandparent = self.operations.get(parent.owner, None) if parent else None
+            for sibling in self.suboperations[parent.name] if parent else [name]:
+                if sibling not in rows:
+                    rows[sibling] = self.getOperationRow(
+                        self.operations[sibling], parent, grandparent
+                    )
+        return list(rows.values())
+
+    def getOperationRow(self, op, parent, grandparent):
+        buffers = {}
+        if parent:
+            priorities = [
+                self.operations[o].priority
+                for o in self.suboperations[parent.name]
+                if self.operations[o].priority is not None
+            ]
+            if (op.priority if op.priority is not None else 1) == (
+                max(priorities) if priorities else None
+            ):
+                for o in (grandparent, parent):
+                    if o and o.item:
+                        buffers["%s @ %s" % (o.item, o.location)] = 1
+        if op.item:
+            buffers["%s @ %s" % (op.item, op.location)] = 1
+        for item, qty, effective_qty in self.materials.get(op.name, []):
+            buffers["%s @ %s" % (item, op.location)] = effective_qty
+        item = self.getItem(op)
+        parentitem = parent.item if parent else None
+        grandparentitem = grandparent.item if grandparent else None
+        return (
+            op.name,
+            op.location,
+            op.type,
+            op.priority if op.priority is not None else 1,
+            buffers or None,
+            self.resources.get(op.name, None),
+            op.duration,
+            op.duration_per,
+            parent.name if parent else None,
+            parent.type if parent else None,
+            (parent.priority if parent.priority is not None else 1) if parent else None,
+            grandparent.name if grandparent else None,
+            grandparent.type if grandparent else None,
+            (
+                (grandparent.priority if grandparent.priority is not None else 1)
+                if grandparent
+                else None
+            ),
+            {
+                "operation_min": op.sizeminimum,
+                "operation_multiple": op.sizemultiple,
+                "operation_max": op.sizemaximum,
+                "parentoperation_min": parent.sizeminimum if parent else None,
+                "parentoperation_multiple": parent.sizemultiple if parent else None,
+                "parentoperation_max": parent.sizemaximum if parent else None,
+                "grandparentoperation_min": (
+                    grandparent.sizeminimum if grandparent else None
+                ),
+                "grandparentoperation_multiple": (
+                    grandparent.sizemultiple if grandparent else None
+                ),
+                "grandparentoperation_max": (
+                    grandparent.sizemaximum if grandparent else None
+                ),
+            },
+            grandparentitem,
+            parentitem,
+            item,
+            self.items[grandparentitem][1] if grandparentitem in self.items else None,
+            self.items[parentitem][1] if parentitem in self.items else None,
+            self.items[item][1] if item in self.items else None,
+            self.blockedby.get(op.name, None),
+            self.blocking.get(op.name, None),
+            self.items[item][2] if item in self.items else None,
+        )
+
+    def getReplenishmentRow(self, r, item, location):
+        if r.origin:
+            name = "Ship %s from %s to %s" % (item, r.origin, location)
+            typ = "distribution"
+            buffers = {
+                "%s @ %s" % (item, r.origin): -1,
+                "%s @ %s" % (item, location): 1,
+            }
+        else:
+            name = "Purchase %s @ %s from %s" % (item, location, r.supplier)
+            typ = "purchase"
+            buffers = {"%s @ %s" % (item, location): 1}
+        return (
+            name,
+            location,
+            typ,
+            r.priority,
+            buffers,
+            {r.resource: r.resource_qty} if r.resource else None,
+            r.leadtime,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            {
+                "operation_min": r.sizeminimum,
+                "operation_multiple": r.sizemultiple,
+                "operation_max": r.sizemaximum,
+            },
+            None,
+            None,
+            item,
+            None,
+            None,
+            self.items[item][1] if item in self.items else None,
+            None,
+            None,
+            self.items[item][2] if item in self.items else None,
+        )
+
+    def getDistributionRows(self, item, location=None, origin=None):
+        return [
+            self.getReplenishmentRow(r, item, r.location)
+            for i in self.getAncestorItems(item)
+            for r in self.distributions.get(i, [])
+            if (not location or r.location == location)
+            and (not origin or r.origin == origin)
+        ]
+
+    def getPurchaseRows(self, item, location=None):
+        rows = []
+        for i in self.getAncestorItems(item):
+            for r in self.suppliers.get(i, []):
+                if r.location:
+                    if not location or r.location == location:
+                        rows.append(self.getReplenishmentRow(r, item, r.location))
+                else:
+                    for loc in [location] if location else self.leaflocations:
+                        if loc in self.leaflocations:
+                            rows.append(self.getReplenishmentRow(r, item, loc))
+        return rows
+
+    def getReplenishmentRowsForResource(self, resource):
+        rows = []
+        for replenishments in (self.distributions, self.suppliers):
+            for i in replenishments.values():
+                for r in i:
+                    if r.resource != resource:
+                        continue
+                    for item in self.getDescendantItems(r.item):
+                        for loc in [r.location] if r.location else self.leaflocations:
+                            rows.append(self.getReplenishmentRow(r, item, loc))
+        return rows
+
+    @staticmethod
+    def sortRows(rows):
+        """
+        Sort the records on the priority and name of their grandparent and parent
+        operation, and on their own priority. Empty values go last.
+        """
+        return sorted(
+            rows,
+            key=lambda i: (
+                (i[13] is None, i[13] or 0),
+                (i[11] is None, i[11] or ""),
+                (i[10] is None, i[10] or 0),
+                (i[8] is None, i[8] or ""),
+                (i[3] is None, i[3] or 0),
+            ),
+        )
+
+
 class PathReport(GridReport):
     """
     A report showing the upstream supply path or following downstream a
@@ -405,6 +896,9 @@ class PathReport(GridReport):
     objecttype = None
     downstream = None
 
+    # Maximum number of nodes in the graph
+    maxnodes = 5000
+
     @classmethod
     def basequeryset(reportclass, request, *args, **kwargs):
         if str(reportclass.objecttype._meta) != "input.buffer":
@@ -449,462 +943,25 @@ class PathReport(GridReport):
 
     @classmethod
     def getOperationFromItem(reportclass, request, item_name, downstream, depth):
-        cursor = connections[request.database].cursor()
-        query = """
-      -- MANUFACTURING OPERATIONS
-      select distinct
-      case when parentoperation is null then operation else sibling end,
-      case when parentoperation is null then operation_location else sibling_location end,
-      case when parentoperation is null then operation_type else sibling_type end,
-      case when parentoperation is null then operation_priority else sibling_priority end,
-      case when parentoperation is null then operation_om else sibling_om end,
-      case when parentoperation is null then operation_or else sibling_or end,
-      case when parentoperation is null then operation_duration else sibling_duration end,
-      case when parentoperation is null then operation_duration_per else sibling_duration_per end,
-      parentoperation,
-      parentoperation_type,
-      parentoperation_priority,
-      grandparentoperation,
-      grandparentoperation_type,
-      grandparentoperation_priority,
-      sizes,
-      grandparentitem_name,
-      parentitem_name,
-      item_name,
-      grandparentitem_description,
-      parentitem_description,
-      item_description,
-      (select jsonb_object_agg(distinct operation_dependency.blockedby_id, operation_dependency.quantity)
-      filter (where operation_dependency.blockedby_id is not null)
-      from operation_dependency where operation_id = (case when parentoperation is null then operation else sibling end)),
-      (select jsonb_object_agg(distinct operation_dependency.operation_id, operation_dependency.quantity)
-      filter (where operation_dependency.operation_id is not null)
-      from operation_dependency where blockedby_id = (case when parentoperation is null then operation else sibling end)),
-      item_uom
-       from
-      (
-      select operation.name as operation,
-           coalesce(operation.type,'fixed_time') operation_type,
-           operation.location_id operation_location,
-           coalesce(operation.priority, 1) as operation_priority,
-           operation.duration as operation_duration,
-           operation.duration_per as operation_duration_per,
-           case when operation.item_id is not null then jsonb_build_object(operation.item_id||' @ '||operation.location_id, 1) else '{}'::jsonb end
-           ||jsonb_object_agg(operationmaterial.item_id||' @ '||operation.location_id,
-                              coalesce(operationmaterial.quantity, operationmaterial.quantity_fixed,0)) filter (where operationmaterial.id is not null) as operation_om,
-           jsonb_object_agg(operationresource.resource_id, operationresource.quantity) filter (where operationresource.id is not null) as operation_or,
-             parentoperation.name as parentoperation,
-           parentoperation.type as parentoperation_type,
-           coalesce(parentoperation.priority, 1) parentoperation_priority,
-             sibling.name as sibling,
-           sibling.type as sibling_type,
-           sibling.location_id as sibling_location,
-           coalesce(sibling.priority, 1) as sibling_priority,
-           sibling.duration as sibling_duration,
-           sibling.duration_per as sibling_duration_per,
-           case when grandparentoperation.item_id is not null
-           and coalesce(sibling.priority, 1) = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(grandparentoperation.item_id||' @ '||grandparentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when parentoperation.item_id is not null
-           and coalesce(sibling.priority, 1) = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(parentoperation.item_id||' @ '||parentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when sibling.item_id is not null then jsonb_build_object(sibling.item_id||' @ '||sibling.location_id, 1) else '{}'::jsonb end
-           ||coalesce(jsonb_object_agg(siblingoperationmaterial.item_id||' @ '||sibling.location_id,
-                                       coalesce(siblingoperationmaterial.quantity, siblingoperationmaterial.quantity_fixed,0)) filter (where siblingoperationmaterial.id is not null), '{}'::jsonb) as sibling_om,
-           jsonb_object_agg(siblingoperationresource.resource_id, siblingoperationresource.quantity)filter (where siblingoperationresource.id is not null) as sibling_or,
-             grandparentoperation.name as grandparentoperation,
-           grandparentoperation.type as grandparentoperation_type,
-           coalesce(grandparentoperation.priority, 1) as grandparentoperation_priority,
-           jsonb_build_object( 'operation_min', operation.sizeminimum,
-                               'operation_multiple', operation.sizemultiple,
-                               'operation_max', operation.sizemaximum,
-                               'parentoperation_min', parentoperation.sizeminimum,
-                               'parentoperation_multiple',parentoperation.sizemultiple,
-                               'parentoperation_max', parentoperation.sizemaximum,
-                               'grandparentoperation_min', grandparentoperation.sizeminimum,
-                               'grandparentoperation_multiple', grandparentoperation.sizemultiple,
-                               'grandparentoperation_max', grandparentoperation.sizemaximum) as sizes,
-           grandparentitem.name as grandparentitem_name,
-           parentitem.name as parentitem_name,
-           item.name as item_name,
-           grandparentitem.description as grandparentitem_description,
-           parentitem.description as parentitem_description,
-           item.description as item_description,
-           item.uom as item_uom
-      from operation
-      left outer join operationmaterial on operationmaterial.operation_id = operation.name
-      left outer join operationresource on operationresource.operation_id = operation.name
-      left outer join operation parentoperation on parentoperation.name = operation.owner_id
-      left outer join operation grandparentoperation on grandparentoperation.name = parentoperation.owner_id
-      left outer join operation sibling on sibling.owner_id = parentoperation.name
-      left outer join operationmaterial siblingoperationmaterial on siblingoperationmaterial.operation_id = sibling.name
-      left outer join operationresource siblingoperationresource on siblingoperationresource.operation_id = sibling.name
-      left outer join item grandparentitem on grandparentitem.name = grandparentoperation.item_id
-      left outer join item parentitem on parentitem.name = parentoperation.item_id
-      left outer join item on item.name = coalesce(operation.item_id,
-                                                   (select item_id from operationmaterial where operation_id = operation.name and quantity > 0 limit 1))
-      where coalesce(operation.priority,1) != 0 and
-      not exists (select 1 from operation parent_op where parent_op.name = operation.owner_id and parent_op.priority = 0)
-      and coalesce(operation.type,'fixed_time') in ('time_per','fixed_time')
-      %s
-      group by operation.name, parentoperation.name, sibling.name, grandparentoperation.name,
-      grandparentitem.name, parentitem.name, item.name, grandparentitem.description, parentitem.description, item.description
-      ) t
-      union all
-      -- DISTRIBUTION OPERATIONS
-      select 'Ship '||item.name||' from '||itemdistribution.origin_id||' to '||itemdistribution.location_id,
-      itemdistribution.location_id,
-      'distribution' as type,
-      itemdistribution.priority,
-      jsonb_build_object(item.name||' @ '||itemdistribution.origin_id, -1,
-                         item.name||' @ '||itemdistribution.location_id, 1) as operation_om,
-      case when itemdistribution.resource_id is not null
-      then jsonb_build_object(itemdistribution.resource_id, itemdistribution.resource_qty)
-      else '{}'::jsonb end operation_or,
-      leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemdistribution.sizeminimum,
-                               'operation_multiple', itemdistribution.sizemultiple,
-                               'operation_max', itemdistribution.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemdistribution
-      inner join item parent on parent.name = itemdistribution.item_id
-      inner join item on item.name = %%s and item.lft between parent.lft and parent.rght
-      """ % (
-            (
-                """
-                and (operation.item_id = %s or
-                (exists (select 1 from operationmaterial op1 where op1.operation_id = operation.name and op1.item_id = %s and op1.quantity > 0))
-                or parentoperation.item_id = %s
-                or grandparentoperation.item_id = %s)
-            """,
-            )
-            if not downstream
-            else (
-                """
-                and exists (select 1 from operationmaterial om where om.operation_id = operation.name
-                and om.item_id = %s and om.quantity < 0)
-            """,
-            )
-        )
-
+        graph = request.supplypathgraph
+        rows = graph.getOperationRows(
+            graph.getOperationsForItem(item_name, downstream)
+        ) + graph.getDistributionRows(item_name)
         if not downstream:
-            query = (
-                query
-                + """
-        union all
-      -- PURCHASING OPERATIONS
-      select 'Purchase '||item.name||' @ '|| location.name||' from '||itemsupplier.supplier_id,
-      location.name as location_id,
-      'purchase' as type,
-      itemsupplier.priority,
-      jsonb_build_object(item.name||' @ '|| location.name,1),
-      case when itemsupplier.resource_id is not null then jsonb_build_object(itemsupplier.resource_id, itemsupplier.resource_qty) else '{}'::jsonb end resources,
-      itemsupplier.leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemsupplier.sizeminimum,
-                               'operation_multiple', itemsupplier.sizemultiple,
-                               'operation_max', itemsupplier.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemsupplier
-      inner join item i_parent on i_parent.name = itemsupplier.item_id
-      inner join item on item.name = %s and item.lft between i_parent.lft and i_parent.rght
-      inner join location on location.name = itemsupplier.location_id
-      union all
-      select 'Purchase '||item.name||' @ '|| location.name||' from '||itemsupplier.supplier_id,
-      location.name as location_id,
-      'purchase' as type,
-      itemsupplier.priority,
-      jsonb_build_object(item.name||' @ '|| location.name,1),
-      case when itemsupplier.resource_id is not null then jsonb_build_object(itemsupplier.resource_id, itemsupplier.resource_qty) else '{}'::jsonb end resources,
-      itemsupplier.leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemsupplier.sizeminimum,
-                               'operation_multiple', itemsupplier.sizemultiple,
-                               'operation_max', itemsupplier.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemsupplier
-      inner join item i_parent on i_parent.name = itemsupplier.item_id
-      inner join item on item.name = %s and item.lft between i_parent.lft and i_parent.rght
-      inner join location on location.lft = location.rght - 1
-      where location_id is null
-      """
-            )
-
-        query = (
-            query
-            + " order by grandparentoperation_priority, grandparentoperation, parentoperation_priority, parentoperation, sibling_priority"
-        )
-
-        if downstream:
-            cursor.execute(query, (item_name,) * 2)
-        else:
-            cursor.execute(query, (item_name,) * 7)
-
-        for i in cursor.fetchall():
-            for j in reportclass.processRecord(i, request, depth, downstream, None, 1):
-                yield j
+            rows += graph.getPurchaseRows(item_name)
+        for i in graph.sortRows(rows):
+            yield from reportclass.processRecord(i, request, depth, downstream, None, 1)
 
     @classmethod
     def getOperationFromResource(
         reportclass, request, resource_name, downstream, depth
     ):
-        cursor = connections[request.database].cursor()
-        query = """
-      -- MANUFACTURING OPERATIONS
-      select distinct
-      case when parentoperation is null then operation else sibling end,
-      case when parentoperation is null then operation_location else sibling_location end,
-      case when parentoperation is null then operation_type else sibling_type end,
-      case when parentoperation is null then operation_priority else sibling_priority end,
-      case when parentoperation is null then operation_om else sibling_om end,
-      case when parentoperation is null then operation_or else sibling_or end,
-      case when parentoperation is null then operation_duration else sibling_duration end,
-      case when parentoperation is null then operation_duration_per else sibling_duration_per end,
-      parentoperation,
-      parentoperation_type,
-      parentoperation_priority,
-      grandparentoperation,
-      grandparentoperation_type,
-      grandparentoperation_priority,
-      sizes,
-      grandparentitem_name,
-      parentitem_name,
-      item_name,
-      grandparentitem_description,
-      parentitem_description,
-      item_description,
-      (select jsonb_object_agg(distinct operation_dependency.blockedby_id, operation_dependency.quantity)
-      filter (where operation_dependency.blockedby_id is not null)
-      from operation_dependency where operation_id = (case when parentoperation is null then operation else sibling end)),
-      (select jsonb_object_agg(distinct operation_dependency.operation_id, operation_dependency.quantity)
-      filter (where operation_dependency.operation_id is not null)
-      from operation_dependency where blockedby_id = (case when parentoperation is null then operation else sibling end)),
-      item_uom
-       from
-      (
-      select operation.name as operation,
-           coalesce(operation.type,'fixed_time') operation_type,
-           operation.location_id operation_location,
-           operation.priority as operation_priority,
-           operation.duration as operation_duration,
-           operation.duration_per as operation_duration_per,
-           case when operation.item_id is not null then jsonb_build_object(operation.item_id||' @ '||operation.location_id, 1) else '{}'::jsonb end
-           ||jsonb_object_agg(operationmaterial.item_id||' @ '||operation.location_id,
-                              coalesce(operationmaterial.quantity, operationmaterial.quantity_fixed, 0)) filter (where operationmaterial.id is not null) as operation_om,
-           jsonb_object_agg(operationresource.resource_id, operationresource.quantity) filter (where operationresource.id is not null) as operation_or,
-             parentoperation.name as parentoperation,
-           parentoperation.type as parentoperation_type,
-           parentoperation.priority parentoperation_priority,
-             sibling.name as sibling,
-           sibling.type as sibling_type,
-           sibling.location_id as sibling_location,
-           sibling.priority as sibling_priority,
-           sibling.duration as sibling_duration,
-           sibling.duration_per as sibling_duration_per,
-           case when grandparentoperation.item_id is not null
-           and sibling.priority = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(grandparentoperation.item_id||' @ '||grandparentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when parentoperation.item_id is not null
-           and sibling.priority = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(parentoperation.item_id||' @ '||parentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when sibling.item_id is not null then jsonb_build_object(sibling.item_id||' @ '||sibling.location_id, 1) else '{}'::jsonb end
-           || coalesce(jsonb_object_agg(siblingoperationmaterial.item_id||' @ '||sibling.location_id,
-                                        coalesce(siblingoperationmaterial.quantity, siblingoperationmaterial.quantity_fixed, 0)) filter (where siblingoperationmaterial.id is not null), '{}'::jsonb) as sibling_om,
-           jsonb_object_agg(siblingoperationresource.resource_id, siblingoperationresource.quantity)filter (where siblingoperationresource.id is not null) as sibling_or,
-             grandparentoperation.name as grandparentoperation,
-           grandparentoperation.type as grandparentoperation_type,
-           grandparentoperation.priority as grandparentoperation_priority,
-           jsonb_build_object( 'operation_min', operation.sizeminimum,
-                               'operation_multiple', operation.sizemultiple,
-                               'operation_max', operation.sizemaximum,
-                               'parentoperation_min', parentoperation.sizeminimum,
-                               'parentoperation_multiple',parentoperation.sizemultiple,
-                               'parentoperation_max', parentoperation.sizemaximum,
-                               'grandparentoperation_min', grandparentoperation.sizeminimum,
-                               'grandparentoperation_multiple', grandparentoperation.sizemultiple,
-                               'grandparentoperation_max', grandparentoperation.sizemaximum) as sizes,
-           grandparentitem.name as grandparentitem_name,
-           parentitem.name as parentitem_name,
-           item.name as item_name,
-           grandparentitem.description as grandparentitem_description,
-           parentitem.description as parentitem_description,
-           item.description as item_description,
-           item.uom as item_uom
-      from operation
-      left outer join operationmaterial on operationmaterial.operation_id = operation.name
-      left outer join operationresource on operationresource.operation_id = operation.name
-      left outer join operation parentoperation on parentoperation.name = operation.owner_id
-      left outer join operation grandparentoperation on grandparentoperation.name = parentoperation.owner_id
-      left outer join operation sibling on sibling.owner_id = parentoperation.name
-      left outer join operationmaterial siblingoperationmaterial on siblingoperationmaterial.operation_id = sibling.name
-      left outer join operationresource siblingoperationresource on siblingoperationresource.operation_id = sibling.name
-      left outer join item grandparentitem on grandparentitem.name = grandparentoperation.item_id
-      left outer join item parentitem on parentitem.name = parentoperation.item_id
-      left outer join item on item.name = coalesce(operation.item_id,
-                                                   (select item_id from operationmaterial where operation_id = operation.name and quantity > 0 limit 1))
-      where
-      coalesce(operation.priority,1) != 0 and
-      not exists (select 1 from operation parent_op where parent_op.name = operation.owner_id and parent_op.priority = 0)
-      and coalesce(operation.type,'fixed_time') in ('time_per','fixed_time')
-      and %s
-      group by operation.name, parentoperation.name, sibling.name, grandparentoperation.name,
-      grandparentitem.name, parentitem.name, item.name, grandparentitem.description, parentitem.description, item.description
-      ) t
-      union all
-      -- DISTRIBUTION OPERATIONS
-      select 'Ship '||item.name||' from '||itemdistribution.origin_id||' to '||itemdistribution.location_id,
-      itemdistribution.location_id,
-      'distribution' as type,
-      itemdistribution.priority,
-      jsonb_build_object(item.name||' @ '||itemdistribution.origin_id, -1,
-                         item.name||' @ '||itemdistribution.location_id, 1) as operation_om,
-      case when itemdistribution.resource_id is not null
-      then jsonb_build_object(itemdistribution.resource_id, itemdistribution.resource_qty)
-      else '{}'::jsonb end operation_or,
-      leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemdistribution.sizeminimum,
-                               'operation_multiple', itemdistribution.sizemultiple,
-                               'operation_max', itemdistribution.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemdistribution
-      inner join item parent on parent.name = itemdistribution.item_id
-      inner join item on item.lft between parent.lft and parent.rght
-      where itemdistribution.resource_id = %%s
-      union all
-      -- PURCHASING OPERATIONS
-      select 'Purchase '||item.name||' @ '|| location.name||' from '||itemsupplier.supplier_id,
-      location.name as location_id,
-      'purchase' as type,
-      itemsupplier.priority,
-      jsonb_build_object(item.name||' @ '|| location.name,1),
-      case when itemsupplier.resource_id is not null then jsonb_build_object(itemsupplier.resource_id, itemsupplier.resource_qty) else '{}'::jsonb end resources,
-      itemsupplier.leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemsupplier.sizeminimum,
-                               'operation_multiple', itemsupplier.sizemultiple,
-                               'operation_max', itemsupplier.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemsupplier
-      inner join item i_parent on i_parent.name = itemsupplier.item_id
-      inner join item on item.lft between i_parent.lft and i_parent.rght
-      inner join location on location.name = itemsupplier.location_id
-      where itemsupplier.resource_id = %%s
-      union all
-      select 'Purchase '||item.name||' @ '|| location.name||' from '||itemsupplier.supplier_id,
-      location.name as location_id,
-      'purchase' as type,
-      itemsupplier.priority,
-      jsonb_build_object(item.name||' @ '|| location.name,1),
-      case when itemsupplier.resource_id is not null then jsonb_build_object(itemsupplier.resource_id, itemsupplier.resource_qty) else '{}'::jsonb end resources,
-      itemsupplier.leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemsupplier.sizeminimum,
-                               'operation_multiple', itemsupplier.sizemultiple,
-                               'operation_max', itemsupplier.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemsupplier
-      inner join item i_parent on i_parent.name = itemsupplier.item_id
-      inner join item on item.lft between i_parent.lft and i_parent.rght
-      inner join location on location.lft = location.rght - 1
-      where location_id is null and itemsupplier.resource_id = %%s
-      order by grandparentoperation_priority, grandparentoperation, parentoperation_priority, parentoperation, sibling_priority
-      """ % (
-            "operationresource.resource_id = %s"
-            if not downstream
-            else "exists (select 1 from operationresource where operation_id = operation.name and resource_id = %s)"
-        )
-
-        cursor.execute(query, (resource_name,) * 4)
-
-        for i in cursor.fetchall():
-            for j in reportclass.processRecord(i, request, depth, downstream, None, 1):
-                yield j
+        graph = request.supplypathgraph
+        rows = graph.getOperationRows(
+            graph.getOperationsForResource(resource_name)
+        ) + graph.getReplenishmentRowsForResource(resource_name)
+        for i in graph.sortRows(rows):
+            yield from reportclass.processRecord(i, request, depth, downstream, None, 1)
 
     @classmethod
     def getOperationFromName(
@@ -916,117 +973,12 @@ class PathReport(GridReport):
         previousOperation=None,
         bom_quantity=1,
     ):
-        cursor = connections[request.database].cursor()
-        query = """
-      -- MANUFACTURING OPERATIONS
-      select distinct
-      case when parentoperation is null then operation else sibling end,
-      case when parentoperation is null then operation_location else sibling_location end,
-      case when parentoperation is null then operation_type else sibling_type end,
-      case when parentoperation is null then operation_priority else sibling_priority end,
-      case when parentoperation is null then operation_om else sibling_om end,
-      case when parentoperation is null then operation_or else sibling_or end,
-      case when parentoperation is null then operation_duration else sibling_duration end,
-      case when parentoperation is null then operation_duration_per else sibling_duration_per end,
-      parentoperation,
-      parentoperation_type,
-      parentoperation_priority,
-      grandparentoperation,
-      grandparentoperation_type,
-      grandparentoperation_priority,
-      sizes,
-      grandparentitem_name,
-      parentitem_name,
-      item_name,
-      grandparentitem_description,
-      parentitem_description,
-      item_description,
-      (select jsonb_object_agg(distinct operation_dependency.blockedby_id, operation_dependency.quantity)
-      filter (where operation_dependency.blockedby_id is not null)
-      from operation_dependency where operation_id = (case when parentoperation is null then operation else sibling end)),
-      (select jsonb_object_agg(distinct operation_dependency.operation_id, operation_dependency.quantity)
-      filter (where operation_dependency.operation_id is not null)
-      from operation_dependency where blockedby_id = (case when parentoperation is null then operation else sibling end)),
-      item_uom
-       from
-      (
-      select operation.name as operation,
-           coalesce(operation.type,'fixed_time') operation_type,
-           operation.location_id operation_location,
-           operation.priority as operation_priority,
-           operation.duration as operation_duration,
-           operation.duration_per as operation_duration_per,
-           case when operation.item_id is not null then jsonb_build_object(operation.item_id||' @ '||operation.location_id, 1) else '{}'::jsonb end
-           ||jsonb_object_agg(operationmaterial.item_id||' @ '||operation.location_id,
-                              coalesce(operationmaterial.quantity, operationmaterial.quantity_fixed, 0)) filter (where operationmaterial.id is not null) as operation_om,
-           jsonb_object_agg(operationresource.resource_id, operationresource.quantity) filter (where operationresource.id is not null) as operation_or,
-             parentoperation.name as parentoperation,
-           parentoperation.type as parentoperation_type,
-           parentoperation.priority parentoperation_priority,
-             sibling.name as sibling,
-           sibling.type as sibling_type,
-           sibling.location_id as sibling_location,
-           sibling.priority as sibling_priority,
-           sibling.duration as sibling_duration,
-           sibling.duration_per as sibling_duration_per,
-           case when grandparentoperation.item_id is not null
-           and sibling.priority = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(grandparentoperation.item_id||' @ '||grandparentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when parentoperation.item_id is not null
-           and sibling.priority = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(parentoperation.item_id||' @ '||parentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when sibling.item_id is not null then jsonb_build_object(sibling.item_id||' @ '||sibling.location_id, 1) else '{}'::jsonb end
-           ||coalesce(jsonb_object_agg(siblingoperationmaterial.item_id||' @ '||sibling.location_id,
-                                       coalesce(siblingoperationmaterial.quantity, siblingoperationmaterial.quantity_fixed, 0)) filter (where siblingoperationmaterial.id is not null), '{}'::jsonb) as sibling_om,
-           jsonb_object_agg(siblingoperationresource.resource_id, siblingoperationresource.quantity)filter (where siblingoperationresource.id is not null) as sibling_or,
-             grandparentoperation.name as grandparentoperation,
-           grandparentoperation.type as grandparentoperation_type,
-           grandparentoperation.priority as grandparentoperation_priority,
-           jsonb_build_object( 'operation_min', operation.sizeminimum,
-                               'operation_multiple', operation.sizemultiple,
-                               'operation_max', operation.sizemaximum,
-                               'parentoperation_min', parentoperation.sizeminimum,
-                               'parentoperation_multiple',parentoperation.sizemultiple,
-                               'parentoperation_max', parentoperation.sizemaximum,
-                               'grandparentoperation_min', grandparentoperation.sizeminimum,
-                               'grandparentoperation_multiple', grandparentoperation.sizemultiple,
-                               'grandparentoperation_max', grandparentoperation.sizemaximum) as sizes,
-           grandparentitem.name as grandparentitem_name,
-           parentitem.name as parentitem_name,
-           item.name as item_name,
-           grandparentitem.description as grandparentitem_description,
-           parentitem.description as parentitem_description,
-           item.description as item_description,
-           item.uom as item_uom
-      from operation
-      left outer join operationmaterial on operationmaterial.operation_id = operation.name
-      left outer join operationresource on operationresource.operation_id = operation.name
-      left outer join operation parentoperation on parentoperation.name = operation.owner_id
-      left outer join operation grandparentoperation on grandparentoperation.name = parentoperation.owner_id
-      left outer join operation sibling on sibling.owner_id = parentoperation.name
-      left outer join operationmaterial siblingoperationmaterial on siblingoperationmaterial.operation_id = sibling.name
-      left outer join operationresource siblingoperationresource on siblingoperationresource.operation_id = sibling.name
-      left outer join item grandparentitem on grandparentitem.name = grandparentoperation.item_id
-      left outer join item parentitem on parentitem.name = parentoperation.item_id
-      left outer join item on item.name = coalesce(operation.item_id,
-                                                   (select item_id from operationmaterial where operation_id = operation.name and quantity > 0 limit 1))
-      where coalesce(operation.priority,1) != 0 and
-      not exists (select 1 from operation parent_op where parent_op.name = operation.owner_id and parent_op.priority = 0)
-      and coalesce(operation.type,'fixed_time') in ('time_per','fixed_time')
-      and (operation.name = %s or parentoperation.name = %s or grandparentoperation.name = %s)
-      group by operation.name, parentoperation.name, sibling.name, grandparentoperation.name,
-      grandparentitem.name, parentitem.name, item.name, grandparentitem.description, parentitem.description, item.description
-      ) t
-      order by grandparentoperation_priority, grandparentoperation, parentoperation_priority, parentoperation, sibling_priority
-      """
-
-        cursor.execute(query, (operation_name,) * 3)
-
-        for i in cursor.fetchall():
-            for j in reportclass.processRecord(
+        graph = request.supplypathgraph
+        rows = graph.getOperationRows(graph.getOperationsForName(operation_name))
+        for i in graph.sortRows(rows):
+            yield from reportclass.processRecord(
                 i, request, depth, downstream, previousOperation, bom_quantity
-            ):
-                yield j
+            )
 
     @classmethod
     def getOperationFromBuffer(
@@ -1038,329 +990,35 @@ class PathReport(GridReport):
         previousOperation,
         bom_quantity,
     ):
-        cursor = connections[request.database].cursor()
+        graph = request.supplypathgraph
         item = buffer_name[0 : buffer_name.find(" @ ")]
         location = buffer_name[buffer_name.find(" @ ") + 3 :]
-        query = """
-      -- MANUFACTURING OPERATIONS
-      select distinct
-      case when parentoperation is null then operation else sibling end,
-      case when parentoperation is null then operation_location else sibling_location end,
-      case when parentoperation is null then operation_type else sibling_type end,
-      case when parentoperation is null then operation_priority else sibling_priority end,
-      case when parentoperation is null then operation_om else sibling_om end,
-      case when parentoperation is null then operation_or else sibling_or end,
-      case when parentoperation is null then operation_duration else sibling_duration end,
-      case when parentoperation is null then operation_duration_per else sibling_duration_per end,
-      parentoperation,
-      parentoperation_type,
-      parentoperation_priority,
-      grandparentoperation,
-      grandparentoperation_type,
-      grandparentoperation_priority,
-      sizes,
-      grandparentitem_name,
-      parentitem_name,
-      item_name,
-      grandparentitem_description,
-      parentitem_description,
-      item_description,
-      (select jsonb_object_agg(distinct operation_dependency.blockedby_id, operation_dependency.quantity)
-      filter (where operation_dependency.blockedby_id is not null)
-      from operation_dependency where operation_id = (case when parentoperation is null then operation else sibling end)),
-      (select jsonb_object_agg(distinct operation_dependency.operation_id, operation_dependency.quantity)
-      filter (where operation_dependency.operation_id is not null)
-      from operation_dependency where blockedby_id = (case when parentoperation is null then operation else sibling end)),
-      item_uom
-      from
-      (
-      select operation.name as operation,
-           coalesce(operation.type,'fixed_time') operation_type,
-           operation.location_id operation_location,
-           operation.priority as operation_priority,
-           operation.duration as operation_duration,
-           operation.duration_per as operation_duration_per,
-           case when operation.item_id is not null then jsonb_build_object(operation.item_id||' @ '||operation.location_id, 1) else '{}'::jsonb end
-           ||jsonb_object_agg(operationmaterial.item_id||' @ '||operation.location_id,
-                              coalesce(operationmaterial.quantity, operationmaterial.quantity_fixed, 0)) filter (where operationmaterial.id is not null) as operation_om,
-           jsonb_object_agg(operationresource.resource_id, operationresource.quantity) filter (where operationresource.id is not null) as operation_or,
-             parentoperation.name as parentoperation,
-           parentoperation.type as parentoperation_type,
-           parentoperation.priority parentoperation_priority,
-             sibling.name as sibling,
-           sibling.type as sibling_type,
-           sibling.location_id as sibling_location,
-           sibling.priority as sibling_priority,
-           sibling.duration as sibling_duration,
-           sibling.duration_per as sibling_duration_per,
-           case when grandparentoperation.item_id is not null
-           and sibling.priority = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(grandparentoperation.item_id||' @ '||grandparentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when parentoperation.item_id is not null
-           and sibling.priority = (select max(priority) from operation where owner_id = parentoperation.name)
-           then jsonb_build_object(parentoperation.item_id||' @ '||parentoperation.location_id, 1) else '{}'::jsonb end
-           ||case when sibling.item_id is not null then jsonb_build_object(sibling.item_id||' @ '||sibling.location_id, 1) else '{}'::jsonb end
-           ||coalesce(jsonb_object_agg(siblingoperationmaterial.item_id||' @ '||sibling.location_id,
-                                       coalesce(siblingoperationmaterial.quantity, siblingoperationmaterial.quantity_fixed, 0)) filter (where siblingoperationmaterial.id is not null), '{}'::jsonb) as sibling_om,
-           jsonb_object_agg(siblingoperationresource.resource_id, siblingoperationresource.quantity)filter (where siblingoperationresource.id is not null) as sibling_or,
-             grandparentoperation.name as grandparentoperation,
-           grandparentoperation.type as grandparentoperation_type,
-           grandparentoperation.priority as grandparentoperation_priority,
-           jsonb_build_object( 'operation_min', operation.sizeminimum,
-                               'operation_multiple', operation.sizemultiple,
-                               'operation_max', operation.sizemaximum,
-                               'parentoperation_min', parentoperation.sizeminimum,
-                               'parentoperation_multiple',parentoperation.sizemultiple,
-                               'parentoperation_max', parentoperation.sizemaximum,
-                               'grandparentoperation_min', grandparentoperation.sizeminimum,
-                               'grandparentoperation_multiple', grandparentoperation.sizemultiple,
-                               'grandparentoperation_max', grandparentoperation.sizemaximum) as sizes,
-           grandparentitem.name as grandparentitem_name,
-           parentitem.name as parentitem_name,
-           item.name as item_name,
-           grandparentitem.description as grandparentitem_description,
-           parentitem.description as parentitem_description,
-           item.description as item_description,
-           item.uom as item_uom
-      from operation
-      left outer join operationmaterial on operationmaterial.operation_id = operation.name
-      left outer join operationresource on operationresource.operation_id = operation.name
-      left outer join operation parentoperation on parentoperation.name = operation.owner_id
-      left outer join operation grandparentoperation on grandparentoperation.name = parentoperation.owner_id
-      left outer join operation sibling on sibling.owner_id = parentoperation.name
-      left outer join operationmaterial siblingoperationmaterial on siblingoperationmaterial.operation_id = sibling.name
-      left outer join operationresource siblingoperationresource on siblingoperationresource.operation_id = sibling.name
-      left outer join item grandparentitem on grandparentitem.name = grandparentoperation.item_id
-      left outer join item parentitem on parentitem.name = parentoperation.item_id
-      left outer join item on item.name = coalesce(operation.item_id,
-                                                   (select item_id from operationmaterial where operation_id = operation.name and quantity > 0 limit 1))
-      where coalesce(operation.priority,1) != 0 and
-      not exists (select 1 from operation parent_op where parent_op.name = operation.owner_id and parent_op.priority = 0)
-      and coalesce(operation.type,'fixed_time') in ('time_per','fixed_time')
-      and operation.location_id = %%s
-      %s
-      group by operation.name, parentoperation.name, sibling.name, grandparentoperation.name,
-      grandparentitem.name, parentitem.name, item.name, grandparentitem.description, parentitem.description, item.description
-      ) t
-      union all
-      -- DISTRIBUTION OPERATIONS
-      select 'Ship '||item.name||' from '||itemdistribution.origin_id||' to '||itemdistribution.location_id,
-      itemdistribution.location_id,
-      'distribution' as type,
-      itemdistribution.priority,
-      jsonb_build_object(item.name||' @ '||itemdistribution.origin_id, -1,
-                         item.name||' @ '||itemdistribution.location_id, 1) as operation_om,
-      case when itemdistribution.resource_id is not null
-      then jsonb_build_object(itemdistribution.resource_id, itemdistribution.resource_qty)
-      else '{}'::jsonb end operation_or,
-      leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemdistribution.sizeminimum,
-                               'operation_multiple', itemdistribution.sizemultiple,
-                               'operation_max', itemdistribution.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemdistribution
-      inner join item parent on parent.name = itemdistribution.item_id
-      inner join item on item.name = %%s and item.lft between parent.lft and parent.rght
-      where itemdistribution.%s = %%s
-      """ % (
-            (
-                """
-                and (operation.item_id = %s or
-                (exists (select 1 from operationmaterial op1 where op1.operation_id = operation.name and op1.item_id = %s and op1.quantity > 0))
-                or parentoperation.item_id = %s
-                or grandparentoperation.item_id = %s)
-                """,
-                "location_id",
-            )
-            if not downstream
-            else (
-                """
-                and exists (select 1 from operationmaterial om where om.operation_id = operation.name
-                and om.item_id = %s and om.quantity < 0)
-                """,
-                "origin_id",
-            )
-        )
-
-        if not downstream:
-            query = (
-                query
-                + """
-        union all
-      -- PURCHASING OPERATIONS
-      select 'Purchase '||item.name||' @ '|| location.name||' from '||itemsupplier.supplier_id,
-      location.name as location_id,
-      'purchase' as type,
-      itemsupplier.priority,
-      jsonb_build_object(item.name||' @ '|| location.name,1),
-      case when itemsupplier.resource_id is not null then jsonb_build_object(itemsupplier.resource_id, itemsupplier.resource_qty) else '{}'::jsonb end resources,
-      itemsupplier.leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemsupplier.sizeminimum,
-                               'operation_multiple', itemsupplier.sizemultiple,
-                               'operation_max', itemsupplier.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemsupplier
-      inner join item i_parent on i_parent.name = itemsupplier.item_id
-      inner join item on item.name = %s and item.lft between i_parent.lft and i_parent.rght
-      inner join location on location.name = %s and location.name = itemsupplier.location_id
-      union all
-      select 'Purchase '||item.name||' @ '|| location.name||' from '||itemsupplier.supplier_id,
-      location.name as location_id,
-      'purchase' as type,
-      itemsupplier.priority,
-      jsonb_build_object(item.name||' @ '|| location.name,1),
-      case when itemsupplier.resource_id is not null then jsonb_build_object(itemsupplier.resource_id, itemsupplier.resource_qty) else '{}'::jsonb end resources,
-      itemsupplier.leadtime as duration,
-      null as duration_per,
-      null,
-      null,
-      null,
-      null,
-      null,
-      null,
-      jsonb_build_object( 'operation_min', itemsupplier.sizeminimum,
-                               'operation_multiple', itemsupplier.sizemultiple,
-                               'operation_max', itemsupplier.sizemaximum) as sizes,
-      null,
-      null,
-      item.name,
-      null,
-      null,
-      item.description,
-      null, -- blockedby
-      null, --blocking
-      item.uom as item_uom
-      from itemsupplier
-      inner join item i_parent on i_parent.name = itemsupplier.item_id
-      inner join item on item.name = %s and item.lft between i_parent.lft and i_parent.rght
-      inner join location on location.name = %s and location.lft = location.rght - 1
-      where location_id is null
-      """
-            )
-
-        query = (
-            query
-            + " order by grandparentoperation_priority, grandparentoperation, parentoperation_priority, parentoperation, sibling_priority"
+        rows = graph.getOperationRows(
+            graph.getOperationsForItem(item, downstream, location=location)
         )
-
         if downstream:
-            cursor.execute(query, (location, item, item, location))
+            rows += graph.getDistributionRows(item, origin=location)
         else:
-            cursor.execute(
-                query,
-                (
-                    location,
-                    item,
-                    item,
-                    item,
-                    item,
-                    item,
-                    location,
-                    item,
-                    location,
-                    item,
-                    location,
-                ),
-            )
-
-        for i in cursor.fetchall():
-            for j in reportclass.processRecord(
+            rows += graph.getDistributionRows(item, location=location)
+            rows += graph.getPurchaseRows(item, location=location)
+        for i in graph.sortRows(rows):
+            yield from reportclass.processRecord(
                 i, request, depth, downstream, previousOperation, bom_quantity
-            ):
-                yield j
+            )
 
     @classmethod
     def processRecord(
         reportclass, i, request, depth, downstream, previousOperation, bom_quantity
     ):
-        # check if routing dependencies has been done
-        if not reportclass.routing_dependencies_done:
-            reportclass.routing_dependencies_done = True
-            reportclass.routing_operation_position = {}
-            cursor = connections[request.database].cursor()
-            cursor.execute(
-                """
-            with q as (
-                with recursive cte as
-                (
-                select 1 as y, operation.owner_id, operation.name, null::text as blockedby_id
-                from operation
-                where operation.owner_id is not null
-                and not exists (select 1 from operation_dependency
-                                inner join operation bb on bb.name = operation_dependency.blockedby_id
-                                and bb.owner_id = operation.owner_id
-                                where operation_dependency.operation_id = operation.name)
-                and exists (select 1 from operation_dependency
-                           inner join operation op1 on op1.name = operation_dependency.operation_id
-                           inner join operation op2 on op2.name = operation_dependency.blockedby_id
-                           where op1.owner_id = operation.owner_id
-                           and op2.owner_id = operation.owner_id)
-                union all
-                select cte.y+1, operation.owner_id, operation.name, operation_dependency.blockedby_id
-                from operation_dependency
-                inner join cte on cte.name = operation_dependency.blockedby_id
-                inner join operation on operation.name = operation_dependency.operation_id and operation.owner_id = cte.owner_id
-                )
-                select distinct cte.owner_id, y, name from cte
-                )
-            select owner_id, name, row_number() over(partition by owner_id, y order by name) as x, y from q
-            order by 1,2,3
-            """
-            )
-            for rec in cursor:
-                reportclass.routing_operation_position[rec[1]] = (rec[2], rec[3])
-                # for the routing, x,y refers to the number of rows and columns
-                if rec[0] not in reportclass.routing_operation_position:
-                    reportclass.routing_operation_position[rec[0]] = (rec[2], rec[3])
-                else:
-                    reportclass.routing_operation_position[rec[0]] = (
-                        max(rec[2], reportclass.routing_operation_position[rec[0]][0]),
-                        max(rec[3], reportclass.routing_operation_position[rec[0]][1]),
-                    )
-
         # First can we go further ?
-        if len(reportclass.node_count) > 400:
+        if len(reportclass.node_count) > reportclass.maxnodes:
             return
-        opdetail = json.loads(i[14])
+        opdetail = i[14]
 
         # do we have a grandparentoperation
         if i[11] and not i[11] in reportclass.operation_dict:
             reportclass.operation_id = reportclass.operation_id + 1
             reportclass.operation_dict[i[11]] = reportclass.operation_id
-            if i[11] not in reportclass.suboperations_count_dict:
-                reportclass.suboperations_count_dict[i[11]] = Operation.objects.filter(
-                    owner_id=i[11]
-                ).count()
             grandparentoperation = {
                 "depth": depth * 2,
                 "id": reportclass.operation_id,
@@ -1381,7 +1039,7 @@ class PathReport(GridReport):
                 "parent": reportclass.operation_dict.get(previousOperation, None),
                 "leaf": "false",
                 "expanded": "true",
-                "numsuboperations": reportclass.suboperations_count_dict[i[11]],
+                "numsuboperations": request.supplypathgraph.getSuboperationCount(i[11]),
                 "realdepth": -depth if reportclass.downstream else depth,
                 "sizeminimum": opdetail["grandparentoperation_min"],
                 "sizemaximum": opdetail["grandparentoperation_max"],
@@ -1399,10 +1057,6 @@ class PathReport(GridReport):
         if i[8] and not i[8] in reportclass.operation_dict:
             reportclass.operation_id = reportclass.operation_id + 1
             reportclass.operation_dict[i[8]] = reportclass.operation_id
-            if i[8] not in reportclass.suboperations_count_dict:
-                reportclass.suboperations_count_dict[i[8]] = Operation.objects.filter(
-                    owner_id=i[8]
-                ).count()
             if i[11]:
                 if i[11] in reportclass.parent_count_dict:
                     reportclass.parent_count_dict[i[11]] = (
@@ -1432,7 +1086,7 @@ class PathReport(GridReport):
                 ),
                 "leaf": "false",
                 "expanded": "true",
-                "numsuboperations": reportclass.suboperations_count_dict[i[8]],
+                "numsuboperations": request.supplypathgraph.getSuboperationCount(i[8]),
                 "realdepth": -depth if reportclass.downstream else depth,
                 "sizeminimum": opdetail["parentoperation_min"],
                 "sizemaximum": opdetail["parentoperation_max"],
@@ -1441,13 +1095,13 @@ class PathReport(GridReport):
                 "blockedby": None,
                 "blocking": None,
                 "rownb": (
-                    reportclass.routing_operation_position[i[8]][0]
-                    if i[8] in reportclass.routing_operation_position
+                    request.supplypathgraph.routing_positions[i[8]][0]
+                    if i[8] in request.supplypathgraph.routing_positions
                     else None
                 ),
                 "colnb": (
-                    reportclass.routing_operation_position[i[8]][1]
-                    if i[8] in reportclass.routing_operation_position
+                    request.supplypathgraph.routing_positions[i[8]][1]
+                    if i[8] in request.supplypathgraph.routing_positions
                     else None
                 ),
             }
@@ -1475,7 +1129,7 @@ class PathReport(GridReport):
                 "description": i[20],
                 "uom": i[23],
                 "location": i[1],
-                "resources": tuple(json.loads(i[5]).items()) if i[5] else None,
+                "resources": tuple(i[5].items()) if i[5] else None,
                 "parentoper": i[8],
                 "suboperation": (
                     0
@@ -1490,7 +1144,7 @@ class PathReport(GridReport):
                 "duration_per": i[7],
                 "quantity": abs(bom_quantity),
                 "buffers": (
-                    tuple(json.loads(i[4]).items())
+                    tuple(i[4].items())
                     if i[4]
                     else tuple([("%s @ %s" % (i[17], i[1]), 1)]) if i[17] else None
                 ),
@@ -1507,16 +1161,16 @@ class PathReport(GridReport):
                 "alternate": "false",
                 "alternate_priority": (i[13] or i[10] or i[3] or 999),
                 "alternate_operation": (i[11] or i[8] or i[0]),
-                "blockedby": tuple(json.loads(i[21]).items()) if i[21] else None,
-                "blocking": tuple(json.loads(i[22]).items()) if i[22] else None,
+                "blockedby": tuple(i[21].items()) if i[21] else None,
+                "blocking": tuple(i[22].items()) if i[22] else None,
                 "rownb": (
-                    reportclass.routing_operation_position[i[0]][0]
-                    if i[0] in reportclass.routing_operation_position
+                    request.supplypathgraph.routing_positions[i[0]][0]
+                    if i[0] in request.supplypathgraph.routing_positions
                     else None
                 ),
                 "colnb": (
-                    reportclass.routing_operation_position[i[0]][1]
-                    if i[0] in reportclass.routing_operation_position
+                    request.supplypathgraph.routing_positions[i[0]][1]
+                    if i[0] in request.supplypathgraph.routing_positions
                     else None
                 ),
             }
@@ -1524,11 +1178,11 @@ class PathReport(GridReport):
             yield operation
 
         if i[5]:
-            for resource, quantity in tuple(json.loads(i[5]).items()):
+            for resource in i[5]:
                 reportclass.node_count.add(resource)
 
         if i[4]:
-            for buffer, quantity in tuple(json.loads(i[4]).items()):
+            for buffer, quantity in i[4].items():
                 # I might already have visisted that buffer
                 if buffer in reportclass.node_count:
                     continue
@@ -1543,14 +1197,14 @@ class PathReport(GridReport):
                     )
 
         if i[21] and not downstream:
-            for blockedby in tuple(json.loads(i[21]).items()):
+            for blockedby in i[21].items():
                 if not blockedby[0] in reportclass.operation_dict:
                     yield from reportclass.getOperationFromName(
                         request, blockedby[0], downstream, depth + 1, i[0], blockedby[1]
                     )
 
         if i[22] and downstream:
-            for blocking in tuple(json.loads(i[22]).items()):
+            for blocking in i[22].items():
                 if not blocking[0] in reportclass.operation_dict:
                     yield from reportclass.getOperationFromName(
                         request, blocking[0], downstream, depth + 1, i[0], blocking[1]
@@ -1568,22 +1222,19 @@ class PathReport(GridReport):
         # dictionary to retrieve the operation id from its name
         reportclass.operation_dict = {}
 
-        # A flag to figure out if the routing dependencies have been scanned
-        reportclass.routing_dependencies_done = False
+        # In-memory copy of the supply chain model.
+        # It's stored on the request, because concurrent requests share the class.
+        request.supplypathgraph = SupplyPathGraph.get(request.database)
 
         # counter used to give a unique id to the operation
         reportclass.operation_id = 0
 
-        # dictionary to count the number of suboperations
-        # prevents to hit database more than once for a given routing/alternate
-        reportclass.suboperations_count_dict = {}
-
         # dictionary to reassign a priority to the alternate/routing suboperations
         # required otherwise suboperations with same priority overlap.
         reportclass.parent_count_dict = {}
 
         # set used to count the number of nodes in the graph.
-        # we stop at 400 otherwise we could draw the full supply chain
+        # we stop at maxnodes otherwise we could draw the full supply chain
         # in the case of downstream raw material.
         reportclass.node_count = set()
 
@@ -22,6 +22,7 @@
 #
 from datetime import datetime
 import base64
+import codecs
 import gzip
 
 from html.parser import HTMLParser
@@ -35,7 +36,7 @@ from django.conf import settings
 from django.contrib.auth.models import Group, Permission
 from django.utils.http import urlencode
 
-from freppledb.common.models import Parameter, User
+from freppledb.common.models import Parameter, ParameterCache, User
 from freppledb.common.commands import (
     PlanTaskRegistry,
     PlanTask,
@@ -51,6 +52,35 @@ from freppledb.input.commands import (
 logger = logging.getLogger(__name__)
 
 
+class OdooStream:
+    """
+    File-like wrapper around the XML data from odoo.
+    The data is decompressed as the parser of the engine requests it, so the
+    complete document is never held in memory. Invalid UTF-8 characters are
+    dropped.
+    """
+
+    def __init__(self, source, compressed=False):
+        self.source = gzip.GzipFile(fileobj=source, mode="rb") if compressed else source
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        # Encoded data that didn't fit in the previous read
+        self.pending = b""
+        self.eof = False
+
+    def read(self, size=-1):
+        # A character completed by this chunk can make the encoded data longer
+        # than the chunk. The parser never accepts more bytes than it asked for.
+        while not self.pending and not self.eof:
+            data = self.source.read(size)
+            self.eof = not data
+            self.pending = self.decoder.decode(data, final=self.eof).encode("utf-8")
+        if size is None or size < 0:
+            size = len(self.pending)
+        data = self.pending[:size]
+        self.pending = self.pending[size:]
+        return data
+
+
 @PlanTaskRegistry.register
 class OdooReadData(PlanTask):
     """
@@ -191,24 +221,17 @@ class OdooReadData(PlanTask):
                 )
                 request.add_header("Accept-Encoding", "gzip")
 
-                # Download and parse XML data
+                # Download, decompress and parse the XML data incrementally
                 with urlopen(request) as response:
-                    if response.info().get("Content-Encoding") == "gzip":
-                        frepple.readXMLdata(
-                            gzip.decompress(response.read()).decode(
-                                encoding="utf-8", errors="ignore"
-                            ),
-                            False,
-                            False,
-                            loglevel,
-                        )
-                    else:
-                        frepple.readXMLdata(
-                            response.read().decode(encoding="utf-8", errors="ignore"),
-                            False,
-                            False,
-                            loglevel,
-                        )
+                    frepple.readXMLstream(
+                        OdooStream(
+                            response,
+                            response.info().get("Content-Encoding") == "gzip",
+                        ),
+                        False,
+                        False,
+                        loglevel,
+                    )
 
             except HTTPError as e:
                 print("Error connecting to odoo at %s" % url)
@@ -234,8 +257,8 @@ class OdooReadData(PlanTask):
 
         else:
             # Parse XML data file
-            with open(debugFile, encoding="utf-8") as f:
-                frepple.readXMLdata(f.read(), False, False, loglevel)
+            with open(debugFile, "rb") as f:
+                frepple.readXMLstream(OdooStream(f), False, False, loglevel)
 
         # All predefined inventory detail records are now loaded.
         # We now create any missing ones.
@@ -253,6 +276,7 @@ class OdooReadData(PlanTask):
                 """,
                 (frepple.settings.current.strftime("%Y-%m-%d %H:%M:%S"),),
             )
+        ParameterCache.invalidate(database)
 
         # Synchronize users
         if hasattr(frepple.settings, "users"):
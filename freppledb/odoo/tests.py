@@ -8,19 +8,25 @@
 # or in the form of compiled binaries.
 #
 
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
 import json
 import os
+from threading import Thread
+from time import time
 from unittest import skipUnless
 import xmlrpc.client
 
 from django.conf import settings
 from django.core import management
 from django.db.models import F
-from django.test import TransactionTestCase
+from django.test import SimpleTestCase, TransactionTestCase
 from django.contrib.auth.models import Group
 
-from freppledb.common.models import User
+from freppledb.common.models import Parameter, User
 from freppledb.input.models import Item, PurchaseOrder, ManufacturingOrder
+from .commands import OdooStream
 from .management.commands.odoo_container import Command as odoo_container_command
 from .utils import getOdooVersion
 
@@ -250,3 +256,113 @@ class OdooTest(TransactionTestCase):
             )
             cnt += 1
         self.assertEqual(cnt, 1)
+
+
+@skipUnless("freppledb.odoo" in settings.INSTALLED_APPS, "App not activated")
+class OdooStreamTest(SimpleTestCase):
+    def test_multibyte_boundary(self):
+        # The 2-byte character spans the first two chunks of 8 bytes
+        payload = "aaaaaaa\u00e9aaaaaaa\u00e9".encode("utf-8")
+        for compressed in (False, True):
+            stream = OdooStream(
+                BytesIO(gzip.compress(payload) if compressed else payload),
+                compressed=compressed,
+            )
+            result = b""
+            while True:
+                data = stream.read(8)
+                self.assertLessEqual(len(data), 8)
+                if not data:
+                    break
+                result += data
+            self.assertEqual(result, payload)
+
+    def test_invalid_characters(self):
+        stream = OdooStream(BytesIO(b"ab\xffcd"))
+        self.assertEqual(stream.read(-1), b"abcd")
+        self.assertEqual(stream.read(8), b"")
+
+
+@skipUnless("freppledb.odoo" in settings.INSTALLED_APPS, "App not activated")
+@skipUnless("FREPPLE_BENCHMARK" in os.environ, "Benchmarks not requested")
+class OdooStreamBenchmark(TransactionTestCase):
+    """
+    Measures the throughput and peak memory of the odoo data import.
+    A local HTTP server stands in for odoo and serves a gzipped payload: the
+    recorded extract in FREPPLE_ODOO_DEBUGFILE when set, or a generated one.
+
+    Run with:
+      FREPPLE_BENCHMARK=100000 ./frepplectl.py test freppledb.odoo.tests.OdooStreamBenchmark
+    """
+
+    def setUp(self):
+        os.environ["FREPPLE_TEST"] = "YES"
+        # The planning process needs to read from the stand-in, not from the file
+        self.debugfile = os.environ.pop("FREPPLE_ODOO_DEBUGFILE", None)
+        if self.debugfile:
+            with open(self.debugfile, "rb") as f:
+                payload = f.read()
+        else:
+            try:
+                size = int(os.environ["FREPPLE_BENCHMARK"])
+            except ValueError:
+                size = 100000
+            payload = (
+                '<?xml version="1.0" encoding="UTF-8" ?>\n'
+                '<plan xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+                "<items>\n%s</items>\n</plan>\n"
+                % "".join(
+                    '<item name="bench %s" description="benchmark item %s" cost="1"/>\n'
+                    % (i, i)
+                    for i in range(size)
+                )
+            ).encode("utf-8")
+        self.size = len(payload)
+        compressed = gzip.compress(payload)
+
+        class OdooStandIn(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/xml")
+                self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(compressed)))
+                self.end_headers()
+                self.wfile.write(compressed)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("localhost", 0), OdooStandIn)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        for key, value in (
+            ("odoo.url", "http://localhost:%s/" % self.server.server_port),
+            ("odoo.user", "admin"),
+            ("odoo.password", "admin"),
+            ("odoo.company", "benchmark"),
+            ("plan.webservice", "false"),
+        ):
+            Parameter.objects.update_or_create(pk=key, defaults={"value": value})
+        super().setUp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.debugfile:
+            os.environ["FREPPLE_ODOO_DEBUGFILE"] = self.debugfile
+        del os.environ["FREPPLE_TEST"]
+        super().tearDown()
+
+    def test_odoo_stream(self):
+        import resource
+
+        start = time()
+        management.call_command("runplan", plantype=1, env="odoo_read_1")
+        duration = time() - start
+        # On Linux the peak resident memory of the planning process is in kB
+        rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        print(
+            "\nReading %.1f MB of XML data from odoo: %.1f MB/sec, peak RSS %.0f MB"
+            % (self.size / 1048576, self.size / 1048576 / duration, rss / 1024)
+        )
+        if not self.debugfile:
+            self.assertTrue(Item.objects.filter(name="bench 0").exists())
@@ -34,14 +34,98 @@ from freppledb.common.commands import (
     PlanTaskRegistry,
     PlanTask,
     clean_value,
+    CopyBinaryGenerator,
     CopyFromGenerator,
 )
+from freppledb.common.dashboard import Dashboard
+from freppledb.common.models import Parameter
 from freppledb.input.models import OperationPlan
 from freppledb.boot import getAttributes
 
 logger = logging.getLogger(__name__)
 
 
+def isDifferentialExport(cluster=-1, database=DEFAULT_DB_ALIAS):
+    """
+    In a differential export the operationplans, operationplanmaterials and
+    operationplanresources aren't erased and rewritten. Only the records that
+    changed since the previous export are inserted, updated or deleted.
+    This mode applies only to the export of the complete model.
+    """
+    return (
+        cluster == -1
+        and Parameter.getValue("plan.differentialExport", database, "false")
+        .strip()
+        .lower()
+        == "true"
+    )
+
+
+def mergeDifferential(cursor, table, columns):
+    """
+    Merges the content of the temporary table tmp_<table> into a table.
+    Records that don't have an identical copy in the new plan are deleted, and
+    new records are inserted. The lastmodified field is not compared.
+    The first column is expected to be the operationplan reference.
+    """
+    fields = [c for c in columns if c != "lastmodified"]
+    match = " and ".join(
+        (
+            "tmp.%s = tbl.%s" % (f, f)
+            if f == columns[0]
+            else "tmp.%s is not distinct from tbl.%s" % (f, f)
+        )
+        for f in fields
+    )
+    cursor.execute("create index on tmp_%s (%s)" % (table, columns[0]))
+    cursor.execute("analyze tmp_%s" % table)
+    cursor.execute(
+        """
+        delete from %s as tbl
+        where not exists (select 1 from tmp_%s as tmp where %s)
+        """
+        % (table, table, match)
+    )
+    deleted = cursor.rowcount
+    cursor.execute(
+        """
+        insert into %s (%s)
+        select %s from tmp_%s as tmp
+        where not exists (select 1 from %s as tbl where %s)
+        """
+        % (
+            table,
+            ", ".join(columns),
+            ", ".join(columns),
+            table,
+            table,
+            match,
+        )
+    )
+    logger.info(
+        "Differential export: %d %s records inserted, %d deleted"
+        % (cursor.rowcount, table, deleted)
+    )
+    cursor.execute("drop table tmp_%s" % table)
+
+
+def logThroughput(table, itr):
+    """
+    Wraps an iterator with the records exported to a table, and logs the
+    number of records and the throughput when the iterator is exhausted.
+    """
+    start = datetime.now()
+    count = 0
+    for rec in itr:
+        count += 1
+        yield rec
+    duration = (datetime.now() - start).total_seconds()
+    logger.info(
+        "Exported %d records to %s at %.0f records/sec"
+        % (count, table, count / duration if duration else count)
+    )
+
+
 @PlanTaskRegistry.register
 class TruncatePlan(PlanTask):
     description = "Erasing previous plan"
@@ -65,7 +149,7 @@ class TruncatePlan(PlanTask):
         resources=None,
         buffers=None,
         demands=None,
-        **kwargs
+        **kwargs,
     ):
         import frepple
 
@@ -80,6 +164,9 @@ class TruncatePlan(PlanTask):
                 # TODO not very clean to make this difference here
                 cursor.execute("delete from out_problem where name != 'outlier'")
                 cursor.execute("truncate table out_resourceplan, out_constraint")
+            if isDifferentialExport(cluster, database):
+                # Operationplans and their details are merged during the export
+                return
             cursor.execute(
                 """
                 update operationplan
@@ -348,6 +435,7 @@ class ShowPlanStats(PlanTask):
 class ExportProblems(PlanTask):
     description = ("Export plan", "Exporting problems")
     sequence = (401, "export2", 2)
+    dependencies = ()
     export = True
 
     @classmethod
@@ -394,7 +482,7 @@ class ExportProblems(PlanTask):
             return
         with connections[database].cursor() as cursor:
             cursor.copy_from(
-                CopyFromGenerator(cls.getData(cluster)),
+                CopyFromGenerator(logThroughput("out_problem", cls.getData(cluster))),
                 "out_problem",
                 columns=(
                     "entity",
@@ -405,7 +493,7 @@ class ExportProblems(PlanTask):
                     "enddate",
                     "weight",
                 ),
-                size=1024,
+                size=settings.COPY_BUFFER_SIZE,
                 sep="\v",
             )
 
@@ -414,6 +502,7 @@ class ExportProblems(PlanTask):
 class ExportConstraints(PlanTask):
     description = ("Export plan", "Exporting constraints")
     sequence = (401, "export2", 3)
+    dependencies = ()
     export = True
 
     @classmethod
@@ -465,7 +554,9 @@ class ExportConstraints(PlanTask):
             return
         with connections[database].cursor() as cursor:
             cursor.copy_from(
-                CopyFromGenerator(cls.getData(cluster=cluster)),
+                CopyFromGenerator(
+                    logThroughput("out_constraint", cls.getData(cluster=cluster))
+                ),
                 "out_constraint",
                 columns=(
                     "demand",
@@ -479,7 +570,7 @@ class ExportConstraints(PlanTask):
                     "enddate",
                     "weight",
                 ),
-                size=1024,
+                size=settings.COPY_BUFFER_SIZE,
                 sep="\v",
             )
 
@@ -488,6 +579,7 @@ class ExportConstraints(PlanTask):
 class ExportOperationPlans(PlanTask):
     description = ("Export plan", "Exporting operationplans")
     sequence = (401, "export1", 1)
+    dependencies = ()
     export = True
 
     @classmethod
@@ -498,11 +590,13 @@ class ExportOperationPlans(PlanTask):
             return -1
 
     @staticmethod
-    def getPegging(opplan, buffer=None):
+    def getUpstream(opplan):
+        """
+        Returns the operationplans directly upstream of an operationplan as a
+        list of tuples (operationplan, quantity, offset).
+        """
         import frepple
 
-        unavail = opplan.unavailable
-
         upstream_opplans = None
         if (
             opplan.owner
@@ -516,7 +610,7 @@ class ExportOperationPlans(PlanTask):
             )
             == 0
         ):
-            upstream_opplans = [(opplan.owner.reference, opplan.quantity, 0)]
+            upstream_opplans = [(opplan.owner, opplan.quantity, 0)]
 
         if isinstance(opplan.operation, frepple.operation_routing):
             first_subop = None
@@ -525,11 +619,20 @@ class ExportOperationPlans(PlanTask):
                 break
             if first_subop:
                 upstream_opplans = [
-                    (j.operationplan.reference, j.quantity, j.offset)
+                    (j.operationplan, j.quantity, j.offset)
                     for j in first_subop.pegging_upstream_first_level
                     if j.operationplan != opplan
                 ]
 
+        return upstream_opplans or [
+            (j.operationplan, j.quantity, j.offset)
+            for j in opplan.pegging_upstream_first_level
+            if j.operationplan != opplan
+        ]
+
+    @classmethod
+    def getPegging(cls, opplan, buffer=None):
+        unavail = opplan.unavailable
         pln = {
             "pegging": {
                 j.demand.name: round(j.quantity, 8) for j in opplan.pegging_demand
@@ -539,11 +642,8 @@ class ExportOperationPlans(PlanTask):
                 for j in opplan.pegging_downstream_first_level
                 if j.operationplan != opplan
             ],
-            "upstream_opplans": upstream_opplans
-            or [
-                (j.operationplan.reference, j.quantity, j.offset)
-                for j in opplan.pegging_upstream_first_level
-                if j.operationplan != opplan
+            "upstream_opplans": [
+                (j[0].reference, j[1], j[2]) for j in cls.getUpstream(opplan)
             ],
             "unavailable": unavail,
             "interruptions": (
@@ -570,14 +670,22 @@ class ExportOperationPlans(PlanTask):
                 pln["location"] = buffer.location.name
         if opplan.rule:
             pln["setuprule"] = [opplan.rule.setupmatrix.name, opplan.rule.priority]
-        # We need to double any backslash to assure that the string remains
-        # valid when passing it through postgresql (which eats them away)
-        return json.dumps(pln).replace("\\", "\\\\")
+        return json.dumps(pln)
 
     @classmethod
     def getData(
-        cls, with_fcst, timestamp, cluster=-1, opplans=None, accepted_status=[]
+        cls,
+        with_fcst,
+        timestamp,
+        cluster=-1,
+        opplans=None,
+        accepted_status=[],
+        binary=False,
     ):
+        """
+        Returns text lines for a text copy command, or tuples of values
+        for a binary copy command.
+        """
         import frepple
 
         linetemplate = "%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s\v%s"
@@ -588,21 +696,76 @@ class ExportOperationPlans(PlanTask):
         linetemplate += "\n"
 
         if cluster == -2:
-            for j in opplans:
-                if j.status in accepted_status:
-                    data = cls.getDataOpplan(j.operation, j, with_fcst, timestamp)
-                    if data:
-                        yield linetemplate % tuple(data)
+            opplanlist = (
+                (j.operation, j) for j in opplans if j.status in accepted_status
+            )
         else:
-            for i in frepple.operations():
-                if cluster != -1 and i.cluster not in cluster:
-                    continue
+            opplanlist = (
+                (i, j)
+                for i in frepple.operations()
+                if cluster == -1 or i.cluster in cluster
+                for j in i.operationplans
+                if j.status in accepted_status
+            )
+        for i, j in opplanlist:
+            data = cls.getDataOpplan(i, j, with_fcst, timestamp)
+            if not data:
+                continue
+            elif binary:
+                yield data
+            else:
+                yield linetemplate % tuple(
+                    clean_value(v) if v is None or isinstance(v, str) else v
+                    for v in data
+                )
 
-                for j in i.operationplans:
-                    if j.status in accepted_status:
-                        data = cls.getDataOpplan(i, j, with_fcst, timestamp)
-                        if data:
-                            yield linetemplate % tuple(data)
+    @classmethod
+    def getTypes(cls, with_fcst, delay="numeric"):
+        """
+        Returns the PostgreSQL data types of the fields returned by getDataOpplan.
+        """
+        types = [
+            "varchar",  # name
+            "varchar",  # type
+            "varchar",  # status
+            "numeric",  # quantity
+            "timestamptz",  # startdate
+            "timestamptz",  # enddate
+            "numeric",  # criticality
+            delay,  # delay
+            "jsonb",  # plan
+            "varchar",  # source
+            "timestamptz",  # lastmodified
+            "varchar",  # operation_id
+            "varchar",  # owner_id
+            "varchar",  # item_id
+            "varchar",  # destination_id
+            "varchar",  # origin_id
+            "varchar",  # location_id
+            "varchar",  # supplier_id
+            "varchar",  # demand_id
+            "timestamptz",  # due
+            "numeric",  # color
+            "varchar",  # reference
+            "varchar",  # batch
+            "numeric",  # quantity_completed
+        ]
+        if with_fcst:
+            types.append("varchar")  # forecast
+        for attr in cls.attrs:
+            types.append(
+                {
+                    "boolean": "boolean",
+                    "duration": "interval",
+                    "integer": "integer",
+                    "number": "numeric",
+                    "string": "varchar",
+                    "time": "time",
+                    "date": "date",
+                    "datetime": "timestamptz",
+                }[attr[2]]
+            )
+        return types
 
     @classmethod
     def getDataOpplan(cls, i, j, with_fcst, timestamp):
@@ -641,236 +804,232 @@ class ExportOperationPlans(PlanTask):
         if isinstance(i, frepple.operation_inventory) or (
             j.demand or (j.owner and j.owner.demand)
         ):
-            color = "\\N"
+            color = None
         else:
             color = j.getColor()[0]
             if color == 999999:
-                color = "\\N"
+                color = None
 
         data = None
         if isinstance(i, frepple.operation_inventory):
             # Export inventory
             data = [
-                clean_value(i.name),
+                i.name,
                 "STCK",
                 status,
                 round(j.quantity, 8),
-                str(j.start),
-                str(j.end),
+                j.start,
+                j.end,
                 round(j.criticality, 8),
                 delay,
                 cls.getPegging(j),
-                clean_value(j.source),
+                j.source,
                 timestamp,
-                "\\N",
+                None,
                 (
-                    clean_value(j.owner.reference)
+                    j.owner.reference
                     if j.owner and not j.owner.operation.hidden
-                    else "\\N"
+                    else None
                 ),
-                clean_value(j.operation.buffer.item.name),
-                clean_value(j.operation.buffer.location.name),
-                "\\N",
-                clean_value(j.operation.buffer.location.name),
-                "\\N",
-                clean_value(j.demand.name) if demand else "\\N",
+                j.operation.buffer.item.name,
+                j.operation.buffer.location.name,
+                None,
+                j.operation.buffer.location.name,
+                None,
+                j.demand.name if demand else None,
                 (
                     j.demand.due
                     if j.demand
-                    else j.owner.demand.due if j.owner and j.owner.demand else "\\N"
+                    else j.owner.demand.due if j.owner and j.owner.demand else None
                 ),
-                "\\N",  # color is empty for stock
-                clean_value(j.reference),
-                clean_value(j.batch),
-                "\\N",
+                None,  # color is empty for stock
+                j.reference,
+                j.batch,
+                None,
             ]
         elif isinstance(i, frepple.operation_itemdistribution):
             # Export DO
             data = [
-                clean_value(i.name),
+                i.name,
                 "DO",
                 status,
                 round(j.quantity, 8),
-                str(j.start),
-                str(j.end),
+                j.start,
+                j.end,
                 round(j.criticality, 8),
                 delay,
                 cls.getPegging(j),
-                clean_value(j.source),
+                j.source,
                 timestamp,
-                "\\N",
+                None,
                 (
-                    clean_value(j.owner.reference)
+                    j.owner.reference
                     if j.owner and not j.owner.operation.hidden
-                    else "\\N"
+                    else None
                 ),
                 (
-                    clean_value(j.operation.destination.item.name)
+                    j.operation.destination.item.name
                     if j.operation.destination
                     else j.operation.origin.item.name
                 ),
                 (
-                    clean_value(j.operation.destination.location.name)
+                    j.operation.destination.location.name
                     if j.operation.destination
-                    else "\\N"
+                    else None
                 ),
-                (
-                    clean_value(j.operation.origin.location.name)
-                    if j.operation.origin
-                    else "\\N"
-                ),
-                "\\N",
-                "\\N",
-                clean_value(j.demand.name) if demand else "\\N",
+                j.operation.origin.location.name if j.operation.origin else None,
+                None,
+                None,
+                j.demand.name if demand else None,
                 (
                     j.demand.due
                     if j.demand
-                    else j.owner.demand.due if j.owner and j.owner.demand else "\\N"
+                    else j.owner.demand.due if j.owner and j.owner.demand else None
                 ),
                 color,  # color
-                clean_value(j.reference),
-                clean_value(j.batch),
-                "\\N",
+                j.reference,
+                j.batch,
+                None,
             ]
         elif isinstance(i, frepple.operation_itemsupplier):
             # Export PO
             data = [
-                clean_value(i.name),
+                i.name,
                 "PO",
                 status,
                 round(j.quantity, 8),
-                str(j.start),
-                str(j.end),
+                j.start,
+                j.end,
                 round(j.criticality, 8),
                 delay,
                 cls.getPegging(j),
-                clean_value(j.source),
+                j.source,
                 timestamp,
-                "\\N",
+                None,
                 (
-                    clean_value(j.owner.reference)
+                    j.owner.reference
                     if j.owner and not j.owner.operation.hidden
-                    else "\\N"
+                    else None
                 ),
-                clean_value(j.operation.buffer.item.name),
-                "\\N",
-                "\\N",
-                clean_value(j.operation.buffer.location.name),
-                clean_value(j.operation.itemsupplier.supplier.name),
-                clean_value(j.demand.name) if demand else "\\N",
+                j.operation.buffer.item.name,
+                None,
+                None,
+                j.operation.buffer.location.name,
+                j.operation.itemsupplier.supplier.name,
+                j.demand.name if demand else None,
                 (
                     j.demand.due
                     if j.demand
-                    else j.owner.demand.due if j.owner and j.owner.demand else "\\N"
+                    else j.owner.demand.due if j.owner and j.owner.demand else None
                 ),
                 color,  # color
-                clean_value(j.reference),
-                clean_value(j.batch),
-                "\\N",
+                j.reference,
+                j.batch,
+                None,
             ]
         elif not i.hidden:
             # Export MO
             data = [
-                clean_value(i.name),
+                i.name,
                 "MO",
                 status,
                 round(j.quantity, 8),
-                str(j.start),
-                str(j.end),
+                j.start,
+                j.end,
                 round(j.criticality, 8),
                 delay,
                 cls.getPegging(j),
-                clean_value(j.source),
+                j.source,
                 timestamp,
-                clean_value(i.name),
+                i.name,
                 (
-                    clean_value(j.owner.reference)
+                    j.owner.reference
                     if j.owner and not j.owner.operation.hidden
-                    else "\\N"
+                    else None
                 ),
                 (
-                    clean_value(i.item.name)
+                    i.item.name
                     if i.item
                     else (
-                        clean_value(i.owner.item.name)
+                        i.owner.item.name
                         if i.owner and i.owner.item
                         else (
-                            clean_value(j.demand.item.name)
+                            j.demand.item.name
                             if j.demand and j.demand.item
                             else (
-                                clean_value(j.owner.demand.item.name)
+                                j.owner.demand.item.name
                                 if j.owner and j.owner.demand and j.owner.demand.item
-                                else "\\N"
+                                else None
                             )
                         )
                     )
                 ),
-                "\\N",
-                "\\N",
-                clean_value(i.location.name) if i.location else "\\N",
-                "\\N",
-                clean_value(j.demand.name) if demand and j.demand else "\\N",
+                None,
+                None,
+                i.location.name if i.location else None,
+                None,
+                j.demand.name if demand and j.demand else None,
                 (
                     j.demand.due
                     if j.demand
-                    else j.owner.demand.due if j.owner and j.owner.demand else "\\N"
+                    else j.owner.demand.due if j.owner and j.owner.demand else None
                 ),
                 color,  # color
-                clean_value(j.reference),
-                clean_value(j.batch),
-                round(j.quantity_completed, 8) if j.quantity_completed else "\\N",
+                j.reference,
+                j.batch,
+                round(j.quantity_completed, 8) if j.quantity_completed else None,
             ]
         elif j.demand or (j.owner and j.owner.demand):
             # Export shipments (with automatically created delivery operations)
             data = [
-                clean_value(i.name),
+                i.name,
                 "DLVR",
                 status,
                 round(j.quantity, 8),
-                str(j.start),
-                str(j.end),
+                j.start,
+                j.end,
                 round(j.criticality, 8),
                 delay,
                 cls.getPegging(j),
-                clean_value(j.source),
+                j.source,
                 timestamp,
-                "\\N",
+                None,
                 (
-                    clean_value(j.owner.reference)
+                    j.owner.reference
                     if j.owner and not j.owner.operation.hidden
-                    else "\\N"
+                    else None
                 ),
-                clean_value(
+                (
                     j.owner.demand.item.name
                     if j.owner and j.owner.demand
                     else j.demand.item.name
                 ),
-                "\\N",
-                "\\N",
-                clean_value(
+                None,
+                None,
+                (
                     j.owner.demand.location.name
                     if j.owner and j.owner.demand
                     else j.demand.location.name
                 ),
-                "\\N",
-                clean_value(j.demand.name) if demand else "\\N",
+                None,
+                j.demand.name if demand else None,
                 (
                     j.demand.due
                     if j.demand
-                    else j.owner.demand.due if j.owner and j.owner.demand else "\\N"
+                    else j.owner.demand.due if j.owner and j.owner.demand else None
                 ),
-                "\\N",  # color is empty for deliver operation
-                clean_value(j.reference),
-                clean_value(j.batch),
-                "\\N",
+                None,  # color is empty for deliver operation
+                j.reference,
+                j.batch,
+                None,
             ]
         if data:
             if with_fcst:
-                data.append(clean_value(forecast.owner.name) if forecast else "\\N")
+                data.append(forecast.owner.name if forecast else None)
             for attr in cls.attrs:
                 v = getattr(j, attr[0], None)
                 if v is None:
-                    data.append("\\N")
+                    data.append(None)
                 elif attr[2] == "boolean":
                     data.append(True if v else False)
                 elif attr[2] == "duration":
@@ -880,7 +1039,7 @@ class ExportOperationPlans(PlanTask):
                 elif attr[2] == "number":
                     data.append(round(v, 6))
                 elif attr[2] == "string":
-                    data.append(clean_value(v))
+                    data.append(v)
                 elif attr[2] == "time":
                     data.append(v)
                 elif attr[2] == "date":
@@ -896,6 +1055,7 @@ class ExportOperationPlans(PlanTask):
         if cluster == -2 and not opplans:
             return
         with_fcst = "freppledb.forecast" in settings.INSTALLED_APPS
+        differential = isDifferentialExport(cluster, database)
         cls.attrs = [x for x in getAttributes(OperationPlan) if x[0] != "forecast"]
 
         # Export operationplans to a temporary table
@@ -951,30 +1111,48 @@ class ExportOperationPlans(PlanTask):
         sql += ")"
         cursor.execute(sql)
 
-        cursor.copy_from(
-            CopyFromGenerator(
-                cls.getData(
-                    with_fcst,
-                    cls.parent.timestamp,
-                    cluster=cluster,
-                    opplans=opplans,
-                    accepted_status=(
-                        ["confirmed", "approved", "completed", "closed"]
-                        if cluster != -2
-                        else [
-                            "proposed",
-                            "confirmed",
-                            "approved",
-                            "completed",
-                            "closed",
-                        ]
-                    ),
-                )
-            ),
-            table="tmp_operationplan",
-            size=1024,
-            sep="\v",
+        accepted_status = (
+            ["confirmed", "approved", "completed", "closed"]
+            if cluster != -2 and not differential
+            else ["proposed", "confirmed", "approved", "completed", "closed"]
         )
+        if settings.COPY_BINARY:
+            cursor.copy_expert(
+                "copy tmp_operationplan from stdin with (format binary)",
+                CopyBinaryGenerator(
+                    logThroughput(
+                        "operationplan",
+                        cls.getData(
+                            with_fcst,
+                            cls.parent.timestamp,
+                            cluster=cluster,
+                            opplans=opplans,
+                            accepted_status=accepted_status,
+                            binary=True,
+                        ),
+                    ),
+                    cls.getTypes(with_fcst),
+                ),
+                size=settings.COPY_BUFFER_SIZE,
+            )
+        else:
+            cursor.copy_from(
+                CopyFromGenerator(
+                    logThroughput(
+                        "operationplan",
+                        cls.getData(
+                            with_fcst,
+                            cls.parent.timestamp,
+                            cluster=cluster,
+                            opplans=opplans,
+                            accepted_status=accepted_status,
+                        ),
+                    )
+                ),
+                table="tmp_operationplan",
+                size=settings.COPY_BUFFER_SIZE,
+                sep="\v",
+            )
 
         if with_fcst:
             forecastfield0 = " ,forecast=excluded.forecast"
@@ -1012,8 +1190,91 @@ class ExportOperationPlans(PlanTask):
             forecastfield0,
             "".join([", %s = excluded.%s" % (a[0], a[0]) for a in cls.attrs]),
         )
+        if differential:
+            # Only update records that changed
+            fields = [
+                "name",
+                "type",
+                "status",
+                "quantity",
+                "startdate",
+                "enddate",
+                "criticality",
+                "delay",
+                "plan",
+                "source",
+                "operation_id",
+                "owner_id",
+                "item_id",
+                "destination_id",
+                "origin_id",
+                "location_id",
+                "supplier_id",
+                "demand_id",
+                "due",
+                "color",
+                "batch",
+                "quantity_completed",
+            ]
+            if with_fcst:
+                fields.append("forecast")
+            fields.extend(a[0] for a in cls.attrs)
+            sql += """
+            where (%s) is distinct from (%s)
+            """ % (
+                ", ".join("operationplan.%s" % f for f in fields),
+                ", ".join("excluded.%s" % f for f in fields),
+            )
 
-        cursor.execute(sql)
+        if differential:
+            with transaction.atomic(using=database, savepoint=False):
+                cursor.execute(sql)
+                changed = cursor.rowcount
+
+                # Delete the proposed operationplans that no longer exist,
+                # together with their material and resource details.
+                # The remaining children of a deleted operationplan lose their owner.
+                cursor.execute(
+                    """
+                    with obsolete as (
+                      select reference from operationplan
+                      where (status = 'proposed' or status is null or type = 'STCK')
+                      and not exists (
+                        select 1 from tmp_operationplan
+                        where tmp_operationplan.reference = operationplan.reference
+                        )
+                      ),
+                    orphans as (
+                      update operationplan
+                      set owner_id = null
+                      from obsolete
+                      where operationplan.owner_id = obsolete.reference
+                      and not exists (
+                        select 1 from obsolete as child
+                        where child.reference = operationplan.reference
+                        )
+                      ),
+                    opplanmat as (
+                      delete from operationplanmaterial
+                      using obsolete
+                      where operationplanmaterial.operationplan_id = obsolete.reference
+                      ),
+                    opplanres as (
+                      delete from operationplanresource
+                      using obsolete
+                      where operationplanresource.operationplan_id = obsolete.reference
+                      )
+                    delete from operationplan
+                    using obsolete
+                    where operationplan.reference = obsolete.reference
+                    """
+                )
+                logger.info(
+                    "Differential export: %d operationplans inserted or updated, %d deleted"
+                    % (changed, cursor.rowcount)
+                )
+        else:
+            cursor.execute(sql)
 
         # Make sure any deleted confirmed MO from Plan Editor gets deleted in the database
         # Only MO can currently be deleted through Plan Editor
@@ -1028,21 +1289,9 @@ class ExportOperationPlans(PlanTask):
             )
 
         # Directly injecting proposed records in operationplan table
-        if cluster != -2:
-            cursor.copy_from(
-                CopyFromGenerator(
-                    cls.getData(
-                        with_fcst,
-                        cls.parent.timestamp,
-                        cluster=cluster,
-                        opplans=opplans,
-                        accepted_status=["proposed"],
-                    )
-                ),
-                table="operationplan",
-                size=1024,
-                sep="\v",
-                columns=[
+        if cluster != -2 and not differential:
+            columns = (
+                [
                     "name",
                     "type",
                     "status",
@@ -1075,8 +1324,47 @@ class ExportOperationPlans(PlanTask):
                     if with_fcst
                     else []
                 )
-                + [a[0] for a in cls.attrs],
+                + [a[0] for a in cls.attrs]
             )
+            if settings.COPY_BINARY:
+                cursor.copy_expert(
+                    "copy operationplan (%s) from stdin with (format binary)"
+                    % ",".join(columns),
+                    CopyBinaryGenerator(
+                        logThroughput(
+                            "operationplan",
+                            cls.getData(
+                                with_fcst,
+                                cls.parent.timestamp,
+                                cluster=cluster,
+                                opplans=opplans,
+                                accepted_status=["proposed"],
+                                binary=True,
+                            ),
+                        ),
+                        cls.getTypes(with_fcst, delay="interval"),
+                    ),
+                    size=settings.COPY_BUFFER_SIZE,
+                )
+            else:
+                cursor.copy_from(
+                    CopyFromGenerator(
+                        logThroughput(
+                            "operationplan",
+                            cls.getData(
+                                with_fcst,
+                                cls.parent.timestamp,
+                                cluster=cluster,
+                                opplans=opplans,
+                                accepted_status=["proposed"],
+                            ),
+                        )
+                    ),
+                    table="operationplan",
+                    size=settings.COPY_BUFFER_SIZE,
+                    sep="\v",
+                    columns=columns,
+                )
 
         # update demand table specific fields
         cursor.execute(
@@ -1144,6 +1432,7 @@ class ExportOperationPlans(PlanTask):
 class ExportOperationPlanMaterials(PlanTask):
     description = ("Export plan", "Exporting operationplan materials")
     sequence = (401, "export1", 2)
+    dependencies = (ExportOperationPlans,)
     export = True
 
     @classmethod
@@ -1194,42 +1483,59 @@ class ExportOperationPlanMaterials(PlanTask):
         buffers=None,
         database=DEFAULT_DB_ALIAS,
         timestamp=None,
-        **kwargs
+        **kwargs,
     ):
         if cluster == -2 and not buffers:
             return
 
+        columns = (
+            "operationplan_id",
+            "item_id",
+            "location_id",
+            "quantity",
+            "flowdate",
+            "onhand",
+            "minimum",
+            "periodofcover",
+            "status",
+            "lastmodified",
+        )
+        differential = isDifferentialExport(cluster, database)
         cursor = connections[database].cursor()
+        if differential:
+            cursor.execute(
+                """
+                create temporary table tmp_operationplanmaterial as
+                select %s from operationplanmaterial where false
+                """
+                % ", ".join(columns)
+            )
         cursor.copy_from(
             CopyFromGenerator(
-                cls.getData(
-                    timestamp=timestamp or cls.parent.timestamp,
-                    cluster=cluster,
-                    buffers=buffers,
+                logThroughput(
+                    "operationplanmaterial",
+                    cls.getData(
+                        timestamp=timestamp or cls.parent.timestamp,
+                        cluster=cluster,
+                        buffers=buffers,
+                    ),
                 )
             ),
-            "operationplanmaterial",
-            columns=(
-                "operationplan_id",
-                "item_id",
-                "location_id",
-                "quantity",
-                "flowdate",
-                "onhand",
-                "minimum",
-                "periodofcover",
-                "status",
-                "lastmodified",
-            ),
-            size=1024,
+            ("tmp_operationplanmaterial" if differential else "operationplanmaterial"),
+            columns=columns,
+            size=settings.COPY_BUFFER_SIZE,
             sep="\v",
         )
+        if differential:
+            with transaction.atomic(using=database, savepoint=False):
+                mergeDifferential(cursor, "operationplanmaterial", columns)
 
 
 @PlanTaskRegistry.register
 class ComputePeriodOfCover(PlanTask):
     description = ("Export plan", "Compute period of cover")
     sequence = (401, "export1", 5)
+    dependencies = (ExportOperationPlanMaterials,)
     export = True
 
     @classmethod
@@ -1362,6 +1668,7 @@ class ComputePeriodOfCover(PlanTask):
 class ExportOperationPlanResources(PlanTask):
     description = ("Export plan", "Exporting operationplan resources")
     sequence = (401, "export1", 3)
+    dependencies = (ExportOperationPlans,)
     export = True
 
     @classmethod
@@ -1408,38 +1715,59 @@ class ExportOperationPlanResources(PlanTask):
         database=DEFAULT_DB_ALIAS,
         timestamp=None,
         resources=None,
-        **kwargs
+        **kwargs,
     ):
         if cluster == -2 and not resources:
             return
+        columns = (
+            "operationplan_id",
+            "resource_id",
+            "quantity",
+            "setup",
+            "status",
+            "lastmodified",
+        )
+        differential = isDifferentialExport(cluster, database)
         with connections[database].cursor() as cursor:
+            if differential:
+                cursor.execute(
+                    """
+                    create temporary table tmp_operationplanresource as
+                    select %s from operationplanresource where false
+                    """
+                    % ", ".join(columns)
+                )
             cursor.copy_from(
                 CopyFromGenerator(
-                    cls.getData(
-                        timestamp=timestamp or cls.parent.timestamp,
-                        cluster=cluster,
-                        resources=resources,
-                        **kwargs
+                    logThroughput(
+                        "operationplanresource",
+                        cls.getData(
+                            timestamp=timestamp or cls.parent.timestamp,
+                            cluster=cluster,
+                            resources=resources,
+                            **kwargs,
+                        ),
                     )
                 ),
-                "operationplanresource",
-                columns=(
-                    "operationplan_id",
-                    "resource_id",
-                    "quantity",
-                    "setup",
-                    "status",
-                    "lastmodified",
+                (
+                    "tmp_operationplanresource"
+                    if differential
+                    else "operationplanresource"
                 ),
-                size=1024,
+                columns=columns,
+                size=settings.COPY_BUFFER_SIZE,
                 sep="\v",
             )
+            if differential:
+                with transaction.atomic(using=database, savepoint=False):
+                    mergeDifferential(cursor, "operationplanresource", columns)
 
 
 @PlanTaskRegistry.register
 class ExportResourcePlans(PlanTask):
     description = ("Export plan", "Exporting resource plans")
     sequence = (401, "export2", 1)
+    dependencies = ()
     export = True
 
     @classmethod
@@ -1514,7 +1842,9 @@ class ExportResourcePlans(PlanTask):
                     )
 
         cursor.copy_from(
-            CopyFromGenerator(getData(resources=resources)),
+            CopyFromGenerator(
+                logThroughput("out_resourceplan", getData(resources=resources))
+            ),
             "out_resourceplan",
             columns=(
                 "resource",
@@ -1525,17 +1855,31 @@ class ExportResourcePlans(PlanTask):
                 "load",
                 "free",
             ),
-            size=1024,
+            size=settings.COPY_BUFFER_SIZE,
             sep="\v",
         )
 
 
 @PlanTaskRegistry.register
 class ExportPegging(PlanTask):
+    """
+    Exports the pegging of the demands.
+
+    The upstream pegging tree of every demand is stored in the table
+    out_pegging, with a record for each operationplan in the tree. The demand
+    plan report reads the tree with an index lookup on the demand. The index
+    on the operationplan finds the trees to refresh when an operationplan is
+    deleted.
+    """
+
     description = ("Export plan", "Exporting demand pegging")
     sequence = (401, "export1", 4)
+    dependencies = (ExportOperationPlans,)
     export = True
 
+    # Pegging trees are cut off at this level
+    maxlevel = 25
+
     @classmethod
     def getWeight(cls, **kwargs):
         if "supply" in os.environ:
@@ -1544,7 +1888,7 @@ class ExportPegging(PlanTask):
             return -1
 
     @staticmethod
-    def getDemandPlan(cluster=-1, demands=None):
+    def getDemands(cluster=-1, demands=None):
         import frepple
 
         for i in demands if cluster == -2 else frepple.demands():
@@ -1552,30 +1896,398 @@ class ExportPegging(PlanTask):
                 continue
             if i.hidden or not isinstance(i, frepple.demand_default):
                 continue
-            peg = []
-            maxlevel = -1
-            for j in i.pegging_first_level:
-                if maxlevel >= 0 and j.level > maxlevel:
-                    break
-                maxlevel = j.level
-                peg.append(
-                    {
-                        "opplan": j.operationplan.reference,
-                        "quantity": j.quantity,
-                    }
-                )
-            yield (json.dumps({"pegging": peg}), i.name)
+            yield i
+
+    @staticmethod
+    def getFirstLevel(demand):
+        maxlevel = -1
+        for j in demand.pegging_first_level:
+            if maxlevel >= 0 and j.level > maxlevel:
+                break
+            maxlevel = j.level
+            yield j
+
+    @classmethod
+    def getDemandPlan(cls, cluster=-1, demands=None):
+        for i in cls.getDemands(cluster, demands):
+            peg = [
+                {
+                    "opplan": j.operationplan.reference,
+                    "quantity": j.quantity,
+                }
+                for j in cls.getFirstLevel(i)
+            ]
+            yield "%s\v%s\n" % (
+                clean_value(i.name),
+                clean_value(json.dumps({"pegging": peg})),
+            )
+
+    @staticmethod
+    def getOwner(opplan):
+        """
+        Returns the owner of an operationplan as stored in the database.
+        """
+        if opplan.owner and not opplan.owner.operation.hidden:
+            return opplan.owner.reference
+
+    @staticmethod
+    def getItem(opplan):
+        """
+        Returns the item of an operationplan as stored in the database, or
+        False if the operationplan isn't stored in the database.
+        """
+        import frepple
+
+        i = opplan.operation
+        if isinstance(i, (frepple.operation_inventory, frepple.operation_itemsupplier)):
+            return i.buffer.item.name
+        elif isinstance(i, frepple.operation_itemdistribution):
+            return i.destination.item.name if i.destination else i.origin.item.name
+        elif not i.hidden:
+            if i.item:
+                return i.item.name
+            elif i.owner and i.owner.item:
+                return i.owner.item.name
+            elif opplan.demand and opplan.demand.item:
+                return opplan.demand.item.name
+            elif opplan.owner and opplan.owner.demand and opplan.owner.demand.item:
+                return opplan.owner.demand.item.name
+            return None
+        elif opplan.owner and opplan.owner.demand:
+            return opplan.owner.demand.item.name
+        elif opplan.demand:
+            return opplan.demand.item.name
+        return False
+
+    @classmethod
+    def getPeggingTree(cls, cluster=-1, demands=None):
+        """
+        Walks upstream from the deliveries of each demand.
+
+        A record is returned for every operationplan in the tree, with the
+        demand, the level, the downstream operationplan, the operationplan,
+        the pegged quantity range of the operationplan and the path in the
+        tree.
+        The pegged quantity range of an upstream operationplan is computed
+        from the range pegged on the downstream operationplan, scaled with the
+        quantities of the pegging link.
+        """
+        # Caches of the pegging links of each operationplan
+        upstream = {}
+        downstream = {}
+        items = {}
+
+        def getItem(opplan):
+            if opplan.reference not in items:
+                items[opplan.reference] = cls.getItem(opplan)
+            return items[opplan.reference]
+
+        def getUpstream(opplan):
+            if opplan.reference not in upstream:
+                upstream[opplan.reference] = [
+                    (j[0], j[2], j[1] + j[2])
+                    for j in ExportOperationPlans.getUpstream(opplan)
+                    if getItem(j[0]) is not False
+                ]
+            return upstream[opplan.reference]
+
+        def getDownstream(opplan, reference):
+            if opplan.reference not in downstream:
+                links = {}
+                for j in opplan.pegging_downstream_first_level:
+                    if j.operationplan != opplan:
+                        links.setdefault(j.operationplan.reference, []).append(
+                            (j.offset, j.quantity + j.offset)
+                        )
+                downstream[opplan.reference] = links
+            return downstream[opplan.reference].get(reference, ())
+
+        for d in cls.getDemands(cluster, demands):
+            stack = []
+            for j in cls.getFirstLevel(d):
+                o = j.operationplan
+                if getItem(o) is not False:
+                    stack.append(
+                        (
+                            1,
+                            1,
+                            "%s/%s" % (getItem(o) or "", o.reference),
+                            None,
+                            o,
+                            0,
+                            o.quantity,
+                        )
+                    )
+            stack.reverse()
+            while stack:
+                depth, level, path, parent, opplan, x, y = stack.pop()
+                yield (d.name, level, parent, opplan.reference, x, y, path)
+                if depth >= 2 * cls.maxlevel:
+                    # Protection against loops in the pegging
+                    continue
+                owner = cls.getOwner(opplan)
+                children = []
+                for up, x1, y1 in getUpstream(opplan):
+                    up_owner = cls.getOwner(up)
+                    up_level = level if owner and up_owner == owner else level + 1
+                    if up_level >= cls.maxlevel:
+                        continue
+                    for x2, y2 in getDownstream(up, opplan.reference):
+                        if x >= y or x2 >= y2 or x >= y2 or x2 >= y:
+                            # The pegged ranges don't overlap
+                            continue
+                        ratio = (y1 - x1) / (y2 - x2)
+                        start = x1 + ratio * (x - x2)
+                        children.append(
+                            (
+                                depth + 1,
+                                up_level,
+                                "%s/%s/%s" % (path, getItem(up) or "", up.reference),
+                                opplan.reference,
+                                up,
+                                max(x1, start),
+                                min(y1, start + (y - x) * ratio),
+                            )
+                        )
+                children.reverse()
+                stack.extend(children)
 
     @classmethod
     def run(cls, cluster=-1, demands=None, database=DEFAULT_DB_ALIAS, **kwargs):
+        deleted_opplans = list(kwargs.get("deleted_opplans", None) or [])
+        if cluster == -2:
+            demands = cls.getPeggedDemands(
+                demands, kwargs.get("opplans", None), deleted_opplans, database
+            )
         with transaction.atomic(using=database, savepoint=False):
             with connections[database].cursor() as cursor:
-                execute_batch(
-                    cursor,
-                    "update demand set plan=%s where name=%s",
-                    cls.getDemandPlan(cluster=cluster, demands=demands),
-                    page_size=200,
+                # Demand plan
+                cursor.execute(
+                    """
+                    create temporary table if not exists tmp_demandplan (
+                      name varchar(300), plan jsonb
+                    ) on commit drop
+                    """
+                )
+                cursor.copy_from(
+                    CopyFromGenerator(
+                        logThroughput(
+                            "demand plan",
+                            cls.getDemandPlan(cluster=cluster, demands=demands),
+                        )
+                    ),
+                    "tmp_demandplan",
+                    columns=("name", "plan"),
+                    size=settings.COPY_BUFFER_SIZE,
+                    sep="\v",
                 )
+                cursor.execute(
+                    """
+                    update demand
+                    set plan = tmp_demandplan.plan
+                    from tmp_demandplan
+                    where demand.name = tmp_demandplan.name
+                    """
+                )
+
+                # Pegging tree
+                if cluster == -1:
+                    cursor.execute("truncate table out_pegging")
+                else:
+                    cursor.execute(
+                        """
+                        delete from out_pegging
+                        where demand = any(%s) or operationplan = any(%s)
+                        """,
+                        (
+                            [i.name for i in cls.getDemands(cluster, demands)],
+                            deleted_opplans,
+                        ),
+                    )
+                cursor.copy_from(
+                    CopyFromGenerator(
+                        logThroughput(
+                            "out_pegging",
+                            (
+                                "%s\v%s\v%s\v%s\v%s\v%s\v%s\n"
+                                % (
+                                    clean_value(rec[0]),
+                                    rec[1],
+                                    clean_value(rec[2]),
+                                    clean_value(rec[3]),
+                                    round(rec[4], 8),
+                                    round(rec[5], 8),
+                                    clean_value(rec[6]),
+                                )
+                                for rec in cls.getPeggingTree(cluster, demands)
+                            ),
+                        )
+                    ),
+                    "out_pegging",
+                    columns=(
+                        "demand",
+                        "level",
+                        "downstream",
+                        "operationplan",
+                        "pegged_x",
+                        "pegged_y",
+                        "path",
+                    ),
+                    size=settings.COPY_BUFFER_SIZE,
+                    sep="\v",
+                )
+
+    @staticmethod
+    def getPeggedDemands(
+        demands, opplans, deleted_opplans=None, database=DEFAULT_DB_ALIAS
+    ):
+        """
+        In an incremental export the pegging tree of a demand also changes
+        when an upstream operationplan changes or is deleted.
+        Deleted operationplans are no longer in memory: the demands pegged to
+        them are found in the pegging table.
+        """
+        import frepple
+
+        result = set(demands or [])
+        for o in opplans or []:
+            for j in o.pegging_demand:
+                result.add(j.demand)
+        if deleted_opplans:
+            with connections[database].cursor() as cursor:
+                cursor.execute(
+                    """
+                    select distinct demand from out_pegging
+                    where operationplan = any(%s)
+                    """,
+                    (list(deleted_opplans),),
+                )
+                for rec in cursor.fetchall():
+                    try:
+                        result.add(frepple.demand(name=rec[0], action="C"))
+                    except Exception:
+                        # The demand was deleted as well
+                        pass
+        return result
+
+
+@PlanTaskRegistry.register
+class ExportInventorySummary(PlanTask):
+    """
+    Precomputes the inventory report in the time buckets listed in the
+    parameter plan.inventorySummary, for a horizon of 1 year starting at the
+    current date.
+    """
+
+    description = ("Export plan", "Computing inventory summary")
+    # After the plan version is updated, which marks older summaries as stale
+    sequence = 406
+    export = True
+
+    @staticmethod
+    def getBuckets(database=DEFAULT_DB_ALIAS):
+        return [
+            b.strip()
+            for b in Parameter.getValue("plan.inventorySummary", database, "").split(
+                ","
+            )
+            if b.strip()
+        ]
+
+    @classmethod
+    def getWeight(cls, database=DEFAULT_DB_ALIAS, **kwargs):
+        if "supply" in os.environ and cls.getBuckets(database):
+            return 1
+        else:
+            return -1
+
+    @classmethod
+    def run(cls, cluster=-1, database=DEFAULT_DB_ALIAS, **kwargs):
+        import frepple
+        from freppledb.output.views.buffer import OverviewReport
+
+        with transaction.atomic(using=database):
+            with connections[database].cursor() as cursor:
+                buffers = OverviewReport.getBuffers().using(database)
+                if cluster == -1:
+                    cursor.execute("truncate table out_inventoryplan")
+                elif cluster == -2:
+                    # The report falls back to computing the inventory profile
+                    cursor.execute("truncate table out_inventoryplan")
+                    return
+                else:
+                    items = [i.name for i in frepple.items() if i.cluster in cluster]
+                    cursor.execute(
+                        "delete from out_inventoryplan where item = any(%s)", (items,)
+                    )
+                    buffers = buffers.filter(item__in=items)
+                basesql, baseparams = buffers.query.get_compiler(database).as_sql(
+                    with_col_aliases=False
+                )
+
+                current = frepple.settings.current
+                startdate = current.replace(hour=0, minute=0, second=0, microsecond=0)
+                enddate = startdate + timedelta(days=365)
+                for bucket in cls.getBuckets(database):
+                    backlogsql, backlogparams = OverviewReport.getBacklogQuery(
+                        basesql, baseparams, current
+                    )
+                    bucketsql, bucketparams = OverviewReport.getBucketQuery(
+                        basesql,
+                        baseparams,
+                        "1 asc",
+                        "",
+                        startdate,
+                        enddate,
+                        current,
+                        bucket,
+                    )
+                    cursor.execute(
+                        """
+                        insert into out_inventoryplan
+                          (item, location, batch, bucket, name, startdate, enddate,
+                           reportstartdate, currentdate, is_ip_buffer, startoh,
+                           safetystock, open_orders, net_forecast, reasons, ongoing,
+                           periodofcover, order_backlog, forecast_backlog, lastmodified)
+                        select
+                          t.item_id, t.location_id, coalesce(t.opplan_batch, ''),
+                          %%s, t.bucket, t.startdate, t.enddate, %%s, %%s,
+                          t.is_ip_buffer, t.startoh, t.safetystock, t.open_orders,
+                          t.net_forecast, t.reasons, t.ongoing, t.periodofcover,
+                          backlog.orders, backlog.forecast, now()
+                        from (%s) t
+                        left outer join (%s) backlog(item_id, location_id, batch, orders, forecast)
+                          on backlog.item_id = t.item_id
+                          and backlog.location_id = t.location_id
+                          and backlog.batch is not distinct from coalesce(t.opplan_batch, '')
+                        where not t.history
+                        """
+                        % (bucketsql, backlogsql),
+                        (bucket, startdate, current) + bucketparams + backlogparams,
+                    )
+                    logger.info(
+                        "Inventory summary: %d records in %s buckets"
+                        % (cursor.rowcount, bucket)
+                    )
+
+
+@PlanTaskRegistry.register
+class InvalidateWidgetCache(PlanTask):
+    """
+    Invalidates the cached results of the dashboard widgets.
+    """
+
+    description = ("Export plan", "Invalidating widget cache")
+    sequence = 405
+    export = True
+
+    @staticmethod
+    def getWeight(**kwargs):
+        return 0.1
+
+    @staticmethod
+    def run(database=DEFAULT_DB_ALIAS, **kwargs):
+        Dashboard.planChanged(database)
 
 
 @PlanTaskRegistry.register
@@ -92,3 +92,83 @@ class ResourceSummary(models.Model):
         )
         verbose_name_plural = "resource summaries"
         default_permissions = []
+
+
+class InventorySummary(models.Model):
+    """
+    Precomputed inventory profile of the buffers in time buckets, as shown in
+    the inventory report. It is filled at the end of the plan export.
+    """
+
+    item = models.CharField(_("item"), max_length=300)
+    location = models.CharField(_("location"), max_length=300)
+    batch = models.CharField(_("batch"), max_length=300, default="")
+    bucket = models.CharField(_("bucket"), max_length=300)
+    name = models.CharField(_("name"), max_length=300)
+    startdate = models.DateTimeField(_("start date"))
+    enddate = models.DateTimeField(_("end date"))
+    reportstartdate = models.DateTimeField(_("report start date"))
+    currentdate = models.DateTimeField(_("current date"))
+    is_ip_buffer = models.BooleanField(null=True)
+    startoh = models.JSONField(null=True)
+    safetystock = models.DecimalField(
+        _("safety stock"), max_digits=20, decimal_places=8, null=True
+    )
+    open_orders = models.DecimalField(
+        _("open orders"), max_digits=20, decimal_places=8, null=True
+    )
+    net_forecast = models.DecimalField(
+        _("net forecast"), max_digits=20, decimal_places=8, null=True
+    )
+    reasons = models.JSONField(null=True)
+    ongoing = models.JSONField(null=True)
+    periodofcover = models.IntegerField(_("period of cover"), null=True)
+    order_backlog = models.DecimalField(
+        _("order backlog"), max_digits=20, decimal_places=8, null=True
+    )
+    forecast_backlog = models.DecimalField(
+        _("forecast backlog"), max_digits=20, decimal_places=8, null=True
+    )
+    lastmodified = models.DateTimeField(_("last modified"))
+
+    class Meta:
+        db_table = "out_inventoryplan"
+        ordering = ["item", "location", "batch", "bucket", "startdate"]
+        indexes = [
+            models.Index(
+                fields=["item", "location", "batch", "bucket", "startdate"],
+                name="out_inventoryplan_idx",
+            ),
+            models.Index(
+                fields=["bucket", "reportstartdate", "currentdate"],
+                name="out_inventoryplan_bucket",
+            ),
+        ]
+        verbose_name = (
+            "inventory summary"  # No need to translate these since only used internally
+        )
+        verbose_name_plural = "inventory summaries"
+        default_permissions = []
+
+
+class DemandPegging(models.Model):
+    """
+    Upstream pegging tree of the demands, with a record for each operationplan
+    in the tree. It is filled during the plan export.
+    """
+
+    demand = models.CharField(_("demand"), max_length=300, db_index=True)
+    level = models.IntegerField(_("level"))
+    downstream = models.CharField(_("downstream"), max_length=300, null=True)
+    operationplan = models.CharField(_("operationplan"), max_length=300, db_index=True)
+    pegged_x = models.DecimalField(max_digits=20, decimal_places=8)
+    pegged_y = models.DecimalField(max_digits=20, decimal_places=8)
+    path = models.TextField()
+
+    class Meta:
+        db_table = "out_pegging"
+        verbose_name = (
+            "demand pegging"  # No need to translate these since only used internally
+        )
+        verbose_name_plural = "demand peggings"
+        default_permissions = []
@@ -21,9 +21,40 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-from django.test import TestCase
+from datetime import datetime, timedelta
+import json
+import os
+from time import time
+from types import SimpleNamespace
+from unittest import skipUnless
+from urllib.parse import quote
 
+from django.conf import settings
+from django.core import management
+from django.db import connection, DEFAULT_DB_ALIAS
+from django.test import TestCase, TransactionTestCase
+
+from freppledb.common.commands import (
+    clean_value,
+    CopyBinaryGenerator,
+    CopyFromGenerator,
+)
+from freppledb.common.dashboard import Dashboard
+from freppledb.common.models import Parameter
 from freppledb.common.tests import checkResponse
+from freppledb.input.models import (
+    Customer,
+    Demand,
+    Item,
+    ItemSupplier,
+    Location,
+    Operation,
+    OperationMaterial,
+    Supplier,
+)
+from freppledb.output.commands import ExportOperationPlans
+from freppledb.output.models import DemandPegging, InventorySummary
+from freppledb.output.views.buffer import OverviewReport
 
 
 class OutputTest(TestCase):
@@ -209,3 +240,364 @@ class OutputTest(TestCase):
                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
         )
+
+
+class InventorySummaryTest(TransactionTestCase):
+    fixtures = ["demo"]
+
+    def setUp(self):
+        os.environ["FREPPLE_TEST"] = "YES"
+        param = Parameter.objects.all().get_or_create(pk="plan.webservice")[0]
+        param.value = "false"
+        param.save()
+        self.client.login(username="admin", password="admin")
+        super().setUp()
+
+    def tearDown(self):
+        del os.environ["FREPPLE_TEST"]
+        super().tearDown()
+
+    def getReport(self):
+        response = self.client.get(
+            "/buffer/?format=json&buckets=week&horizontype=1&horizonunit=week"
+            "&horizonlength=8&horizonbefore=0"
+        )
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_inventory_summary(self):
+        # Inventory report computed from the plan
+        management.call_command("runplan", plantype=1, constraint=15, env="supply")
+        self.assertEqual(InventorySummary.objects.count(), 0)
+        computed = self.getReport()
+
+        # Inventory report read from the precomputed summary
+        param = Parameter.objects.all().get_or_create(pk="plan.inventorySummary")[0]
+        param.value = "week"
+        param.save()
+        management.call_command("runplan", plantype=1, constraint=15, env="supply")
+        self.assertGreater(InventorySummary.objects.count(), 0)
+        self.assertEqual(self.getReport(), computed)
+
+        # Any later change, eg to the forecast, marks the summary as stale
+        summary = InventorySummary.objects.first()
+        request = SimpleNamespace(
+            database=DEFAULT_DB_ALIAS,
+            report_bucket=summary.bucket,
+            report_startdate=summary.reportstartdate,
+            report_enddate=summary.reportstartdate + timedelta(days=7),
+        )
+        self.assertTrue(OverviewReport.useSummary(request, summary.currentdate))
+        Dashboard.planChanged()
+        self.assertFalse(OverviewReport.useSummary(request, summary.currentdate))
+
+
+# Recursive query that computed the pegging tree of a demand from the json
+# fields of the operationplans, before the pegging was exported to a table
+legacyPeggingQuery = """
+    with recursive cte as
+    (
+    select 1 as level,
+    (coalesce(operationplan.item_id,'')||'/'||operationplan.reference)::varchar as path,
+    operationplan.reference::text,
+    0::numeric as pegged_x,
+    operationplan.quantity::numeric as pegged_y,
+    operationplan.owner_id
+    from operationplan
+    inner join demand on demand.name = %s
+        inner join lateral
+        (select t->>'opplan' as reference,
+        (t->>'quantity')::numeric as quantity from jsonb_array_elements(demand.plan->'pegging') t) t on true
+        where operationplan.reference = t.reference
+    union all
+    select case when upstream_opplan.owner_id = cte.owner_id then cte.level else cte.level+1 end,
+    cte.path||'/'||coalesce(upstream_opplan.item_id,'')||'/'||upstream_opplan.reference,
+    t1.upstream_reference::text,
+    greatest(t1.x, t1.x + (t1.y-t1.x)/(t2.y-t2.x)*(cte.pegged_x-t2.x)) as pegged_x,
+    least(t1.y, t1.x + (t1.y-t1.x)/(t2.y-t2.x)*(cte.pegged_x-t2.x) + (cte.pegged_y-cte.pegged_x)*(t1.y-t1.x)/(t2.y-t2.x)) as pegged_y,
+    upstream_opplan.owner_id
+    from operationplan
+    inner join cte on cte.reference = operationplan.reference
+    inner join lateral
+    (select t->>0 upstream_reference,
+    (t->>1)::numeric + (t->>2)::numeric as y,
+    (t->>2)::numeric as x from jsonb_array_elements(operationplan.plan->'upstream_opplans') t) t1 on true
+    inner join operationplan upstream_opplan on upstream_opplan.reference = t1.upstream_reference
+    inner join lateral
+    (select t->>0 downstream_reference,
+    (t->>1)::numeric+(t->>2)::numeric as y,
+    (t->>2)::numeric as x from jsonb_array_elements(upstream_opplan.plan->'downstream_opplans') t) t2
+        on t2.downstream_reference = operationplan.reference and numrange(t2.x,t2.y) && numrange(cte.pegged_x,cte.pegged_y)
+    )
+    select level, reference, round(pegged_y-pegged_x, 6), path from cte
+    where level < 25
+    order by path, level desc
+    """
+
+peggingQuery = """
+    select level, operationplan, round(pegged_y-pegged_x, 6), path
+    from out_pegging
+    where demand = %s
+    order by path, level desc
+    """
+
+
+class PeggingTest(TransactionTestCase):
+    fixtures = ["demo"]
+
+    def setUp(self):
+        os.environ["FREPPLE_TEST"] = "YES"
+        param = Parameter.objects.all().get_or_create(pk="plan.webservice")[0]
+        param.value = "false"
+        param.save()
+        self.client.login(username="admin", password="admin")
+        super().setUp()
+
+    def tearDown(self):
+        del os.environ["FREPPLE_TEST"]
+        super().tearDown()
+
+    def test_pegging_table(self):
+        management.call_command("runplan", plantype=1, constraint=15, env="supply")
+        self.assertGreater(DemandPegging.objects.count(), 0)
+        with connection.cursor() as cursor:
+            for name in Demand.objects.values_list("name", flat=True):
+                cursor.execute(legacyPeggingQuery, (name,))
+                legacy = sorted(cursor.fetchall())
+                cursor.execute(peggingQuery, (name,))
+                self.assertEqual(sorted(cursor.fetchall()), legacy)
+        response = self.client.get("/demandpegging/Demand%2001/?format=json")
+        checkResponse(self, response)
+
+
+@skipUnless("FREPPLE_BENCHMARK" in os.environ, "Benchmarks not requested")
+class PeggingBenchmark(TransactionTestCase):
+    """
+    Compares the time to read the pegging tree of a demand from the pegging
+    table with the recursive query on the json fields of the operationplans,
+    using a bill of material with 10 levels.
+
+    Run with:
+      FREPPLE_BENCHMARK=100 ./frepplectl.py test freppledb.output.tests.PeggingBenchmark
+    """
+
+    levels = 10
+
+    def setUp(self):
+        os.environ["FREPPLE_TEST"] = "YES"
+        try:
+            self.size = int(os.environ["FREPPLE_BENCHMARK"])
+        except ValueError:
+            self.size = 100
+        param = Parameter.objects.all().get_or_create(pk="plan.webservice")[0]
+        param.value = "false"
+        param.save()
+        self.client.login(username="admin", password="admin")
+        location = Location.objects.create(name="bench location")
+        customer = Customer.objects.create(name="bench customer")
+        supplier = Supplier.objects.create(name="bench supplier")
+        items = [
+            Item.objects.create(name="bench item %s" % i)
+            for i in range(self.levels + 1)
+        ]
+        for i in range(self.levels):
+            operation = Operation.objects.create(
+                name="bench operation %s" % i,
+                type="fixed_time",
+                item=items[i],
+                location=location,
+                duration=timedelta(days=1),
+            )
+            OperationMaterial.objects.create(
+                operation=operation, item=items[i + 1], quantity=-2, type="start"
+            )
+        ItemSupplier.objects.create(
+            item=items[self.levels],
+            location=location,
+            supplier=supplier,
+            leadtime=timedelta(days=7),
+        )
+        now = datetime.now()
+        Demand.objects.bulk_create(
+            [
+                Demand(
+                    name="bench demand %s" % i,
+                    item=items[0],
+                    location=location,
+                    customer=customer,
+                    due=now + timedelta(days=30 + i % 100),
+                    quantity=1 + i % 5,
+                    priority=10,
+                    status="open",
+                )
+                for i in range(self.size)
+            ]
+        )
+        super().setUp()
+
+    def tearDown(self):
+        del os.environ["FREPPLE_TEST"]
+        super().tearDown()
+
+    def _run(self, query, names):
+        start = time()
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(query, (name,))
+                cursor.fetchall()
+        return (time() - start) / len(names)
+
+    def test_pegging_report(self):
+        management.call_command("runplan", plantype=1, constraint=15, env="supply")
+        names = list(
+            Demand.objects.filter(name__startswith="bench").values_list(
+                "name", flat=True
+            )
+        )
+        legacy = self._run(legacyPeggingQuery, names)
+        table = self._run(peggingQuery, names)
+        start = time()
+        for name in names:
+            response = self.client.get("/demandpegging/%s/?format=json" % quote(name))
+            checkResponse(self, response)
+        report = (time() - start) / len(names)
+        print(
+            "\nPegging of %d demands on a %d level bill of material: "
+            "%.2f ms with the recursive query, %.2f ms with the pegging table, "
+            "%.2f ms for the complete report"
+            % (len(names), self.levels, legacy * 1000, table * 1000, report * 1000)
+        )
+
+
+@skipUnless("FREPPLE_BENCHMARK" in os.environ, "Benchmarks not requested")
+class ExportBenchmark(TransactionTestCase):
+    """
+    Compares the throughput of the text and binary copy formats for the
+    export of operationplans, using a synthetic plan.
+
+    Run with:
+      FREPPLE_BENCHMARK=1000000 ./frepplectl.py test freppledb.output.tests.ExportBenchmark
+    """
+
+    def setUp(self):
+        try:
+            self.size = int(os.environ["FREPPLE_BENCHMARK"])
+        except ValueError:
+            self.size = 1000000
+        # The synthetic plan has no custom attributes
+        self.attrs = getattr(ExportOperationPlans, "attrs", None)
+        ExportOperationPlans.attrs = []
+        super().setUp()
+
+    def tearDown(self):
+        if self.attrs is None:
+            del ExportOperationPlans.attrs
+        else:
+            ExportOperationPlans.attrs = self.attrs
+        super().tearDown()
+
+    def getData(self):
+        now = datetime.now()
+        for i in range(self.size):
+            yield [
+                "operation %s" % (i % 100),
+                "MO",
+                "proposed",
+                round(i % 7 + 0.5, 8),
+                now + timedelta(hours=i),
+                now + timedelta(hours=i + 8),
+                round(i % 999 * 1.0, 8),
+                i % 3600 * 1.0,
+                '{"pegging": {"demand %s": 1}}' % (i % 1000),
+                None,
+                now,
+                "operation %s" % (i % 100),
+                None,
+                "item %s" % (i % 100),
+                None,
+                None,
+                "location",
+                None,
+                None,
+                None,
+                None,
+                str(i),
+                None,
+                None,
+            ]
+
+    def _run(self, binary):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "create temporary table tmp_operationplan "
+                "(like operationplan including defaults)"
+            )
+            cursor.execute(
+                "alter table tmp_operationplan drop column if exists forecast"
+            )
+            columns = [
+                "name",
+                "type",
+                "status",
+                "quantity",
+                "startdate",
+                "enddate",
+                "criticality",
+                "delay",
+                "plan",
+                "source",
+                "lastmodified",
+                "operation_id",
+                "owner_id",
+                "item_id",
+                "destination_id",
+                "origin_id",
+                "location_id",
+                "supplier_id",
+                "demand_id",
+                "due",
+                "color",
+                "reference",
+                "batch",
+                "quantity_completed",
+            ]
+            start = time()
+            if binary:
+                cursor.copy_expert(
+                    "copy tmp_operationplan (%s) from stdin with (format binary)"
+                    % ",".join(columns),
+                    CopyBinaryGenerator(
+                        self.getData(),
+                        ExportOperationPlans.getTypes(False, delay="interval"),
+                    ),
+                    size=settings.COPY_BUFFER_SIZE,
+                )
+            else:
+                cursor.copy_from(
+                    CopyFromGenerator(
+                        "\v".join(
+                            str(
+                                clean_value(v) if v is None or isinstance(v, str) else v
+                            )
+                            for v in data
+                        )
+                        + "\n"
+                        for data in self.getData()
+                    ),
+                    table="tmp_operationplan",
+                    size=settings.COPY_BUFFER_SIZE,
+                    sep="\v",
+                    columns=columns,
+                )
+            duration = time() - start
+            cursor.execute("select count(*) from tmp_operationplan")
+            self.assertEqual(cursor.fetchone()[0], self.size)
+            cursor.execute("drop table tmp_operationplan")
+        return duration
+
+    def test_export_operationplans(self):
+        text = self._run(binary=False)
+        binary = self._run(binary=True)
+        print(
+            "\nExporting %d operationplans: %.0f rows/sec in text format, %.0f rows/sec in binary format"
+            % (self.size, self.size / text, self.size / binary)
+        )
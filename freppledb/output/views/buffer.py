@@ -32,6 +32,7 @@ from django.utils.text import format_lazy
 from django.utils.translation import gettext_lazy as _
 
 from freppledb.boot import getAttributeFields
+from freppledb.common.dashboard import Dashboard
 from freppledb.input.models import Buffer, Item, Location, OperationPlanMaterial
 from freppledb.common.report import (
     GridPivot,
@@ -80,7 +81,16 @@ class OverviewReport(GridPivot):
                     location = i_b_l[2]
                     batch = i_b_l[1]
 
-        request.basequeryset = OperationPlanMaterial.objects.values(
+        request.basequeryset = reportclass.getBuffers(item, location, batch)
+
+        return request.basequeryset
+
+    @staticmethod
+    def getBuffers(item=None, location=None, batch=None):
+        """
+        Returns a queryset with the buffers shown in the report.
+        """
+        query = OperationPlanMaterial.objects.values(
             "item", "location", "item__type"
         ).filter(
             ((Q(item__type="make to stock") | Q(item__type__isnull=True)))
@@ -88,17 +98,15 @@ class OverviewReport(GridPivot):
         )
 
         if item:
-            request.basequeryset = request.basequeryset.filter(item=item)
+            query = query.filter(item=item)
 
         if location:
-            request.basequeryset = request.basequeryset.filter(location=location)
+            query = query.filter(location=location)
 
         if batch:
-            request.basequeryset = request.basequeryset.filter(
-                operationplan__batch=batch
-            )
+            query = query.filter(operationplan__batch=batch)
 
-        request.basequeryset = request.basequeryset.annotate(
+        query = query.annotate(
             buffer=RawSQL(
                 "operationplanmaterial.item_id || "
                 "(case when item.type is distinct from 'make to order' then '' else ' @ ' || operationplan.batch end) "
@@ -110,8 +118,7 @@ class OverviewReport(GridPivot):
                 (),
             ),
         ).distinct()
-
-        return request.basequeryset
+        return query
 
     model = OperationPlanMaterial
     default_sort = (1, "asc", 2, "asc")
@@ -597,20 +604,17 @@ class OverviewReport(GridPivot):
             return {"withforecast": "freppledb.forecast" in settings.INSTALLED_APPS}
 
     @classmethod
-    def query(reportclass, request, basequery, sortsql="1 asc"):
-        basesql, baseparams = basequery.query.get_compiler(basequery.db).as_sql(
-            with_col_aliases=False
-        )
-
-        # Execute a query to get the backlog at the start of the horizon
-        startbacklogdict = {}
-
+    def getBacklogQuery(reportclass, basesql, baseparams, startdate):
+        """
+        Returns the query and its arguments to compute the backlog of each
+        buffer at a date.
+        """
         # code assumes no max lateness is set to calculate the backlog
         # forecast knows nothing about batch so all is counted as backlog
 
         backlog_fcst = """
             union all
-          select opm.item_id, opm.location_id, '' as batch, 0::numeric qty_orders, coalesce(sum((forecastplan.value->>'forecastnet')::numeric),0) qty_forecast
+          select opm.item_id, opm.location_id, '' as batch, 0::numeric qty_orders, coalesce(sum(forecastplan.forecastnet),0) qty_forecast
           from forecastplan
           left outer join common_parameter cp on cp.name = 'forecast.DueWithinBucket'
           inner join (%s) opm on forecastplan.item_id = opm.item_id
@@ -698,37 +702,32 @@ class OverviewReport(GridPivot):
             if "freppledb.forecast" in settings.INSTALLED_APPS
             else deliveries_no_fcst,
         )
+        fcst = "freppledb.forecast" in settings.INSTALLED_APPS
+        return (
+            query,
+            baseparams
+            + (startdate,)
+            + baseparams
+            + (startdate,)
+            + (baseparams + (startdate,) if fcst else ()),
+        )
 
-        with transaction.atomic(using=request.database):
-            with connections[request.database].chunked_cursor() as cursor_chunked:
-                current_date = datetime.strptime(
-                    request.current_date, "%Y-%m-%d %H:%M:%S"
-                )
-                cursor_chunked.execute(
-                    query,
-                    baseparams
-                    + (max(request.report_startdate, current_date),)
-                    + baseparams
-                    + (max(request.report_startdate, current_date),)
-                    + (
-                        baseparams
-                        if "freppledb.forecast" in settings.INSTALLED_APPS
-                        else ()
-                    )
-                    + (
-                        (max(request.report_startdate, current_date),)
-                        if "freppledb.forecast" in settings.INSTALLED_APPS
-                        else ()
-                    ),
-                )
-
-                for row in cursor_chunked:
-                    if row[0]:
-                        startbacklogdict[(row[0], row[1], row[2])] = (
-                            max(float(row[3] or 0), 0),
-                            max(float(row[4] or 0), 0),
-                        )
-        # Execute the actual query
+    @classmethod
+    def getBucketQuery(
+        reportclass,
+        basesql,
+        baseparams,
+        sortsql,
+        attr_sql,
+        startdate,
+        enddate,
+        currentdate,
+        bucket,
+    ):
+        """
+        Returns the query and its arguments to compute the inventory profile
+        of each buffer in the time buckets.
+        """
         reasons_forecast = """
                 union all
                 select distinct out_constraint.name, out_constraint.owner
@@ -739,7 +738,7 @@ class OverviewReport(GridPivot):
                 and operationplan.due < d.enddate
                 """
         net_forecast = """
-        (select sum((forecastplan.value->>'forecastnet')::numeric)
+        (select sum(forecastplan.forecastnet)
             from forecastplan
             left outer join common_parameter cp on cp.name = 'forecast.DueWithinBucket'
             where forecastplan.item_id = item.name and forecastplan.location_id = location.name
@@ -1070,26 +1069,190 @@ class OverviewReport(GridPivot):
            arguments.report_currentdate
            order by %s, d.startdate
         """ % (
-            reportclass.attr_sql,
+            attr_sql,
             net_forecast if "freppledb.forecast" in settings.INSTALLED_APPS else "0",
             reasons_forecast if "freppledb.forecast" in settings.INSTALLED_APPS else "",
             basesql,
             sortsql,
         )
+        return query, (startdate, enddate, currentdate, bucket) + baseparams
+
+    @classmethod
+    def useSummary(reportclass, request, current_date):
+        """
+        Checks whether the inventory summary precomputed during the plan
+        export covers the time buckets of the request, and whether it is
+        more recent than the last change to the data it depends on.
+        The forecastplan table doesn't have a last modified field. Changes
+        to the forecast are detected from the plan version instead, which
+        is based on the clock and updated on every edit.
+        """
+        version = Dashboard.getPlanVersion(request.database)
+        with connections[request.database].cursor() as cursor:
+            cursor.execute(
+                """
+                select
+                  min(lastmodified), max(enddate),
+                  (extract(epoch from min(lastmodified)) * 1000000)::bigint
+                from out_inventoryplan
+                where bucket = %s and reportstartdate = %s and currentdate = %s
+                """,
+                (request.report_bucket, request.report_startdate, current_date),
+            )
+            lastmodified, enddate, computed = cursor.fetchone()
+            if not lastmodified or enddate < request.report_enddate:
+                return False
+            if version and version > computed:
+                return False
+            cursor.execute(
+                """
+                select
+                  exists (select 1 from operationplan where lastmodified > %s)
+                  or exists (select 1 from demand where lastmodified > %s)
+                  or exists (select 1 from buffer where lastmodified > %s)
+                  or exists (select 1 from calendarbucket where lastmodified > %s)
+                  or exists (select 1 from item where lastmodified > %s)
+                """,
+                (lastmodified,) * 5,
+            )
+            return not cursor.fetchone()[0]
+
+    @classmethod
+    def getSummaryBacklogQuery(reportclass, basesql, baseparams, bucket):
+        """
+        Returns the query and its arguments to read the backlog at the start
+        of the horizon from the inventory summary.
+        """
+        query = """
+            select distinct on (s.item, s.location, s.batch)
+              s.item, s.location, s.batch, s.order_backlog, s.forecast_backlog
+            from (%s) opplanmat
+            inner join out_inventoryplan s
+              on s.item = opplanmat.item_id
+              and s.location = opplanmat.location_id
+              and s.batch = coalesce(opplanmat.opplan_batch, '')
+              and s.bucket = %%s
+            order by s.item, s.location, s.batch
+            """ % (
+            basesql,
+        )
+        return query, baseparams + (bucket,)
+
+    @classmethod
+    def getSummaryQuery(
+        reportclass, basesql, baseparams, sortsql, startdate, enddate, bucket
+    ):
+        """
+        Returns the query and its arguments to read the inventory profile
+        from the inventory summary. The fields are the same as the ones of
+        the getBucketQuery method.
+        """
+        query = """
+           select
+           opplanmat.buffer,
+           item.name item_id,
+           location.name location_id,
+           item.description,
+           item.type,
+           item.category,
+           item.subcategory,
+           item.cost,
+           item.volume,
+           item.weight,
+           item.uom,
+           item.periodofcover,
+           item.owner_id,
+           item.source,
+           item.lastmodified,
+           location.description,
+           location.category,
+           location.subcategory,
+           location.available_id,
+           location.owner_id,
+           location.source,
+           location.lastmodified,
+           opplanmat.opplan_batch,
+           s.is_ip_buffer,
+           %s
+           s.open_orders,
+           s.net_forecast,
+           'not implemented' expiring,
+           s.reasons,
+           s.startoh,
+           s.name,
+           s.startdate,
+           s.enddate,
+           false as history,
+           s.safetystock,
+           s.ongoing,
+           s.periodofcover
+           from (%s) opplanmat
+           inner join item on item.name = opplanmat.item_id
+           inner join location on location.name = opplanmat.location_id
+           inner join out_inventoryplan s
+             on s.item = opplanmat.item_id
+             and s.location = opplanmat.location_id
+             and s.batch = coalesce(opplanmat.opplan_batch, '')
+             and s.bucket = %%s
+             and s.enddate > %%s
+             and s.startdate < %%s
+           order by %s, s.startdate
+           """ % (
+            reportclass.attr_sql,
+            basesql,
+            sortsql,
+        )
+        return query, baseparams + (bucket, startdate, enddate)
+
+    @classmethod
+    def query(reportclass, request, basequery, sortsql="1 asc"):
+        basesql, baseparams = basequery.query.get_compiler(basequery.db).as_sql(
+            with_col_aliases=False
+        )
+        current_date = datetime.strptime(request.current_date, "%Y-%m-%d %H:%M:%S")
+        if reportclass.useSummary(request, current_date):
+            backlogquery, backlogparams = reportclass.getSummaryBacklogQuery(
+                basesql, baseparams, request.report_bucket
+            )
+            query, params = reportclass.getSummaryQuery(
+                basesql,
+                baseparams,
+                sortsql,
+                request.report_startdate,
+                request.report_enddate,
+                request.report_bucket,
+            )
+        else:
+            backlogquery, backlogparams = reportclass.getBacklogQuery(
+                basesql, baseparams, max(request.report_startdate, current_date)
+            )
+            query, params = reportclass.getBucketQuery(
+                basesql,
+                baseparams,
+                sortsql,
+                reportclass.attr_sql,
+                request.report_startdate,
+                request.report_enddate,
+                request.current_date,
+                request.report_bucket,
+            )
+
+        # Execute a query to get the backlog at the start of the horizon
+        startbacklogdict = {}
+        with transaction.atomic(using=request.database):
+            with connections[request.database].chunked_cursor() as cursor_chunked:
+                cursor_chunked.execute(backlogquery, backlogparams)
+                for row in cursor_chunked:
+                    if row[0]:
+                        startbacklogdict[(row[0], row[1], row[2])] = (
+                            max(float(row[3] or 0), 0),
+                            max(float(row[4] or 0), 0),
+                        )
 
         # Build the python result
         with transaction.atomic(using=request.database):
             with connections[request.database].chunked_cursor() as cursor_chunked:
-                cursor_chunked.execute(
-                    query,
-                    (
-                        request.report_startdate,
-                        request.report_enddate,
-                        request.current_date,
-                        request.report_bucket,
-                    )
-                    + baseparams,
-                )
+                cursor_chunked.execute(query, params)
                 itemattributefields = getAttributeFields(
                     Item, related_name_prefix="item"
                 )
@@ -50,6 +50,7 @@ class LateOrdersWidget(Widget):
     tooltip = _("Shows orders that will be delivered after their due date")
     permissions = (("view_problem_report", "Can view problem report"),)
     asynchronous = True
+    cache = True
     url = "/problem/?noautofilter&entity=demand&name=late&sord=asc&sidx=startdate"
     exporturl = True
     limit = 20
@@ -136,6 +137,7 @@ class ShortOrdersWidget(Widget):
     tooltip = _("Shows orders that are not planned completely")
     permissions = (("view_problem_report", "Can view problem report"),)
     asynchronous = True
+    cache = True
     # Note the gte filter lets pass "short" and "unplanned", and filters out
     # "late" and "early".
     url = "/problem/?noautofilter&entity=demand&name__gte=short&sord=asc&sidx=startdate"
@@ -216,6 +218,7 @@ class ManufacturingOrderWidget(Widget):
     tooltip = _("Shows manufacturing orders by start date")
     permissions = (("view_problem_report", "Can view problem report"),)
     asynchronous = True
+    cache = True
     url = "/data/input/manufacturingorder/?noautofilter&sord=asc&sidx=startdate&status__in=proposed,confirmed,approved"
     exporturl = True
     fence1 = 7
@@ -532,6 +535,7 @@ class DistributionOrderWidget(Widget):
     tooltip = _("Shows distribution orders by start date")
     permissions = (("view_problem_report", "Can view problem report"),)
     asynchronous = True
+    cache = True
     url = "/data/input/distributionorder/?noautofilter&sord=asc&sidx=startdate&status__in=proposed,confirmed"
     exporturl = True
     fence1 = 7
@@ -848,6 +852,7 @@ class PurchaseOrderWidget(Widget):
     tooltip = _("Shows purchase orders by ordering date")
     permissions = (("view_problem_report", "Can view problem report"),)
     asynchronous = True
+    cache = True
     url = "/data/input/purchaseorder/?sord=asc&sidx=startdate&status__in=proposed,confirmed,approved"
     exporturl = True
     fence1 = 7
@@ -1246,6 +1251,7 @@ class PurchaseQueueWidget(Widget):
     tooltip = _("Display a list of new purchase orders")
     permissions = (("view_purchaseorder", "Can view purchase orders"),)
     asynchronous = True
+    cache = True
     url = "/data/input/purchaseorder/?noautofilter&status=proposed&sidx=startdate&sord=asc"
     exporturl = True
     limit = 20
@@ -1306,6 +1312,7 @@ class DistributionQueueWidget(Widget):
     tooltip = _("Display a list of new distribution orders")
     permissions = (("view_distributionorder", "Can view distribution order"),)
     asynchronous = True
+    cache = True
     url = "/data/input/distributionorder/?noautofilter&status=proposed&sidx=startdate&sord=asc"
     exporturl = True
     limit = 20
@@ -1368,6 +1375,7 @@ class ShippingQueueWidget(Widget):
     tooltip = _("Display a list of new distribution orders")
     permissions = (("view_distributionorder", "Can view distribution order"),)
     asynchronous = True
+    cache = True
     url = "/data/input/distributionorder/?noautofilter&sidx=plandate&sord=asc"
     exporturl = True
     limit = 20
@@ -1430,6 +1438,7 @@ class ResourceQueueWidget(Widget):
     tooltip = _("Display planned activities for the resources")
     permissions = (("view_resource_report", "Can view resource report"),)
     asynchronous = True
+    cache = True
     url = "/data/input/operationplanresource/?sidx=operatiopnplan__startdate&sord=asc"
     exporturl = True
     limit = 20
@@ -1510,6 +1519,7 @@ class PurchaseAnalysisWidget(Widget):
     tooltip = _("Analyse the urgency of existing purchase orders")
     permissions = (("view_purchaseorder", "Can view purchase orders"),)
     asynchronous = True
+    cache = True
     url = "/data/input/purchaseorder/?noautofilter&status=confirmed&sidx=color&sord=asc"
     limit = 20
 
@@ -1567,6 +1577,7 @@ class AlertsWidget(Widget):
     tooltip = _("Overview of all alerts in the plan")
     permissions = (("view_problem_report", "Can view problem report"),)
     asynchronous = True
+    cache = True
     url = "/problem/"
     entities = "material,capacity,demand,operation"
 
@@ -1653,6 +1664,7 @@ class ResourceLoadWidget(Widget):
     tooltip = _("Shows the resources with the highest utilization")
     permissions = (("view_resource_report", "Can view resource report"),)
     asynchronous = True
+    cache = True
     url = "/resource/"
     exporturl = True
     limit = 5
@@ -1759,6 +1771,7 @@ class InventoryByLocationWidget(Widget):
     title = _("inventory by location")
     tooltip = _("Display the locations with the highest inventory value")
     asynchronous = True
+    cache = True
     limit = 5
 
     def args(self):
@@ -1849,6 +1862,7 @@ class InventoryByItemWidget(Widget):
     title = _("inventory by item")
     tooltip = _("Display the items with the highest inventory value")
     asynchronous = True
+    cache = True
     limit = 20
 
     def args(self):
@@ -1939,6 +1953,7 @@ class DeliveryPerformanceWidget(Widget):
         "Shows the percentage of demands that are planned to be shipped completely on time"
     )
     asynchronous = True
+    cache = True
     green = 90
     yellow = 80
 
@@ -34,7 +34,7 @@ from django.utils.timezone import now
 from django.db import transaction
 
 from freppledb import __version__
-from freppledb.common.models import User, Parameter
+from freppledb.common.models import User, Parameter, ParameterCache
 from freppledb.execute.models import Task
  
 from ...utils import getERPconnection
@@ -1084,6 +1084,8 @@ class Command(BaseCommand):
                 self.error_count += 1
         with transaction.atomic(using=self.database):
             Parameter.objects.bulk_create(objects_to_create, ignore_conflicts=True, batch_size=100000)
+            # The bulk insert doesn't send the signals that refresh the parameter cache
+            ParameterCache.invalidate(self.database)
             for object_current in objects_to_update:
                 object_current.save()
 
@@ -555,6 +555,16 @@ DEFAULT_DASHBOARD = [
 # Memory cache
 CACHE_GRID_COUNT = None
 CACHE_PIVOT_COUNT = None
+# Number of seconds the result of a dashboard widget is cached. The cache is
+# invalidated when the plan is exported or data is edited in the user interface.
+# With multiple web server processes, configure a shared cache backend below.
+# Use None to disable the widget cache.
+CACHE_WIDGET = 3600
+# Number of seconds the scenario specific settings of the users are cached.
+# A cached entry is discarded by all web server processes when a user is saved,
+# when scenario access changes and when the scenario is refreshed.
+# Use 0 to disable the cache.
+CACHE_SCENARIO_USERS = 300
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
@@ -572,6 +582,10 @@ MAXCPUTIME = None  # limit in seconds, use None for unlimited
 # Max total log files size in MB, if the limit is reached deletes the oldest.
 MAXTOTALLOGFILESIZE = 200
 
+# Number of tasks the worker of a scenario runs at the same time.
+# Only tasks that declare they can run next to others use the extra slots.
+WORKER_SLOTS = 4
+
 # Google analytics code to report usage statistics to.
 # The default value of None disables this feature.
 GOOGLE_ANALYTICS = None
@@ -581,6 +595,12 @@ GOOGLE_ANALYTICS = None
 CACHE_MAXIMUM = 1000000
 CACHE_THREADS = 1
 
+# Size in bytes of the chunks we send to PostgreSQL when exporting the plan
+# with a COPY command, and a flag to use the binary COPY format instead of
+# the text format for the largest tables.
+COPY_BUFFER_SIZE = 65536
+COPY_BINARY = False
+
 # Adress and port number for the runwebserver command, the Windows system tray
 # executable and the Windows service
 ADDRESS = "0.0.0.0"
@@ -22,10 +22,12 @@
 #
 
 import asyncio
+import logging
 import os
 import portend
 import sys
 
+from channels.db import database_sync_to_async
 from django.conf import settings
 from django.db import DEFAULT_DB_ALIAS
 
@@ -33,7 +35,11 @@ from freppledb.common.auth import getWebserviceAuthorization
 from freppledb.common.commands import PlanTaskRegistry
 from freppledb.common.models import Parameter
 
-# Only a single service can be making updates at the same time
+logger = logging.getLogger(__name__)
+
+# Only a single service can be making updates at the same time.
+# The lock protects the plan in memory. Services that only read data or
+# only access the database don't need it.
 try:
     lock = asyncio.Lock()
 except Exception:
@@ -163,3 +169,112 @@ def createSolvers(loglevel=2, database=DEFAULT_DB_ALIAS):
         fcst_solver = createForecastSolver(database)
         if fcst_solver:
             fcst_solver.loglevel = loglevel
+
+
+class PlanSaver:
+    """
+    Saves the plan changes of the web service requests in the database.
+
+    A request updates the plan in memory while holding the lock, and then
+    registers the keys of the changed objects with the save method. The
+    database export runs after the request released the lock. Requests that
+    arrive while an export is running are merged into a single next export.
+
+    The export reads the plan in memory, so it holds the lock while it runs.
+    """
+
+    # Time to wait for other requests to join a batch, in seconds
+    delay = 0.05
+
+    # Batches waiting to be exported, per database
+    _pending = {}
+
+    # Only one export at a time
+    _exporting = None
+
+    @classmethod
+    async def save(
+        cls,
+        database=DEFAULT_DB_ALIAS,
+        deleted_opplans=(),
+        opplans=(),
+        resources=(),
+        buffers=(),
+        demands=(),
+    ):
+        """
+        Adds changes to the next export and waits till they are saved.
+        The changed objects are identified by their reference or name.
+        An exception is raised when the export fails.
+        """
+        batch = cls._pending.get(database, None)
+        if not batch:
+            batch = {
+                "deleted_opplans": set(),
+                "opplans": set(),
+                "resources": set(),
+                "buffers": set(),
+                "demands": set(),
+                "done": asyncio.get_running_loop().create_future(),
+            }
+            cls._pending[database] = batch
+            asyncio.create_task(cls._export(database, batch))
+        batch["deleted_opplans"].update(deleted_opplans)
+        batch["opplans"].difference_update(deleted_opplans)
+        batch["opplans"].update(i for i in opplans if i not in deleted_opplans)
+        batch["resources"].update(resources)
+        batch["buffers"].update(buffers)
+        batch["demands"].update(demands)
+        await asyncio.shield(batch["done"])
+
+    @classmethod
+    async def _export(cls, database, batch):
+        if not cls._exporting:
+            cls._exporting = asyncio.Lock()
+        try:
+            async with cls._exporting:
+                await asyncio.sleep(cls.delay)
+                # From now on new changes go into the next batch
+                if cls._pending.get(database, None) is batch:
+                    del cls._pending[database]
+                async with lock:
+                    await cls._run(database, batch)
+            batch["done"].set_result(True)
+        except Exception as e:
+            logger.error("Error saving plan: %s" % e)
+            batch["done"].set_exception(e)
+
+    @staticmethod
+    @database_sync_to_async
+    def _run(database, batch):
+        import frepple
+
+        def lookup(keys, finder):
+            # Objects deleted in the meantime are skipped
+            result = set()
+            for k in keys:
+                try:
+                    result.add(finder(k))
+                except Exception:
+                    pass
+            return result
+
+        PlanTaskRegistry.run(
+            export=1,
+            cluster=-2,
+            database=database,
+            deleted_opplans=batch["deleted_opplans"],
+            opplans=lookup(
+                batch["opplans"],
+                lambda k: frepple.operationplan(reference=k, action="C"),
+            ),
+            resources=lookup(
+                batch["resources"], lambda k: frepple.resource(name=k, action="C")
+            ),
+            buffers=lookup(
+                batch["buffers"], lambda k: frepple.buffer(name=k, action="C")
+            ),
+            demands=lookup(
+                batch["demands"], lambda k: frepple.demand(name=k, action="C")
+            ),
+        )
@@ -10243,6 +10243,40 @@ PyObject* readXMLfile(PyObject*, PyObject*);
  */
 PyObject* readXMLdata(PyObject*, PyObject*);
 
+/* This Python function is used for processing XML input data from a
+ * Python file-like object, such as an open file, a network response or a
+ * gzip.GzipFile wrapping one of these.
+ * The data is read in blocks as the parser progresses, so the complete
+ * document is never held in memory.
+ *
+ * The function takes up to five arguments:
+ *   - Object with a read() method returning bytes
+ *   - Optional validate flag, defining whether or not the input data needs to
+ * be validated against the XML schema definition.
+ *   - Optional validate_only flag, which allows us to validate the data but
+ *     skip any processing.
+ *   - Optional loglevel flag, which writes out a verbose trace of the parsing.
+ *   - Optional user exit function.
+ */
+PyObject* readXMLstream(PyObject*, PyObject*);
+
+/* This Python function creates or updates a batch of objects in a single
+ * call, avoiding the overhead of a Python constructor call per object.
+ *
+ * The function takes three arguments:
+ *   - The Python type to instantiate, eg frepple.demand.
+ *   - A sequence of column names. A column can also be passed as a tuple
+ *     (name, type) to indicate the value is the name of an entity of that
+ *     type, eg ("item", frepple.item). Such references are looked up once
+ *     per call and cached.
+ *   - An iterable of rows, each row being a sequence with a value for each
+ *     column. None values are skipped.
+ *
+ * Errors on individual rows are logged and don't abort the load.
+ * The function returns the number of rows loaded successfully.
+ */
+PyObject* bulkLoad(PyObject*, PyObject*);
+
 /* This Python function writes the dynamic part of the plan to an text
  * file.
  *
@@ -39,10 +39,12 @@
 #include <xercesc/framework/MemBufInputSource.hpp>
 #include <xercesc/framework/StdInInputSource.hpp>
 #include <xercesc/framework/URLInputSource.hpp>
+#include <xercesc/sax/InputSource.hpp>
 #include <xercesc/sax2/Attributes.hpp>
 #include <xercesc/sax2/DefaultHandler.hpp>
 #include <xercesc/sax2/SAX2XMLReader.hpp>
 #include <xercesc/sax2/XMLReaderFactory.hpp>
+#include <xercesc/util/BinInputStream.hpp>
 #include <xercesc/util/PlatformUtils.hpp>
 #include <xercesc/util/TransService.hpp>
 #include <xercesc/util/XMLException.hpp>
@@ -295,6 +297,27 @@ class XMLInputFile : public XMLInput {
   string filename;
 };
 
+/* This class reads XML data from a Python file-like object.
+ *
+ * The parser pulls the data in blocks from the read() method of the object
+ * while it progresses through the document. The complete document is thus
+ * never held in memory, which allows parsing a large document as it arrives
+ * over the network or while it is being decompressed.
+ */
+class XMLInputStream : public XMLInput {
+ public:
+  /* Constructor. The argument is an object with a read() method returning
+   * bytes. The caller keeps a reference to it during the parsing. */
+  XMLInputStream(PyObject* s) : source(s){};
+
+  /* Parse the data returned by the stream. */
+  void parse(Object*, bool = false);
+
+ private:
+  /* Python object with a read() method. */
+  PyObject* source;
+};
+
 /* This class represents a list of XML key+value pairs.
  *
  * The method is a thin wrapper around one of the internal data
@@ -116,6 +116,163 @@ PyObject *readXMLdata(PyObject *self, PyObject *args) {
                              // portable across compilers
 }
 
+//
+// READ XML INPUT STREAM
+//
+
+PyObject *readXMLstream(PyObject *self, PyObject *args) {
+  // Pick up arguments
+  PyObject *source;
+  int validate(1), validate_only(0), loglevel(0);
+  PyObject *userexit = nullptr;
+  int ok = PyArg_ParseTuple(args, "O|iiiO:readXMLstream", &source, &validate,
+                            &validate_only, &loglevel, &userexit);
+  if (!ok) return nullptr;
+  if (!PyObject_HasAttrString(source, "read")) {
+    PyErr_SetString(PythonDataException,
+                    "readXMLstream expects an object with a read() method");
+    return nullptr;
+  }
+
+  // Free Python interpreter for other threads.
+  // The input stream reacquires it when it needs to read more data.
+  Py_BEGIN_ALLOW_THREADS;
+
+  // Execute and catch exceptions
+  try {
+    XMLInputStream p(source);
+    if (userexit) p.setUserExit(userexit);
+    if (loglevel) p.setLogLevel(1);
+    if (validate_only != 0)
+      p.parse(nullptr, true);
+    else
+      p.parse(&Plan::instance(), validate != 0);
+  } catch (...) {
+    Py_BLOCK_THREADS;
+    PythonType::evalException();
+    return nullptr;
+  }
+
+  // Reclaim Python interpreter
+  Py_END_ALLOW_THREADS;
+  return Py_BuildValue("");
+}
+
+//
+// BULK LOAD OF OBJECTS
+//
+
+PyObject *bulkLoad(PyObject *self, PyObject *args) {
+  // Pick up arguments
+  PyObject *pytype, *columns, *rows;
+  int ok =
+      PyArg_ParseTuple(args, "OOO:bulk_load", &pytype, &columns, &rows);
+  if (!ok) return nullptr;
+  if (!PyCallable_Check(pytype)) {
+    PyErr_SetString(PythonDataException, "bulk_load expects a type to create");
+    return nullptr;
+  }
+
+  // Analyze the columns
+  PyObject *cols = PySequence_Fast(columns, "columns must be a sequence");
+  if (!cols) return nullptr;
+  Py_ssize_t ncols = PySequence_Fast_GET_SIZE(cols);
+  vector<PyObject *> names(ncols, nullptr);
+  vector<PyObject *> reftypes(ncols, nullptr);
+  vector<PyObject *> caches(ncols, nullptr);
+  PyObject *empty = PyTuple_New(0);
+  PyObject *iter = nullptr;
+  long cnt = 0;
+  bool failed = false;
+  for (Py_ssize_t c = 0; c < ncols && !failed; ++c) {
+    PyObject *col = PySequence_Fast_GET_ITEM(cols, c);
+    if (PyTuple_Check(col) && PyTuple_Size(col) == 2) {
+      names[c] = PyTuple_GetItem(col, 0);
+      reftypes[c] = PyTuple_GetItem(col, 1);
+      caches[c] = PyDict_New();
+    } else
+      names[c] = col;
+    if (!PyUnicode_Check(names[c])) {
+      PyErr_SetString(PythonDataException, "column names must be strings");
+      failed = true;
+    }
+  }
+
+  // Process all rows
+  if (!failed) iter = PyObject_GetIter(rows);
+  if (!iter) failed = true;
+  while (!failed) {
+    PyObject *row = PyIter_Next(iter);
+    if (!row) {
+      if (PyErr_Occurred()) failed = true;
+      break;
+    }
+    PyObject *values = PySequence_Fast(row, "row must be a sequence");
+    Py_DECREF(row);
+    if (!values) {
+      failed = true;
+      break;
+    }
+    PyObject *kwds = PyDict_New();
+    bool rowok = true;
+    Py_ssize_t nvalues = PySequence_Fast_GET_SIZE(values);
+    for (Py_ssize_t c = 0; c < ncols && c < nvalues && rowok; ++c) {
+      PyObject *val = PySequence_Fast_GET_ITEM(values, c);
+      if (val == Py_None) continue;
+      if (reftypes[c]) {
+        // Look up the referenced entity, using a cache
+        PyObject *ref = PyDict_GetItem(caches[c], val);
+        if (ref)
+          Py_INCREF(ref);
+        else {
+          PyObject *refkwds = Py_BuildValue("{s:O}", "name", val);
+          ref = PyObject_Call(reftypes[c], empty, refkwds);
+          Py_DECREF(refkwds);
+          if (ref) PyDict_SetItem(caches[c], val, ref);
+        }
+        if (ref) {
+          PyDict_SetItem(kwds, names[c], ref);
+          Py_DECREF(ref);
+        } else
+          rowok = false;
+      } else
+        PyDict_SetItem(kwds, names[c], val);
+    }
+    if (rowok) {
+      PyObject *obj = PyObject_Call(pytype, empty, kwds);
+      if (obj) {
+        ++cnt;
+        Py_DECREF(obj);
+      } else
+        rowok = false;
+    }
+    if (!rowok) {
+      // Log the error and continue with the next row
+      PyObject *ptype, *pvalue, *ptraceback;
+      PyErr_Fetch(&ptype, &pvalue, &ptraceback);
+      PyObject *msg = pvalue ? PyObject_Str(pvalue) : nullptr;
+      const char *txt = msg ? PyUnicode_AsUTF8(msg) : nullptr;
+      logger << "**** " << (txt ? txt : "Error loading row") << " ****"
+             << endl;
+      Py_XDECREF(msg);
+      Py_XDECREF(ptype);
+      Py_XDECREF(pvalue);
+      Py_XDECREF(ptraceback);
+      PyErr_Clear();
+    }
+    Py_DECREF(kwds);
+    Py_DECREF(values);
+  }
+
+  // Clean up
+  Py_XDECREF(iter);
+  for (auto c : caches) Py_XDECREF(c);
+  Py_DECREF(empty);
+  Py_DECREF(cols);
+  if (failed) return nullptr;
+  return PyLong_FromLong(cnt);
+}
+
 //
 // SAVE MODEL TO XML
 //
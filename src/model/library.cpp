@@ -127,6 +127,12 @@ void LibraryModel::initialize() {
   PythonInterpreter::registerGlobalMethod(
       "readXMLdata", readXMLdata, METH_VARARGS,
       "Processes a XML string passed as argument.");
+  PythonInterpreter::registerGlobalMethod(
+      "readXMLstream", readXMLstream, METH_VARARGS,
+      "Processes XML data read incrementally from a file-like object.");
+  PythonInterpreter::registerGlobalMethod(
+      "bulk_load", bulkLoad, METH_VARARGS,
+      "Creates or updates a batch of objects from a list of rows.");
   PythonInterpreter::registerGlobalMethod("readXMLfile", readXMLfile,
                                           METH_VARARGS, "Read an XML file.");
   PythonInterpreter::registerGlobalMethod("saveXMLfile", saveXMLfile,
@@ -993,5 +993,80 @@ void XMLInputFile::parse(Object* pRoot, bool validate) {
   }
 }
 
+namespace {
+
+/* A Xerces input stream calling the read() method of a Python object. */
+class PythonBinInputStream : public xercesc::BinInputStream {
+ public:
+  PythonBinInputStream(PyObject* s) : source(s) {}
+
+  XMLFilePos curPos() const { return pos; }
+
+  const XMLCh* getContentType() const { return nullptr; }
+
+  XMLSize_t readBytes(XMLByte* const toFill, const XMLSize_t maxToRead) {
+    auto pythonstate = PyGILState_Ensure();
+    PyObject* data = PyObject_CallMethod(source, "read", "n",
+                                         static_cast<Py_ssize_t>(maxToRead));
+    char* buffer;
+    Py_ssize_t size;
+    if (!data || PyBytes_AsStringAndSize(data, &buffer, &size)) {
+      Py_XDECREF(data);
+      string msg = "Error reading XML stream";
+      PyObject *type, *value, *traceback;
+      PyErr_Fetch(&type, &value, &traceback);
+      if (value) {
+        PyObject* str = PyObject_Str(value);
+        if (str) {
+          const char* c = PyUnicode_AsUTF8(str);
+          if (c) msg += string(": ") + c;
+          Py_DECREF(str);
+        }
+      }
+      Py_XDECREF(type);
+      Py_XDECREF(value);
+      Py_XDECREF(traceback);
+      PyErr_Clear();
+      PyGILState_Release(pythonstate);
+      throw RuntimeException(msg);
+    }
+    if (static_cast<XMLSize_t>(size) > maxToRead) {
+      Py_DECREF(data);
+      PyGILState_Release(pythonstate);
+      throw RuntimeException("XML stream returned more data than requested");
+    }
+    memcpy(toFill, buffer, size);
+    Py_DECREF(data);
+    PyGILState_Release(pythonstate);
+    pos += size;
+    return size;
+  }
+
+ private:
+  PyObject* source;
+  XMLFilePos pos = 0;
+};
+
+/* A Xerces input source wrapping a Python file-like object. */
+class PythonInputSource : public xercesc::InputSource {
+ public:
+  PythonInputSource(PyObject* s) : source(s) {}
+
+  xercesc::BinInputStream* makeStream() const {
+    return new PythonBinInputStream(source);
+  }
+
+ private:
+  PyObject* source;
+};
+
+}  // namespace
+
+void XMLInputStream::parse(Object* pRoot, bool validate) {
+  if (!source) throw DataException("Missing input stream");
+  PythonInputSource in(source);
+  XMLInput::parse(in, pRoot, validate);
+}
+
 }  // namespace utils
 }  // namespace frepple